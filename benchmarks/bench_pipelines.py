@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Benchmarks de las rutas calientes contra el simulador local de Gmail.
+
+Cada escenario corre en un subproceso propio (para que el pico de RSS sea
+suyo) sobre un buzón sintético nuevo con latencia inyectada, y reporta:
+
+- msgs_per_sec: mensajes procesados por segundo de reloj
+- calls_per_1000: llamadas a la API (incluye sub-peticiones batch) por 1000 msgs
+- http_per_1000: idas y vueltas HTTP por 1000 msgs
+- peak_rss_mb: pico de memoria residente del subproceso
+- p95_chunk_ms: p95 de la latencia de cada lote/página (spans de tracing)
+- conns_per_1000: conexiones TCP nuevas por 1000 msgs (sólo escenarios *_http,
+  que hablan con simulator.serve() por localhost: dos trabajos seguidos con el
+  transporte con pool frente a un httplib2.Http por hilo como antes)
+
+Uso:
+    python benchmarks/bench_pipelines.py                 # compara con baseline
+    python benchmarks/bench_pipelines.py --save          # reescribe baseline
+    python benchmarks/bench_pipelines.py -k trash --size 100000 --latency 0.05
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "pipelines.json")
+
+# nombre -> (función, kwargs, span principal para el p95)
+SCENARIOS = {
+    "iter_message_ids": ("iter_ids", {}, "list_page"),
+    "trash_query_b500_c2": (
+        "trash_query",
+        {"batch_size": 500, "concurrency": 2},
+        "batch",
+    ),
+    "trash_query_b1000_c4": (
+        "trash_query",
+        {"batch_size": 1000, "concurrency": 4},
+        "batch",
+    ),
+    "trash_query_b1000_c8": (
+        "trash_query",
+        {"batch_size": 1000, "concurrency": 8},
+        "batch",
+    ),
+    "delete_query_b500_c4": (
+        "delete_query",
+        {"batch_size": 500, "concurrency": 4},
+        "batch",
+    ),
+    "delete_query_b1000_c8": (
+        "delete_query",
+        {"batch_size": 1000, "concurrency": 8},
+        "batch",
+    ),
+    "trash_http_pooled": ("trash_http", {"transport": "pooled"}, "batch"),
+    "trash_http_httplib2": ("trash_http", {"transport": "httplib2"}, "batch"),
+    "top_senders": ("top_senders", {}, "batch"),
+    "list_labels_with_counts": ("label_counts", {}, "labels_get"),
+    "or_label_union": ("or_union", {}, "batch"),
+}
+
+# Métricas donde "más alto es peor"
+LOWER_IS_BETTER = (
+    "calls_per_1000",
+    "http_per_1000",
+    "peak_rss_mb",
+    "p95_chunk_ms",
+    "conns_per_1000",
+)
+
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _p95(values):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))]
+
+
+def _http_factory(sim, transport: str):
+    """Fábrica de servicios contra simulator.serve() con el transporte pedido."""
+    import threading
+
+    import httplib2
+    from googleapiclient.discovery import build
+    from gmail_manager.transport import PooledHttp
+
+    server = sim.serve()
+
+    def make(http):
+        return build(
+            "gmail",
+            "v1",
+            http=http,
+            cache_discovery=False,
+            client_options={"api_endpoint": server.base_url},
+        )
+
+    if transport == "pooled":
+        shared = make(PooledHttp())
+        return lambda: shared
+
+    # Comportamiento anterior: un httplib2.Http (y sus conexiones) por hilo
+    local = threading.local()
+
+    def per_thread():
+        if not hasattr(local, "svc"):
+            local.svc = make(httplib2.Http())
+        return local.svc
+
+    return per_thread
+
+
+def run_one(name: str, size: int, latency: float) -> dict:
+    from gmail_manager import labels, messages, search, service, tracing
+    from gmail_manager.simulator import SimMailbox, SimulatedGmail
+
+    kind, kwargs, span_name = SCENARIOS[name]
+    sim = SimulatedGmail(SimMailbox(size=size, seed=11), latency=latency)
+    tracer = tracing.Tracer(name)
+    with sim.install():
+        sim.build_service()  # no medir el parseo del documento de descubrimiento
+        if kind == "label_counts":
+            sim.mailbox.label_counts("INBOX")  # precalcular conteos del simulador
+        t0 = time.perf_counter()
+        with tracing.trace_job(name, tracer=tracer):
+            if kind == "iter_ids":
+                n = sum(1 for _ in messages.iter_message_ids(None, None))
+            elif kind == "trash_query":
+                n = messages.trash_by_query_fast("", **kwargs)["processed"]
+            elif kind == "trash_http":
+                prev = service.set_service_factory(
+                    _http_factory(sim, kwargs["transport"])
+                )
+                try:
+                    n = 0
+                    for q in ("category:promotions", "category:social"):
+                        res = messages.trash_by_query_fast(
+                            q, concurrency=8, batch_size=250
+                        )
+                        n += res["processed"]
+                finally:
+                    service.set_service_factory(prev)
+            elif kind == "delete_query":
+                n = messages.delete_permanently_by_query_fast("", **kwargs)["processed"]
+            elif kind == "top_senders":
+                search.top_senders("")
+                n = sim.calls["messages.get"]
+            elif kind == "label_counts":
+                n = sum(l["messagesTotal"] for l in labels.list_labels_with_counts())
+            elif kind == "or_union":
+                res = messages.trash_by_label_ids_fast(
+                    ["CATEGORY_PROMOTIONS", "CATEGORY_UPDATES", "Label_1", "Label_2"]
+                )
+                n = res["processed"]
+        elapsed = time.perf_counter() - t0
+    st = sim.stats()
+    per = 1000.0 / max(1, n)
+    durations = [e["dur"] / 1000.0 for e in tracer.spans(span_name)]
+    return {
+        "messages": n,
+        "seconds": round(elapsed, 3),
+        "msgs_per_sec": round(n / elapsed, 1) if elapsed else 0.0,
+        "calls_per_1000": round(st["api_calls"] * per, 2),
+        "http_per_1000": round(st["http_requests"] * per, 2),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "p95_chunk_ms": round(_p95(durations), 2),
+        "conns_per_1000": round(st["connections"] * per, 2),
+    }
+
+
+def _spawn(name: str, size: int, latency: float) -> dict:
+    out = subprocess.run(
+        [sys.executable, __file__, "--one", name, "--size", str(size)]
+        + ["--latency", str(latency)],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _compare(name: str, cur: dict, base: dict, tolerance: float) -> list:
+    problems = []
+    for key in ("msgs_per_sec",) + LOWER_IS_BETTER:
+        old, new = base.get(key), cur.get(key)
+        if not old or new is None:
+            continue
+        delta = (new - old) / old
+        worse = delta > tolerance if key in LOWER_IS_BETTER else delta < -tolerance
+        if worse:
+            problems.append(f"{name}.{key}: {old} -> {new} ({delta:+.0%})")
+    return problems
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--size", type=int, default=20000, help="mensajes del buzón")
+    ap.add_argument("--latency", type=float, default=0.02, help="s por petición")
+    ap.add_argument("-k", default="", help="sólo escenarios que contengan esto")
+    ap.add_argument("--save", action="store_true", help="guardar como baseline")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    ap.add_argument("--one", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.one:
+        print(json.dumps(run_one(args.one, args.size, args.latency)))
+        return 0
+
+    results = {}
+    for name in SCENARIOS:
+        if args.k and args.k not in name:
+            continue
+        results[name] = _spawn(name, args.size, args.latency)
+        r = results[name]
+        print(
+            f"{name:26s} {r['msgs_per_sec']:>10.1f} msg/s "
+            f"{r['calls_per_1000']:>8.2f} calls/1k {r['http_per_1000']:>7.2f} http/1k "
+            f"{r['peak_rss_mb']:>7.1f} MB  p95 {r['p95_chunk_ms']:>8.2f} ms "
+            f"{r.get('conns_per_1000', 0):>6.2f} conns/1k"
+        )
+
+    meta = {"size": args.size, "latency": args.latency}
+    if args.save:
+        data = {"meta": meta, "results": results}
+        if os.path.exists(BASELINE):
+            with open(BASELINE, encoding="utf-8") as fh:
+                old = json.load(fh)
+            if old.get("meta") == meta:
+                data["results"] = {**old.get("results", {}), **results}
+        os.makedirs(os.path.dirname(BASELINE), exist_ok=True)
+        with open(BASELINE, "w", encoding="utf-8") as fh:
+            json.dump(data, fh, indent=2, sort_keys=True)
+            fh.write("\n")
+        print(f"Baseline guardado en {BASELINE}")
+        return 0
+
+    if not os.path.exists(BASELINE):
+        print("Sin baseline; ejecuta con --save para crearlo.")
+        return 0
+    with open(BASELINE, encoding="utf-8") as fh:
+        base = json.load(fh)
+    if base.get("meta") != meta:
+        print(f"Baseline con otros parámetros ({base.get('meta')}); no se compara.")
+        return 0
+    problems = []
+    for name, cur in results.items():
+        if name in base["results"]:
+            problems += _compare(name, cur, base["results"][name], args.tolerance)
+    for p in problems:
+        print("REGRESIÓN:", p)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,4 +8,26 @@ __all__ = [
     "messages",
     "gui",
     "config",
+    "tracing",
+    "profiling",
+    "query",
+    "simulator",
+    "tuning",
+    "cli",
+    "aio",
+    "transport",
+    "api",
+    "threads",
+    "sketches",
+    "counting",
+    "planner",
+    "selection",
+    "accounts",
+    "snapshot",
+    "backtest",
+    "rules",
+    "journal",
+    "export",
+    "duplicates",
+    "meter",
 ]
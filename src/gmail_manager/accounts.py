@@ -0,0 +1,266 @@
+"""
+Varias cuentas en el mismo proceso: perfiles con su propio token y cuota.
+
+Cada perfil (config.ACCOUNTS_FILE) tiene nombre, fichero de token
+(``tokens/<nombre>.json`` por defecto), credenciales OAuth y, opcionalmente,
+un presupuesto de cuota en unidades por segundo (``quota_per_sec``). La
+cuenta activa vive en un ``ContextVar``: auth.py, service.py y api.py la
+consultan, así que todo el código existente (messages, search, counting...)
+trabaja sobre la cuenta del contexto sin cambiar de firma::
+
+    with accounts.use("soporte"):
+        messages.trash_by_query("older_than:1y")
+
+Los workers de ``ThreadPoolExecutor`` no heredan el contexto; los módulos
+que abren hilos usan `ContextThreadPool`, que sí lo copia.
+
+`run_many` lanza un trabajo por cuenta en un pool: cada cuenta tiene su
+propio servicio, sus reintentos y su cubo de cuota, y un fallo o un 429
+persistente en una cuenta sólo afecta a esa cuenta. Sin ``--account`` (o
+con la cuenta ``None``) todo funciona como antes con config.TOKEN_FILE.
+"""
+
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from .config import (
+    ACCOUNT_WORKERS,
+    ACCOUNTS_FILE,
+    CREDENTIALS_PATH,
+    TOKEN_FILE,
+    TOKENS_DIR,
+)
+
+_current: contextvars.ContextVar = contextvars.ContextVar("account", default=None)
+_default: Optional[str] = None
+_budgets: Dict[Optional[str], "QuotaBudget"] = {}
+_budgets_lock = threading.Lock()
+
+
+# ---------- cuenta activa ----------
+def current() -> Optional[str]:
+    """Cuenta del contexto actual (None = la cuenta por defecto de siempre)."""
+    return _current.get() or _default
+
+
+def set_default(name: Optional[str]) -> None:
+    """Cuenta para el código que no pasa por `use` (p. ej. la GUI)."""
+    global _default
+    if name is not None and name not in names():
+        raise KeyError(f"Cuenta desconocida: {name}")
+    _default = name
+
+
+@contextlib.contextmanager
+def use(name: Optional[str]) -> Iterator[None]:
+    """Activa `name` en este contexto (y en los hilos de ContextThreadPool)."""
+    if name is not None and name not in names():
+        raise KeyError(f"Cuenta desconocida: {name}")
+    token = _current.set(name)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+class ContextThreadPool(ThreadPoolExecutor):
+    """ThreadPoolExecutor cuyos workers corren con el contexto de quien envía."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        ctx = contextvars.copy_context()
+        return super().submit(ctx.run, fn, *args, **kwargs)
+
+
+# ---------- perfiles ----------
+def load(path: Optional[str] = None) -> Dict[str, Dict]:
+    path = path or ACCOUNTS_FILE
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh).get("accounts", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save(profiles: Dict[str, Dict], path: Optional[str] = None) -> None:
+    path = path or ACCOUNTS_FILE
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump({"accounts": profiles}, fh, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def names() -> List[str]:
+    return sorted(load())
+
+
+def add(
+    name: str,
+    credentials_path: Optional[str] = None,
+    token_file: Optional[str] = None,
+    quota_per_sec: Optional[float] = None,
+) -> Dict:
+    """Crea o actualiza un perfil; el token se genera al primer uso."""
+    name = name.strip()
+    if not name or os.sep in name or name.startswith("."):
+        raise ValueError(f"Nombre de cuenta no válido: {name!r}")
+    profiles = load()
+    prof = profiles.get(name, {})
+    prof["token_file"] = token_file or prof.get(
+        "token_file", os.path.join(TOKENS_DIR, f"{name}.json")
+    )
+    prof["credentials_path"] = credentials_path or prof.get(
+        "credentials_path", CREDENTIALS_PATH
+    )
+    if quota_per_sec is not None:
+        prof["quota_per_sec"] = quota_per_sec or None
+    profiles[name] = prof
+    save(profiles)
+    with _budgets_lock:
+        _budgets.pop(name, None)
+    return prof
+
+
+def remove(name: str, delete_token: bool = False) -> bool:
+    profiles = load()
+    prof = profiles.pop(name, None)
+    if prof is None:
+        return False
+    save(profiles)
+    if delete_token:
+        try:
+            os.remove(prof["token_file"])
+        except (FileNotFoundError, KeyError):
+            pass
+    return True
+
+
+def profile(name: Optional[str] = None) -> Dict:
+    """Perfil de `name` (o de la cuenta activa); None da el de config.py."""
+    name = name if name is not None else current()
+    if name is None:
+        return {"token_file": TOKEN_FILE, "credentials_path": CREDENTIALS_PATH}
+    prof = load().get(name)
+    if prof is None:
+        raise KeyError(f"Cuenta desconocida: {name}")
+    return prof
+
+
+def token_file(name: Optional[str] = None) -> str:
+    return profile(name)["token_file"]
+
+
+def credentials_path(name: Optional[str] = None) -> str:
+    return profile(name).get("credentials_path") or CREDENTIALS_PATH
+
+
+# ---------- presupuesto de cuota ----------
+class QuotaBudget:
+    """
+    Cubo de tokens en unidades de cuota por segundo. `acquire` espera hasta
+    tener saldo; sólo bloquea al hilo (y la cuenta) que lo pide.
+    """
+
+    def __init__(self, per_sec: Optional[float], burst: Optional[float] = None):
+        self.per_sec = float(per_sec) if per_sec else None
+        self.burst = float(burst or (self.per_sec or 0))
+        self.tokens = self.burst
+        self.spent = 0
+        self.waited = 0.0
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, units: int) -> None:
+        with self._lock:
+            self.spent += units
+        if not self.per_sec:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self._stamp) * self.per_sec
+                )
+                self._stamp = now
+                if self.tokens >= min(units, self.burst):
+                    self.tokens -= units
+                    return
+                wait = (min(units, self.burst) - self.tokens) / self.per_sec
+                self.waited += wait
+            time.sleep(wait)
+
+
+def budget(name: Optional[str] = None) -> QuotaBudget:
+    """Cubo de cuota de `name` (o de la cuenta activa), uno por proceso."""
+    name = name if name is not None else current()
+    b = _budgets.get(name)
+    if b is None:
+        with _budgets_lock:
+            b = _budgets.get(name)
+            if b is None:
+                per_sec = profile(name).get("quota_per_sec")
+                b = _budgets[name] = QuotaBudget(per_sec)
+    return b
+
+
+# ---------- varias cuentas en paralelo ----------
+def run_many(
+    names_: Iterable[Optional[str]],
+    job: Callable[..., Dict],
+    max_workers: int = ACCOUNT_WORKERS,
+    progress_cb: Optional[Callable[[Optional[str], int, int], None]] = None,
+) -> Dict:
+    """
+    Ejecuta ``job(progress_cb=...)`` una vez por cuenta, cada una en su worker
+    y con su cuenta activa. `progress_cb(cuenta, hechos, total)` recibe el
+    progreso de todas. Devuelve ``{"accounts": {cuenta: {...}}, "summary":
+    {...}}``: por cuenta ``ok``, ``result`` o ``error`` y ``seconds``; el
+    resumen suma los campos numéricos de los resultados correctos.
+    """
+    targets = list(dict.fromkeys(names_))
+    for name in targets:
+        profile(name)  # falla pronto con cuentas desconocidas
+
+    def run_one(name: Optional[str]) -> Dict:
+        def cb(done: int, total: int) -> None:
+            if progress_cb:
+                progress_cb(name, done, total)
+
+        t0 = time.monotonic()
+        with use(name):
+            try:
+                res = job(progress_cb=cb)
+                out = {"ok": True, "result": res}
+            except Exception as e:  # una cuenta no tumba al resto
+                out = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        out["seconds"] = round(time.monotonic() - t0, 3)
+        return out
+
+    results: Dict[Optional[str], Dict] = {}
+    workers = max(1, min(max_workers, len(targets) or 1))
+    with ContextThreadPool(max_workers=workers) as ex:
+        futures = {ex.submit(run_one, name): name for name in targets}
+        for f in as_completed(futures):
+            results[futures[f]] = f.result()
+
+    summary: Dict = {"accounts": len(targets), "failed": 0}
+    for out in results.values():
+        if not out["ok"]:
+            summary["failed"] += 1
+            continue
+        res = out["result"]
+        if isinstance(res, dict):
+            for key, value in res.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    summary[key] = summary.get(key, 0) + value
+    return {
+        "accounts": {name: results[name] for name in targets},
+        "summary": summary,
+    }
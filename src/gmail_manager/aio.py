@@ -0,0 +1,794 @@
+"""
+Motor asyncio opcional para la E/S masiva (requiere ``aiohttp``).
+
+Mismas operaciones que la ruta por hilos -- páginas de ``messages.list``,
+lotes de ``messages.get`` en metadata (batch HTTP multipart/mixed),
+``batchModify``, ``batchDelete`` y ``labels.get`` -- pero con cientos de
+peticiones en vuelo sobre un único hilo y un pool de conexiones keep-alive.
+
+Se activa con ``INBOXZERO_ENGINE=async`` (config.ENGINE) o ``set_engine("async")``.
+Si aiohttp no está instalado (``pip install "inboxzero-tool[async]"``) se
+sigue usando el motor por hilos. ``INBOXZERO_API_BASE_URL`` / ``configure``
+permite apuntarlo a otra raíz, p. ej. ``SimulatedGmail.serve().base_url``;
+el token OAuth sólo se envía a URLs https.
+
+Los trabajos respetan el mismo contrato que messages._stream_action_from_ids:
+``progress_cb(done, total)`` se llama desde el hilo que lanzó el trabajo y
+``stop_event`` (threading.Event) detiene el listado y los fallbacks unitarios.
+Los listados pasan por el mismo planner.plan que la ruta por hilos y el
+total de la barra es un counting.LiveCount sembrado con planner.job_total
+(ambos en un hilo aparte: usan el cliente síncrono, con su caché).
+Cada petición (y cada sub-petición de un batch) se cobra en unidades de
+api.QUOTA_UNITS al accounts.budget() de la cuenta activa, como api.request;
+la espera corre en un hilo aparte para no frenar el bucle.
+"""
+
+import asyncio
+import json
+import random
+import threading
+from email.parser import BytesParser
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+)
+from urllib.parse import quote, urlencode
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+try:
+    import aiohttp
+except ImportError:  # dependencia opcional
+    aiohttp = None
+
+from . import accounts, api, counting, messages, meter, planner, tracing
+from .config import AIO_MAX_IN_FLIGHT, API_BASE_URL, ENGINE
+
+USER_ID = "me"
+BATCH_GET_LIMIT = 100  # sub-peticiones por batch HTTP
+METADATA_FIELDS = api.FIELDS["messages.get"]
+
+T = TypeVar("T")
+
+_engine = ENGINE
+_base_url = API_BASE_URL
+
+
+# ---------- selección de motor ----------
+def available() -> bool:
+    return aiohttp is not None
+
+
+def set_engine(name: str) -> None:
+    """ "threads" (por defecto) o "async"."""
+    global _engine
+    if name not in ("threads", "async"):
+        raise ValueError(f"Motor desconocido: {name}")
+    _engine = name
+
+
+def engine_enabled() -> bool:
+    """True si los trabajos masivos deben ir por el motor asyncio."""
+    return _engine == "async" and available()
+
+
+def configure(engine: Optional[str] = None, base_url: Optional[str] = None) -> None:
+    global _base_url
+    if engine:
+        set_engine(engine)
+    if base_url:
+        _base_url = base_url
+
+
+# ---------- batch HTTP ----------
+def _encode_batch(paths: Sequence[str], boundary: str) -> bytes:
+    out = []
+    for i, path in enumerate(paths):
+        out.append(
+            f"--{boundary}\r\n"
+            "Content-Type: application/http\r\n"
+            "Content-Transfer-Encoding: binary\r\n"
+            f"Content-ID: <{i + 1}>\r\n\r\n"
+            f"GET {path} HTTP/1.1\r\n\r\n"
+        )
+    out.append(f"--{boundary}--\r\n")
+    return "".join(out).encode("utf-8")
+
+
+def _decode_batch(content: bytes, content_type: str) -> Dict[int, Tuple[int, Dict]]:
+    """Respuesta multipart/mixed -> {índice: (status, json)}."""
+    header = f"content-type: {content_type}\r\n\r\n".encode("utf-8")
+    msg = BytesParser().parsebytes(header + content)
+    out: Dict[int, Tuple[int, Dict]] = {}
+    for part in msg.get_payload() if msg.is_multipart() else []:
+        cid = (part.get("Content-ID") or "").strip("<> ")
+        idx = int(cid.rsplit("-", 1)[-1].split("+")[-1].strip()) - 1
+        raw = part.get_payload()
+        if isinstance(raw, list):
+            raw = raw[0].as_string()
+        raw = raw.replace("\r\n", "\n")
+        status_line, _, rest = raw.partition("\n")
+        _, _, body = rest.partition("\n\n")
+        try:
+            status = int(status_line.split(" ")[1])
+        except (IndexError, ValueError):
+            status = 500
+        try:
+            payload = json.loads(body) if body.strip() else {}
+        except ValueError:
+            payload = {}
+        out[idx] = (status, payload)
+    return out
+
+
+def _http_error(status: int, content: bytes, uri: str) -> HttpError:
+    return HttpError(httplib2.Response({"status": str(status)}), content, uri=uri)
+
+
+# ---------- cliente ----------
+class AsyncGmail:
+    """
+    Cliente asíncrono de la Gmail API sobre una sesión aiohttp compartida.
+    Usar como ``async with AsyncGmail() as client``.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        credentials=None,
+        max_in_flight: int = AIO_MAX_IN_FLIGHT,
+        retries: int = 6,
+        backoff: float = 0.4,
+    ):
+        if aiohttp is None:
+            raise RuntimeError(
+                'El motor asyncio requiere aiohttp: pip install "inboxzero-tool[async]"'
+            )
+        self.base_url = (base_url or _base_url).rstrip("/") + "/"
+        self.api_root = f"{self.base_url}gmail/v1/users/{USER_ID}/"
+        self.authenticate = self.base_url.startswith("https://")
+        self.credentials = credentials
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.retries = retries
+        self.backoff = backoff
+        self._session = None
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._refresh_lock: Optional[asyncio.Lock] = None
+        self._boundary = 0
+        self.budget = accounts.budget()
+
+    async def __aenter__(self) -> "AsyncGmail":
+        if self.authenticate and self.credentials is None:
+            from .auth import get_credentials
+
+            self.credentials = await asyncio.to_thread(get_credentials)
+        connector = aiohttp.TCPConnector(
+            limit=self.max_in_flight,
+            keepalive_timeout=30,
+            ttl_dns_cache=300,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            headers={"Accept-Encoding": "gzip", "User-Agent": "inboxzero (gzip)"},
+            timeout=aiohttp.ClientTimeout(total=120),
+        )
+        self._sem = asyncio.Semaphore(self.max_in_flight)
+        self._refresh_lock = asyncio.Lock()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    # ---- transporte ----
+    async def _charge(self, op: str, n: int = 1) -> None:
+        """Cobra `n` veces `op` al presupuesto de la cuenta (esperando si hace falta)."""
+        units = api.QUOTA_UNITS.get(op, 5) * n
+        if self.budget.per_sec:
+            await asyncio.to_thread(self.budget.acquire, units)
+        else:
+            self.budget.acquire(units)
+
+    async def _auth_headers(self, force_refresh: bool = False) -> Dict[str, str]:
+        creds = self.credentials
+        if not self.authenticate or creds is None:
+            return {}
+        if force_refresh or not creds.valid:
+            async with self._refresh_lock:
+                if force_refresh or not creds.valid:
+                    from google.auth.transport.requests import Request
+
+                    await asyncio.to_thread(creds.refresh, Request())
+        return {"Authorization": f"Bearer {creds.token}"}
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        data: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """Una ida y vuelta con reintentos (429/5xx, red) y refresco de token en 401."""
+        refreshed = False
+        attempt = 0
+        while True:
+            hdrs = dict(headers or {})
+            hdrs.update(await self._auth_headers(force_refresh=False))
+            try:
+                async with self._sem:
+                    async with self._session.request(
+                        method, url, data=data, headers=hdrs
+                    ) as resp:
+                        content = await resp.read()
+                        status = resp.status
+                        resp_headers = {k.lower(): v for k, v in resp.headers.items()}
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt + 1 >= self.retries:
+                    raise
+                status, resp_headers, content = 503, {}, b""
+            if status == 401 and self.authenticate and not refreshed:
+                refreshed = True
+                await self._auth_headers(force_refresh=True)
+                continue
+            if status in messages.RETRY_STATUS and attempt + 1 < self.retries:
+                await self._sleep_backoff(attempt, status)
+                attempt += 1
+                continue
+            if status >= 400:
+                raise _http_error(status, content, url)
+            return status, resp_headers, content
+
+    async def _sleep_backoff(self, attempt: int, status: int) -> None:
+        delay = min(8.0, self.backoff * (2**attempt) + random.uniform(0, self.backoff))
+        meter.note_retry(delay)
+        with tracing.span("retry_sleep", "retry", status=status, attempt=attempt):
+            await asyncio.sleep(delay)
+
+    def _url(self, path: str, params: Optional[Dict] = None) -> str:
+        url = self.api_root + path
+        query = []
+        for k, v in (params or {}).items():
+            if v is None:
+                continue
+            if isinstance(v, bool):
+                v = "true" if v else "false"
+            if isinstance(v, (list, tuple)):
+                query.extend((k, x) for x in v)
+            else:
+                query.append((k, v))
+        return url + ("?" + urlencode(query) if query else "")
+
+    async def _json(
+        self,
+        op: str,
+        method: str,
+        path: str,
+        params: Optional[Dict] = None,
+        body=None,
+    ) -> Dict:
+        await self._charge(op)
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if data is not None else None
+        _, _, content = await self._request(
+            method, self._url(path, params), data, headers
+        )
+        return json.loads(content) if content else {}
+
+    # ---- listados ----
+    async def list_page(
+        self,
+        q: Optional[str],
+        label_ids: Optional[List[str]],
+        page_token: Optional[str],
+    ) -> Dict:
+        with tracing.span("list_page", "list", first=not page_token):
+            return await self._json(
+                "messages.list",
+                "GET",
+                "messages",
+                {
+                    "q": q or None,
+                    "labelIds": label_ids or None,
+                    "pageToken": page_token or None,
+                    "includeSpamTrash": False,
+                    "maxResults": messages.MAX_RESULTS_PER_PAGE,
+                    "fields": api.FIELDS["messages.list"],
+                },
+            )
+
+    async def list_pages(
+        self,
+        q: Optional[str],
+        label_ids: Optional[List[str]] = None,
+        max_total: Optional[int] = None,
+        stop_event: Optional[threading.Event] = None,
+    ) -> AsyncIterator[List[str]]:
+        """Genera listas de IDs página a página."""
+        token = None
+        yielded = 0
+        while not (stop_event and stop_event.is_set()):
+            resp = await self.list_page(q, label_ids, token)
+            ids = [m["id"] for m in resp.get("messages", []) or []]
+            if max_total:
+                ids = ids[: max_total - yielded]
+            if ids:
+                yielded += len(ids)
+                yield ids
+            token = resp.get("nextPageToken")
+            if not token or (max_total and yielded >= max_total):
+                return
+
+    # ---- metadata en batch ----
+    def _next_boundary(self) -> str:
+        self._boundary += 1
+        return f"inboxzero_aio_{self._boundary:08d}"
+
+    async def get_metadata_batch(
+        self,
+        ids: Sequence[str],
+        headers: Sequence[str] = ("From",),
+        fields: str = METADATA_FIELDS,
+    ) -> List[Dict]:
+        """
+        messages.get(format=metadata) de hasta 100 IDs en una sola ida y vuelta.
+        Las sub-peticiones 429/5xx se reintentan; otros fallos se omiten.
+        """
+        base = f"/gmail/v1/users/{USER_ID}/messages/"
+        query = urlencode(
+            [("format", "metadata")]
+            + [("metadataHeaders", h) for h in headers]
+            + [("fields", fields)]
+        )
+        pending = list(ids)
+        found: List[Dict] = []
+        for attempt in range(self.retries):
+            if not pending:
+                break
+            boundary = self._next_boundary()
+            body = _encode_batch(
+                [f"{base}{quote(mid, safe='')}?{query}" for mid in pending], boundary
+            )
+            await self._charge("messages.get", len(pending))
+            with tracing.span(
+                "batch", "http", action="GET_METADATA", size=len(pending)
+            ):
+                _, resp_headers, content = await self._request(
+                    "POST",
+                    self.base_url + "batch/gmail/v1",
+                    body,
+                    {"Content-Type": f"multipart/mixed; boundary={boundary}"},
+                )
+            parts = _decode_batch(content, resp_headers.get("content-type", ""))
+            retry = []
+            for i, mid in enumerate(pending):
+                status, payload = parts.get(i, (500, {}))
+                if status < 300:
+                    found.append(payload)
+                elif status in messages.RETRY_STATUS:
+                    retry.append(mid)
+            pending = retry
+            if pending and attempt + 1 < self.retries:
+                await self._sleep_backoff(attempt, 429)
+        return found
+
+    async def iter_metadata(
+        self,
+        ids: Iterable[str],
+        headers: Sequence[str] = ("From",),
+        fields: str = METADATA_FIELDS,
+        stop_event: Optional[threading.Event] = None,
+    ) -> AsyncIterator[List[Dict]]:
+        """Lotes de metadata en el orden en que terminan (todas las peticiones en vuelo)."""
+        ids = list(ids)
+        tasks = [
+            asyncio.ensure_future(
+                self.get_metadata_batch(ids[i : i + BATCH_GET_LIMIT], headers, fields)
+            )
+            for i in range(0, len(ids), BATCH_GET_LIMIT)
+        ]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                if stop_event and stop_event.is_set():
+                    return
+                try:
+                    yield await fut
+                except HttpError:
+                    continue  # igual que la ruta por hilos: se ignora el bloque
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    # ---- mutaciones ----
+    async def batch_modify(
+        self,
+        ids: List[str],
+        add: Optional[List[str]] = None,
+        remove: Optional[List[str]] = None,
+    ) -> None:
+        body: Dict = {"ids": ids}
+        if add:
+            body["addLabelIds"] = add
+        if remove:
+            body["removeLabelIds"] = remove
+        await self._json(
+            "messages.batchModify", "POST", "messages/batchModify", body=body
+        )
+
+    async def batch_delete(self, ids: List[str]) -> None:
+        await self._json(
+            "messages.batchDelete", "POST", "messages/batchDelete", body={"ids": ids}
+        )
+
+    async def modify_one(
+        self, mid: str, add: Optional[List[str]], remove: Optional[List[str]]
+    ) -> None:
+        body = {"addLabelIds": add or [], "removeLabelIds": remove or []}
+        await self._json(
+            "messages.modify",
+            "POST",
+            f"messages/{quote(mid, safe='')}/modify",
+            {"fields": api.FIELDS["messages.modify"]},
+            body,
+        )
+
+    async def trash_one(self, mid: str) -> None:
+        await self._json(
+            "messages.trash",
+            "POST",
+            f"messages/{quote(mid, safe='')}/trash",
+            {"fields": api.FIELDS["messages.trash"]},
+        )
+
+    async def delete_one(self, mid: str) -> None:
+        await self._json("messages.delete", "DELETE", f"messages/{quote(mid, safe='')}")
+
+    # ---- etiquetas ----
+    async def labels_list(self) -> List[Dict]:
+        resp = await self._json(
+            "labels.list", "GET", "labels", {"fields": api.FIELDS["labels.list"]}
+        )
+        return resp.get("labels", [])
+
+    async def labels_get(self, label_id: str) -> Dict:
+        with tracing.span("labels_get", "http"):
+            return await self._json(
+                "labels.get",
+                "GET",
+                f"labels/{quote(label_id, safe='')}",
+                {"fields": api.FIELDS["labels.get"]},
+            )
+
+    async def label_counts(self, base: Optional[List[Dict]] = None) -> List[Dict]:
+        """labels.get de todas las etiquetas a la vez; mismo formato que labels.py."""
+        base = base if base is not None else await self.labels_list()
+        got = await asyncio.gather(
+            *(self.labels_get(lbl["id"]) for lbl in base), return_exceptions=True
+        )
+        out = []
+        for lbl, res in zip(base, got):
+            item = lbl if isinstance(res, BaseException) else res
+            item.setdefault("messagesTotal", 0)
+            item.setdefault("threadsTotal", 0)
+            out.append(item)
+        return out
+
+
+# ---------- tubería de acciones ----------
+def _action_fns(client: AsyncGmail, action_type: str, label_changes):
+    if action_type == "MODIFY":
+        add, remove = label_changes or ([], [])
+        return (
+            lambda ids: client.batch_modify(ids, add, remove),
+            lambda mid: client.modify_one(mid, add, remove),
+        )
+    if action_type == "TRASH":
+        return (lambda ids: client.batch_modify(ids, ["TRASH"]), client.trash_one)
+    return client.batch_delete, client.delete_one
+
+
+async def _run_chunk(
+    client: AsyncGmail,
+    chunk: List[str],
+    action_type: str,
+    label_changes,
+    stop_event: Optional[threading.Event],
+    on_chunk: Optional[Callable[[List[str]], None]] = None,
+) -> int:
+    gained = await _run_chunk_inner(
+        client, chunk, action_type, label_changes, stop_event
+    )
+    if gained and on_chunk is not None:
+        on_chunk(chunk)
+    return gained
+
+
+async def _run_chunk_inner(
+    client: AsyncGmail,
+    chunk: List[str],
+    action_type: str,
+    label_changes,
+    stop_event: Optional[threading.Event],
+) -> int:
+    batch_fn, single_fn = _action_fns(client, action_type, label_changes)
+    try:
+        with tracing.span("batch", "http", action=action_type, size=len(chunk)):
+            await batch_fn(chunk)
+        return len(chunk)
+    except HttpError as e:
+        if e.resp is not None and e.resp.status == 403:
+            raise PermissionError(
+                f"Permisos insuficientes para {action_type}. "
+                "Reautentica con los scopes requeridos."
+            ) from e
+
+    # Fallback unitario (concurrente, limitado por el semáforo del cliente)
+    async def one(mid: str) -> int:
+        if stop_event and stop_event.is_set():
+            return 0
+        try:
+            await single_fn(mid)
+            return 1
+        except HttpError:
+            return 0
+
+    with tracing.span("single_fallback", "http", action=action_type, size=len(chunk)):
+        return sum(await asyncio.gather(*(one(mid) for mid in chunk)))
+
+
+async def _plan(q: Optional[str], label_ids: Optional[List[str]]) -> planner.Plan:
+    """planner.plan fuera del bucle (puede pedir labels.list)."""
+    return await asyncio.to_thread(planner.plan, q, label_ids)
+
+
+async def _iter_selection(
+    client: AsyncGmail,
+    plans: List[planner.Plan],
+    max_fetch: Optional[int],
+    stop_event: Optional[threading.Event],
+) -> AsyncIterator[List[str]]:
+    """Páginas de IDs de cada plan (conjunto de etiquetas), sin repetir (unión OR)."""
+    seen: Set[str] = set()
+    dedupe = len(plans) > 1
+    yielded = 0
+    for p in plans:
+        async for page in client.list_pages(p.q, p.label_ids, None, stop_event):
+            if dedupe:
+                page = [m for m in page if m not in seen]
+                seen.update(page)
+            if max_fetch:
+                page = page[: max_fetch - yielded]
+            if page:
+                yielded += len(page)
+                yield page
+            if max_fetch and yielded >= max_fetch:
+                return
+
+
+async def stream_action(
+    client: AsyncGmail,
+    q: Optional[str],
+    label_sets: List[Optional[List[str]]],
+    max_fetch: Optional[int],
+    batch_size: int,
+    concurrency: int,
+    progress_cb: Optional[Callable[[int, int], None]],
+    stop_event: Optional[threading.Event],
+    action_type: str,
+    label_changes: Optional[Tuple[List[str], List[str]]] = None,
+    on_chunk: Optional[Callable[[List[str]], None]] = None,
+    count_mode: Optional[str] = None,
+) -> Tuple[int, int]:
+    """
+    Equivalente asíncrono de messages._stream_action_from_ids sobre una
+    consulta (y uno o varios conjuntos de etiquetas). Devuelve (estimado, procesados).
+    """
+    plans = await asyncio.gather(*(_plan(q, l) for l in label_sets))
+    # Con varios conjuntos (OR) max_fetch recorta la unión, no cada uno
+    cap = max_fetch if len(plans) == 1 else None
+    ests = await asyncio.gather(
+        *(asyncio.to_thread(planner.job_total, p, cap, count_mode) for p in plans)
+    )
+    est_total = sum(ests)
+    live = counting.LiveCount(min(est_total, max_fetch) if max_fetch else est_total)
+    if progress_cb:
+        messages._report_progress(progress_cb, 0, live)
+
+    batch_size = max(
+        1, min(int(batch_size or messages.BATCH_LIMIT), messages.BATCH_LIMIT)
+    )
+    in_flight = max(1, min(int(concurrency or 1), client.max_in_flight))
+    meter.note_concurrency(in_flight)
+    done = 0
+    pending: Set[asyncio.Future] = set()
+
+    async def collect(return_when) -> None:
+        nonlocal done, pending
+        if not pending:
+            return
+        finished, pending = await asyncio.wait(pending, return_when=return_when)
+        for f in finished:
+            try:
+                done += f.result()
+            except PermissionError:
+                raise
+            except Exception:
+                pass
+            if progress_cb:
+                messages._report_progress(progress_cb, done, live)
+
+    def submit(chunk: List[str]) -> None:
+        pending.add(
+            asyncio.ensure_future(
+                _run_chunk(
+                    client, chunk, action_type, label_changes, stop_event, on_chunk
+                )
+            )
+        )
+
+    current: List[str] = []
+    try:
+        async for page in _iter_selection(client, plans, max_fetch, stop_event):
+            live.listed += len(page)
+            current.extend(page)
+            while len(current) >= batch_size:
+                submit(current[:batch_size])
+                del current[:batch_size]
+                if len(pending) >= in_flight:
+                    with tracing.span("queue_full", size=len(pending)):
+                        await collect(asyncio.FIRST_COMPLETED)
+            if stop_event and stop_event.is_set():
+                break
+        else:
+            live.exact = True
+        if current and not (stop_event and stop_event.is_set()):
+            submit(current)
+        await collect(asyncio.ALL_COMPLETED)
+    finally:
+        for f in pending:
+            f.cancel()
+
+    if progress_cb:
+        # Con el listado agotado el LiveCount ya es exacto: la barra cierra
+        messages._report_progress(progress_cb, done, live)
+    return est_total, done
+
+
+# ---------- entradas síncronas ----------
+def run(job: Callable[[AsyncGmail], Awaitable[T]], **client_kwargs) -> T:
+    """Ejecuta `job(client)` en un bucle nuevo (desde cualquier hilo sin bucle)."""
+
+    async def main():
+        async with AsyncGmail(**client_kwargs) as client:
+            return await job(client)
+
+    return asyncio.run(main())
+
+
+def run_action(
+    q: Optional[str],
+    label_sets: List[Optional[List[str]]],
+    max_fetch: Optional[int],
+    concurrency: int,
+    batch_size: int,
+    progress_cb: Optional[Callable[[int, int], None]],
+    stop_event: Optional[threading.Event],
+    action_type: str,
+    label_changes: Optional[Tuple[List[str], List[str]]] = None,
+    on_chunk: Optional[Callable[[List[str]], None]] = None,
+    count_mode: Optional[str] = None,
+) -> Tuple[int, int]:
+    return run(
+        lambda client: stream_action(
+            client,
+            q,
+            label_sets,
+            max_fetch,
+            batch_size,
+            concurrency,
+            progress_cb,
+            stop_event,
+            action_type,
+            label_changes,
+            on_chunk,
+            count_mode,
+        )
+    )
+
+
+def list_ids(
+    queries: Sequence[Tuple[Optional[str], Optional[List[str]]]],
+) -> List[List[str]]:
+    """IDs de varias (q, labelIds), listadas a la vez con el motor asyncio."""
+
+    async def collect(client: AsyncGmail, q, label_ids) -> List[str]:
+        p = await _plan(q, label_ids)
+        out: List[str] = []
+        async for page in client.list_pages(p.q, p.label_ids):
+            out.extend(page)
+        return out
+
+    async def job(client: AsyncGmail) -> List[List[str]]:
+        return list(await asyncio.gather(*(collect(client, q, l) for q, l in queries)))
+
+    return run(job)
+
+
+def fetch_metadata(
+    ids: Iterable[str],
+    headers: Sequence[str] = ("From",),
+    fields: str = METADATA_FIELDS,
+) -> List[Dict]:
+    """messages.get(metadata) de todos los IDs con el motor asyncio."""
+
+    async def job(client: AsyncGmail) -> List[Dict]:
+        out: List[Dict] = []
+        async for chunk in client.iter_metadata(ids, headers, fields):
+            out.extend(chunk)
+        return out
+
+    return run(job)
+
+
+def fetch_metadata_for_query(
+    q: Optional[str],
+    max_total: Optional[int] = None,
+    headers: Sequence[str] = ("From",),
+    fields: str = METADATA_FIELDS,
+    on_message: Optional[Callable[[Dict], None]] = None,
+) -> List[Dict]:
+    """
+    Lista y descarga metadata a la vez: cada página lanza sus lotes al llegar,
+    con como mucho ``max_in_flight`` lotes en vuelo (el listado espera a que
+    acabe uno antes de lanzar el siguiente). Con `on_message` cada mensaje se
+    entrega al completar su lote y no se acumula nada (memoria acotada en
+    buzones enormes).
+    """
+
+    async def fetch(client: AsyncGmail, chunk: List[str]) -> List[Dict]:
+        got = await client.get_metadata_batch(chunk, headers, fields)
+        if on_message is None:
+            return got
+        for msg in got:
+            on_message(msg)
+        return []
+
+    async def job(client: AsyncGmail) -> List[Dict]:
+        out: List[Dict] = []
+        slots = asyncio.Semaphore(client.max_in_flight)
+        running: Set[asyncio.Future] = set()
+
+        def done(task: asyncio.Future) -> None:
+            running.discard(task)
+            slots.release()
+            if not task.cancelled() and task.exception() is None:
+                out.extend(task.result())
+
+        p = await _plan(q, None)
+        async for page in client.list_pages(p.q, p.label_ids, max_total):
+            for i in range(0, len(page), BATCH_GET_LIMIT):
+                await slots.acquire()  # contrapresión: no listar por delante
+                task = asyncio.ensure_future(
+                    fetch(client, page[i : i + BATCH_GET_LIMIT])
+                )
+                running.add(task)
+                task.add_done_callback(done)
+        if running:
+            await asyncio.wait(set(running))
+        return out
+
+    return run(job)
+
+
+def list_labels_with_counts(base: Optional[List[Dict]] = None) -> List[Dict]:
+    return run(lambda client: client.label_counts(base))
@@ -0,0 +1,122 @@
+"""
+Capa central de peticiones a la Gmail API.
+
+Todas las llamadas del paquete se construyen con `request()` / `execute()`,
+que aplican la máscara ``fields`` mínima registrada para cada operación en
+FIELDS y piden la respuesta comprimida (``Accept-Encoding: gzip``). Así no
+se descargan ni se parsean cuerpos que nadie lee.
+
+Una operación sin entrada en FIELDS es un error: cada llamada nueva debe
+registrar su máscara (``None`` sólo para respuestas sin cuerpo).
+"""
+
+from typing import Dict, Optional
+
+from . import accounts
+from .service import get_gmail_service
+
+USER_ID = "me"
+
+# operación ("recurso.método") -> máscara mínima; None = respuesta sin cuerpo
+FIELDS: Dict[str, Optional[str]] = {
+    "getProfile": "emailAddress,historyId,messagesTotal",
+    "messages.list": "messages/id,nextPageToken,resultSizeEstimate",
+    "messages.get": "id,threadId,labelIds,sizeEstimate,internalDate,payload/headers",
+    "messages.modify": "id",
+    "messages.trash": "id",
+    "messages.untrash": "id",
+    "messages.batchModify": None,
+    "messages.batchDelete": None,
+    "messages.delete": None,
+    "labels.list": "labels(id,name,type)",
+    "labels.get": (
+        "id,name,type,color,messagesTotal,messagesUnread,threadsTotal,threadsUnread"
+    ),
+    "labels.create": "id,name",
+    "labels.update": "id,name",
+    "labels.delete": None,
+    "settings.filters.list": "filter(id,criteria,action)",
+    "settings.filters.create": "id,criteria,action",
+    "settings.filters.delete": None,
+    "threads.list": "threads/id,nextPageToken,resultSizeEstimate",
+    "threads.get": "id,messages(id,labelIds,sizeEstimate,internalDate,payload/headers)",
+    "threads.modify": "id",
+    "threads.trash": "id",
+    "threads.untrash": "id",
+    "threads.delete": None,
+    "history.list": "history(id,messagesAdded,messagesDeleted,labelsAdded,labelsRemoved),historyId,nextPageToken",
+}
+
+# Unidades de cuota por operación (tabla pública de la Gmail API)
+QUOTA_UNITS: Dict[str, int] = {
+    "getProfile": 1,
+    "messages.list": 5,
+    "messages.get": 5,
+    "messages.modify": 5,
+    "messages.trash": 5,
+    "messages.untrash": 5,
+    "messages.delete": 10,
+    "messages.batchModify": 50,
+    "messages.batchDelete": 50,
+    "labels.list": 1,
+    "labels.get": 1,
+    "labels.create": 5,
+    "labels.update": 5,
+    "labels.delete": 5,
+    "settings.filters.list": 1,
+    "settings.filters.get": 1,
+    "settings.filters.create": 5,
+    "settings.filters.delete": 5,
+    "history.list": 2,
+    "threads.list": 10,
+    "threads.get": 10,
+    "threads.modify": 10,
+    "threads.trash": 10,
+    "threads.untrash": 10,
+    "threads.delete": 20,
+}
+
+# Máscaras más estrechas para usos concretos
+SENDER_FIELDS = "id,payload/headers"  # messages.get sólo para leer remitentes
+PROFILE_FIELDS = "id,labelIds,sizeEstimate,internalDate,payload/headers"  # perfiles
+SNAPSHOT_FIELDS = (
+    "id,threadId,labelIds,sizeEstimate,internalDate,payload/headers"  # snapshot.py
+)
+# backtest.py: cabeceras + mimeType (adjuntos) + snippet (palabras sueltas)
+BACKTEST_FIELDS = (
+    "id,labelIds,sizeEstimate,internalDate,snippet,payload(mimeType,headers)"
+)
+# duplicates.py: Message-ID/Date/From/Subject + lo que decide qué copia queda
+DUPLICATE_FIELDS = "id,labelIds,sizeEstimate,internalDate,payload/headers"
+# export.py: mensaje completo en RFC 822 (base64url) + lo necesario para mbox
+RAW_FIELDS = "id,threadId,labelIds,internalDate,raw"
+LABEL_IDS_FIELDS = "labels(id,name)"  # labels.list sólo para resolver nombres
+THREAD_MESSAGE_IDS_FIELDS = "id,messages/id"  # threads.get para expandir a mensajes
+THREAD_SENDER_FIELDS = "id,messages/payload/headers"  # threads.get para remitentes
+
+
+def request(op: str, service=None, fields: Optional[str] = None, **params):
+    """
+    HttpRequest de googleapiclient para `op` (p. ej. "labels.get") con su
+    máscara y gzip; `fields` permite una máscara aún más estrecha.
+    """
+    if op not in FIELDS:
+        raise KeyError(f"Operación sin máscara registrada en api.FIELDS: {op}")
+    # Presupuesto de cuota de la cuenta activa (sin límite si no se configuró)
+    accounts.budget().acquire(QUOTA_UNITS.get(op, 5))
+    svc = service or get_gmail_service()
+    *path, method = op.split(".")
+    resource = svc.users()
+    for name in path:
+        resource = getattr(resource, name)()
+    mask = fields or FIELDS[op]
+    if mask:
+        params["fields"] = mask
+    req = getattr(resource, method)(userId=USER_ID, **params)
+    req.headers["accept-encoding"] = "gzip"
+    return req
+
+
+def execute(op: str, service=None, fields: Optional[str] = None, **params):
+    """Construye y ejecuta `op` (ver `request`)."""
+    return request(op, service, fields, **params).execute()
@@ -4,7 +4,8 @@ from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 
-from .config import SCOPES, TOKEN_FILE, CREDENTIALS_PATH
+from . import accounts
+from .config import SCOPES
 
 
 def _has_required_scopes(creds: Optional[Credentials]) -> bool:
@@ -17,13 +18,16 @@ def _has_required_scopes(creds: Optional[Credentials]) -> bool:
 def get_credentials(force_reauth: bool = False) -> Credentials:
     """
     Devuelve credenciales válidas. Si no existen, están inválidas o carecen de scopes,
-    abre el flujo OAuth y guarda token.json.
+    abre el flujo OAuth y guarda token.json (el token de la cuenta activa,
+    ver accounts.py).
     """
     creds: Optional[Credentials] = None
+    token_file = accounts.token_file()
+    credentials_path = accounts.credentials_path()
 
-    if not force_reauth and os.path.exists(TOKEN_FILE):
+    if not force_reauth and os.path.exists(token_file):
         try:
-            creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+            creds = Credentials.from_authorized_user_file(token_file, SCOPES)
         except Exception:
             creds = None
 
@@ -41,13 +45,16 @@ def get_credentials(force_reauth: bool = False) -> Credentials:
         or (not creds.valid)
         or (not _has_required_scopes(creds))
     ):
-        if not os.path.exists(CREDENTIALS_PATH):
+        if not os.path.exists(credentials_path):
             raise FileNotFoundError(
-                f"No se encontró {CREDENTIALS_PATH}. Coloca tus credenciales OAuth."
+                f"No se encontró {credentials_path}. Coloca tus credenciales OAuth."
             )
-        flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_PATH, SCOPES)
+        flow = InstalledAppFlow.from_client_secrets_file(credentials_path, SCOPES)
         creds = flow.run_local_server(port=0)
-        with open(TOKEN_FILE, "w") as token:
+        token_dir = os.path.dirname(token_file)
+        if token_dir:
+            os.makedirs(token_dir, exist_ok=True)
+        with open(token_file, "w") as token:
             token.write(creds.to_json())
 
     return creds
@@ -56,17 +63,18 @@ def get_credentials(force_reauth: bool = False) -> Credentials:
 def delete_token_file() -> None:
     """Elimina token.json para forzar reautenticación en el próximo uso."""
     try:
-        os.remove(TOKEN_FILE)
+        os.remove(accounts.token_file())
     except FileNotFoundError:
         pass
 
 
 def current_token_scopes() -> List[str]:
     """Lee los scopes actuales del token, si existe."""
-    if not os.path.exists(TOKEN_FILE):
+    token_file = accounts.token_file()
+    if not os.path.exists(token_file):
         return []
     try:
-        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+        creds = Credentials.from_authorized_user_file(token_file, SCOPES)
         return list(creds.scopes or [])
     except Exception:
         return []
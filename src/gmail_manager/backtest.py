@@ -0,0 +1,200 @@
+"""
+Previsualización instantánea de filtros sobre metadata cacheada en local.
+
+`load_cache()` descarga una vez la metadata de una muestra del buzón (From,
+To, Subject, etiquetas, tamaño, fecha, snippet) y la guarda en memoria por
+cuenta. `backtest(criteria)` traduce los ``criteria`` de un filtro (la misma
+forma que acepta filters.create_filter) a una consulta, la compila con
+query.compile_query y la evalúa sobre la caché sin llamadas a la API:
+devuelve cuántos mensajes cogería, una muestra y el tamaño afectado.
+
+La evaluación local es una aproximación (ver query.py): subcadenas en vez de
+tokens, fechas en UTC, adjuntos deducidos del mimeType. `backtest` devuelve
+en ``warnings`` los motivos concretos por los que el resultado puede diferir
+del de Gmail para esos criterios.
+"""
+
+import threading
+import time
+from email.utils import parseaddr
+from typing import Dict, List, Optional
+
+from . import accounts, api, filters, planner, search
+from . import query as gq
+from .profiling import profiled
+
+CACHE_LIMIT = 20000  # mensajes más recientes que se cachean
+CACHE_TTL = 900  # segundos hasta considerar la caché vieja
+SAMPLE_SIZE = 20
+VIEW_HEADERS = ["From", "To", "Subject", "Date"]
+
+_caches: Dict[Optional[str], "MetadataCache"] = {}
+_caches_lock = threading.Lock()
+
+
+def message_view(msg: Dict) -> gq.MessageView:
+    """MessageView de una respuesta de messages.get con api.BACKTEST_FIELDS."""
+    mime = (msg.get("payload") or {}).get("mimeType", "")
+    return gq.MessageView(
+        sender=search._header(msg, "From"),
+        to=search._header(msg, "To"),
+        subject=search._header(msg, "Subject"),
+        labels=set(msg.get("labelIds", []) or []),
+        date=search._timestamp(msg),
+        size=int(msg.get("sizeEstimate", 0) or 0),
+        has_attachment=mime.startswith("multipart/mixed"),
+        snippet=msg.get("snippet", ""),
+    )
+
+
+class MetadataCache:
+    """Metadata de una muestra del buzón como (id, MessageView)."""
+
+    def __init__(self, q: str = "", limit: Optional[int] = CACHE_LIMIT):
+        self.q = q
+        self.limit = limit
+        self.rows: List = []
+        self.loaded_at = 0.0
+        self.complete = False
+
+    def load(self) -> "MetadataCache":
+        rows = []
+
+        def on_message(msg: Dict) -> None:
+            rows.append((msg["id"], message_view(msg)))
+
+        search._scan_sample(
+            self.q, self.limit, VIEW_HEADERS, api.BACKTEST_FIELDS, on_message
+        )
+        self.rows = rows
+        self.loaded_at = time.time()
+        self.complete = not self.limit or len(rows) < self.limit
+        return self
+
+    @property
+    def stale(self) -> bool:
+        return time.time() - self.loaded_at > CACHE_TTL
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+@profiled("backtest_cache")
+def load_cache(
+    q: str = "", limit: Optional[int] = CACHE_LIMIT, refresh: bool = False
+) -> MetadataCache:
+    """Caché de la cuenta activa; se descarga la primera vez o con refresh."""
+    key = accounts.current()
+    cache = _caches.get(key)
+    if cache is None or refresh or cache.q != q or cache.limit != limit:
+        cache = MetadataCache(q, limit).load()
+        with _caches_lock:
+            _caches[key] = cache
+    return cache
+
+
+def cached() -> Optional[MetadataCache]:
+    """Caché ya cargada de la cuenta activa, sin tocar la red."""
+    return _caches.get(accounts.current())
+
+
+# ---------- divergencias con Gmail ----------
+def _warnings(criteria: Dict, q: str, unsupported: List[str], cache) -> List[str]:
+    out = []
+    if unsupported:
+        out.append(
+            "Términos que no se evalúan en local (se tratan como coincidencia): "
+            + ", ".join(unsupported)
+        )
+    terms = list(gq.iter_terms(gq.parse(q)))
+    if any(t.op in (None, "from", "to", "subject") for t, _ in terms):
+        out.append(
+            "Gmail busca por palabras completas; en local se compara por "
+            "subcadena y puede coger de más."
+        )
+    if any(t.op is None for t, _ in terms):
+        out.append(
+            "Las palabras sueltas sólo se buscan en asunto, remitente y snippet."
+        )
+    if criteria.get("to"):
+        out.append("to: en local sólo mira la cabecera To (Gmail incluye Cc/Bcc).")
+    if criteria.get("hasAttachment") or any(
+        t.op == "has" and t.value.lower() == "attachment" for t, _ in terms
+    ):
+        out.append("Los adjuntos se deducen del mimeType (multipart/mixed).")
+    if any(t.op in ("after", "before", "older", "newer") for t, _ in terms):
+        out.append("Las fechas se evalúan en UTC, no en la zona de la cuenta.")
+    if criteria.get("size"):
+        out.append("El tamaño es sizeEstimate; Gmail redondea distinto.")
+    if not cache.complete:
+        out.append(
+            f"La caché sólo tiene los {len(cache)} mensajes más recientes: "
+            "el conteo real será mayor."
+        )
+    if cache.stale:
+        out.append("La caché tiene más de 15 minutos; recárgala si hay correo nuevo.")
+    return out
+
+
+# ---------- PUBLIC ----------
+def compile_criteria(criteria: Dict, unsupported: Optional[List[str]] = None):
+    """Predicado sobre MessageView para los `criteria` de un filtro."""
+    q = filters.criteria_to_query(criteria)
+    resolver = planner._label_resolver() if "label:" in q else None
+    return gq.compile_query(gq.parse(q), resolver, unsupported=unsupported)
+
+
+def backtest(
+    criteria: Dict,
+    cache: Optional[MetadataCache] = None,
+    sample_size: int = SAMPLE_SIZE,
+) -> Dict:
+    """
+    Evalúa los criterios sobre la caché: ``{"count", "bytes", "sample",
+    "scanned", "complete", "query", "warnings", "seconds"}``. Sin criterios
+    el filtro cogería todo el correo nuevo; se devuelve count 0 y un aviso.
+    """
+    cache = cache or cached() or load_cache()
+    q = filters.criteria_to_query(criteria)
+    t0 = time.perf_counter()
+    if not q:
+        return {
+            "count": 0,
+            "bytes": 0,
+            "sample": [],
+            "scanned": len(cache),
+            "complete": cache.complete,
+            "query": "",
+            "warnings": ["Sin criterios: el filtro se aplicaría a todo el correo."],
+            "seconds": 0.0,
+        }
+    unsupported: List[str] = []
+    pred = compile_criteria(criteria, unsupported)
+    count = 0
+    total = 0
+    sample = []
+    for mid, view in cache.rows:
+        if not pred(view):
+            continue
+        count += 1
+        total += view.size
+        if len(sample) < sample_size:
+            sample.append(
+                {
+                    "id": mid,
+                    "from": parseaddr(view.sender)[1] or view.sender,
+                    "subject": view.subject,
+                    "date": view.date,
+                    "size": view.size,
+                }
+            )
+    return {
+        "count": count,
+        "bytes": total,
+        "sample": sample,
+        "scanned": len(cache),
+        "complete": cache.complete,
+        "query": q,
+        "warnings": _warnings(criteria, q, unsupported, cache),
+        "seconds": round(time.perf_counter() - t0, 4),
+    }
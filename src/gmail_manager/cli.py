@@ -0,0 +1,918 @@
+"""
+Interfaz de línea de comandos (`inboxzero <comando>`).
+
+Sin argumentos, `inboxzero` abre la GUI. Los comandos masivos usan el perfil
+de lote/concurrencia calibrado (`inboxzero calibrate`) salvo que se indique
+--batch-size / --concurrency. Con ``--account`` (repetible) o
+``--all-accounts`` trash/delete/senders/count corren en varias cuentas a la
+vez (accounts.run_many) con un resumen combinado.
+"""
+
+import argparse
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+from . import (
+    accounts,
+    backtest,
+    counting,
+    duplicates,
+    export,
+    filters,
+    journal,
+    labels,
+    messages,
+    meter,
+    rules,
+    search,
+    selection,
+    snapshot,
+    threads,
+    tuning,
+)
+from .config import RULES_FILE
+
+
+def _progress() -> meter.Meter:
+    """progress_cb de un trabajo: ritmo, ETA, reintentos... en una línea."""
+
+    def render(snap: meter.Snapshot) -> None:
+        sys.stderr.write(f"\rProgreso: {snap.describe()}\x1b[K")
+        sys.stderr.flush()
+
+    return meter.Meter(render)
+
+
+def _end_progress(prog: meter.Meter) -> None:
+    prog.close()
+    sys.stderr.write("\n")
+
+
+def _multi_progress() -> Callable[[Optional[str], int, int], None]:
+    """Progreso de varias cuentas en una sola línea."""
+    state: Dict[str, str] = {}
+    lock = threading.Lock()
+
+    meters: Dict[str, meter.Meter] = {}
+
+    def render(name: str, snap: meter.Snapshot) -> None:
+        eta = "" if snap.eta is None else f" ETA {meter._clock(snap.eta)}"
+        with lock:
+            state[name] = f"{snap.done}/{snap.total} {snap.rate:.0f}/s{eta}"
+            line = " | ".join(f"{k}: {v}" for k, v in sorted(state.items()))
+            sys.stderr.write(f"\r{line}\x1b[K")
+            sys.stderr.flush()
+
+    def cb(account: Optional[str], done: int, total: int) -> None:
+        name = account or "(defecto)"
+        with lock:
+            if name not in meters:
+                meters[name] = meter.Meter(lambda snap: render(name, snap))
+        meters[name](done, total)
+
+    return cb
+
+
+def _run_accounts(args, job: Callable[..., Dict]) -> Dict:
+    """run_many sobre las cuentas de la línea de comandos; informa fallos."""
+    out = accounts.run_many(args.accounts, job, progress_cb=_multi_progress())
+    sys.stderr.write("\n")
+    for name, r in out["accounts"].items():
+        if not r["ok"]:
+            print(f"[{name}] ERROR: {r['error']}")
+    return out
+
+
+def _confirm(text: str) -> bool:
+    try:
+        return input(f"{text} [s/N] ").strip().lower() in ("s", "si", "sí", "y", "yes")
+    except EOFError:
+        return False
+
+
+def _cmd_calibrate(args) -> int:
+    def prog(i, n):
+        sys.stderr.write(f"\rSonda {i}/{n}")
+        sys.stderr.flush()
+
+    res = tuning.calibrate(sample_size=args.sample, q=args.query, progress_cb=prog)
+    sys.stderr.write("\n")
+    for r in res["results"]:
+        print(
+            f"lote={r['batch_size']:>5} paralelo={r['concurrency']:>2} "
+            f"{r['msgs_per_sec']:>9.1f} msg/s  errores={r['error_rate']:.3f}"
+        )
+    best = res["best"]
+    print(
+        f"Perfil guardado para {res['email'] or res['account']}: lote={best['batch_size']} "
+        f"paralelo={best['concurrency']}"
+    )
+    return 0
+
+
+def _bulk_job(args, action: str, progress_cb) -> Dict:
+    tuned_batch, tuned_conc = tuning.recommended(action)
+    batch_size = args.batch_size or tuned_batch
+    concurrency = args.concurrency or tuned_conc
+    if args.threads:
+        fn = (
+            threads.delete_threads_by_query
+            if action == "DELETE"
+            else threads.trash_threads_by_query
+        )
+        res = fn(
+            args.query,
+            protect_starred=not args.include_starred,
+            max_threads=args.max,
+            concurrency=concurrency,
+            progress_cb=progress_cb,
+        )
+    else:
+        fn = (
+            messages.delete_permanently_by_query_fast
+            if action == "DELETE"
+            else messages.trash_by_query_fast
+        )
+        res = fn(
+            args.query,
+            protect_starred=not args.include_starred,
+            max_fetch=args.max,
+            concurrency=concurrency,
+            batch_size=batch_size,
+            progress_cb=progress_cb,
+        )
+    res.update(batch_size=batch_size, concurrency=concurrency)
+    return res
+
+
+def _cmd_bulk(args) -> int:
+    action = "DELETE" if args.command == "delete" else "TRASH"
+    q2 = messages._safe_query(args.query, not args.include_starred)
+    if not args.yes:
+        verb = "ELIMINAR PERMANENTEMENTE" if action == "DELETE" else "Enviar a PAPELERA"
+        where = f" en {len(args.accounts)} cuentas" if len(args.accounts) > 1 else ""
+        if not _confirm(f"¿{verb} los correos que coincidan con '{q2}'{where}?"):
+            print("Cancelado.")
+            return 1
+    unit = "hilos" if args.threads else "mensajes"
+    if len(args.accounts) > 1:
+        out = _run_accounts(
+            args, lambda progress_cb: _bulk_job(args, action, progress_cb)
+        )
+        for name, r in out["accounts"].items():
+            if r["ok"]:
+                res = r["result"]
+                print(
+                    f"[{name}] {action}: {res['processed']} {unit} | "
+                    f"Estimado: {res['estimated']} | {r['seconds']:.1f}s"
+                )
+        total = out["summary"]
+        print(
+            f"Total {action}: {total.get('processed', 0)} {unit} en "
+            f"{total['accounts'] - total['failed']}/{total['accounts']} cuentas"
+        )
+        return 1 if total["failed"] else 0
+    prog = _progress()
+    res = _bulk_job(args, action, prog)
+    _end_progress(prog)
+    print(
+        f"{action}: {res['processed']} {unit} procesados | Estimado: {res['estimated']} "
+        f"| Lote={res['batch_size']} Paralelo={res['concurrency']} "
+        f"| Query: '{res['query_used']}'"
+    )
+    if res.get("journal"):
+        print(f"Para deshacer: inboxzero journal restore {res['journal']}")
+    return 0
+
+
+def _cmd_senders(args) -> int:
+    limit = None if args.all else args.max
+    if len(args.accounts) > 1:
+        return _senders_many(args, limit)
+    if args.approx:
+        sketch = search.sender_sketch(args.query, args.approx, args.regex, limit)
+        for email, count, error in sketch.top(args.top):
+            print(f"{count:>8} ±{error:<6} {email}")
+        print(
+            f"{sketch.total} mensajes | {len(sketch)} contadores | "
+            f"error máx. {sketch.error_bound}"
+        )
+        return 0
+    for email, count in search.top_senders(
+        args.query, args.top, args.regex, max_messages=limit
+    ):
+        print(f"{count:>8} {email}")
+    return 0
+
+
+def _senders_many(args, limit: Optional[int]) -> int:
+    """Top de remitentes sumado entre cuentas (Space-Saving se fusiona)."""
+    if args.approx:
+        job = lambda progress_cb: {
+            "sketch": search.sender_sketch(args.query, args.approx, args.regex, limit)
+        }
+    else:
+        # Sin --top por cuenta: un remitente repartido podría quedarse fuera
+        job = lambda progress_cb: {
+            "top": search.top_senders(args.query, None, args.regex, max_messages=limit)
+        }
+    out = _run_accounts(args, job)
+    done = [r["result"] for r in out["accounts"].values() if r["ok"]]
+    if args.approx:
+        sketches = [d["sketch"] for d in done]
+        merged = sketches[0] if sketches else None
+        for sk in sketches[1:]:
+            merged = merged.merge(sk)
+        if merged is not None:
+            for email, count, error in merged.top(args.top):
+                print(f"{count:>8} ±{error:<6} {email}")
+            print(f"{merged.total} mensajes | error máx. {merged.error_bound}")
+    else:
+        combined: Counter = Counter()
+        for d in done:
+            combined.update(dict(d["top"]))
+        rows = sorted(combined.items(), key=lambda kv: (-kv[1], kv[0]))
+        for email, count in rows[: args.top]:
+            print(f"{count:>8} {email}")
+    return 1 if out["summary"]["failed"] else 0
+
+
+def _cmd_count(args) -> int:
+    mode = "exact" if args.exact else "estimate"
+    kwargs = {"shards": args.shards}
+    if not args.exact:
+        kwargs["time_budget"] = args.budget
+    if len(args.accounts) > 1:
+        out = _run_accounts(
+            args,
+            lambda progress_cb: counting.count_matches(args.query, mode=mode, **kwargs),
+        )
+        for name, r in out["accounts"].items():
+            if r["ok"]:
+                print(f"[{name}] {r['result']['count']}")
+        total = out["summary"]
+        print(f"Total: {total.get('count', 0)} en {total['accounts']} cuentas")
+        return 1 if total["failed"] else 0
+    res = counting.count_matches(args.query, mode=mode, **kwargs)
+    if res["exact"]:
+        print(f"{res['count']} (exacto)")
+    else:
+        print(f"{res['count']} (IC 95%: {res['low']}–{res['high']})")
+    return 0
+
+
+def _cmd_select(args) -> int:
+    lids = [labels.get_label_id_by_name(l) or l for l in args.label]
+    parts = [selection.query(q) for q in args.query]
+    if lids:
+        parts.append(selection.labels(*lids, match_all=args.all_labels))
+    if not parts:
+        print("Indica al menos --query o --label.")
+        return 2
+    sel = parts[0]
+    for p in parts[1:]:
+        sel = sel | p
+    if args.vip:
+        sel = sel & selection.senders_file(args.vip)
+    for q in args.minus:
+        sel = sel - selection.query(q)
+    if not args.include_starred:
+        sel = sel - selection.query("is:starred")
+
+    if args.action == "count":
+        print(f"{len(selection.evaluate(sel))} mensajes | {sel!r}")
+        return 0
+    action = args.action.upper()
+    if not args.yes and not _confirm(f"¿{action} los mensajes de {sel!r}?"):
+        print("Cancelado.")
+        return 1
+    batch_size, concurrency = tuning.recommended(action)
+    prog = _progress()
+    res = selection.run_action(
+        sel,
+        action,
+        protect_starred=False,  # ya restado arriba salvo --include-starred
+        concurrency=concurrency,
+        batch_size=batch_size,
+        progress_cb=prog,
+    )
+    _end_progress(prog)
+    print(f"{action}: {res['processed']} de {res['matched']} | {res['selection']}")
+    if res.get("journal"):
+        print(f"Para deshacer: inboxzero journal restore {res['journal']}")
+    return 0
+
+
+def _cmd_filters_apply(args) -> int:
+    fl = filters.list_filters()
+    if args.ids:
+        fl = [f for f in fl if f.get("id") in set(args.ids)]
+    if not fl:
+        print("No hay filtros que aplicar.")
+        return 1
+    for f in fl:
+        q = filters.criteria_to_query(f.get("criteria", {}))
+        print(f"{f.get('id')}: '{q}' -> {f.get('action')}")
+    if args.dry_run:
+        res = filters.apply_filters(fl, dry_run=True)
+    else:
+        if not args.yes and not _confirm(
+            f"¿Aplicar {len(fl)} filtro(s) al correo existente?"
+        ):
+            print("Cancelado.")
+            return 1
+        batch_size, concurrency = tuning.recommended("MODIFY")
+        prog = _progress()
+        res = filters.apply_filters(
+            fl,
+            protect_starred=not args.include_starred,
+            concurrency=concurrency,
+            batch_size=batch_size,
+            progress_cb=prog,
+        )
+        _end_progress(prog)
+    for g in res["groups"]:
+        print(
+            f"{g['count']:>8} +{','.join(g['add']) or '-'} -{','.join(g['remove']) or '-'}"
+        )
+    print(
+        f"{res['processed']} de {res['matched']} mensajes | "
+        f"{res['queries']} consultas listadas para {res['filters']} filtros"
+    )
+    if res.get("journal"):
+        print(f"Para deshacer: inboxzero journal restore {res['journal']}")
+    return 0
+
+
+def _cmd_filters_export(args) -> int:
+    n = filters.export_filters(args.path)
+    print(f"{n} filtros exportados a {args.path}")
+    return 0
+
+
+def _print_redundant(redundant) -> None:
+    for f, orig in redundant["duplicates"]:
+        q = filters.criteria_to_query(f.get("criteria", {}))
+        print(f"  duplicado: '{q}'")
+    for f, by in redundant["subsumed"]:
+        q = filters.criteria_to_query(f.get("criteria", {}))
+        q2 = filters.criteria_to_query(by.get("criteria", {}))
+        print(f"  subsumido: '{q}' (ya lo cubre '{q2}')")
+
+
+def _cmd_filters_import(args) -> int:
+    plan = filters.import_filters(args.path, prune=args.prune, dry_run=True)
+    diff = plan["diff"]
+    for line in filters.format_diff(diff):
+        if not line.startswith("=") or args.verbose:
+            print(line)
+    if plan["redundant"]["duplicates"] or plan["redundant"]["subsumed"]:
+        print("Redundantes en el fichero:")
+        _print_redundant(plan["redundant"])
+    print(
+        f"{len(diff['create'])} a crear | {len(diff['delete'])} a borrar | "
+        f"{len(diff['unchanged'])} sin cambios"
+    )
+    if args.dry_run or not (diff["create"] or diff["delete"]):
+        return 0
+    if not args.yes and not _confirm("¿Aplicar estos cambios?"):
+        print("Cancelado.")
+        return 1
+    # Se recalcula con las etiquetas ya creadas/resueltas en esta cuenta
+    res = filters.import_filters(args.path, prune=args.prune)["result"]
+    for fail in res["failed"]:
+        print(f"ERROR {fail['op']}: {fail['error']}")
+    print(f"Creados {res['created']} | Borrados {res['deleted']}")
+    return 1 if res["failed"] else 0
+
+
+def _cmd_filters_dedupe(args) -> int:
+    plan = filters.dedupe_filters(not args.keep_subsumed, dry_run=True)
+    _print_redundant(plan["redundant"])
+    if not plan["delete"]:
+        print("No hay filtros redundantes.")
+        return 0
+    if args.dry_run:
+        print(f"{len(plan['delete'])} filtros se borrarían.")
+        return 0
+    if not args.yes and not _confirm(f"¿Borrar {len(plan['delete'])} filtros?"):
+        print("Cancelado.")
+        return 1
+    res = filters.apply_diff({"create": [], "delete": plan["delete"], "unchanged": []})
+    print(f"Borrados {res['deleted']} | errores {len(res['failed'])}")
+    return 1 if res["failed"] else 0
+
+
+def _cmd_filters_test(args) -> int:
+    criteria = {
+        "from": args.sender,
+        "to": args.to,
+        "subject": args.subject,
+        "query": args.query,
+        "negatedQuery": args.negated,
+        "hasAttachment": args.has_attachment,
+        "size": args.larger or args.smaller,
+        "sizeComparison": "smaller" if args.smaller else "larger",
+    }
+    criteria = {k: v for k, v in criteria.items() if v}
+    if "size" not in criteria:
+        criteria.pop("sizeComparison", None)
+    cache = backtest.load_cache(limit=args.cache)
+    res = backtest.backtest(criteria, cache, sample_size=args.sample)
+    for row in res["sample"]:
+        print(f"{row['size'] // 1024:>7} KB  {row['from']:<35} {row['subject']}")
+    more = "" if res["complete"] else "+"
+    print(
+        f"{res['count']}{more} de {res['scanned']} mensajes | "
+        f"{res['bytes'] / 2**20:.1f} MB | q='{res['query']}'"
+    )
+    for w in res["warnings"]:
+        print(f"Aviso: {w}")
+    return 0
+
+
+def _cmd_snapshot(args) -> int:
+    if args.snapshot_command == "export":
+        meta = snapshot.export(args.path, args.query, args.max)
+        print(
+            f"{meta['rows']} mensajes | {meta['senders']} remitentes | "
+            f"{len(meta['labels'])} etiquetas -> {args.path}"
+        )
+        if args.pack:
+            print(f"Comprimido: {snapshot.pack(args.path)}")
+        return 0
+    snap = snapshot.load(args.path)
+    mask = snap.has_label(args.label) if args.label else None
+    print(f"{len(snap)} mensajes en la instantánea ('{snap.meta.get('query', '')}')")
+    print("\nRemitentes:")
+    for email, count in snapshot.top_senders(snap, args.top, mask):
+        print(f"{count:>8} {email}")
+    print("\nTamaños:")
+    for low, high, count, total in snapshot.size_histogram(snap, mask=mask):
+        if count:
+            print(f"{low:>12}-{high:<12} {count:>8} msgs {total / 2**20:>10.1f} MB")
+    print(f"\nPor {args.period}:")
+    for period, count, total in snapshot.time_series(snap, args.period, mask):
+        print(f"{period:>10} {count:>8} msgs {total / 2**20:>10.1f} MB")
+    return 0
+
+
+def _print_tick(res: Dict) -> None:
+    stamp = time.strftime("%H:%M:%S")
+    if "error" in res:
+        print(f"[{stamp}] ERROR: {res['error']}")
+        return
+    parts = []
+    for name, r in res["rules"].items():
+        if not r["matched"]:
+            continue
+        text = f"{name}: {r['matched']}"
+        if r["scanned"]:
+            text += " (consulta)"
+        if r["latency"]:
+            text += f" lat. {r['latency']['avg']:.0f}/{r['latency']['max']:.0f} s"
+        parts.append(text)
+    extra = " | reinicio del historial" if res["reset"] else ""
+    print(
+        f"[{stamp}] {res['changed']} cambios ({res['history_pages']} pág.) | "
+        f"{' | '.join(parts) or 'sin coincidencias'} | "
+        f"modificados {res['processed']} borrados {res['deleted']} | "
+        f"{res['seconds']:.2f} s{extra}"
+    )
+
+
+def _cmd_rules(args) -> int:
+    try:
+        loaded = rules.load_rules(args.path, create_labels=args.rules_command == "run")
+    except (OSError, ValueError) as e:
+        print(f"Reglas no válidas: {e}")
+        return 2
+    if args.rules_command == "check":
+        for rule in loaded:
+            print(rule.describe())
+            if rule.unsupported:
+                print(f"    sin evaluación local: {', '.join(rule.unsupported)}")
+        return 0
+    if args.rules_command == "reset":
+        rules.reset_state()
+        print("Estado olvidado: la próxima pasada consultará todas las reglas.")
+        return 0
+    kwargs = {
+        "dry_run": args.dry_run,
+        "backfill": not args.no_backfill,
+        "protect_starred": not args.include_starred,
+    }
+    if args.once or args.dry_run:
+        _print_tick(rules.run_once(loaded, **kwargs))
+        return 0
+    print(f"{len(loaded)} reglas; pasada cada {args.interval:g} s (Ctrl+C para salir)")
+    try:
+        rules.run_daemon(
+            args.path, interval=args.interval, on_tick=_print_tick, **kwargs
+        )
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _cmd_journal(args) -> int:
+    if args.journal_command == "list":
+        found = journal.list_journals()
+        for m in found:
+            created = time.strftime("%Y-%m-%d %H:%M", time.localtime(m["created"]))
+            restored = sum(r["count"] for r in m.get("restores", []))
+            print(
+                f"{m['id']:<22} {created}  {m['count']:>8} msgs  "
+                f"{m['job']:<16} '{m['query']}'"
+                + (f"  (restaurados {restored})" if restored else "")
+                + ("" if m["complete"] else "  [incompleto]")
+            )
+        if not found:
+            print("No hay diarios de papelera vigentes.")
+        return 0
+    if args.journal_command == "prune":
+        print(f"{journal.prune()} diarios caducados eliminados.")
+        return 0
+    try:
+        plan = journal.restore(args.id, dry_run=True)
+    except ValueError as e:
+        print(e)
+        return 1
+    present = plan["recorded"] - plan["missing"]
+    print(
+        f"Diario {plan['journal']}: {present} de {plan['recorded']} mensajes "
+        f"siguen en la Papelera"
+    )
+    for g in plan["groups"]:
+        adds = " ".join(f"+{l}" for l in g["add"])
+        print(f"  {g['count']:>8}  -TRASH {adds}")
+    if args.dry_run or not present:
+        return 0
+    if not args.yes and not _confirm(f"¿Restaurar {present} mensajes?"):
+        print("Cancelado.")
+        return 1
+    batch_size, concurrency = tuning.recommended("MODIFY")
+    prog = _progress()
+    res = journal.restore(
+        plan["journal"],
+        concurrency=args.concurrency or concurrency,
+        batch_size=batch_size,
+        progress_cb=prog,
+    )
+    _end_progress(prog)
+    print(f"Restaurados {res['restored']} mensajes.")
+    return 0
+
+
+def _cmd_duplicates(args) -> int:
+    found = duplicates.find_duplicates(
+        args.query, args.keep, args.max, not args.include_starred
+    )
+    print(
+        f"{found['scanned']} mensajes revisados | {found['groups']} grupos "
+        f"({found['by_message_id']} por Message-ID, {found['by_fingerprint']} por "
+        f"huella) | {found['duplicates']} copias sobrantes "
+        f"({found['bytes'] / 1e6:.1f} MB)"
+    )
+    if found["protected"]:
+        print(f"{found['protected']} copias destacadas no se tocan.")
+    if args.dry_run or not found["duplicates"]:
+        return 0
+    if not args.yes and not _confirm(
+        f"¿Enviar a PAPELERA {found['duplicates']} copias (se conserva la "
+        f"'{args.keep}' de cada grupo)?"
+    ):
+        print("Cancelado.")
+        return 1
+    batch_size, concurrency = tuning.recommended("TRASH")
+    prog = _progress()
+    res = duplicates.remove_duplicates(
+        args.query,
+        batch_size=batch_size,
+        concurrency=concurrency,
+        progress_cb=prog,
+        found=found,
+    )
+    _end_progress(prog)
+    print(f"TRASH: {res['processed']} copias duplicadas")
+    if res["journal"]:
+        print(f"Para deshacer: inboxzero journal restore {res['journal']}")
+    return 0
+
+
+def _cmd_export(args) -> int:
+    fmt = "eml" if args.eml else "mbox"
+    if args.delete and not args.yes:
+        q2 = messages._safe_query(args.query, not args.include_starred)
+        if not _confirm(
+            f"¿Exportar '{q2}' a {args.path} y después ELIMINAR PERMANENTEMENTE "
+            "lo exportado?"
+        ):
+            print("Cancelado.")
+            return 1
+    try:
+        prog = _progress()
+        res = export.export_messages(
+            args.query,
+            args.path,
+            fmt=fmt,
+            resume=not args.no_resume,
+            max_messages=args.max,
+            concurrency=args.concurrency,
+            delete=args.delete,
+            protect_starred=not args.include_starred,
+            progress_cb=prog,
+        )
+    except ValueError as e:
+        print(e)
+        return 1
+    _end_progress(prog)
+    print(
+        f"Exportados {res['exported']} mensajes ({res['bytes'] / 1e6:.1f} MB) "
+        f"a {res['path']} | ya exportados: {res['skipped']} | "
+        f"total en el archivo: {res['archived']}"
+    )
+    if res["failed"]:
+        print(f"{len(res['failed'])} mensajes fallaron; vuelve a lanzar para reanudar.")
+    if args.delete:
+        if res["failed"]:
+            print("No se ha borrado nada porque la exportación quedó incompleta.")
+        else:
+            print(f"Eliminados permanentemente: {res['deleted']}")
+    return 1 if res["failed"] else 0
+
+
+def _cmd_accounts(args) -> int:
+    if args.accounts_command == "add":
+        prof = accounts.add(args.name, args.credentials, quota_per_sec=args.quota)
+        print(f"Cuenta '{args.name}': token en {prof['token_file']}")
+        return 0
+    if args.accounts_command == "remove":
+        if not accounts.remove(args.name, delete_token=args.delete_token):
+            print(f"No existe la cuenta '{args.name}'.")
+            return 1
+        return 0
+    for name, prof in sorted(accounts.load().items()):
+        quota = prof.get("quota_per_sec")
+        extra = f" | cuota {quota} u/s" if quota else ""
+        print(f"{name}: {prof['token_file']}{extra}")
+    return 0
+
+
+def _cmd_gui(args) -> int:
+    from .gui import run
+
+    run()
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="inboxzero", description=__doc__.split("\n")[1])
+    ap.add_argument(
+        "--account",
+        action="append",
+        default=[],
+        dest="accounts",
+        help="perfil de cuenta (repetible; ver `inboxzero accounts`)",
+    )
+    ap.add_argument(
+        "--all-accounts", action="store_true", help="todas las cuentas configuradas"
+    )
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("calibrate", help="medir y guardar lote/concurrencia óptimos")
+    p.add_argument("--sample", type=int, default=2000, help="mensajes de la sonda")
+    p.add_argument("--query", default="", help="consulta para elegir la muestra")
+    p.set_defaults(func=_cmd_calibrate)
+
+    for name, help_ in (
+        ("trash", "mover a papelera los mensajes de una consulta"),
+        ("delete", "eliminar PERMANENTEMENTE los mensajes de una consulta"),
+    ):
+        p = sub.add_parser(name, help=help_)
+        p.add_argument("query", help="consulta Gmail (q)")
+        p.add_argument("--max", type=int, default=None, help="máximo a procesar")
+        p.add_argument("--batch-size", type=int, default=None)
+        p.add_argument("--concurrency", type=int, default=None)
+        p.add_argument(
+            "--include-starred",
+            action="store_true",
+            help="no añadir -is:starred a la consulta",
+        )
+        p.add_argument(
+            "--threads",
+            action="store_true",
+            help="actuar por conversación (threads.*); --max cuenta hilos",
+        )
+        p.add_argument("-y", "--yes", action="store_true", help="no pedir confirmación")
+        p.set_defaults(func=_cmd_bulk)
+
+    p = sub.add_parser("senders", help="remitentes más frecuentes de una consulta")
+    p.add_argument("query", nargs="?", default="", help="consulta Gmail (q)")
+    p.add_argument("--top", type=int, default=50)
+    p.add_argument("--regex", default=None, help="filtrar remitentes por regex")
+    p.add_argument(
+        "--max", type=int, default=search.SAMPLE_LIMIT, help="mensajes a muestrear"
+    )
+    p.add_argument("--all", action="store_true", help="recorrer toda la consulta")
+    p.add_argument(
+        "--approx",
+        type=float,
+        default=None,
+        metavar="EPS",
+        help="top-K aproximado (Space-Saving) con error <= EPS * total",
+    )
+    p.set_defaults(func=_cmd_senders)
+
+    p = sub.add_parser("count", help="contar los mensajes de una consulta")
+    p.add_argument("query", nargs="?", default="", help="consulta Gmail (q)")
+    p.add_argument("--exact", action="store_true", help="listar todos los shards")
+    p.add_argument(
+        "--budget", type=float, default=3.0, help="segundos para el estimado"
+    )
+    p.add_argument("--shards", type=int, default=counting.DEFAULT_SHARDS)
+    p.set_defaults(func=_cmd_count)
+
+    p = sub.add_parser(
+        "select",
+        help="selección compuesta: (consultas ∪ etiquetas) ∩ VIP − exclusiones",
+    )
+    p.add_argument("--query", action="append", default=[], help="consulta a unir")
+    p.add_argument(
+        "--label", action="append", default=[], help="etiqueta (nombre o ID)"
+    )
+    p.add_argument("--all-labels", action="store_true", help="exigir todas las --label")
+    p.add_argument("--minus", action="append", default=[], help="consulta a restar")
+    p.add_argument(
+        "--vip", default=None, help="limitar a los remitentes de este archivo"
+    )
+    p.add_argument("--action", choices=("count", "trash", "delete"), default="count")
+    p.add_argument("--include-starred", action="store_true")
+    p.add_argument("-y", "--yes", action="store_true", help="no pedir confirmación")
+    p.set_defaults(func=_cmd_select)
+
+    p = sub.add_parser("filters", help="filtros de Gmail")
+    fsub = p.add_subparsers(dest="filters_command", required=True)
+    pf = fsub.add_parser("apply", help="aplicar filtros al correo existente")
+    pf.add_argument("ids", nargs="*", help="IDs de filtro (por defecto, todos)")
+    pf.add_argument("--dry-run", action="store_true", help="sólo contar")
+    pf.add_argument("--include-starred", action="store_true")
+    pf.add_argument("-y", "--yes", action="store_true", help="no pedir confirmación")
+    pf.set_defaults(func=_cmd_filters_apply)
+    pf = fsub.add_parser("export", help="guardar los filtros en JSON")
+    pf.add_argument("path")
+    pf.set_defaults(func=_cmd_filters_export)
+    pf = fsub.add_parser("import", help="importar filtros desde JSON (con diff)")
+    pf.add_argument("path")
+    pf.add_argument(
+        "--prune", action="store_true", help="borrar los que no estén en el fichero"
+    )
+    pf.add_argument("--dry-run", action="store_true", help="sólo mostrar el diff")
+    pf.add_argument("-v", "--verbose", action="store_true", help="mostrar también '='")
+    pf.add_argument("-y", "--yes", action="store_true", help="no pedir confirmación")
+    pf.set_defaults(func=_cmd_filters_import)
+    pf = fsub.add_parser("dedupe", help="borrar filtros duplicados o subsumidos")
+    pf.add_argument(
+        "--keep-subsumed", action="store_true", help="borrar sólo duplicados exactos"
+    )
+    pf.add_argument("--dry-run", action="store_true")
+    pf.add_argument("-y", "--yes", action="store_true", help="no pedir confirmación")
+    pf.set_defaults(func=_cmd_filters_dedupe)
+    pf = fsub.add_parser("test", help="previsualizar unos criterios en local")
+    pf.add_argument("--from", dest="sender", default="")
+    pf.add_argument("--to", default="")
+    pf.add_argument("--subject", default="")
+    pf.add_argument("--query", default="")
+    pf.add_argument("--negated", default="", help="negatedQuery")
+    pf.add_argument("--has-attachment", action="store_true")
+    pf.add_argument("--larger", type=int, default=0, help="bytes")
+    pf.add_argument("--smaller", type=int, default=0, help="bytes")
+    pf.add_argument("--sample", type=int, default=10)
+    pf.add_argument(
+        "--cache", type=int, default=backtest.CACHE_LIMIT, help="mensajes a cachear"
+    )
+    pf.set_defaults(func=_cmd_filters_test)
+
+    p = sub.add_parser("snapshot", help="instantánea columnar para análisis sin red")
+    snap = p.add_subparsers(dest="snapshot_command", required=True)
+    ps = snap.add_parser("export", help="exportar la metadata de una consulta")
+    ps.add_argument("path", help="directorio de salida")
+    ps.add_argument("query", nargs="?", default="", help="consulta Gmail (q)")
+    ps.add_argument("--max", type=int, default=None, help="máximo de mensajes")
+    ps.add_argument("--pack", action="store_true", help="crear también un .npz")
+    ps = snap.add_parser("report", help="remitentes, tamaños y serie temporal")
+    ps.add_argument("path", help="directorio o .npz de la instantánea")
+    ps.add_argument("--top", type=int, default=20)
+    ps.add_argument("--label", default=None, help="sólo mensajes con esta etiqueta")
+    ps.add_argument(
+        "--period", choices=("day", "week", "month", "year"), default="month"
+    )
+    p.set_defaults(func=_cmd_snapshot)
+
+    p = sub.add_parser("rules", help="reglas de limpieza y demonio incremental")
+    rsub = p.add_subparsers(dest="rules_command", required=True)
+    for name, text in (
+        ("check", "validar las reglas y ver su modo (local/scan)"),
+        ("run", "aplicar las reglas (en bucle salvo --once)"),
+        ("reset", "olvidar el historyId guardado de la cuenta"),
+    ):
+        pr = rsub.add_parser(name, help=text)
+        pr.add_argument("path", nargs="?", default=RULES_FILE)
+    pr = rsub.choices["run"]
+    pr.add_argument("--once", action="store_true", help="una sola pasada")
+    pr.add_argument("--interval", type=float, default=rules.RULES_INTERVAL)
+    pr.add_argument(
+        "--dry-run", action="store_true", help="una pasada sin modificar nada"
+    )
+    pr.add_argument(
+        "--no-backfill",
+        action="store_true",
+        help="no aplicar las reglas locales al correo ya existente",
+    )
+    pr.add_argument("--include-starred", action="store_true")
+    p.set_defaults(func=_cmd_rules)
+
+    p = sub.add_parser("journal", help="diarios de papelera y deshacer")
+    jsub = p.add_subparsers(dest="journal_command", required=True)
+    jsub.add_parser("list", help="trabajos de papelera que se pueden deshacer")
+    jsub.add_parser("prune", help="borrar diarios de más de 30 días")
+    pj = jsub.add_parser("restore", help="sacar de la papelera lo que movió un trabajo")
+    pj.add_argument(
+        "id", nargs="?", default=None, help="diario (por defecto el último)"
+    )
+    pj.add_argument("--dry-run", action="store_true")
+    pj.add_argument("--concurrency", type=int, default=None)
+    pj.add_argument("-y", "--yes", action="store_true", help="no pedir confirmación")
+    p.set_defaults(func=_cmd_journal)
+
+    p = sub.add_parser("duplicates", help="buscar y quitar mensajes duplicados")
+    p.add_argument("query", nargs="?", default="", help="consulta Gmail (q)")
+    p.add_argument(
+        "--keep",
+        choices=duplicates.KEEP_POLICIES,
+        default="oldest",
+        help="qué copia conservar de cada grupo",
+    )
+    p.add_argument("--max", type=int, default=None, help="máximo a revisar")
+    p.add_argument("--dry-run", action="store_true")
+    p.add_argument(
+        "--include-starred",
+        action="store_true",
+        help="permitir quitar copias destacadas sobrantes",
+    )
+    p.add_argument("-y", "--yes", action="store_true", help="no pedir confirmación")
+    p.set_defaults(func=_cmd_duplicates)
+
+    p = sub.add_parser(
+        "export", help="exportar mensajes completos a mbox/EML (y borrarlos)"
+    )
+    p.add_argument("query", help="consulta Gmail (q)")
+    p.add_argument("path", help="fichero .mbox / .mbox.gz, o directorio con --eml")
+    p.add_argument("--eml", action="store_true", help="un fichero .eml por mensaje")
+    p.add_argument("--max", type=int, default=None, help="máximo a exportar")
+    p.add_argument("--concurrency", type=int, default=4)
+    p.add_argument(
+        "--no-resume", action="store_true", help="empezar de cero aunque haya estado"
+    )
+    p.add_argument(
+        "--delete",
+        action="store_true",
+        help="eliminar PERMANENTEMENTE lo exportado al terminar",
+    )
+    p.add_argument("--include-starred", action="store_true")
+    p.add_argument("-y", "--yes", action="store_true", help="no pedir confirmación")
+    p.set_defaults(func=_cmd_export)
+
+    p = sub.add_parser("accounts", help="gestionar perfiles de cuenta")
+    acc = p.add_subparsers(dest="accounts_command")
+    pa = acc.add_parser("add", help="crear o actualizar un perfil")
+    pa.add_argument("name")
+    pa.add_argument("--credentials", default=None, help="credentials.json propio")
+    pa.add_argument(
+        "--quota", type=float, default=None, help="límite en unidades de cuota/s"
+    )
+    pr = acc.add_parser("remove", help="borrar un perfil")
+    pr.add_argument("name")
+    pr.add_argument("--delete-token", action="store_true")
+    acc.add_parser("list", help="listar perfiles")
+    p.set_defaults(func=_cmd_accounts)
+
+    p = sub.add_parser("gui", help="abrir la interfaz gráfica")
+    p.set_defaults(func=_cmd_gui)
+    return ap
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.all_accounts:
+        args.accounts = accounts.names()
+    multi = ("trash", "delete", "senders", "count")
+    if len(args.accounts) > 1 and args.command not in multi:
+        print(f"'{args.command}' admite una sola cuenta.")
+        return 2
+    if len(args.accounts) == 1:
+        accounts.set_default(args.accounts[0])
+    return args.func(args)
@@ -1,4 +1,5 @@
 # Configuración central del proyecto
+import os
 
 # Scopes necesarios para:
 # - Leer/Buscar/Modificar/Aplicar etiquetas: gmail.modify
@@ -14,3 +15,36 @@ SCOPES = [
 APP_NAME = "Gmail Label Manager"
 TOKEN_FILE = "token.json"  # se genera después del flujo OAuth
 CREDENTIALS_PATH = "credentials/credentials.json"
+# Perfiles de lote/concurrencia calibrados por cuenta y operación (tuning.calibrate)
+TUNING_FILE = "tuning.json"
+# Perfiles de cuenta (accounts.py): cada uno con su token en TOKENS_DIR/<nombre>.json
+ACCOUNTS_FILE = os.environ.get("INBOXZERO_ACCOUNTS_FILE", "accounts.json")
+TOKENS_DIR = os.environ.get("INBOXZERO_TOKENS_DIR", "tokens")
+# Cuentas procesadas a la vez por accounts.run_many
+ACCOUNT_WORKERS = int(os.environ.get("INBOXZERO_ACCOUNT_WORKERS", "4"))
+# Reglas de limpieza (rules.py) y estado del demonio (historyId por cuenta)
+RULES_FILE = os.environ.get("INBOXZERO_RULES_FILE", "rules.json")
+RULES_STATE_FILE = os.environ.get("INBOXZERO_RULES_STATE_FILE", "rules_state.json")
+# Total de los trabajos masivos: "estimate" (shards de fecha, se afina al listar) o "fast" (resultSizeEstimate)
+JOB_COUNT_MODE = os.environ.get("INBOXZERO_JOB_COUNT", "estimate")
+# Diario de papelera (journal.py): IDs movidos por cada trabajo, para deshacer
+JOURNAL_DIR = os.environ.get("INBOXZERO_JOURNAL_DIR", "journal")
+JOURNAL_ENABLED = os.environ.get("INBOXZERO_JOURNAL", "1") != "0"
+# Capturar antes de cada trabajo qué mensajes tenían INBOX/UNREAD/IMPORTANT (listados extra)
+JOURNAL_CAPTURE = os.environ.get("INBOXZERO_JOURNAL_CAPTURE", "0") == "1"
+
+# Transporte HTTP compartido: conexiones keep-alive en el pool y timeout por petición (s)
+HTTP_POOL_SIZE = int(os.environ.get("INBOXZERO_HTTP_POOL_SIZE", "16"))
+HTTP_TIMEOUT = float(os.environ.get("INBOXZERO_HTTP_TIMEOUT", "60"))
+# Motor de E/S de los trabajos masivos: "threads" (por defecto) o "async" (aio.py, requiere aiohttp)
+ENGINE = os.environ.get("INBOXZERO_ENGINE", "threads")
+# Raíz de la API para el motor async (p. ej. la URL de simulator.serve())
+API_BASE_URL = os.environ.get("INBOXZERO_API_BASE_URL", "https://gmail.googleapis.com/")
+# Peticiones simultáneas máximas del motor async (una sola conexión keep-alive por petición)
+AIO_MAX_IN_FLIGHT = int(os.environ.get("INBOXZERO_AIO_MAX_IN_FLIGHT", "256"))
+
+# Diagnóstico de rendimiento (opcional)
+# Directorio donde escribir trazas Chrome/Perfetto de cada trabajo ("" = desactivado)
+TRACE_DIR = os.environ.get("INBOXZERO_TRACE_DIR", "")
+# Directorio para perfiles cProfile/tracemalloc de cada trabajo ("" = desactivado)
+PROFILE_DIR = os.environ.get("INBOXZERO_PROFILE_DIR", "")
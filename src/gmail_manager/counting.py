@@ -0,0 +1,468 @@
+"""
+Conteo de coincidencias de una consulta sin fiarse de ``resultSizeEstimate``.
+
+``resultSizeEstimate`` sale de la 1ª página y con ``q`` complejas se desvía
+mucho. Aquí el rango de fechas se parte en shards (``after:`` / ``before:``
+en epoch) que se listan en paralelo pidiendo sólo IDs:
+
+- ``count_exact``: lista todos los shards y suma; exacto.
+- ``estimate``: 1ª página de cada shard (los que caben en una página ya son
+  exactos) y, de los grandes, lista completos sólo los que dé tiempo en
+  ``time_budget`` segundos (al menos `min_sampled`). Cada shard grande sin
+  listar vale la media de los listados (estimador de expansión; no se usa
+  ``resultSizeEstimate``) y el intervalo de confianza sale de la varianza
+  entre shards listados.
+- ``LiveCount``: total de un trabajo en marcha que se afina con los IDs que
+  el propio trabajo va listando y es exacto al agotarse el listado. Los
+  trabajos lo siembran con ``JobListing``, que lista sin partir desde la
+  1ª página y sondea en paralelo la 1ª página de cada shard de fecha.
+"""
+
+import random
+import statistics
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from . import messages, tracing
+from .accounts import ContextThreadPool
+from .service import get_gmail_service
+
+# Gmail abrió en 2004: lo anterior (importado) cae en el primer shard abierto
+EPOCH_FLOOR = 1072915200  # 2004-01-01 UTC
+DEFAULT_SHARDS = 32
+DEFAULT_CONCURRENCY = 8
+MIN_SAMPLED = 3  # shards grandes que se listan siempre, aun sin presupuesto
+# Listado de trabajos (JobListing): ~mensajes por shard sondeado y tope de shards
+JOB_SHARD_SIZE = 5000
+JOB_MAX_SHARDS = 8
+
+
+# ---------- shards por fecha ----------
+Span = Tuple[Optional[int], Optional[int]]  # (after, before); None = abierto
+
+
+def date_spans(
+    shards: int = DEFAULT_SHARDS, now: Optional[int] = None, span: Span = (None, None)
+) -> List[Span]:
+    """
+    Parte el tiempo (o sólo `span`) en `shards` tramos disjuntos; los
+    extremos abiertos siguen abiertos.
+    """
+    shards = max(1, int(shards))
+    lo, hi = span
+    start = EPOCH_FLOOR if lo is None else lo
+    end = int(now or time.time()) + 86400 if hi is None else hi
+    step = (end - start) / shards
+    edges: List[Optional[int]] = [int(start + i * step) for i in range(shards + 1)]
+    edges[0], edges[-1] = lo, hi
+    return [(edges[i], edges[i + 1]) for i in range(shards)]
+
+
+def _span_filter(span: Span) -> str:
+    lo, hi = span
+    parts = []
+    if lo is not None:
+        parts.append(f"after:{lo}")
+    if hi is not None:
+        parts.append(f"before:{hi}")
+    return " ".join(parts)
+
+
+def date_shards(shards: int = DEFAULT_SHARDS, now: Optional[int] = None) -> List[str]:
+    """
+    Filtros ``after:/before:`` que parten el tiempo en `shards` tramos
+    disjuntos; el primero y el último quedan abiertos.
+    """
+    return [_span_filter(s) for s in date_spans(shards, now)]
+
+
+def _shard_query(q: str, shard: str) -> str:
+    q = (q or "").strip()
+    return f"({q}) {shard}".strip() if q else shard
+
+
+def _count_pages(
+    q: str,
+    label_ids: Optional[List[str]],
+    first: Optional[Dict] = None,
+    stop_event: Optional[threading.Event] = None,
+) -> int:
+    """Cuenta IDs página a página (a partir de `first` si ya se pidió)."""
+    svc = get_gmail_service()
+    resp = first or messages._list_page(svc, q or None, label_ids, None)
+    n = len(resp.get("messages", []) or [])
+    while resp.get("nextPageToken") and not (stop_event and stop_event.is_set()):
+        resp = messages._list_page(svc, q or None, label_ids, resp["nextPageToken"])
+        n += len(resp.get("messages", []) or [])
+    return n
+
+
+# ---------- exacto ----------
+def count_exact(
+    q: str = "",
+    label_ids: Optional[List[str]] = None,
+    shards: int = DEFAULT_SHARDS,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    on_update: Optional[Callable[[int, int], None]] = None,
+    stop_event: Optional[threading.Event] = None,
+) -> int:
+    """
+    Número exacto de coincidencias listando sólo IDs, con los shards de
+    fecha en paralelo. `on_update(contados, shards_terminados)` permite
+    mostrar el conteo según avanza.
+    """
+    queries = [_shard_query(q, s) for s in date_shards(shards)]
+    total = 0
+    finished = 0
+    lock = threading.Lock()
+
+    def work(sq: str) -> None:
+        nonlocal total, finished
+        with tracing.span("count_shard", "list", query=sq):
+            n = _count_pages(sq, label_ids, stop_event=stop_event)
+        with lock:
+            total += n
+            finished += 1
+            if on_update:
+                on_update(total, finished)
+
+    with ContextThreadPool(max_workers=max(1, concurrency)) as ex:
+        for f in [ex.submit(work, sq) for sq in queries]:
+            f.result()
+    return total
+
+
+# ---------- estimado con intervalo ----------
+def estimate(
+    q: str = "",
+    label_ids: Optional[List[str]] = None,
+    shards: int = DEFAULT_SHARDS,
+    time_budget: float = 3.0,
+    confidence: float = 0.95,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    seed: Optional[int] = None,
+    min_sampled: int = MIN_SAMPLED,
+) -> Dict:
+    """
+    Estimado en tiempo acotado. Devuelve ``{"count", "low", "high", "exact",
+    "shards", "sampled"}``: si todos los shards grandes se llegaron a listar
+    `exact` es True y low == high == count.
+    """
+    deadline = time.monotonic() + max(0.0, time_budget)
+    svc = get_gmail_service()
+    queries = [_shard_query(q, s) for s in date_shards(shards)]
+
+    def first_page(sq: str) -> Dict:
+        with tracing.span("count_probe", "list", query=sq):
+            return messages._list_page(svc, sq, label_ids, None)
+
+    with ContextThreadPool(max_workers=max(1, concurrency)) as ex:
+        firsts = list(ex.map(first_page, queries))
+
+    exact_part = 0
+    big: List[Tuple[str, Dict]] = []
+    for sq, resp in zip(queries, firsts):
+        if resp.get("nextPageToken"):
+            big.append((sq, resp))
+        else:
+            exact_part += len(resp.get("messages", []) or [])
+
+    # Shards grandes en orden aleatorio hasta agotar el presupuesto (mín. min_sampled)
+    order = list(range(len(big)))
+    random.Random(seed).shuffle(order)
+    counted: Dict[int, int] = {}
+    lock = threading.Lock()
+    started = 0
+
+    def work(i: int) -> None:
+        nonlocal started
+        with lock:
+            if started >= max(1, min_sampled) and time.monotonic() > deadline:
+                return
+            started += 1
+        sq, resp = big[i]
+        with tracing.span("count_shard", "list", query=sq):
+            n = _count_pages(sq, label_ids, first=resp)
+        with lock:
+            counted[i] = n
+
+    with ContextThreadPool(max_workers=max(1, concurrency)) as ex:
+        for f in [ex.submit(work, i) for i in order]:
+            f.result()
+
+    pending = [
+        len(big[i][1].get("messages", []) or []) for i in order if i not in counted
+    ]
+    res = _expand(exact_part, list(counted.values()), pending, confidence)
+    res.update(shards=len(queries), sampled=len(counted))
+    return res
+
+
+def _expand(
+    exact_part: int, ys: List[int], pending: List[int], confidence: float = 0.95
+) -> Dict:
+    """
+    Total de unos shards: `exact_part` de los pequeños, `ys` de los grandes
+    ya listados y `pending` (tamaño de su 1ª página) de los grandes sin listar.
+    """
+    known = exact_part + sum(ys)
+    if not pending:
+        return {"count": known, "low": known, "high": known, "exact": True}
+    # Expansión: cada shard grande no listado vale la media de los listados.
+    # No se usa resultSizeEstimate: es justo el dato poco fiable.
+    n = len(ys)
+    m = n + len(pending)
+    mean = sum(ys) / n
+    predicted = mean * (m - n)
+    # Suelo de Poisson: dos shards iguales por azar no dan certeza
+    s2 = max(statistics.variance(ys) if n > 1 else mean**2, mean)
+    # Varianza del total (corrección de población finita) y t de Student
+    var = m**2 * (1 - n / m) * s2 / n
+    half = _t_quantile(confidence, n - 1) * var**0.5
+    # Cota dura: un shard con nextPageToken tiene al menos su 1ª página + 1
+    floor = known + sum(first + 1 for first in pending)
+    count = max(floor, int(round(known + predicted)))
+    return {
+        "count": count,
+        "low": int(max(floor, known + predicted - half)),
+        "high": max(count, int(round(known + predicted + half))),
+        "exact": False,
+    }
+
+
+# t de Student al 95% (dos colas) para pocos grados de libertad
+_T95 = {1: 12.71, 2: 4.30, 3: 3.18, 4: 2.78, 5: 2.57, 6: 2.45, 7: 2.36, 8: 2.31}
+
+
+def _t_quantile(confidence: float, df: int) -> float:
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+    if df < 1:
+        return z * _T95[1] / 1.96
+    # Fuera de la tabla la normal basta; para otros niveles se escala igual
+    return z * _T95.get(df, 1.96) / 1.96
+
+
+def count_matches(
+    q: str = "",
+    label_ids: Optional[List[str]] = None,
+    mode: str = "estimate",
+    **kwargs,
+) -> Dict:
+    """
+    Punto único para elegir coste/precisión: ``"fast"`` (resultSizeEstimate,
+    1 llamada), ``"estimate"`` (intervalo en tiempo acotado) o ``"exact"``.
+    """
+    if mode == "fast":
+        n = messages.estimate_count(q, label_ids)
+        return {"count": n, "low": None, "high": None, "exact": False}
+    if mode == "exact":
+        n = count_exact(q, label_ids, **kwargs)
+        return {"count": n, "low": n, "high": n, "exact": True}
+    if mode == "estimate":
+        return estimate(q, label_ids, **kwargs)
+    raise ValueError(f"Modo de conteo desconocido: {mode}")
+
+
+# ---------- total progresivo durante un trabajo ----------
+class LiveCount:
+    """
+    Total de un trabajo que se afina mientras corre. Parte de un estimado
+    (un número o un callable que se reevalúa, p. ej. el de un JobListing),
+    nunca baja de los IDs ya listados y al agotarse el listado es exacto.
+    Se llama como función para obtener el total actual.
+    """
+
+    def __init__(
+        self,
+        estimate: Union[int, Callable[[], int]] = 0,
+        limit: Optional[int] = None,
+    ):
+        self.estimate = estimate if callable(estimate) else int(estimate or 0)
+        self.limit = limit  # max_fetch del trabajo: la barra no pasa de ahí
+        self.listed = 0
+        self.exact = False
+
+    def __call__(self) -> int:
+        if self.exact:
+            return self.listed
+        est = self.estimate() if callable(self.estimate) else self.estimate
+        total = max(est, self.listed)
+        return min(total, self.limit) if self.limit else total
+
+    def track(self, ids: Iterable[str]) -> Iterator[str]:
+        """Envuelve el iterador de IDs del trabajo contando lo que sale."""
+        for mid in ids:
+            self.listed += 1
+            yield mid
+        self.exact = True
+
+
+class JobListing:
+    """
+    IDs de un trabajo masivo (de más nuevo a más viejo) con su total
+    estimado, sin llamadas aparte para contar y sin listar por adelantado.
+
+    La consulta se lista tal cual, página a página, y los IDs salen desde la
+    1ª página (nunca más de `max_total`). `open()` sólo pide esa página: sin
+    más páginas el total es exacto; si no, su resultSizeEstimate es la
+    semilla. Si la consulta es grande y `sharded`, mientras el trabajo
+    arranca se pide en paralelo la 1ª página de cada shard de fecha
+    (resultSizeEstimate sólo decide cuántos): los que caben en una página
+    son exactos y el 1er ID de cada uno marca dónde empieza en el listado,
+    así que cada shard grande que el listado deja atrás queda contado y
+    corrige el estimado de los pendientes (estimador de razón). En memoria sólo queda
+    una página. Con `total` (conteo ya conocido, p. ej. labels.get) o sin
+    `sharded` no se parte nada.
+    """
+
+    def __init__(
+        self,
+        q: Optional[str],
+        label_ids: Optional[List[str]],
+        max_total: Optional[int] = None,
+        stop_event: Optional[threading.Event] = None,
+        total: Optional[int] = None,
+        sharded: bool = True,
+    ):
+        self.q = q or ""
+        self.label_ids = label_ids or None
+        self.max_total = max_total
+        self.stop_event = stop_event
+        self.known = total
+        self.sharded = sharded
+        self.estimate = int(total or 0)
+        self.shards = 0  # shards de fecha sondeados (0: sin partir)
+        self._first: Optional[Dict] = None
+        self._probes: List[Tuple[Optional[str], int, bool, int]] = []
+        self._starts: Dict[str, int] = {}  # 1er ID de shard -> índice
+        self._counted: Dict[int, int] = {}
+        self._exact_part = 0
+        self._pos = 0
+        self._cur: Optional[int] = None
+        self._cur_start = 0
+
+    def open(self) -> int:
+        """Pide la 1ª página y devuelve el total inicial."""
+        if self._first is not None:
+            return self.estimate
+        svc = get_gmail_service()
+        self._first = messages._list_page(svc, self.q or None, self.label_ids, None)
+        if self.known is not None:
+            return self.estimate
+        n = len(self._first.get("messages", []) or [])
+        rse = int(self._first.get("resultSizeEstimate", 0) or 0)
+        if not self._first.get("nextPageToken"):
+            self.estimate = n
+            return self.estimate
+        self.estimate = max(rse, n + 1)
+        small_job = self.max_total and self.max_total <= 2 * JOB_SHARD_SIZE
+        if self.sharded and not small_job and rse >= 2 * JOB_SHARD_SIZE:
+            self.shards = max(2, min(JOB_MAX_SHARDS, rse // JOB_SHARD_SIZE))
+        return self.estimate
+
+    def seed(self) -> int:
+        """`open()` más los sondeos de shards, sin listar: el total inicial
+        para quien lista por su cuenta (motor asyncio)."""
+        self.open()
+        if self.shards and not self._probes:
+            self._set_probes(self._probe())
+            self._refresh()
+        return self.estimate
+
+    def _probe(self) -> List[Tuple[Optional[str], int, bool, int]]:
+        """(1er ID, IDs de la 1ª página, ¿más páginas?, estimado) por shard."""
+        svc = get_gmail_service()
+        spans = list(reversed(date_spans(self.shards)))
+
+        def first_page(sp: Span) -> Tuple[Optional[str], int, bool, int]:
+            sq = _shard_query(self.q, _span_filter(sp))
+            with tracing.span("count_probe", "list", query=sq):
+                resp = messages._list_page(svc, sq, self.label_ids, None)
+            got = resp.get("messages", []) or []
+            rse = int(resp.get("resultSizeEstimate", 0) or 0)
+            return (
+                got[0]["id"] if got else None,
+                len(got),
+                bool(resp.get("nextPageToken")),
+                rse,
+            )
+
+        with ContextThreadPool(max_workers=min(self.shards, DEFAULT_CONCURRENCY)) as ex:
+            return list(ex.map(first_page, spans))
+
+    def _set_probes(self, probes: List[Tuple[Optional[str], int, bool, int]]) -> None:
+        self._probes = probes
+        for i, (first_id, n, more, _) in enumerate(probes):
+            if first_id is not None:
+                self._starts[first_id] = i
+            if not more:
+                self._exact_part += n
+
+    def _scan(self, ids: List[str]) -> None:
+        """Avanza la posición del listado; al cruzar el inicio de un shard
+        cierra el conteo del anterior."""
+        for mid in ids:
+            i = self._starts.get(mid)
+            if i is not None:
+                self._close_shard()
+                self._cur, self._cur_start = i, self._pos
+            self._pos += 1
+        self._refresh()
+
+    def _close_shard(self) -> None:
+        i = self._cur
+        if i is not None and self._probes[i][2]:
+            self._counted[i] = self._pos - self._cur_start
+
+    def _refresh(self) -> None:
+        # Estimador de razón: cada shard grande pendiente vale su
+        # resultSizeEstimate corregido por contados/estimados de los ya
+        # contados (los shards de fecha no tienen el mismo tamaño, así que
+        # la media de los contados se desvía mucho con pocos shards)
+        big = [i for i, p in enumerate(self._probes) if p[2]]
+        done = [i for i in big if i in self._counted]
+        counted = sum(self._counted[i] for i in done)
+        rses = sum(self._probes[i][3] for i in done)
+        ratio = counted / rses if done and rses else 1.0
+        self.estimate = self._exact_part + counted
+        for i in big:
+            if i not in self._counted:
+                _, first, _, rse = self._probes[i]
+                self.estimate += max(first + 1, int(round(rse * ratio)))
+
+    def __iter__(self) -> Iterator[str]:
+        self.open()
+        svc = get_gmail_service()
+        stop = self.stop_event
+        resp = self._first
+        yielded = pages = 0
+        unscanned: List[str] = []
+        with ContextThreadPool(max_workers=1) as ex:
+            probe = ex.submit(self._probe) if self.shards else None
+            while True:
+                ids = [m["id"] for m in resp.get("messages", []) or []]
+                pages += 1
+                if probe is not None and pages > 1:
+                    # Desde la 2ª página el listado espera a los sondeos
+                    self._set_probes(probe.result())
+                    probe = None
+                    self._scan(unscanned)
+                if probe is None:
+                    if self._probes:
+                        self._scan(ids)
+                else:
+                    unscanned = ids
+                if self.max_total:
+                    ids = ids[: self.max_total - yielded]
+                yield from ids
+                yielded += len(ids)
+                token = resp.get("nextPageToken")
+                if self.max_total and yielded >= self.max_total:
+                    return
+                if not token or (stop and stop.is_set()):
+                    break
+                resp = messages._list_page(svc, self.q or None, self.label_ids, token)
+        if probe is None and self._probes and not token:
+            self._close_shard()
+            self._refresh()
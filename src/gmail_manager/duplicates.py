@@ -0,0 +1,204 @@
+"""
+Detección y eliminación de mensajes duplicados.
+
+Importaciones y bucles de reenvío dejan varias copias del mismo correo con
+IDs de Gmail distintos. `find_duplicates(q)` recorre la metadata de `q`
+(Message-ID, Date, From, Subject y sizeEstimate en los mismos batch de
+messages.get que usa search._scan_sample) y agrupa:
+
+- por ``Message-ID`` normalizado (sin ``<>`` ni mayúsculas), o
+- si falta la cabecera, por una huella de From + Date + Subject + tamaño.
+
+Cada clave se guarda como un digest de 16 bytes con la copia a conservar
+hasta el momento según la política (KEEP_POLICIES); cuando llega otra copia
+la perdedora se anota como entero de 64 bits. En memoria hay una entrada
+por grupo y 8 bytes por duplicado, nunca la metadata de los mensajes.
+
+`remove_duplicates()` manda los duplicados a la Papelera por la tubería de
+messages._stream_action_from_ids, con diario (journal) para poder
+deshacerlo. Las copias destacadas se prefieren como la que se conserva y,
+con protect_starred, nunca se tocan.
+"""
+
+import hashlib
+import threading
+from array import array
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional, Tuple
+
+from . import api, journal, messages, search, selection, tracing
+from .profiling import profiled
+
+DUPLICATE_HEADERS = ["Message-ID", "Date", "From", "Subject"]
+# oldest: la primera recibida; newest: la última; labeled: la que más
+# etiquetas tiene (empate: la más antigua)
+KEEP_POLICIES = ("oldest", "newest", "labeled")
+
+
+class _Group:
+    """Copia conservada de un grupo y cuántas copias se han visto."""
+
+    __slots__ = ("count", "keep", "rank", "size", "by_id")
+
+    def __init__(self, keep: int, rank: Tuple, size: int, by_id: bool):
+        self.count = 1
+        self.keep = keep
+        self.rank = rank
+        self.size = size
+        self.by_id = by_id
+
+
+def _headers(msg: Dict) -> Dict[str, str]:
+    # Gmail devuelve "Message-ID" o "Message-Id" según el remitente
+    return {
+        h.get("name", "").lower(): h.get("value", "")
+        for h in msg.get("payload", {}).get("headers", [])
+    }
+
+
+def _date_key(value: str) -> str:
+    try:
+        return str(int(parsedate_to_datetime(value).timestamp()))
+    except (TypeError, ValueError):
+        return " ".join(value.split())
+
+
+def group_key(msg: Dict) -> Tuple[bytes, bool]:
+    """(digest, por_message_id) de un mensaje con la metadata de arriba."""
+    h = _headers(msg)
+    mid = h.get("message-id", "").strip().strip("<>").strip().lower()
+    if mid:
+        raw = "id\0" + mid
+    else:
+        raw = "\0".join(
+            (
+                "fp",
+                " ".join(h.get("from", "").split()).lower(),
+                _date_key(h.get("date", "")),
+                " ".join(h.get("subject", "").split()),
+                str(msg.get("sizeEstimate", 0)),
+            )
+        )
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).digest(), bool(mid)
+
+
+def _rank(msg: Dict, keep: str) -> Tuple:
+    """Menor = mejor candidata a conservar; las destacadas siempre primero."""
+    label_ids = msg.get("labelIds", []) or []
+    ts = int(msg.get("internalDate", 0) or 0)
+    starred = 0 if "STARRED" in label_ids else 1
+    if keep == "newest":
+        return (starred, -ts)
+    if keep == "labeled":
+        return (starred, -len(label_ids), ts)
+    return (starred, ts)
+
+
+# ---------- PUBLIC ----------
+@profiled("find_duplicates")
+def find_duplicates(
+    q: str = "",
+    keep: str = "oldest",
+    max_messages: Optional[int] = None,
+    protect_starred: bool = True,
+) -> Dict:
+    """
+    Recorre `q` y devuelve ``{"scanned", "groups", "duplicates", "bytes",
+    "by_message_id", "by_fingerprint", "protected", "ids"}``: ``groups`` son
+    los grupos con más de una copia, ``ids`` (array('Q') ordenado) las copias
+    sobrantes y ``bytes`` lo que ocupan. Con protect_starred las copias
+    destacadas sobrantes se cuentan en ``protected`` y no van a ``ids``.
+    """
+    if keep not in KEEP_POLICIES:
+        raise ValueError(f"Política no soportada: {keep}")
+    groups: Dict[bytes, _Group] = {}
+    extra = array("Q")
+    stats = {"scanned": 0, "bytes": 0, "protected": 0}
+
+    def drop(mid: int, size: int, starred: bool) -> None:
+        if protect_starred and starred:
+            stats["protected"] += 1
+            return
+        extra.append(mid)
+        stats["bytes"] += size
+
+    def on_message(msg: Dict) -> None:
+        stats["scanned"] += 1
+        key, by_id = group_key(msg)
+        mid = selection._to_int(msg["id"])
+        rank = _rank(msg, keep)
+        size = int(msg.get("sizeEstimate", 0) or 0)
+        starred = rank[0] == 0
+        g = groups.get(key)
+        if g is None:
+            groups[key] = _Group(mid, rank, size, by_id)
+            return
+        g.count += 1
+        if rank < g.rank:
+            # La nueva gana: la conservada hasta ahora pasa a sobrar
+            drop(g.keep, g.size, g.rank[0] == 0)
+            g.keep, g.rank, g.size = mid, rank, size
+        else:
+            drop(mid, size, starred)
+
+    search._scan_sample(
+        q, max_messages, DUPLICATE_HEADERS, api.DUPLICATE_FIELDS, on_message
+    )
+    dup = [g for g in groups.values() if g.count > 1]
+    return {
+        "scanned": stats["scanned"],
+        "groups": len(dup),
+        "duplicates": len(extra),
+        "bytes": stats["bytes"],
+        "by_message_id": sum(1 for g in dup if g.by_id),
+        "by_fingerprint": sum(1 for g in dup if not g.by_id),
+        "protected": stats["protected"],
+        "ids": array("Q", sorted(extra)),
+    }
+
+
+def remove_duplicates(
+    q: str = "",
+    keep: str = "oldest",
+    max_messages: Optional[int] = None,
+    protect_starred: bool = True,
+    dry_run: bool = False,
+    batch_size: int = messages.BATCH_LIMIT,
+    concurrency: int = 4,
+    progress_cb: Optional[Callable[[int, int], None]] = None,
+    stop_event: Optional[threading.Event] = None,
+    found: Optional[Dict] = None,
+) -> Dict:
+    """
+    Envía a la Papelera las copias sobrantes de `q` (una por grupo se queda).
+    `found` reutiliza un find_duplicates() previo (p. ej. la vista previa)
+    en vez de volver a recorrer la consulta. Devuelve lo de find_duplicates()
+    sin ``ids`` más ``processed`` y ``journal`` (para `inboxzero journal
+    restore`).
+    """
+    job = "trash_duplicates"
+    with tracing.trace_job(job):
+        found = dict(found or find_duplicates(q, keep, max_messages, protect_starred))
+        ids = found.pop("ids")
+        processed = 0
+        jr = None
+        if not dry_run and len(ids):
+            jr = journal.start(job, q)
+            try:
+                processed = messages._stream_action_from_ids(
+                    selection.iter_ids(ids),
+                    len(ids),
+                    None,
+                    batch_size,
+                    concurrency,
+                    progress_cb,
+                    stop_event,
+                    "TRASH",
+                    on_chunk=jr.add if jr else None,
+                )
+            finally:
+                if jr:
+                    jr.close(processed)
+    found["processed"] = processed
+    found["journal"] = jr.id if jr else None
+    return found
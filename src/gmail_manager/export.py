@@ -0,0 +1,321 @@
+"""
+Exportación de mensajes completos (mbox / EML) antes de acciones destructivas.
+
+`export_messages(q, path)` lista la consulta y descarga cada mensaje con
+``messages.get(format=raw)`` en batch HTTP de RAW_BATCH_SIZE, con varios
+lotes en vuelo a la vez. El ``raw`` (base64url) se decodifica por trozos y
+se escribe según llega:
+
+- ``mbox``: un fichero mbox (mboxrd: las líneas ``From `` del cuerpo se
+  escapan con ``>``); si termina en ``.gz`` cada lote se añade como un
+  miembro gzip completo. Cada mensaje lleva ``X-GM-THRID`` y
+  ``X-Gmail-Labels`` como en Google Takeout.
+- ``eml``: un fichero ``<id>.eml`` por mensaje en un directorio.
+
+En memoria sólo hay los lotes en vuelo. Tras escribir cada lote se anotan
+sus IDs (``.ids``, 8 bytes por mensaje) y el tamaño confirmado del archivo
+(``.state.json``). Si el proceso se corta, la siguiente ejecución recorta
+lo escrito a medias y sigue saltándose los IDs ya exportados.
+
+Con ``delete=True`` al terminar se borran permanentemente exactamente los
+IDs que están en el archivo (batchDelete), nunca los de la consulta.
+"""
+
+import base64
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from array import array
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from . import api, labels, messages, meter, profiling, selection, tracing
+from .accounts import ContextThreadPool
+from .service import get_gmail_service
+
+RAW_BATCH_SIZE = 25  # mensajes completos por batch HTTP (pueden pesar MB)
+DECODE_CHUNK = 1 << 16  # caracteres base64 por trozo (múltiplo de 4)
+STATE_VERSION = 1
+_FROM_LINE = re.compile(rb"(?m)^(>*From )")
+
+
+# ---------- decodificación por trozos ----------
+def _decoded_chunks(raw: str) -> Iterator[bytes]:
+    for i in range(0, len(raw), DECODE_CHUNK):
+        piece = raw[i : i + DECODE_CHUNK]
+        yield base64.urlsafe_b64decode(piece + "=" * (-len(piece) % 4))
+
+
+def _mboxrd(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Escapa ``From `` a principio de línea sin juntar el mensaje entero."""
+    carry = b""
+    for chunk in chunks:
+        block = carry + chunk
+        cut = block.rfind(b"\n") + 1
+        carry = block[cut:]
+        if cut:
+            yield _FROM_LINE.sub(rb">\1", block[:cut])
+    if carry:
+        yield _FROM_LINE.sub(rb">\1", carry) + b"\n"
+
+
+def _envelope(msg: Dict, label_names: Dict[str, str]) -> bytes:
+    ts = int(msg.get("internalDate", 0) or 0) // 1000
+    names = ",".join(label_names.get(l, l) for l in msg.get("labelIds", []) or [])
+    return (
+        f"From MAILER-DAEMON {time.asctime(time.gmtime(ts))}\n"
+        f"X-GM-THRID: {msg.get('threadId', '')}\r\n"
+        f"X-Gmail-Labels: {names}\r\n"
+    ).encode("utf-8")
+
+
+# ---------- escritores ----------
+class _Archive:
+    """Fichero/directorio de salida con su índice de IDs y estado."""
+
+    def __init__(self, path: str, fmt: str):
+        self.path = path
+        self.fmt = fmt
+        base = os.path.join(path, "") if fmt == "eml" else path
+        self.ids_path = base + ".ids"
+        self.state_path = base + ".state.json"
+        self.state: Dict = {}
+
+    def open(self, q: str, resume: bool) -> array:
+        """Prepara la salida; devuelve los IDs ya exportados (ordenados)."""
+        if self.fmt == "eml":
+            os.makedirs(self.path, exist_ok=True)
+        state = {}
+        if resume and os.path.exists(self.state_path):
+            with open(self.state_path, encoding="utf-8") as fh:
+                state = json.load(fh)
+            if state.get("query") != q:
+                raise ValueError(
+                    f"{self.path} ya contiene otra consulta: '{state.get('query')}'"
+                )
+        elif not resume:
+            for p in (self.ids_path, self.state_path):
+                if os.path.exists(p):
+                    os.remove(p)
+        self.state = state or {
+            "version": STATE_VERSION,
+            "query": q,
+            "count": 0,
+            "offset": 0,
+        }
+        # Lo escrito después del último lote confirmado se descarta
+        if self.fmt == "mbox":
+            mode = "r+b" if os.path.exists(self.path) else "wb"
+            with open(self.path, mode) as fh:
+                fh.truncate(self.state["offset"])
+        done = array("Q")
+        if os.path.exists(self.ids_path):
+            with open(self.ids_path, "r+b") as fh:
+                fh.truncate(self.state["count"] * 8)
+                done.frombytes(fh.read())
+        return array("Q", sorted(done))
+
+    def write_batch(self, msgs: List[Dict], label_names: Dict[str, str]) -> int:
+        written = 0
+        if self.fmt == "eml":
+            for msg in msgs:
+                final = os.path.join(self.path, f"{msg['id']}.eml")
+                with open(final + ".tmp", "wb") as fh:
+                    for chunk in _decoded_chunks(msg["raw"]):
+                        written += fh.write(chunk)
+                os.replace(final + ".tmp", final)
+        else:
+            gz = self.path.endswith(".gz")
+            comp = zlib.compressobj(6, zlib.DEFLATED, 31) if gz else None
+            with open(self.path, "ab") as fh:
+                for msg in msgs:
+                    parts = [_envelope(msg, label_names)]
+                    for piece in parts + list(_mboxrd(_decoded_chunks(msg["raw"]))):
+                        written += len(piece)
+                        fh.write(comp.compress(piece) if comp else piece)
+                    sep = b"\n"
+                    fh.write(comp.compress(sep) if comp else sep)
+                if comp:
+                    fh.write(comp.flush())
+                fh.flush()
+                os.fsync(fh.fileno())
+                self.state["offset"] = fh.tell()
+        with open(self.ids_path, "ab") as fh:
+            fh.write(array("Q", (selection._to_int(m["id"]) for m in msgs)).tobytes())
+        self.state["count"] += len(msgs)
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.state, fh)
+        os.replace(tmp, self.state_path)
+        return written
+
+    def exported_ids(self) -> array:
+        done = array("Q")
+        if os.path.exists(self.ids_path):
+            with open(self.ids_path, "rb") as fh:
+                done.frombytes(fh.read(self.state.get("count", 0) * 8))
+        return done
+
+
+# ---------- descarga ----------
+def _fetch_raw(ids: List[str]) -> Tuple[List[Dict], List[str]]:
+    """
+    messages.get(format=raw) de `ids` en un batch; reintenta sólo las
+    sub-peticiones 429/5xx. Devuelve (mensajes, IDs fallidos).
+    """
+    service = get_gmail_service()
+    got: Dict[str, Dict] = {}
+    failed: List[str] = []
+    pending = list(ids)
+    for attempt in range(6):
+        retry: List[str] = []
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                got[request_id] = response
+                return
+            status = getattr(getattr(exception, "resp", None), "status", None)
+            (retry if status in messages.RETRY_STATUS else failed).append(request_id)
+
+        batch = service.new_batch_http_request(callback=callback)
+        for mid in pending:
+            batch.add(
+                api.request(
+                    "messages.get", service, api.RAW_FIELDS, id=mid, format="raw"
+                ),
+                None,
+                mid,
+            )
+        with tracing.span("batch", "http", action="GET_RAW", size=len(pending)):
+            messages._with_retries(batch.execute)
+        if not retry:
+            break
+        pending = retry
+        sleep = min(16.0, 0.5 * (2**attempt) + random.uniform(0, 0.5))
+        meter.note_retry(sleep)
+        with tracing.span("retry_sleep", "retry", status=429, attempt=attempt):
+            time.sleep(sleep)
+    else:
+        failed.extend(pending)
+    return [got[m] for m in ids if m in got], failed
+
+
+# ---------- PUBLIC ----------
+def export_messages(
+    q: str,
+    path: str,
+    fmt: str = "mbox",
+    resume: bool = True,
+    max_messages: Optional[int] = None,
+    concurrency: int = 4,
+    batch_size: int = RAW_BATCH_SIZE,
+    delete: bool = False,
+    protect_starred: bool = True,
+    progress_cb: Optional[Callable[[int, int], None]] = None,
+    stop_event: Optional[threading.Event] = None,
+) -> Dict:
+    """
+    Exporta los mensajes de `q` a `path` (``fmt`` mbox o eml). Con `delete`
+    y si la exportación termina sin fallos ni cancelación, borra de forma
+    permanente los IDs exportados. Con protect_starred y `delete` la consulta
+    excluye los destacados. Devuelve ``{"exported", "skipped", "failed",
+    "bytes", "archived", "deleted", "query_used", "path"}``.
+    """
+    if fmt not in ("mbox", "eml"):
+        raise ValueError(f"Formato no soportado: {fmt}")
+    q2 = messages._safe_query(q, protect_starred and delete)
+    archive = _Archive(path, fmt)
+    done = archive.open(q2, resume)
+    label_names = {
+        l["id"]: l["name"] for l in labels.list_labels() if l.get("type") == "user"
+    }
+    est = messages.estimate_count(q2, None)
+    if max_messages:
+        est = min(est, max_messages)
+    exported = skipped = written = 0
+    failed: List[str] = []
+    workers = max(1, concurrency)
+
+    def ids_to_fetch() -> Iterator[List[str]]:
+        nonlocal skipped
+        chunk: List[str] = []
+        for mid in messages.iter_message_ids(q2, None, max_total=max_messages):
+            if stop_event and stop_event.is_set():
+                break
+            value = selection._to_int(mid)
+            i = _bisect(done, value)
+            if i < len(done) and done[i] == value:
+                skipped += 1
+                continue
+            chunk.append(mid)
+            if len(chunk) >= batch_size:
+                yield chunk
+                chunk = []
+        if chunk and not (stop_event and stop_event.is_set()):
+            yield chunk
+
+    def drain(futures, return_when) -> set:
+        nonlocal exported, written
+        finished, rest = wait(futures, return_when=return_when)
+        for f in finished:
+            msgs, bad = f.result()
+            failed.extend(bad)
+            if msgs:
+                written += archive.write_batch(msgs, label_names)
+                exported += len(msgs)
+            if progress_cb:
+                messages._report_progress(progress_cb, exported + skipped, est)
+        return rest
+
+    job = "export_raw"
+    meter.note_concurrency(workers)
+    with tracing.trace_job(job), profiling.profile_job(job):
+        with ContextThreadPool(max_workers=workers) as ex:
+            futures: set = set()
+            for chunk in ids_to_fetch():
+                futures.add(ex.submit(_fetch_raw, chunk))
+                # Memoria acotada: como mucho 2 lotes en vuelo por worker
+                if len(futures) >= workers * 2:
+                    futures = drain(futures, FIRST_COMPLETED)
+            if futures:
+                drain(futures, "ALL_COMPLETED")
+
+        archived = archive.exported_ids()
+        deleted = 0
+        cancelled = bool(stop_event and stop_event.is_set())
+        if delete and not failed and not cancelled and archived:
+            deleted = messages._stream_action_from_ids(
+                selection.iter_ids(archived),
+                len(archived),
+                None,
+                messages.BATCH_LIMIT,
+                concurrency,
+                progress_cb,
+                stop_event,
+                "DELETE",
+            )
+    return {
+        "exported": exported,
+        "skipped": skipped,
+        "failed": failed,
+        "bytes": written,
+        "archived": len(archived),
+        "deleted": deleted,
+        "query_used": q2,
+        "path": path,
+    }
+
+
+def _bisect(arr: array, value: int) -> int:
+    lo, hi = 0, len(arr)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if arr[mid] < value:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
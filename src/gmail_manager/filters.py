@@ -1,12 +1,29 @@
-from typing import Dict, List, Optional
+import heapq
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from array import array
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from . import api, labels, messages, meter, profiling, selection, tracing
+from . import query as gq
+from .accounts import ContextThreadPool
 from .service import get_gmail_service
 
 USER_ID = "me"
+# Escrituras en settings/filters: lotes pequeños y pausa entre lotes (los
+# endpoints de configuración tienen límites por usuario más estrictos)
+FILTER_BATCH_SIZE = 20
+FILTER_BATCH_INTERVAL = 1.0
+EXPORT_VERSION = 1
 
 
 def list_filters() -> List[Dict]:
     service = get_gmail_service()
-    res = service.users().settings().filters().list(userId=USER_ID).execute()
+    res = api.execute("settings.filters.list", service)
     return res.get("filter", [])
 
 
@@ -32,11 +49,529 @@ def create_filter(criteria: Dict, action: Dict) -> Dict:
     """
     service = get_gmail_service()
     body = {"criteria": criteria, "action": action}
-    return (
-        service.users().settings().filters().create(userId=USER_ID, body=body).execute()
-    )
+    return api.execute("settings.filters.create", service, body=body)
 
 
 def delete_filter(filter_id: str) -> None:
     service = get_gmail_service()
-    service.users().settings().filters().delete(userId=USER_ID, id=filter_id).execute()
+    api.execute("settings.filters.delete", service, id=filter_id)
+
+
+# ---------- aplicar filtros al correo existente ----------
+# Los filtros de Gmail sólo actúan sobre el correo nuevo; esto los "ejecuta"
+# sobre lo que ya hay: criteria -> q, se listan los IDs y se aplica action
+# con la tubería de batchModify de messages.py. Con varios filtros cada
+# consulta distinta se lista una vez y un mensaje que cumple varios recibe
+# la suma de acciones en un único batchModify. `forward` no se reproduce.
+
+
+def _criteria_term(op: str, value) -> str:
+    v = str(value or "").strip()
+    if not v:
+        return ""
+    if v[0] in '({"':
+        return f"{op}:{v}"
+    if re.search(r"\s(OR|\|)\s", v):
+        return f"{op}:({v})"
+    if any(ch.isspace() for ch in v):
+        return f'{op}:"{v}"'
+    return f"{op}:{v}"
+
+
+def criteria_to_query(criteria: Dict) -> str:
+    """Traduce los `criteria` de un filtro a la `q` equivalente."""
+    c = criteria or {}
+    parts = [
+        _criteria_term("from", c.get("from")),
+        _criteria_term("to", c.get("to")),
+        _criteria_term("subject", c.get("subject")),
+    ]
+    query = (c.get("query") or "").strip()
+    if query:
+        parts.append(f"({query})" if re.search(r"\sOR\s", query) else query)
+    negated = (c.get("negatedQuery") or "").strip()
+    if negated:
+        # "No contiene": ninguna de las palabras, como hace la UI de Gmail
+        parts.append(f"-{{{negated}}}" if " " in negated else f"-{negated}")
+    if c.get("hasAttachment"):
+        parts.append("has:attachment")
+    if c.get("size"):
+        cmp_ = "smaller" if c.get("sizeComparison") == "smaller" else "larger"
+        parts.append(f"{cmp_}:{int(c['size'])}")
+    if c.get("excludeChats"):
+        parts.append("-in:chats")
+    return " ".join(p for p in parts if p)
+
+
+def _action_changes(action: Dict) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    a = action or {}
+    return frozenset(a.get("addLabelIds") or []), frozenset(
+        a.get("removeLabelIds") or []
+    )
+
+
+def _combine(changes: List[Tuple[FrozenSet[str], FrozenSet[str]]]):
+    """Suma de acciones: gana añadir si un filtro añade lo que otro quita."""
+    add = frozenset().union(*(c[0] for c in changes))
+    remove = frozenset().union(*(c[1] for c in changes)) - add
+    return tuple(sorted(add)), tuple(sorted(remove))
+
+
+def _list_queries(queries: List[str], concurrency: int) -> List[array]:
+    def fetch(q: str) -> array:
+        with tracing.span("filter_list", "list", query=q):
+            return selection.compact(messages.iter_message_ids(q, None))
+
+    with ContextThreadPool(max_workers=max(1, concurrency)) as ex:
+        return list(ex.map(fetch, queries))
+
+
+def _group_by_change(arrays: List[array], actions: List[List[int]], changes):
+    """
+    Recorre los IDs de todas las consultas en orden (merge) y reparte cada
+    mensaje en el grupo de su acción combinada: {(add, remove): array}.
+    """
+    streams = [zip(arr, itertools.repeat(qi)) for qi, arr in enumerate(arrays)]
+    combos: Dict[Tuple[int, ...], Tuple] = {}
+    groups: Dict[Tuple, array] = {}
+    for value, hits in itertools.groupby(heapq.merge(*streams), key=lambda t: t[0]):
+        key = tuple(qi for _, qi in hits)
+        change = combos.get(key)
+        if change is None:
+            fids = [fi for qi in key for fi in actions[qi]]
+            change = combos[key] = _combine([changes[fi] for fi in fids])
+        if change[0] or change[1]:
+            groups.setdefault(change, array("Q")).append(value)
+    return groups
+
+
+def apply_filters(
+    filter_list: List[Dict],
+    protect_starred: bool = True,
+    concurrency: int = 4,
+    batch_size: int = messages.BATCH_LIMIT,
+    progress_cb: Optional[Callable[[int, int], None]] = None,
+    stop_event: Optional[threading.Event] = None,
+    dry_run: bool = False,
+) -> Dict:
+    """
+    Aplica filtros (como los devuelve list_filters) al correo ya existente.
+    Con protect_starred los destacados no van a la papelera. Con dry_run
+    sólo se lista y se devuelven los grupos sin modificar nada. Lo que va a
+    la papelera queda en un diario (journal) para poder deshacerlo.
+    """
+    from . import journal  # diferido: journal importa filters
+
+    queries: Dict[str, List[int]] = {}
+    changes = []
+    skipped = []
+    for fi, f in enumerate(filter_list):
+        q = criteria_to_query(f.get("criteria", {}))
+        change = _action_changes(f.get("action", {}))
+        changes.append(change)
+        # Sin criterios coincidiría todo el buzón; sin acciones no hay nada que hacer
+        if not q or not (change[0] or change[1]):
+            skipped.append(f.get("id", fi))
+            continue
+        queries.setdefault(q, []).append(fi)
+
+    qs = list(queries)
+    with tracing.trace_job("apply_filters"), profiling.profile_job("apply_filters"):
+        arrays = _list_queries(qs, concurrency)
+        groups = _group_by_change(arrays, [queries[q] for q in qs], changes)
+        skipped_starred = 0
+        if protect_starred and any("TRASH" in add for add, _ in groups):
+            starred = selection.compact(messages.iter_message_ids("is:starred", None))
+            for change in [c for c in groups if "TRASH" in c[0]]:
+                arr = groups.pop(change)
+                kept = selection.difference(arr, starred)
+                if kept:
+                    groups[change] = kept
+                # Los destacados reciben el resto de acciones, sin la papelera
+                held = selection.intersection(arr, starred)
+                skipped_starred += len(held)
+                rest = (tuple(l for l in change[0] if l != "TRASH"), change[1])
+                if held and (rest[0] or rest[1]):
+                    groups[rest] = selection.union(groups.get(rest, array("Q")), held)
+
+        total = sum(len(arr) for arr in groups.values())
+        processed = trashed = 0
+        jr = None
+        if not dry_run:
+            if any("TRASH" in add for add, _ in groups):
+                jr = journal.start("apply_filters", " | ".join(qs))
+            try:
+                for (add, remove), arr in groups.items():
+                    if stop_event and stop_event.is_set():
+                        break
+                    offset = processed
+                    cb = None
+                    if progress_cb:
+                        cb = lambda d, _t, o=offset: progress_cb(o + d, total)
+                    done = messages._stream_action_from_ids(
+                        selection.iter_ids(arr),
+                        len(arr),
+                        None,
+                        batch_size,
+                        concurrency,
+                        cb,
+                        stop_event,
+                        "MODIFY",
+                        (list(add), list(remove)),
+                        on_chunk=jr.add if jr and "TRASH" in add else None,
+                    )
+                    processed += done
+                    if "TRASH" in add:
+                        trashed += done
+            finally:
+                if jr:
+                    jr.close(trashed)
+    return {
+        "processed": processed,
+        "matched": total,
+        "filters": len(filter_list),
+        "queries": len(qs),
+        "listed": sum(len(arr) for arr in arrays),
+        "groups": [
+            {"add": list(add), "remove": list(remove), "count": len(arr)}
+            for (add, remove), arr in groups.items()
+        ],
+        "skipped": skipped,
+        "skipped_starred": skipped_starred,
+        "journal": jr.id if jr else None,
+    }
+
+
+def apply_filter(filt: Dict, **kwargs) -> Dict:
+    """`apply_filters` para un único filtro."""
+    return apply_filters([filt], **kwargs)
+
+
+# ---------- importar / exportar ----------
+def _clean_criteria(criteria: Dict) -> Dict:
+    out = {}
+    for key, value in (criteria or {}).items():
+        if value in (None, "", False, 0, []):
+            continue
+        if key in ("from", "to", "subject", "query", "negatedQuery"):
+            value = " ".join(str(value).split())
+            if key in ("from", "to"):
+                value = value.lower()
+        out[key] = value
+    if "size" not in out:
+        out.pop("sizeComparison", None)
+    return out
+
+
+def _clean_action(action: Dict) -> Dict:
+    out = {}
+    for key, value in (action or {}).items():
+        if key in ("addLabelIds", "removeLabelIds"):
+            value = sorted(set(value or []))
+        if value in (None, "", []):
+            continue
+        out[key] = value
+    return out
+
+
+def canonical(f: Dict) -> Dict:
+    """Filtro sin ID y normalizado (espacios, mayúsculas en direcciones, orden)."""
+    return {
+        "criteria": _clean_criteria(f.get("criteria", {})),
+        "action": _clean_action(f.get("action", {})),
+    }
+
+
+def filter_key(f: Dict) -> str:
+    """Clave estable para comparar filtros entre cuentas o ficheros."""
+    return json.dumps(canonical(f), sort_keys=True, ensure_ascii=False)
+
+
+def _map_labels(f: Dict, mapping: Dict[str, str]) -> Dict:
+    out = canonical(f)
+    for key in ("addLabelIds", "removeLabelIds"):
+        if key in out["action"]:
+            out["action"][key] = sorted(mapping.get(l, l) for l in out["action"][key])
+    return out
+
+
+def export_filters(path: str, filter_list: Optional[List[Dict]] = None) -> int:
+    """
+    Guarda los filtros (los de la cuenta si no se pasan) en JSON. Las
+    etiquetas de usuario se guardan por nombre: los IDs cambian entre cuentas.
+    """
+    fl = list_filters() if filter_list is None else filter_list
+    names = {
+        l["id"]: l["name"] for l in labels.list_labels() if l.get("type") == "user"
+    }
+    data = {
+        "version": EXPORT_VERSION,
+        "labels": "names",
+        "filters": [_map_labels(f, names) for f in fl],
+    }
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, indent=2, ensure_ascii=False)
+    return len(data["filters"])
+
+
+def load_filter_file(
+    path: str, create_labels: bool = False, strict: bool = True
+) -> List[Dict]:
+    """
+    Lee un fichero de export_filters (o una lista JSON de filtros con IDs) y
+    traduce los nombres de etiqueta a IDs de la cuenta activa. Con
+    create_labels crea las que falten; si no, con strict=False las deja por
+    nombre (para previsualizar) y con strict=True falla.
+    """
+    with open(path, encoding="utf-8") as fh:
+        data = json.load(fh)
+    fl = data.get("filters", []) if isinstance(data, dict) else data
+    if not (isinstance(data, dict) and data.get("labels") == "names"):
+        return [canonical(f) for f in fl]
+    ids = {l["name"]: l["id"] for l in labels.list_labels()}
+    wanted = {
+        name
+        for f in fl
+        for key in ("addLabelIds", "removeLabelIds")
+        for name in (f.get("action", {}).get(key) or [])
+    }
+    missing = sorted(n for n in wanted if n not in ids and n not in gq.SYSTEM_LABELS)
+    if missing and not create_labels and strict:
+        raise ValueError("Etiquetas inexistentes en esta cuenta: " + ", ".join(missing))
+    for name in missing if create_labels else []:
+        ids[name] = labels.create_label(name)["id"]
+    return [_map_labels(f, ids) for f in fl]
+
+
+def _address_covers(general: str, specific: str) -> bool:
+    """`general` (dirección, @dominio o dominio) incluye a `specific`."""
+    if general == specific:
+        return True
+    if " " in general or " " in specific or "@" not in specific:
+        return False
+    domain = general.lstrip("@")
+    if "@" in domain:
+        return False
+    host = specific.rsplit("@", 1)[1]
+    return host == domain or host.endswith("." + domain)
+
+
+def _criteria_covers(general: Dict, specific: Dict) -> bool:
+    """
+    True si todo lo que cumple `specific` cumple también `general`, juzgado
+    sólo por la forma de los criterios (conservador: ante la duda, False).
+    """
+    for key, value in general.items():
+        other = specific.get(key)
+        if key in ("from", "to"):
+            if other is None or not _address_covers(value, other):
+                return False
+        elif key == "size":
+            cmp_ = general.get("sizeComparison", "larger")
+            if specific.get("sizeComparison", "larger") != cmp_ or other is None:
+                return False
+            if (cmp_ == "larger" and other < value) or (
+                cmp_ == "smaller" and other > value
+            ):
+                return False
+        elif key == "sizeComparison":
+            continue
+        elif other != value:
+            return False
+    return True
+
+
+def _action_covers(general: Dict, specific: Dict) -> bool:
+    for key in ("addLabelIds", "removeLabelIds"):
+        if not set(specific.get(key, [])) <= set(general.get(key, [])):
+            return False
+    return specific.get("forward") in (None, general.get("forward"))
+
+
+def find_redundant(filter_list: List[Dict]) -> Dict[str, List[Tuple[Dict, Dict]]]:
+    """
+    ``{"duplicates": [(filtro, original)], "subsumed": [(filtro, cubierto_por)]}``.
+    Un filtro está subsumido si otro coge al menos sus mensajes y hace al
+    menos sus acciones: borrarlo no cambia el resultado.
+    """
+    seen: Dict[str, Dict] = {}
+    unique = []
+    duplicates = []
+    for f in filter_list:
+        key = filter_key(f)
+        if key in seen:
+            duplicates.append((f, seen[key]))
+        else:
+            seen[key] = f
+            unique.append(f)
+    subsumed = []
+    removed = set()
+    canon = [canonical(f) for f in unique]
+    for i, f in enumerate(unique):
+        for j, g in enumerate(unique):
+            # Con dos filtros que se cubren mutuamente sólo cae el primero
+            if i == j or j in removed:
+                continue
+            if _criteria_covers(canon[j]["criteria"], canon[i]["criteria"]) and (
+                _action_covers(canon[j]["action"], canon[i]["action"])
+            ):
+                subsumed.append((f, g))
+                removed.add(i)
+                break
+    return {"duplicates": duplicates, "subsumed": subsumed}
+
+
+def diff_filters(
+    current: List[Dict], desired: List[Dict], prune: bool = False
+) -> Dict[str, List[Dict]]:
+    """
+    Qué cambia para pasar de `current` a `desired`: ``create``, ``delete``
+    (sólo con prune: filtros actuales que no están en `desired`, y los
+    duplicados actuales) y ``unchanged``. Gmail no edita filtros: un cambio
+    es borrar y crear.
+    """
+    have: Dict[str, List[Dict]] = {}
+    for f in current:
+        have.setdefault(filter_key(f), []).append(f)
+    want: Dict[str, Dict] = {}
+    for f in desired:
+        want.setdefault(filter_key(f), canonical(f))
+    create = [f for key, f in want.items() if key not in have]
+    unchanged = [fs[0] for key, fs in have.items() if key in want]
+    delete = []
+    if prune:
+        for key, fs in have.items():
+            delete.extend(fs if key not in want else fs[1:])
+    return {"create": create, "delete": delete, "unchanged": unchanged}
+
+
+def format_diff(diff: Dict[str, List[Dict]]) -> List[str]:
+    """Líneas legibles ``+``/``-``/``=`` con la consulta y las acciones."""
+
+    def line(sign: str, f: Dict) -> str:
+        q = criteria_to_query(f.get("criteria", {}))
+        a = _clean_action(f.get("action", {}))
+        acts = [f"+{l}" for l in a.get("addLabelIds", [])]
+        acts += [f"-{l}" for l in a.get("removeLabelIds", [])]
+        if a.get("forward"):
+            acts.append(f">{a['forward']}")
+        return f"{sign} {q}  =>  {' '.join(acts)}"
+
+    out = [line("-", f) for f in diff["delete"]]
+    out += [line("+", f) for f in diff["create"]]
+    out += [line("=", f) for f in diff["unchanged"]]
+    return out
+
+
+def _batch_write(
+    op: str,
+    items: List[Dict],
+    progress_cb: Optional[Callable[[int, int], None]] = None,
+) -> Tuple[List[Dict], List[Tuple[Dict, str]]]:
+    """
+    Envía `items` (parámetros de cada llamada) en batch HTTP de
+    FILTER_BATCH_SIZE con pausa entre lotes; reintenta 429/5xx con backoff.
+    Devuelve (respuestas correctas, [(item, error)]).
+    """
+    service = get_gmail_service()
+    done: List[Dict] = []
+    failed: List[Tuple[Dict, str]] = []
+    total = len(items)
+    for start in range(0, total, FILTER_BATCH_SIZE):
+        pending = dict(enumerate(items[start : start + FILTER_BATCH_SIZE]))
+        for attempt in range(6):
+            retry: Dict[int, Dict] = {}
+
+            def callback(request_id, response, exception):
+                item = pending[int(request_id)]
+                if exception is None:
+                    done.append(response or {})
+                    return
+                status = getattr(getattr(exception, "resp", None), "status", None)
+                if status in messages.RETRY_STATUS:
+                    retry[int(request_id)] = item
+                else:
+                    failed.append((item, str(exception)))
+
+            batch = service.new_batch_http_request(callback=callback)
+            for i, item in pending.items():
+                batch.add(api.request(op, service, **item), None, str(i))
+            with tracing.span("batch", "http", action=op, size=len(pending)):
+                messages._with_retries(batch.execute)
+            if not retry:
+                break
+            pending = retry
+            sleep = min(16.0, 0.5 * (2**attempt) + random.uniform(0, 0.5))
+            meter.note_retry(sleep)
+            with tracing.span("retry_sleep", "retry", status=429, attempt=attempt):
+                time.sleep(sleep)
+        else:
+            failed.extend((item, "reintentos agotados") for item in pending.values())
+        if progress_cb:
+            progress_cb(min(total, start + FILTER_BATCH_SIZE), total)
+        if start + FILTER_BATCH_SIZE < total:
+            time.sleep(FILTER_BATCH_INTERVAL)
+    return done, failed
+
+
+def apply_diff(
+    diff: Dict[str, List[Dict]],
+    progress_cb: Optional[Callable[[int, int], None]] = None,
+) -> Dict:
+    """Borra y crea en batch lo que indica `diff_filters` (primero borra)."""
+    deletes = [{"id": f["id"]} for f in diff["delete"] if f.get("id")]
+    creates = [{"body": canonical(f)} for f in diff["create"]]
+    total = len(deletes) + len(creates)
+
+    def offset(base: int):
+        if progress_cb is None:
+            return None
+        return lambda d, _t: progress_cb(base + d, total)
+
+    with tracing.trace_job("import_filters"):
+        deleted, del_failed = _batch_write(
+            "settings.filters.delete", deletes, offset(0)
+        )
+        created, create_failed = _batch_write(
+            "settings.filters.create", creates, offset(len(deletes))
+        )
+    return {
+        "created": len(created),
+        "deleted": len(deleted),
+        "failed": [
+            {"op": "delete", "id": item["id"], "error": err} for item, err in del_failed
+        ]
+        + [
+            {"op": "create", "filter": item["body"], "error": err}
+            for item, err in create_failed
+        ],
+    }
+
+
+def import_filters(
+    path: str, prune: bool = False, dry_run: bool = False, create_labels: bool = True
+) -> Dict:
+    """
+    Importa un fichero de filtros en la cuenta activa. Devuelve el diff
+    (``create``/``delete``/``unchanged``), los redundantes del fichero y,
+    si no es dry_run, el resultado de aplicarlo.
+    """
+    desired = load_filter_file(path, create_labels and not dry_run, strict=not dry_run)
+    redundant = find_redundant(desired)
+    diff = diff_filters(list_filters(), desired, prune)
+    out = {"diff": diff, "redundant": redundant}
+    if not dry_run:
+        out["result"] = apply_diff(diff)
+    return out
+
+
+def dedupe_filters(include_subsumed: bool = True, dry_run: bool = False) -> Dict:
+    """Borra (en batch) los filtros duplicados o subsumidos de la cuenta."""
+    redundant = find_redundant(list_filters())
+    victims = [f for f, _ in redundant["duplicates"]]
+    if include_subsumed:
+        victims += [f for f, _ in redundant["subsumed"]]
+    out = {"redundant": redundant, "delete": victims}
+    if not dry_run:
+        out["result"] = apply_diff({"create": [], "delete": victims, "unchanged": []})
+    return out
@@ -1,19 +1,31 @@
 import threading
+import time
 import tkinter as tk
 from datetime import datetime, timedelta
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 
 from . import labels as labels_api
 from . import search as search_api
 from . import filters as filters_api
 from . import trash as trash_api
 from . import messages as messages_api
+from . import threads as threads_api
 from . import auth as auth_api
-from .service import get_gmail_service
-from .config import APP_NAME
+from . import accounts, backtest, journal, meter, profiling, tuning
+from .service import get_gmail_service, reset_service
+from .config import APP_NAME, PROFILE_DIR
 
 CHECK_OFF = "☐"
 CHECK_ON = "☑"
+# Agrupación de la vista de remitentes -> nivel de search.rollup_senders
+SENDER_GROUPINGS = {
+    "Dirección exacta": None,
+    "Dirección (sin +tag)": "address",
+    "Dominio": "domain",
+    "Organización": "org",
+}
+# Cada cuánto se copia el progreso (ritmo, ETA...) al registro
+PROGRESS_LOG_SECONDS = 30.0
 
 
 class App(tk.Tk):
@@ -26,17 +38,21 @@ class App(tk.Tk):
         self.selected_label_ids = set()
         self._sort_state = {}
         self._labels_cache = []
+        self._sender_rows = []  # perfiles de la última búsqueda (orden local)
+        self._sender_items = {}  # iid del árbol -> fila/grupo mostrado
+        self._sender_sort = ("count", True)
 
         # Progreso / cancelación
         self._cancel_event = None
-        self._last_logged = -1
+        self._meter = None
+        self._last_logged = 0.0
 
         self._build_ui()
 
     def _build_ui(self):
         self.notebook = ttk.Notebook(self)
         self.notebook.pack(fill=tk.BOTH, expand=True, padx=8, pady=8)
-        
+
         nb = self.notebook
 
         self.tab_labels = ttk.Frame(nb)
@@ -194,6 +210,7 @@ class App(tk.Tk):
         self.var_or_labels = tk.BooleanVar(value=True)
         self.var_turbo = tk.BooleanVar(value=True)  # turbo por defecto
         self.var_perm_delete = tk.BooleanVar(value=False)  # Nuevo: borrar permanente
+        self.var_thread_mode = tk.BooleanVar(value=False)  # actuar por conversación
 
         ttk.Checkbutton(
             frame,
@@ -208,6 +225,9 @@ class App(tk.Tk):
         ttk.Checkbutton(frame, text="Turbo (streaming)", variable=self.var_turbo).grid(
             row=7, column=4, padx=5, sticky="w"
         )
+        ttk.Checkbutton(
+            frame, text="Por conversación (hilos)", variable=self.var_thread_mode
+        ).grid(row=7, column=5, padx=5, sticky="w")
 
         # Fila 8 límites/paralelo
         ttk.Label(frame, text="Máximo a procesar:").grid(
@@ -218,14 +238,17 @@ class App(tk.Tk):
         ttk.Label(frame, text="Tamaño de lote:").grid(
             row=8, column=2, padx=5, sticky="e"
         )
+        # Valores calibrados (tuning.json) si existen; si el usuario no los
+        # cambia, cada operación usa su propio perfil al ejecutarse.
+        self._auto_batch, self._auto_parallel = tuning.recommended("TRASH")
         self.entry_batch_size = ttk.Entry(frame, width=10)
-        self.entry_batch_size.insert(0, "1000")
+        self.entry_batch_size.insert(0, str(self._auto_batch))
         self.entry_batch_size.grid(row=8, column=3, padx=5, sticky="w")
         ttk.Label(frame, text="Peticiones paralelas:").grid(
             row=8, column=4, padx=5, sticky="e"
         )
         self.entry_parallel = ttk.Entry(frame, width=8)
-        self.entry_parallel.insert(0, "4")
+        self.entry_parallel.insert(0, str(self._auto_parallel))
         self.entry_parallel.grid(row=8, column=5, padx=5, sticky="w")
 
         # Fila 9 acciones
@@ -449,24 +472,34 @@ class App(tk.Tk):
         threading.Thread(target=task, daemon=True).start()
 
     # ---------- Progreso / cancelar ----------
+    def _begin_long_task(self):
+        """Evento de cancelación y medidor de progreso nuevos para un trabajo."""
+        self._cancel_event = threading.Event()
+        self._meter = meter.Meter(
+            lambda snap: self.after(0, self._progress_update_ui, snap)
+        )
+        self._last_logged = time.monotonic()
+
     def _reset_progress(self, total: int):
         self.progress["maximum"] = max(1, total)
         self.progress["value"] = 0
         self.lbl_progress.config(text=f"Progreso: 0/{total}")
-        self._last_logged = -1
 
     def _progress_cb(self, done: int, total: int):
-        self.after(0, self._progress_update_ui, done, total)
+        if self._meter is None:
+            self._begin_long_task()
+        self._meter(done, total)
 
-    def _progress_update_ui(self, done: int, total: int):
+    def _progress_update_ui(self, snap: meter.Snapshot):
         # Si el estimado se queda corto, mantenlo visible
-        if done > self.progress["maximum"]:
-            self.progress["maximum"] = done
-        self.progress["value"] = done
-        self.lbl_progress.config(text=f"Progreso: {done}/{total}")
-        if done != self._last_logged and (done % 1000 == 0 or done == total):
-            self._log(f"Avance: {done}/{total}")
-            self._last_logged = done
+        self.progress["maximum"] = max(1, snap.total or 0, snap.done)
+        self.progress["value"] = snap.done
+        self.lbl_progress.config(text=f"Progreso: {snap.describe()}")
+        now = time.monotonic()
+        final = bool(snap.total) and snap.done >= snap.total
+        if final or now - self._last_logged >= PROGRESS_LOG_SECONDS:
+            self._log(f"Avance: {snap.describe()}")
+            self._last_logged = now
 
     def _cancel_long_task(self):
         if self._cancel_event:
@@ -484,6 +517,17 @@ class App(tk.Tk):
         except ValueError:
             return None
 
+    def _tuned_params(self, operation: str):
+        """(batch_size, parallel): lo escrito por el usuario o el perfil calibrado."""
+        tuned_batch, tuned_parallel = tuning.recommended(operation)
+        batch_size = self._read_int_or_none(self.entry_batch_size)
+        parallel = self._read_int_or_none(self.entry_parallel)
+        if batch_size is None or batch_size == self._auto_batch:
+            batch_size = tuned_batch
+        if parallel is None or parallel == self._auto_parallel:
+            parallel = tuned_parallel
+        return batch_size, parallel
+
     # ---------- Enviar a TRASH o DELETE Permanentemente ----------
     def _trash_by_query(self):
         def task():
@@ -491,9 +535,10 @@ class App(tk.Tk):
             protect = self.var_protect_starred.get()
             perm_delete = self.var_perm_delete.get()
             limit = self._read_int_or_none(self.entry_max_to_process)
-            batch_size = self._read_int_or_none(self.entry_batch_size) or 1000
-            parallel = self._read_int_or_none(self.entry_parallel) or 4
-            self._cancel_event = threading.Event()
+            batch_size, parallel = self._tuned_params(
+                "DELETE" if perm_delete else "TRASH"
+            )
+            self._begin_long_task()
 
             # Mensaje confirmación
             action_name = (
@@ -514,15 +559,28 @@ class App(tk.Tk):
             ):
                 return
 
-            self._log(f"Calculando estimado para: {action_name}...")
-            # Estimación preliminar
-            q2 = messages_api._safe_query(q, protect)
-            est = messages_api.estimate_count(q2, None)
-            self.after(0, self._reset_progress, est)
-            self._log(f"Estimado: {est}. Lote={batch_size}, Paralelo={parallel}.")
+            # Sin conteo previo: el trabajo siembra la barra con su 1ª página
+            # (planner.job_listing) y la afina según lista
+            self.after(0, self._reset_progress, 0)
+            self._log(f"{action_name}: Lote={batch_size}, Paralelo={parallel}.")
 
             try:
-                if perm_delete:
+                if self.var_thread_mode.get():
+                    # Máximo a procesar cuenta conversaciones en este modo
+                    fn = (
+                        threads_api.delete_threads_by_query
+                        if perm_delete
+                        else threads_api.trash_threads_by_query
+                    )
+                    res = fn(
+                        q,
+                        protect_starred=protect,
+                        max_threads=limit,
+                        concurrency=parallel,
+                        progress_cb=self._progress_cb,
+                        stop_event=self._cancel_event,
+                    )
+                elif perm_delete:
                     res = messages_api.delete_permanently_by_query_fast(
                         q,
                         protect_starred=protect,
@@ -544,9 +602,12 @@ class App(tk.Tk):
                     )
 
                 act_done = res.get("processed", 0)
+                unit = " hilos" if res.get("unit") == "threads" else ""
                 self._log(
-                    f"Acción completada ({action_name}): {act_done} | Estimado: {res.get('estimated')} | Query: '{res['query_used']}'"
+                    f"Acción completada ({action_name}): {act_done}{unit} | Estimado: {res.get('estimated')} | Query: '{res['query_used']}'"
                 )
+                if res.get("journal"):
+                    self._log(f"Diario de papelera: {res['journal']}")
             except Exception as e:
                 self._log(self._format_error(e))
 
@@ -565,9 +626,10 @@ class App(tk.Tk):
             use_or = self.var_or_labels.get()
             perm_delete = self.var_perm_delete.get()
             limit = self._read_int_or_none(self.entry_max_to_process)
-            batch_size = self._read_int_or_none(self.entry_batch_size) or 1000
-            parallel = self._read_int_or_none(self.entry_parallel) or 4
-            self._cancel_event = threading.Event()
+            batch_size, parallel = self._tuned_params(
+                "DELETE" if perm_delete else "TRASH"
+            )
+            self._begin_long_task()
 
             if protect and "STARRED" in label_ids:
                 label_ids = [x for x in label_ids if x != "STARRED"]
@@ -628,6 +690,8 @@ class App(tk.Tk):
                     f"| Match: {res.get('matched')} "
                     f"| Query: '{res['query_used']}'{extra}"
                 )
+                if res.get("journal"):
+                    self._log(f"Diario de papelera: {res['journal']}")
             except Exception as e:
                 self._log(self._format_error(e))
 
@@ -674,6 +738,22 @@ class App(tk.Tk):
         self.entry_regex = ttk.Entry(f_adv, width=30)
         self.entry_regex.pack(side="left", padx=5, fill="x", expand=True)
 
+        ttk.Label(f_adv, text="Agrupar:").pack(side="left", padx=5)
+        self.combo_group = ttk.Combobox(
+            f_adv,
+            values=list(SENDER_GROUPINGS),
+            state="readonly",
+            width=16,
+        )
+        self.combo_group.current(0)
+        self.combo_group.bind("<<ComboboxSelected>>", lambda e: self._render_senders())
+        self.combo_group.pack(side="left", padx=5)
+
+        self.var_search_threads = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            f_adv, text="Contar conversaciones", variable=self.var_search_threads
+        ).pack(side="left", padx=5)
+
         # Fila 2: Botones rápidos
         ttk.Button(
             frame,
@@ -681,11 +761,31 @@ class App(tk.Tk):
             command=lambda: self._quick_search("larger:10M"),
         ).grid(row=2, column=0, columnspan=2, padx=5, pady=5, sticky="w")
 
+        sender_cols = (
+            ("email", "Remitente", 220),
+            ("count", "Conteo", 70),
+            ("bytes", "Tamaño (MB)", 90),
+            ("unread_ratio", "% No leídos", 85),
+            ("newest", "Último", 90),
+            ("oldest", "Primero", 90),
+            ("labels", "Etiquetas", 220),
+        )
         self.tree_senders = ttk.Treeview(
-            frame, columns=("email", "count"), show="headings", height=15
+            frame,
+            columns=[c[0] for c in sender_cols],
+            show="tree headings",
+            height=15,
         )
-        self.tree_senders.heading("email", text="Email")
-        self.tree_senders.heading("count", text="Conteo")
+        self.tree_senders.column("#0", width=28, stretch=False)
+        for key, text, width in sender_cols:
+            self.tree_senders.heading(
+                key,
+                text=text,
+                command=(
+                    None if key == "labels" else lambda k=key: self._sort_senders(k)
+                ),
+            )
+            self.tree_senders.column(key, width=width, anchor="w")
         self.tree_senders.grid(
             row=3, column=0, columnspan=5, padx=5, pady=5, sticky="nsew"
         )
@@ -746,17 +846,81 @@ class App(tk.Tk):
                 f"Calculando remitentes... (Query: '{final_q}', Regex: '{regex}')"
             )
             try:
-                res = search_api.top_senders(q=final_q, limit=topn, regex_pattern=regex)
-                for i in self.tree_senders.get_children():
-                    self.tree_senders.delete(i)
-                for email, cnt in res:
-                    self.tree_senders.insert("", tk.END, values=(email, cnt))
+                if self.var_search_threads.get():
+                    # Por conversación sólo hay conteo
+                    res = [
+                        {"email": email, "count": cnt}
+                        for email, cnt in threads_api.top_senders(
+                            q=final_q, limit=topn, regex_pattern=regex
+                        )
+                    ]
+                else:
+                    res = search_api.sender_profiles(
+                        q=final_q, limit=topn, regex_pattern=regex
+                    )
+                self._sender_rows = res
+                self._sender_sort = ("count", True)
+                self._render_senders()
                 self._log(f"Listo: {len(res)} remitentes encontrados.")
             except Exception as e:
                 self._log(self._format_error(e))
 
         threading.Thread(target=task, daemon=True).start()
 
+    def _sender_values(self, r):
+        if "bytes" not in r:
+            return (r["email"], r["count"])
+        names = {l.get("id"): l.get("name") for l in self._labels_cache}
+        labels = ", ".join(
+            f"{names.get(lid, lid)} ({n})" for lid, n in list(r["labels"].items())[:3]
+        )
+
+        def day(ts):
+            return datetime.fromtimestamp(ts).strftime("%Y-%m-%d") if ts else ""
+
+        return (
+            r["email"],
+            r["count"],
+            f"{r['bytes'] / (1024 * 1024):.1f}",
+            f"{r['unread_ratio'] * 100:.0f}%",
+            day(r["newest"]),
+            day(r["oldest"]),
+            labels,
+        )
+
+    def _render_senders(self):
+        for i in self.tree_senders.get_children():
+            self.tree_senders.delete(i)
+        self._sender_items = {}
+        rows = self._sender_rows
+        level = SENDER_GROUPINGS.get(self.combo_group.get())
+        if level and rows and "bytes" in rows[0]:
+            # Los grupos salen de los perfiles ya descargados (sin re-consultar)
+            rows = search_api.rollup_senders(rows, level, *self._sender_sort)
+
+        def insert(parent, r):
+            iid = self.tree_senders.insert(
+                parent, tk.END, values=self._sender_values(r)
+            )
+            self._sender_items[iid] = r
+            for child in r.get("children", []):
+                insert(iid, child)
+
+        for r in rows:
+            insert("", r)
+
+    def _sort_senders(self, key: str):
+        """Reordena los perfiles ya descargados; no hace llamadas a la API."""
+        rows = self._sender_rows
+        if not rows or (key != "email" and key not in rows[0]):
+            return
+        state_key = f"senders:{key}"
+        descending = not self._sort_state.get(state_key, False)
+        self._sender_rows = search_api.sort_profiles(rows, key, descending)
+        self._sender_sort = (key, descending)
+        self._sort_state[state_key] = descending
+        self._render_senders()
+
     def _show_search_context_menu(self, event):
         item = self.tree_senders.identify_row(event.y)
         if item:
@@ -770,9 +934,16 @@ class App(tk.Tk):
         vals = self.tree_senders.item(sel[0], "values")
         return vals[0] if vals else None
 
+    def _get_selected_sender_query(self):
+        """Consulta que cubre la fila elegida (dirección, dominio u organización)."""
+        sel = self.tree_senders.selection()
+        row = self._sender_items.get(sel[0]) if sel else None
+        return search_api.rollup_query(row) if row else None
+
     def _context_search_sender(self):
         email = self._get_selected_sender()
-        if not email:
+        query = self._get_selected_sender_query()
+        if not email or not query:
             return
 
         # Switch to Labels Tab (Index 0)
@@ -797,7 +968,7 @@ class App(tk.Tk):
 
         self.var_target_mode.set("SEARCH_QUERY")
         self.entry_query_action.delete(0, tk.END)
-        self.entry_query_action.insert(0, f"from:{email}")
+        self.entry_query_action.insert(0, query)
         self._log(f"Listo para actuar sobre correos de: {email}")
 
     def _context_filter_sender(self):
@@ -884,6 +1055,58 @@ class App(tk.Tk):
         ttk.Button(
             frame, text="Eliminar filtro", command=lambda: self._delete_filter()
         ).grid(row=5, column=2, padx=5, pady=5, sticky="w")
+        ttk.Button(
+            frame,
+            text="Aplicar al correo existente",
+            command=lambda: self._apply_filters_existing(),
+        ).grid(row=5, column=3, padx=5, pady=5, sticky="w")
+        ttk.Button(
+            frame, text="Exportar…", command=lambda: self._export_filters()
+        ).grid(row=5, column=4, padx=5, pady=5, sticky="ew")
+        ttk.Button(
+            frame, text="Importar…", command=lambda: self._import_filters()
+        ).grid(row=5, column=5, padx=5, pady=5, sticky="ew")
+        self._filters_by_iid = {}
+
+        # Previsualización local de los criterios mientras se escriben
+        self.lbl_backtest = ttk.Label(
+            frame, text="Previsualización: escribe criterios para ver coincidencias"
+        )
+        self.lbl_backtest.grid(
+            row=6, column=0, columnspan=5, padx=5, pady=(8, 2), sticky="w"
+        )
+        ttk.Button(
+            frame,
+            text="Recargar caché local",
+            command=lambda: self._load_backtest_cache(refresh=True),
+        ).grid(row=6, column=5, padx=5, pady=(8, 2), sticky="e")
+        self.tree_backtest = ttk.Treeview(
+            frame,
+            columns=("from", "subject", "date", "size"),
+            show="headings",
+            height=6,
+        )
+        for col, text in (
+            ("from", "De"),
+            ("subject", "Asunto"),
+            ("date", "Fecha"),
+            ("size", "Tamaño"),
+        ):
+            self.tree_backtest.heading(col, text=text)
+        self.tree_backtest.grid(
+            row=7, column=0, columnspan=6, padx=5, pady=5, sticky="nsew"
+        )
+        self._backtest_job = None
+        self._backtest_loading = False
+        self._backtest_warned = set()
+        for entry in (
+            self.entry_f_from,
+            self.entry_f_to,
+            self.entry_f_subject,
+            self.entry_f_query,
+            self.entry_f_hasatt,
+        ):
+            entry.bind("<KeyRelease>", lambda _e: self._schedule_backtest())
 
     def _list_filters(self):
         def task():
@@ -892,18 +1115,223 @@ class App(tk.Tk):
                 fl = filters_api.list_filters()
                 for i in self.tree_filters.get_children():
                     self.tree_filters.delete(i)
+                self._filters_by_iid = {}
                 for f in fl:
-                    self.tree_filters.insert(
+                    iid = self.tree_filters.insert(
                         "",
                         tk.END,
                         values=(f.get("id"), f.get("criteria"), f.get("action")),
                     )
+                    self._filters_by_iid[iid] = f
                 self._log(f"Encontrados {len(fl)} filtros.")
             except Exception as e:
                 self._log(self._format_error(e))
 
         threading.Thread(target=task, daemon=True).start()
 
+    def _filter_form(self):
+        """(criteria, action) a partir de los campos de la pestaña Filtros."""
+        criteria = {
+            "from": self.entry_f_from.get().strip(),
+            "to": self.entry_f_to.get().strip(),
+            "subject": self.entry_f_subject.get().strip(),
+            "query": self.entry_f_query.get().strip(),
+            "hasAttachment": self.entry_f_hasatt.get().strip().lower()
+            in ("true", "1", "si", "sí"),
+        }
+        criteria = {k: v for k, v in criteria.items() if v}
+        split = lambda e: [x.strip() for x in e.get().split(",") if x.strip()]
+        action = {
+            "addLabelIds": split(self.entry_f_add),
+            "removeLabelIds": split(self.entry_f_remove),
+            "forward": self.entry_f_forward.get().strip(),
+        }
+        action = {k: v for k, v in action.items() if v}
+        return criteria, action
+
+    def _create_filter(self):
+        criteria, action = self._filter_form()
+        if not criteria or not action:
+            self._log("Indica al menos un criterio y una acción.")
+            return
+
+        def task():
+            try:
+                f = filters_api.create_filter(criteria, action)
+                self._log(f"Filtro creado: {f.get('id')}")
+            except Exception as e:
+                self._log(self._format_error(e))
+
+        threading.Thread(target=task, daemon=True).start()
+
+    def _delete_filter(self):
+        fid = self.entry_filter_id.get().strip()
+        if not fid:
+            return
+
+        def task():
+            try:
+                filters_api.delete_filter(fid)
+                self._log(f"Filtro eliminado: {fid}")
+            except Exception as e:
+                self._log(self._format_error(e))
+
+        threading.Thread(target=task, daemon=True).start()
+
+    def _schedule_backtest(self):
+        # Espera a que se deje de teclear para no evaluar en cada tecla
+        if self._backtest_job is not None:
+            self.after_cancel(self._backtest_job)
+        self._backtest_job = self.after(250, self._run_backtest)
+
+    def _load_backtest_cache(self, refresh: bool = False):
+        if self._backtest_loading:
+            return
+        self._backtest_loading = True
+        self.lbl_backtest.config(text="Previsualización: cargando metadata local...")
+
+        def task():
+            try:
+                cache = backtest.load_cache(refresh=refresh)
+                self._log(f"Caché local de filtros: {len(cache)} mensajes.")
+            except Exception as e:
+                self._log(self._format_error(e))
+            finally:
+                self._backtest_loading = False
+            self.after(0, self._run_backtest)
+
+        threading.Thread(target=task, daemon=True).start()
+
+    def _run_backtest(self):
+        self._backtest_job = None
+        criteria, _ = self._filter_form()
+        if not criteria:
+            return
+        cache = backtest.cached()
+        if cache is None:
+            self._load_backtest_cache()
+            return
+        res = backtest.backtest(criteria, cache)
+        more = "" if res["complete"] else "+"
+        self.lbl_backtest.config(
+            text=(
+                f"Previsualización: {res['count']}{more} de {res['scanned']} "
+                f"mensajes | {res['bytes'] / 2**20:.1f} MB | '{res['query']}'"
+            )
+        )
+        for i in self.tree_backtest.get_children():
+            self.tree_backtest.delete(i)
+        for row in res["sample"]:
+            day = datetime.fromtimestamp(row["date"]).strftime("%Y-%m-%d")
+            self.tree_backtest.insert(
+                "",
+                tk.END,
+                values=(row["from"], row["subject"], day, f"{row['size'] // 1024} KB"),
+            )
+        # Cada aviso se muestra una vez, no en cada tecla
+        for w in res["warnings"]:
+            if w not in self._backtest_warned:
+                self._backtest_warned.add(w)
+                self._log(f"Aviso previsualización: {w}")
+
+    def _apply_filters_existing(self):
+        sel = self.tree_filters.selection() or self.tree_filters.get_children()
+        chosen = [self._filters_by_iid[i] for i in sel if i in self._filters_by_iid]
+        if not chosen:
+            self._log("Lista los filtros primero (y selecciona los que aplicar).")
+            return
+        if not messagebox.askyesno(
+            "Aplicar filtros",
+            f"¿Aplicar {len(chosen)} filtro(s) a los correos ya existentes?\n"
+            "Los destacados no se enviarán a la papelera.",
+        ):
+            return
+
+        def task():
+            self._begin_long_task()
+            self._log(f"Aplicando {len(chosen)} filtro(s) al correo existente...")
+            try:
+                res = filters_api.apply_filters(
+                    chosen,
+                    progress_cb=self._progress_cb,
+                    stop_event=self._cancel_event,
+                )
+                self._log(
+                    f"Filtros aplicados: {res['processed']} de {res['matched']} "
+                    f"mensajes | {res['queries']} consultas | "
+                    f"{len(res['groups'])} grupos de acciones"
+                )
+                if res["skipped"]:
+                    self._log(f"Omitidos (sin criterios o acciones): {res['skipped']}")
+            except Exception as e:
+                self._log(self._format_error(e))
+
+        threading.Thread(target=task, daemon=True).start()
+
+    def _export_filters(self):
+        path = filedialog.asksaveasfilename(
+            title="Exportar filtros",
+            defaultextension=".json",
+            filetypes=[("JSON", "*.json")],
+        )
+        if not path:
+            return
+
+        def task():
+            try:
+                n = filters_api.export_filters(path)
+                self._log(f"{n} filtros exportados a {path}")
+            except Exception as e:
+                self._log(self._format_error(e))
+
+        threading.Thread(target=task, daemon=True).start()
+
+    def _import_filters(self):
+        path = filedialog.askopenfilename(
+            title="Importar filtros", filetypes=[("JSON", "*.json")]
+        )
+        if not path:
+            return
+
+        def confirm(plan):
+            diff = plan["diff"]
+            lines = [l for l in filters_api.format_diff(diff) if l[0] != "="]
+            shown = "\n".join(lines[:25]) + ("\n..." if len(lines) > 25 else "")
+            dup = len(plan["redundant"]["duplicates"]) + len(
+                plan["redundant"]["subsumed"]
+            )
+            if not lines:
+                self._log("Los filtros del fichero ya están todos en la cuenta.")
+                return
+            if not messagebox.askyesno(
+                "Importar filtros",
+                f"{len(diff['create'])} a crear, {len(diff['delete'])} a borrar "
+                f"({dup} redundantes en el fichero):\n\n{shown}\n\n¿Aplicar?",
+            ):
+                return
+            threading.Thread(target=apply, daemon=True).start()
+
+        def apply():
+            try:
+                res = filters_api.import_filters(path)["result"]
+                self._log(
+                    f"Filtros importados: {res['created']} creados, "
+                    f"{res['deleted']} borrados, {len(res['failed'])} errores"
+                )
+                for fail in res["failed"]:
+                    self._log(f"Error {fail['op']}: {fail['error']}")
+            except Exception as e:
+                self._log(self._format_error(e))
+
+        def task():
+            try:
+                plan = filters_api.import_filters(path, dry_run=True)
+                self.after(0, lambda: confirm(plan))
+            except Exception as e:
+                self._log(self._format_error(e))
+
+        threading.Thread(target=task, daemon=True).start()
+
     # -------------------- Trash Tab / Account --------------------
     def _build_trash_tab(self):
         frame = self.tab_trash
@@ -913,6 +1341,41 @@ class App(tk.Tk):
         ttk.Label(
             frame, text="Esto eliminará permanentemente los mensajes en TRASH."
         ).grid(row=1, column=0, padx=5, pady=5, sticky="w")
+        ttk.Button(
+            frame,
+            text="Deshacer último envío a papelera",
+            command=lambda: self._restore_last_trash(),
+        ).grid(row=2, column=0, padx=5, pady=(15, 5), sticky="w")
+
+    def _restore_last_trash(self):
+        def task():
+            try:
+                plan = journal.restore(dry_run=True)
+            except Exception as e:
+                self._log(self._format_error(e))
+                return
+            present = plan["recorded"] - plan["missing"]
+            if not present:
+                self._log(f"Diario {plan['journal']}: nada sigue en la Papelera.")
+                return
+            if not messagebox.askyesno(
+                "Deshacer papelera",
+                f"¿Sacar de la Papelera {present} mensajes del trabajo "
+                f"{plan['journal']} y devolverles sus etiquetas?",
+            ):
+                return
+            self._begin_long_task()
+            try:
+                res = journal.restore(
+                    plan["journal"],
+                    progress_cb=self._progress_cb,
+                    stop_event=self._cancel_event,
+                )
+                self._log(f"Restaurados {res['restored']} mensajes.")
+            except Exception as e:
+                self._log(self._format_error(e))
+
+        threading.Thread(target=task, daemon=True).start()
 
     def _empty_trash(self):
         def task():
@@ -956,6 +1419,80 @@ class App(tk.Tk):
             row=2, column=0, columnspan=2, padx=5, pady=10, sticky="w"
         )
 
+        # Perfil de cuenta activo (accounts.py); "(por defecto)" = token.json
+        ttk.Label(frame, text="Cuenta:").grid(
+            row=1, column=2, padx=5, pady=5, sticky="e"
+        )
+        self.var_account = tk.StringVar(value=accounts.current() or "(por defecto)")
+        combo = ttk.Combobox(
+            frame,
+            textvariable=self.var_account,
+            values=["(por defecto)"] + accounts.names(),
+            state="readonly",
+            width=20,
+        )
+        combo.grid(row=1, column=3, padx=5, pady=5, sticky="w")
+        combo.bind("<<ComboboxSelected>>", lambda _e: self._switch_account())
+
+        # Diagnóstico: perfilado por trabajo
+        self.var_profile_jobs = tk.BooleanVar(value=profiling.is_enabled())
+        ttk.Checkbutton(
+            frame,
+            text="Perfilar trabajos (cProfile + tracemalloc → carpeta profiles/)",
+            variable=self.var_profile_jobs,
+            command=lambda: self._toggle_profiling(),
+        ).grid(row=3, column=0, columnspan=2, padx=5, pady=5, sticky="w")
+
+        # Auto-ajuste de lote/concurrencia
+        ttk.Button(
+            frame,
+            text="Calibrar lote/concurrencia (sonda con etiqueta temporal)",
+            command=lambda: self._calibrate(),
+        ).grid(row=4, column=0, columnspan=2, padx=5, pady=5, sticky="w")
+
+    def _calibrate(self):
+        def task():
+            if not messagebox.askyesno(
+                "Calibrar",
+                "Se añadirá y quitará una etiqueta temporal a ~2000 mensajes "
+                "probando varias combinaciones de lote y concurrencia. ¿Continuar?",
+            ):
+                return
+            self._log("Calibrando lote/concurrencia...")
+            try:
+                res = tuning.calibrate(
+                    progress_cb=lambda i, n: self._log(f"Sonda {i}/{n}")
+                )
+                best = res["best"]
+                self._log(
+                    f"Perfil para {res['account']}: lote={best['batch_size']}, "
+                    f"paralelo={best['concurrency']} ({best['msgs_per_sec']} msg/s)"
+                )
+                self.after(0, self._apply_tuned_defaults)
+            except Exception as e:
+                self._log(self._format_error(e))
+
+        threading.Thread(target=task, daemon=True).start()
+
+    def _apply_tuned_defaults(self):
+        self._auto_batch, self._auto_parallel = tuning.recommended("TRASH")
+        for entry, val in (
+            (self.entry_batch_size, self._auto_batch),
+            (self.entry_parallel, self._auto_parallel),
+        ):
+            entry.delete(0, tk.END)
+            entry.insert(0, str(val))
+
+    def _toggle_profiling(self):
+        if self.var_profile_jobs.get():
+            profiling.enable(PROFILE_DIR or "profiles")
+            self._log(
+                "Perfilado activado: se guardarán .pstats y .alloc.txt por trabajo."
+            )
+        else:
+            profiling.disable()
+            self._log("Perfilado desactivado.")
+
     def _show_scopes(self):
         scopes = auth_api.current_token_scopes()
         if not scopes:
@@ -967,6 +1504,11 @@ class App(tk.Tk):
                 "Scopes del token", "Scopes actuales:\n\n" + "\n".join(scopes)
             )
 
+    def _switch_account(self):
+        name = self.var_account.get()
+        accounts.set_default(None if name == "(por defecto)" else name)
+        self._log(f"Cuenta activa: {name}. Recarga etiquetas para verla.")
+
     def _reauth(self):
         if not messagebox.askyesno(
             "Reautenticación",
@@ -977,6 +1519,7 @@ class App(tk.Tk):
             from .auth import delete_token_file
 
             delete_token_file()
+            reset_service()
             self._log("token.json eliminado. Abriendo flujo OAuth...")
             get_gmail_service()
             self._log("Reautenticación completada.")
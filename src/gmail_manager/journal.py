@@ -0,0 +1,302 @@
+"""
+Diario de papelera: qué movió cada trabajo a TRASH, para poder deshacerlo.
+
+Cada trabajo de papelera (messages.py por consulta o por etiquetas,
+selecciones, duplicados, filtros y reglas) abre un diario en
+``JOURNAL_DIR/<cuenta>/<id>/``:
+
+- ``ids.bin``: IDs como enteros de 64 bits (8 bytes por mensaje), añadidos
+  por lotes según la tubería confirma cada batchModify.
+- ``meta.json``: trabajo, consulta, etiquetas, conteos y caducidad.
+
+Las etiquetas a devolver salen gratis del propio listado: si todas las
+selecciones del trabajo se listaron con unas etiquetas (``labelIds``),
+todos los IDs las tenían y se anotan en ``implied``. La captura completa
+(``JOURNAL_CAPTURE`` o ``capture=True``) es opcional porque cuesta listados
+extra antes de la acción:
+
+- ``label-<n>.bin``: para cada etiqueta capturada (INBOX, UNREAD, IMPORTANT
+  y las etiquetas del trabajo), los IDs de la selección que la tenían antes
+  de la acción, ordenados. Se obtienen listando ``q`` + etiqueta, que cuesta
+  una página de messages.list por cada 500 IDs en vez de un messages.get
+  por mensaje.
+
+`restore()` lee los IDs, se queda con los que siguen en la Papelera y los
+agrupa por etiquetas a recuperar (filters._group_by_change): cada grupo sale
+por la tubería de batchModify quitando TRASH y volviendo a poner lo que
+tenía. Gmail borra la Papelera a los 30 días, así que los diarios caducan
+igual y `prune()` los elimina.
+"""
+
+import itertools
+import json
+import os
+import shutil
+import threading
+import time
+from array import array
+from typing import Callable, Dict, List, Optional
+
+from . import accounts, aio, filters, messages, selection, tracing
+from .accounts import ContextThreadPool
+from .config import JOURNAL_CAPTURE, JOURNAL_DIR, JOURNAL_ENABLED
+
+JOURNAL_TTL_DAYS = 30  # retención de la Papelera de Gmail
+CAPTURE_LABELS = ("INBOX", "UNREAD", "IMPORTANT")
+VERSION = 1
+
+_seq = itertools.count(1)
+
+
+def _account_dir() -> str:
+    return os.path.join(JOURNAL_DIR, accounts.current() or "_default")
+
+
+def _read_ids(path: str) -> array:
+    arr = array("Q")
+    if os.path.exists(path):
+        with open(path, "rb") as fh:
+            arr.frombytes(fh.read())
+    return arr
+
+
+def _save_meta(path: str, meta: Dict) -> None:
+    """Escribe meta.json de forma atómica (tmp + os.replace)."""
+    tmp = os.path.join(path, "meta.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(meta, fh, indent=2)
+    os.replace(tmp, os.path.join(path, "meta.json"))
+
+
+class Journal:
+    """Diario abierto de un trabajo de papelera."""
+
+    def __init__(self, path: str, meta: Dict):
+        self.path = path
+        self.meta = meta
+        self._lock = threading.Lock()
+        self._fh = open(os.path.join(path, "ids.bin"), "ab")
+
+    @property
+    def id(self) -> str:
+        return self.meta["id"]
+
+    def _write_meta(self) -> None:
+        _save_meta(self.path, self.meta)
+
+    def capture(self, q: str, label_sets: List[Optional[List[str]]]) -> None:
+        """Lista en paralelo qué mensajes de la selección tienen cada etiqueta."""
+        wanted = list(CAPTURE_LABELS)
+        for lids in label_sets:
+            wanted += [l for l in lids or [] if l not in wanted]
+
+        combos = [
+            (q, sorted({label, *(lids or [])}))
+            for label in wanted
+            for lids in label_sets
+        ]
+        with tracing.span("journal_capture", "list", labels=len(wanted)):
+            if aio.engine_enabled():
+                lists = aio.list_ids(combos)
+            else:
+                with ContextThreadPool(max_workers=4) as ex:
+                    lists = list(
+                        ex.map(lambda c: list(messages.iter_message_ids(*c)), combos)
+                    )
+        per = len(label_sets)
+        members = []
+        for n in range(len(wanted)):
+            arr = array("Q")
+            for got in lists[n * per : (n + 1) * per]:
+                arr = selection.union(arr, selection.compact(got))
+            members.append(arr)
+        for n, arr in enumerate(members):
+            with open(os.path.join(self.path, f"label-{n}.bin"), "wb") as fh:
+                arr.tofile(fh)
+        self.meta["labels"] = wanted
+        self._write_meta()
+
+    def add(self, ids: List[str]) -> None:
+        """Anota un lote ya movido a TRASH (se llama desde los workers)."""
+        data = array("Q", (selection._to_int(m) for m in ids)).tobytes()
+        with self._lock:
+            self._fh.write(data)
+            self._fh.flush()
+            self.meta["count"] += len(ids)
+
+    def close(self, processed: int) -> None:
+        with self._lock:
+            self._fh.close()
+            self.meta["processed"] = processed
+            self.meta["complete"] = True
+            self._write_meta()
+
+
+def start(
+    job: str,
+    q: str,
+    label_sets: Optional[List[Optional[List[str]]]] = None,
+    capture: Optional[bool] = None,
+) -> Optional[Journal]:
+    """
+    Abre el diario de un trabajo; None si está desactivado. `capture`
+    (por defecto ``JOURNAL_CAPTURE``) lista antes qué mensajes tienen cada
+    etiqueta a devolver.
+    """
+    if not JOURNAL_ENABLED:
+        return None
+    prune()
+    now = time.time()
+    jid = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"-{next(_seq)}"
+    path = os.path.join(_account_dir(), jid)
+    os.makedirs(path)
+    label_sets = label_sets or [None]
+    meta = {
+        "version": VERSION,
+        "id": jid,
+        "job": job,
+        "query": q,
+        "label_sets": label_sets,
+        "created": int(now),
+        "expires": int(now + JOURNAL_TTL_DAYS * 86400),
+        "labels": [],
+        "implied": _implied_labels(label_sets),
+        "count": 0,
+        "complete": False,
+    }
+    jr = Journal(path, meta)
+    jr._write_meta()
+    if JOURNAL_CAPTURE if capture is None else capture:
+        jr.capture(q, label_sets)
+    return jr
+
+
+def _implied_labels(label_sets: List[Optional[List[str]]]) -> List[str]:
+    """Etiquetas que comparten todas las selecciones listadas por labelIds."""
+    common = None
+    for lids in label_sets:
+        if common is None:
+            common = list(lids or [])
+        else:
+            common = [l for l in common if l in (lids or [])]
+    return common or []
+
+
+def _load_meta(path: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def list_journals() -> List[Dict]:
+    """Diarios vigentes de la cuenta activa, el más reciente primero."""
+    prune()
+    base = _account_dir()
+    if not os.path.isdir(base):
+        return []
+    out = [_load_meta(os.path.join(base, name)) for name in os.listdir(base)]
+    return sorted(
+        (m for m in out if m), key=lambda m: (m["created"], m["id"]), reverse=True
+    )
+
+
+def prune(now: Optional[float] = None) -> int:
+    """Borra los diarios caducados de la cuenta activa; devuelve cuántos."""
+    now = time.time() if now is None else now
+    base = _account_dir()
+    if not os.path.isdir(base):
+        return 0
+    removed = 0
+    for name in os.listdir(base):
+        path = os.path.join(base, name)
+        meta = _load_meta(path)
+        if meta is None or meta.get("expires", 0) <= now:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def _resolve(journal_id: Optional[str]) -> str:
+    if journal_id is None:
+        found = list_journals()
+        if not found:
+            raise ValueError("No hay diarios de papelera vigentes.")
+        journal_id = found[0]["id"]
+    path = os.path.join(_account_dir(), journal_id)
+    if _load_meta(path) is None:
+        raise ValueError(f"Diario no encontrado: {journal_id}")
+    return path
+
+
+def restore(
+    journal_id: Optional[str] = None,
+    concurrency: int = 4,
+    batch_size: int = messages.BATCH_LIMIT,
+    progress_cb: Optional[Callable[[int, int], None]] = None,
+    stop_event: Optional[threading.Event] = None,
+    dry_run: bool = False,
+) -> Dict:
+    """
+    Saca de la Papelera lo que movió un trabajo (el último si no se indica)
+    y le devuelve las etiquetas capturadas. Devuelve ``{"journal",
+    "restored", "recorded", "missing", "groups"}``; ``missing`` son los que
+    ya no están en la Papelera (restaurados antes o borrados).
+    """
+    path = _resolve(journal_id)
+    meta = _load_meta(path)
+    job = "restore_trash"
+    with tracing.trace_job(job):
+        raw = _read_ids(os.path.join(path, "ids.bin"))
+        recorded = array("Q", sorted(set(raw)))
+        in_trash = selection.compact(messages.iter_message_ids("in:trash", None))
+        present = selection.intersection(recorded, in_trash)
+        arrays = [present]
+        changes = [((), ("TRASH",))]
+        for n, label in enumerate(meta.get("labels", [])):
+            had = _read_ids(os.path.join(path, f"label-{n}.bin"))
+            arrays.append(selection.intersection(present, had))
+            changes.append(((label,), ()))
+        for label in meta.get("implied", []):
+            if label not in meta.get("labels", []):
+                arrays.append(present)
+                changes.append(((label,), ()))
+        groups = filters._group_by_change(
+            arrays, [[i] for i in range(len(arrays))], changes
+        )
+        total = len(present)
+        restored = 0
+        if not dry_run:
+            for (add, remove), arr in groups.items():
+                if stop_event and stop_event.is_set():
+                    break
+                offset = restored
+                cb = None
+                if progress_cb:
+                    cb = lambda d, _t, o=offset: progress_cb(o + d, total)
+                restored += messages._stream_action_from_ids(
+                    selection.iter_ids(arr),
+                    len(arr),
+                    None,
+                    batch_size,
+                    concurrency,
+                    cb,
+                    stop_event,
+                    "MODIFY",
+                    (list(add), list(remove)),
+                )
+            meta.setdefault("restores", []).append(
+                {"at": int(time.time()), "count": restored}
+            )
+            _save_meta(path, meta)
+    return {
+        "journal": meta["id"],
+        "restored": restored,
+        "recorded": len(recorded),
+        "missing": len(recorded) - total,
+        "groups": [
+            {"add": list(add), "remove": list(remove), "count": len(arr)}
+            for (add, remove), arr in groups.items()
+        ],
+    }
@@ -1,28 +1,33 @@
 from typing import List, Dict, Optional
 from googleapiclient.errors import HttpError
+from . import aio, api, tracing
+from .profiling import profiled
 from .service import get_gmail_service
 
 USER_ID = "me"
 
 
 def list_labels() -> List[Dict]:
-    service = get_gmail_service()
-    results = service.users().labels().list(userId=USER_ID).execute()
+    results = api.execute("labels.list")
     return results.get("labels", [])
 
 
+@profiled("list_labels_with_counts")
 def list_labels_with_counts() -> List[Dict]:
     """
     Devuelve etiquetas con conteos (messagesTotal, threadsTotal).
     Usa users.labels.get por cada etiqueta.
     """
+    if aio.engine_enabled():
+        return aio.list_labels_with_counts()
     service = get_gmail_service()
     base = list_labels()
     detailed = []
     for lbl in base:
         lid = lbl.get("id")
         try:
-            got = service.users().labels().get(userId=USER_ID, id=lid).execute()
+            with tracing.span("labels_get", "http"):
+                got = api.execute("labels.get", service, id=lid)
             # Asegurar campos presentes
             got.setdefault("messagesTotal", 0)
             got.setdefault("threadsTotal", 0)
@@ -45,23 +50,18 @@ def create_label(
         "messageListVisibility": "show",
         "color": {"textColor": text_color, "backgroundColor": bg_color},
     }
-    return service.users().labels().create(userId=USER_ID, body=label_body).execute()
+    return api.execute("labels.create", service, body=label_body)
 
 
 def delete_label(label_id: str) -> None:
     service = get_gmail_service()
-    service.users().labels().delete(userId=USER_ID, id=label_id).execute()
+    api.execute("labels.delete", service, id=label_id)
 
 
 def rename_label(label_id: str, new_name: str) -> Dict:
     service = get_gmail_service()
     body = {"name": new_name}
-    return (
-        service.users()
-        .labels()
-        .update(userId=USER_ID, id=label_id, body=body)
-        .execute()
-    )
+    return api.execute("labels.update", service, id=label_id, body=body)
 
 
 def get_label_id_by_name(name: str) -> Optional[str]:
@@ -71,6 +71,7 @@ def get_label_id_by_name(name: str) -> Optional[str]:
     return None
 
 
+@profiled("apply_label_to_query")
 def apply_label_to_query(
     query: str,
     add_label_ids: Optional[List[str]] = None,
@@ -87,11 +88,12 @@ def apply_label_to_query(
     modified = 0
     next_page_token = None
     while True:
-        resp = (
-            service.users()
-            .messages()
-            .list(userId=USER_ID, q=query, pageToken=next_page_token, maxResults=500)
-            .execute()
+        resp = api.execute(
+            "messages.list",
+            service,
+            q=query,
+            pageToken=next_page_token,
+            maxResults=500,
         )
         msgs = resp.get("messages", [])
         if not msgs:
@@ -104,7 +106,7 @@ def apply_label_to_query(
                 "addLabelIds": add_label_ids,
                 "removeLabelIds": remove_label_ids,
             }
-            service.users().messages().batchModify(userId=USER_ID, body=body).execute()
+            api.execute("messages.batchModify", service, body=body)
             modified += len(ids)
         next_page_token = resp.get("nextPageToken")
         if not next_page_token:
@@ -11,3 +11,15 @@ if __name__ == "__main__":
     run()
 else:
     from .gui import run
+
+
+def main():
+    """Entrada de `inboxzero`: sin argumentos abre la GUI; si no, la CLI."""
+    import sys
+
+    if len(sys.argv) <= 1:
+        run()
+        return 0
+    from .cli import main as cli_main
+
+    return cli_main(sys.argv[1:])
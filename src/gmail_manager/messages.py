@@ -1,22 +1,21 @@
-from typing import List, Optional, Dict, Set, Callable, Iterable
+from typing import List, Optional, Dict, Set, Callable, Iterable, Tuple, Union
 from googleapiclient.errors import HttpError
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import threading, time, random
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+import itertools, threading, time, random
 
+from . import aio, api, counting, meter, planner, profiling, tracing
+from .accounts import ContextThreadPool
 from .service import get_gmail_service
 
 USER_ID = "me"
 MAX_RESULTS_PER_PAGE = 500
 BATCH_LIMIT = 1000  # Gmail permite hasta 1000 ids por batchModify
 
-# ---------- helpers de servicio por hilo ----------
-_thread_local = threading.local()
-
 
+# ---------- servicio ----------
 def _thread_service():
-    if not hasattr(_thread_local, "svc"):
-        _thread_local.svc = get_gmail_service()
-    return _thread_local.svc
+    # El servicio y su pool de conexiones se comparten entre hilos y trabajos
+    return get_gmail_service()
 
 
 # ---------- backoff / reintentos ----------
@@ -36,8 +35,10 @@ def _with_retries(fn, retries: int = 6, base: float = 0.4):
             code = getattr(e.resp, "status", None)
             if code not in RETRY_STATUS:
                 raise
-            sleep = base * (2**attempt) + random.uniform(0, base)
-            time.sleep(min(8.0, sleep))
+            sleep = min(8.0, base * (2**attempt) + random.uniform(0, base))
+            meter.note_retry(sleep)
+            with tracing.span("retry_sleep", "retry", status=code, attempt=attempt):
+                time.sleep(sleep)
     # último intento
     if last:
         raise last
@@ -54,43 +55,42 @@ def _safe_query(q: str, protect_starred: bool) -> str:
 def _list_page(
     service, q: Optional[str], label_ids: Optional[List[str]], page_token: Optional[str]
 ):
-    return _with_retries(
-        lambda: service.users()
-        .messages()
-        .list(
-            userId=USER_ID,
-            q=q or None,
-            labelIds=label_ids or None,
-            pageToken=page_token or None,
-            includeSpamTrash=False,
-            maxResults=MAX_RESULTS_PER_PAGE,
-            fields="messages/id,nextPageToken,resultSizeEstimate",
+    with tracing.span("list_page", "list", first=not page_token):
+        return _with_retries(
+            lambda: api.execute(
+                "messages.list",
+                service,
+                q=q or None,
+                labelIds=label_ids or None,
+                pageToken=page_token or None,
+                includeSpamTrash=False,
+                maxResults=MAX_RESULTS_PER_PAGE,
+            )
         )
-        .execute()
-    )
 
 
 def estimate_count(q: str = "", label_ids: Optional[List[str]] = None) -> int:
     """
     Estima cuántos mensajes coinciden SIN traer todos los IDs.
-    Usa resultSizeEstimate de la 1ª página.
+    El planner elige: messagesTotal de labels.get para una sola etiqueta,
+    caché de remitentes o resultSizeEstimate de la 1ª página.
     """
-    svc = get_gmail_service()
-    resp = _list_page(svc, q or None, label_ids or None, None)
-    return int(resp.get("resultSizeEstimate", 0) or 0)
+    return planner.estimate_total(planner.plan(q, label_ids))
 
 
 def iter_message_ids(
     q: Optional[str], label_ids: Optional[List[str]], max_total: Optional[int] = None
 ) -> Iterable[str]:
     """
-    Itera IDs página a página (bajo consumo de memoria).
+    Itera IDs página a página (bajo consumo de memoria). Las etiquetas de la
+    consulta se listan con labelIds= (ver planner).
     """
+    p = planner.plan(q, label_ids)
     svc = get_gmail_service()
     token = None
     yielded = 0
     while True:
-        resp = _list_page(svc, q or None, label_ids or None, token)
+        resp = _list_page(svc, p.q, p.label_ids or None, token)
         for m in resp.get("messages", []) or []:
             yield m["id"]
             yielded += 1
@@ -155,33 +155,47 @@ def _batch_modify_add_trash(ids: List[str]) -> None:
     """Mueve en bloque a TRASH con batchModify."""
     svc = _thread_service()
     body = {"ids": ids, "addLabelIds": ["TRASH"]}
-    _with_retries(
-        lambda: svc.users().messages().batchModify(userId=USER_ID, body=body).execute()
-    )
+    _with_retries(lambda: api.execute("messages.batchModify", svc, body=body))
 
 
 def _batch_delete_permanently(ids: List[str]) -> None:
     """Elimina PERMANENTEMENTE en bloque con batchDelete."""
     svc = _thread_service()
     body = {"ids": ids}
-    _with_retries(
-        lambda: svc.users().messages().batchDelete(userId=USER_ID, body=body).execute()
-    )
+    _with_retries(lambda: api.execute("messages.batchDelete", svc, body=body))
+
+
+def _batch_modify_labels(
+    ids: List[str], add_label_ids: List[str], remove_label_ids: List[str]
+) -> None:
+    """Añade/quita etiquetas en bloque con batchModify."""
+    svc = _thread_service()
+    body = {
+        "ids": ids,
+        "addLabelIds": add_label_ids,
+        "removeLabelIds": remove_label_ids,
+    }
+    _with_retries(lambda: api.execute("messages.batchModify", svc, body=body))
+
+
+def _modify_one(
+    mid: str, add_label_ids: List[str], remove_label_ids: List[str]
+) -> bool:
+    svc = _thread_service()
+    body = {"addLabelIds": add_label_ids, "removeLabelIds": remove_label_ids}
+    _with_retries(lambda: api.execute("messages.modify", svc, id=mid, body=body))
+    return True
 
 
 def _trash_one(mid: str) -> bool:
     svc = _thread_service()
-    _with_retries(
-        lambda: svc.users().messages().trash(userId=USER_ID, id=mid).execute()
-    )
+    _with_retries(lambda: api.execute("messages.trash", svc, id=mid))
     return True
 
 
 def _delete_one(mid: str) -> bool:
     svc = _thread_service()
-    _with_retries(
-        lambda: svc.users().messages().delete(userId=USER_ID, id=mid).execute()
-    )
+    _with_retries(lambda: api.execute("messages.delete", svc, id=mid))
     return True
 
 
@@ -192,19 +206,29 @@ def _chunks(seq: List[str], size: int):
 
 
 # ---------- WORKERS GENÉRICOS ----------
-def _get_worker_func(action_type: str, stop_event: Optional[threading.Event]):
+def _get_worker_func(
+    action_type: str,
+    stop_event: Optional[threading.Event],
+    label_changes: Optional[Tuple[List[str], List[str]]] = None,
+):
     """
-    Retorna la función worker adecuada (Trash o Delete).
-    action_type: "TRASH" o "DELETE"
+    Retorna la función worker adecuada (Trash, Delete o Modify).
+    action_type: "TRASH", "DELETE" o "MODIFY" (requiere label_changes=(add, remove))
     """
-    is_trash = action_type == "TRASH"
-    batch_fn = _batch_modify_add_trash if is_trash else _batch_delete_permanently
-    single_fn = _trash_one if is_trash else _delete_one
+    if action_type == "MODIFY":
+        add, remove = label_changes or ([], [])
+        batch_fn = lambda ids: _batch_modify_labels(ids, add, remove)
+        single_fn = lambda mid: _modify_one(mid, add, remove)
+    else:
+        is_trash = action_type == "TRASH"
+        batch_fn = _batch_modify_add_trash if is_trash else _batch_delete_permanently
+        single_fn = _trash_one if is_trash else _delete_one
 
     def worker(chunk: List[str]) -> int:
         nonlocal batch_fn, single_fn
         try:
-            batch_fn(chunk)
+            with tracing.span("batch", "http", action=action_type, size=len(chunk)):
+                batch_fn(chunk)
             return len(chunk)
         except HttpError as e:
             # Si falla el batch, intenta uno por uno o reporta error
@@ -216,45 +240,93 @@ def _get_worker_func(action_type: str, stop_event: Optional[threading.Event]):
 
             # Fallback unitario
             ok = 0
-            for mid in chunk:
-                if stop_event and stop_event.is_set():
-                    break
-                try:
-                    single_fn(mid)
-                    ok += 1
-                except HttpError:
-                    pass
+            with tracing.span(
+                "single_fallback", "http", action=action_type, size=len(chunk)
+            ):
+                for mid in chunk:
+                    if stop_event and stop_event.is_set():
+                        break
+                    try:
+                        single_fn(mid)
+                        ok += 1
+                    except HttpError:
+                        pass
             return ok
 
     return worker
 
 
 # ---------- STREAMING GENÉRICO ----------
+_chunk_seq = itertools.count(1)
+
+
+def _submit_chunk(ex: ThreadPoolExecutor, worker_func, chunk: List[str]):
+    """Encola un lote; con traza activa registra también la espera en cola."""
+    if tracing.active() is None:
+        return ex.submit(worker_func, chunk)
+
+    seq = next(_chunk_seq)
+    with tracing.span("submit", size=len(chunk), chunk=seq):
+        tracing.async_begin("queue_wait", seq, size=len(chunk))
+
+        def run():
+            tracing.async_end("queue_wait", seq)
+            return worker_func(chunk)
+
+        return ex.submit(run)
+
+
+def _report_progress(progress_cb, done: int, total) -> None:
+    # `total` puede ser un counting.LiveCount que se afina durante el trabajo
+    total = total() if callable(total) else total
+    with tracing.span("progress_cb", done=done, total=total):
+        progress_cb(done, total)
+
+
 def _stream_action_from_ids(
     id_iter: Iterable[str],
-    est_total: int,
+    est_total: Union[int, Callable[[], int]],
     max_fetch: Optional[int],
     batch_size: int,
     batch_concurrency: int,
     progress_cb: Optional[Callable[[int, int], None]],
     stop_event: Optional[threading.Event],
     action_type: str,
+    label_changes: Optional[Tuple[List[str], List[str]]] = None,
+    worker_func: Optional[Callable[[List[str]], int]] = None,
+    on_chunk: Optional[Callable[[List[str]], None]] = None,
 ) -> int:
     """
-    Tubería: itera IDs -> empaqueta -> hilo worker (Trash o Delete).
+    Tubería: itera IDs -> empaqueta -> hilo worker (Trash, Delete o Modify).
+    `worker_func` sustituye al worker por defecto (p. ej. acciones sobre hilos).
+    `on_chunk` recibe cada lote con al menos un mensaje procesado (diario).
+    `est_total` puede ser un callable (counting.LiveCount) que se reevalúa en
+    cada aviso de progreso.
     """
     if progress_cb:
-        progress_cb(0, est_total)
+        _report_progress(progress_cb, 0, est_total)
 
     done = 0
     processed_count = 0
     current: List[str] = []
     futures = []
     workers = max(1, min(int(batch_concurrency or 1), 8))
+    batch_size = max(1, min(int(batch_size or BATCH_LIMIT), BATCH_LIMIT))
+
+    meter.note_concurrency(workers)
+    worker_func = worker_func or _get_worker_func(
+        action_type, stop_event, label_changes
+    )
+    if on_chunk is not None:
+        base_worker = worker_func
 
-    worker_func = _get_worker_func(action_type, stop_event)
+        def worker_func(chunk: List[str]) -> int:
+            gained = base_worker(chunk)
+            if gained:
+                on_chunk(chunk)
+            return gained
 
-    with ThreadPoolExecutor(max_workers=workers) as ex:
+    with ContextThreadPool(max_workers=workers) as ex:
         emitted = 0
         for mid in id_iter:
             if stop_event and stop_event.is_set():
@@ -265,15 +337,17 @@ def _stream_action_from_ids(
                 break
 
             if len(current) >= batch_size:
-                futures.append(ex.submit(worker_func, list(current)))
+                futures.append(_submit_chunk(ex, worker_func, list(current)))
                 current.clear()
                 # limitar cola
                 if len(futures) >= workers * 4:
-                    done += _drain_some(futures, progress_cb, done, est_total)
+                    gained = _drain_some(futures, progress_cb, done, est_total)
+                    processed_count += gained
+                    done += gained
 
         # último lote
         if current:
-            futures.append(ex.submit(worker_func, list(current)))
+            futures.append(_submit_chunk(ex, worker_func, list(current)))
 
         # drenar restantes
         for f in as_completed(futures):
@@ -284,10 +358,13 @@ def _stream_action_from_ids(
             processed_count += gained
             done += gained
             if progress_cb:
-                progress_cb(done, est_total)
+                _report_progress(progress_cb, done, est_total)
 
-    if progress_cb and done < est_total:
-        progress_cb(done, est_total)
+    if progress_cb:
+        # Con el listado agotado un LiveCount ya es exacto: la barra cierra
+        final = est_total() if callable(est_total) else est_total
+        if done < final or callable(est_total):
+            _report_progress(progress_cb, done, final)
 
     return processed_count
 
@@ -301,6 +378,10 @@ def _drain_some(futures, progress_cb, done, total):
             ready.append(f)
         if len(ready) >= n:
             break
+    if not ready:
+        # cola llena y nada terminado: esperar (backpressure) en vez de crecer
+        with tracing.span("queue_full", size=len(futures)):
+            ready = list(wait(futures, return_when=FIRST_COMPLETED).done)
     for f in ready:
         futures.remove(f)
         try:
@@ -309,7 +390,7 @@ def _drain_some(futures, progress_cb, done, total):
             gained = 0
         gained_total += gained
         if progress_cb:
-            progress_cb(done + gained_total, total)
+            _report_progress(progress_cb, done + gained_total, total)
     return gained_total
 
 
@@ -322,6 +403,7 @@ def trash_by_query_fast(
     batch_size: int = BATCH_LIMIT,
     progress_cb: Optional[Callable[[int, int], None]] = None,
     stop_event: Optional[threading.Event] = None,
+    count_mode: Optional[str] = None,
 ) -> Dict:
     return _action_by_query_fast(
         q,
@@ -332,6 +414,7 @@ def trash_by_query_fast(
         progress_cb,
         stop_event,
         "TRASH",
+        count_mode=count_mode,
     )
 
 
@@ -344,6 +427,7 @@ def trash_by_label_ids_fast(
     batch_size: int = BATCH_LIMIT,
     progress_cb: Optional[Callable[[int, int], None]] = None,
     stop_event: Optional[threading.Event] = None,
+    count_mode: Optional[str] = None,
 ) -> Dict:
     return _action_by_label_ids_fast(
         label_ids,
@@ -355,6 +439,7 @@ def trash_by_label_ids_fast(
         progress_cb,
         stop_event,
         "TRASH",
+        count_mode=count_mode,
     )
 
 
@@ -367,6 +452,7 @@ def delete_permanently_by_query_fast(
     batch_size: int = BATCH_LIMIT,
     progress_cb: Optional[Callable[[int, int], None]] = None,
     stop_event: Optional[threading.Event] = None,
+    count_mode: Optional[str] = None,
 ) -> Dict:
     return _action_by_query_fast(
         q,
@@ -377,6 +463,7 @@ def delete_permanently_by_query_fast(
         progress_cb,
         stop_event,
         "DELETE",
+        count_mode=count_mode,
     )
 
 
@@ -389,6 +476,7 @@ def delete_permanently_by_label_ids_fast(
     batch_size: int = BATCH_LIMIT,
     progress_cb: Optional[Callable[[int, int], None]] = None,
     stop_event: Optional[threading.Event] = None,
+    count_mode: Optional[str] = None,
 ) -> Dict:
     return _action_by_label_ids_fast(
         label_ids,
@@ -400,6 +488,34 @@ def delete_permanently_by_label_ids_fast(
         progress_cb,
         stop_event,
         "DELETE",
+        count_mode=count_mode,
+    )
+
+
+# ---------- PUBLIC: MODIFY (Añadir/quitar etiquetas) ----------
+def modify_labels_by_query_fast(
+    q: str,
+    add_label_ids: Optional[List[str]] = None,
+    remove_label_ids: Optional[List[str]] = None,
+    protect_starred: bool = False,
+    max_fetch: Optional[int] = None,
+    concurrency: int = 4,
+    batch_size: int = BATCH_LIMIT,
+    progress_cb: Optional[Callable[[int, int], None]] = None,
+    stop_event: Optional[threading.Event] = None,
+    count_mode: Optional[str] = None,
+) -> Dict:
+    return _action_by_query_fast(
+        q,
+        protect_starred,
+        max_fetch,
+        concurrency,
+        batch_size,
+        progress_cb,
+        stop_event,
+        "MODIFY",
+        (list(add_label_ids or []), list(remove_label_ids or [])),
+        count_mode=count_mode,
     )
 
 
@@ -413,20 +529,54 @@ def _action_by_query_fast(
     progress_cb: Optional[Callable[[int, int], None]],
     stop_event: Optional[threading.Event],
     action_type: str,
+    label_changes: Optional[Tuple[List[str], List[str]]] = None,
+    count_mode: Optional[str] = None,
 ) -> Dict:
+    from . import journal  # diferido: journal importa messages
+
     q2 = _safe_query(q, protect_starred)
-    est = estimate_count(q2, None)
-    ids_iter = iter_message_ids(q2, None, max_total=max_fetch)
-    processed = _stream_action_from_ids(
-        ids_iter,
-        est,
-        max_fetch,
-        batch_size,
-        concurrency,
-        progress_cb,
-        stop_event,
-        action_type,
-    )
+    job = f"{action_type.lower()}_by_query"
+    with tracing.trace_job(job), profiling.profile_job(job):
+        jr = journal.start(job, q2) if action_type == "TRASH" else None
+        on_chunk = jr.add if jr else None
+        processed = 0
+        try:
+            if aio.engine_enabled():
+                est, processed = aio.run_action(
+                    q2,
+                    [None],
+                    max_fetch,
+                    concurrency,
+                    batch_size,
+                    progress_cb,
+                    stop_event,
+                    action_type,
+                    label_changes,
+                    on_chunk,
+                    count_mode,
+                )
+            else:
+                listing = planner.job_listing(
+                    q2, None, max_fetch, stop_event, count_mode
+                )
+                est = listing.open()
+                live = counting.LiveCount(lambda: listing.estimate, limit=max_fetch)
+                ids_iter = live.track(listing)
+                processed = _stream_action_from_ids(
+                    ids_iter,
+                    live,
+                    max_fetch,
+                    batch_size,
+                    concurrency,
+                    progress_cb,
+                    stop_event,
+                    action_type,
+                    label_changes,
+                    on_chunk=on_chunk,
+                )
+        finally:
+            if jr:
+                jr.close(processed)
     matched = (
         min(est, processed) if max_fetch and est > max_fetch else max(processed, est)
     )
@@ -436,6 +586,7 @@ def _action_by_query_fast(
         "query_used": q2,
         "estimated": est,
         "action": action_type,
+        "journal": jr.id if jr else None,
     }
 
 
@@ -449,6 +600,7 @@ def _action_by_label_ids_fast(
     progress_cb: Optional[Callable[[int, int], None]],
     stop_event: Optional[threading.Event],
     action_type: str,
+    count_mode: Optional[str] = None,
 ) -> Dict:
     if not label_ids:
         if progress_cb:
@@ -462,6 +614,8 @@ def _action_by_label_ids_fast(
             "skipped_labels": [],
         }
 
+    from . import journal  # diferido: journal importa messages
+
     lids = list(label_ids)
     skipped: List[str] = []
     if protect_starred and "STARRED" in lids:
@@ -470,47 +624,73 @@ def _action_by_label_ids_fast(
 
     q2 = _safe_query("", protect_starred)
     est_total = 0
+    listings: List[counting.JobListing] = []
+    # Los totales llegan cuando el iterador arranca; la barra los ve vía LiveCount
+    live = counting.LiveCount(lambda: sum(l.estimate for l in listings), max_fetch)
 
     def _iter_and():
         nonlocal est_total
-        est_total = estimate_count(q2, lids)
-        yield from iter_message_ids(q2, lids, max_total=max_fetch)
+        listings.append(
+            planner.job_listing(q2, lids, max_fetch, stop_event, count_mode)
+        )
+        est_total = listings[0].open()
+        yield from listings[0]
 
     def _iter_or():
         nonlocal est_total
-        svc = get_gmail_service()
         seen: Set[str] = set()
         for lid in lids:
-            est_total += estimate_count(q2, [lid])
+            listings.append(
+                planner.job_listing(q2, [lid], None, stop_event, count_mode)
+            )
+        est_total = sum(l.open() for l in listings)
         yielded = 0
-        for lid in lids:
-            token = None
-            while True:
-                resp = _list_page(svc, q2, [lid], token)
-                for m in resp.get("messages", []) or []:
-                    mid = m["id"]
-                    if mid in seen:
-                        continue
-                    seen.add(mid)
-                    yield mid
-                    yielded += 1
-                    if max_fetch and yielded >= max_fetch:
-                        return
-                token = resp.get("nextPageToken")
-                if not token:
-                    break
+        for listing in listings:
+            for mid in listing:
+                if mid in seen:
+                    continue
+                seen.add(mid)
+                yield mid
+                yielded += 1
+                if max_fetch and yielded >= max_fetch:
+                    return
 
     iterator = _iter_or() if use_or else _iter_and()
-    processed = _stream_action_from_ids(
-        iterator,
-        est_total,
-        max_fetch,
-        batch_size,
-        concurrency,
-        progress_cb,
-        stop_event,
-        action_type,
-    )
+    job = f"{action_type.lower()}_by_labels"
+    label_sets = [[lid] for lid in lids] if use_or else [lids]
+    with tracing.trace_job(job), profiling.profile_job(job):
+        jr = journal.start(job, q2, label_sets) if action_type == "TRASH" else None
+        on_chunk = jr.add if jr else None
+        processed = 0
+        try:
+            if aio.engine_enabled():
+                est_total, processed = aio.run_action(
+                    q2,
+                    label_sets,
+                    max_fetch,
+                    concurrency,
+                    batch_size,
+                    progress_cb,
+                    stop_event,
+                    action_type,
+                    on_chunk=on_chunk,
+                    count_mode=count_mode,
+                )
+            else:
+                processed = _stream_action_from_ids(
+                    live.track(iterator),
+                    live,
+                    max_fetch,
+                    batch_size,
+                    concurrency,
+                    progress_cb,
+                    stop_event,
+                    action_type,
+                    on_chunk=on_chunk,
+                )
+        finally:
+            if jr:
+                jr.close(processed)
 
     return {
         "processed": processed,
@@ -521,6 +701,7 @@ def _action_by_label_ids_fast(
         "skipped_labels": skipped,
         "estimated": est_total,
         "action": action_type,
+        "journal": jr.id if jr else None,
     }
 
 
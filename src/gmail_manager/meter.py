@@ -0,0 +1,240 @@
+"""
+Medidor de progreso: ritmo, ETA, concurrencia, reintentos y esperas.
+
+El protocolo de progreso sigue siendo ``progress_cb(done, total)``; un
+`Meter` es un progress_cb que, con cada aviso de la tubería, calcula un
+`Snapshot` sobre una ventana deslizante de WINDOW_SECONDS:
+
+- ``rate``: mensajes/s en la ventana; ``eta`` sale de una media exponencial
+  de ese ritmo (constante ETA_SMOOTHING), así no salta con cada lote.
+- ``concurrency``: lotes en vuelo que declaró la tubería (`note_concurrency`).
+- ``retries`` / ``retry_rate``: reintentos 429/5xx del trabajo y por segundo
+  en la ventana (`note_retry`, llamado junto a cada espera de backoff).
+- ``throttled``: segundos esperando, backoff más el cubo de cuota de la
+  cuenta (accounts.QuotaBudget.waited).
+
+Los contadores son por cuenta (accounts.current()), así que varios trabajos
+en paralelo sobre cuentas distintas no se mezclan. El Meter entrega como
+mucho un snapshot cada EMIT_INTERVAL segundos al `render` (más el primero y
+el final); un aviso retenido sale solo al vencer el intervalo, o con
+`close()`. Cada snapshot entregado queda además en la traza activa como
+evento ``progress``.
+"""
+
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple
+
+from . import accounts, tracing
+
+WINDOW_SECONDS = 30.0  # ventana del ritmo instantáneo
+ETA_SMOOTHING = 20.0  # segundos de la media exponencial del ritmo
+EMIT_INTERVAL = 0.5  # como mucho 2 snapshots por segundo
+
+_lock = threading.Lock()
+_retries: Dict[Optional[str], int] = {}
+_backoff: Dict[Optional[str], float] = {}
+_concurrency: Dict[Optional[str], int] = {}
+
+
+# ---------- contadores (los alimenta la tubería) ----------
+def note_retry(seconds: float) -> None:
+    """Un reintento de la cuenta activa que va a esperar `seconds`."""
+    name = accounts.current()
+    with _lock:
+        _retries[name] = _retries.get(name, 0) + 1
+        _backoff[name] = _backoff.get(name, 0.0) + seconds
+
+
+def note_concurrency(workers: int) -> None:
+    """Lotes en vuelo que usa ahora la tubería de la cuenta activa."""
+    with _lock:
+        _concurrency[accounts.current()] = int(workers)
+
+
+def _totals(name: Optional[str]):
+    with _lock:
+        retries = _retries.get(name, 0)
+        backoff = _backoff.get(name, 0.0)
+        workers = _concurrency.get(name, 0)
+    return retries, backoff + accounts.budget(name).waited, workers
+
+
+# ---------- snapshot ----------
+def _clock(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
+
+
+class Snapshot:
+    """Estado del trabajo en un instante."""
+
+    __slots__ = (
+        "done",
+        "total",
+        "elapsed",
+        "rate",
+        "eta",
+        "concurrency",
+        "retries",
+        "retry_rate",
+        "throttled",
+    )
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def describe(self) -> str:
+        parts = [
+            f"{self.done}/{self.total}",
+            f"{self.rate:.1f} msg/s",
+            f"ETA {_clock(self.eta)}",
+        ]
+        if self.concurrency:
+            parts.append(f"x{self.concurrency}")
+        if self.retries:
+            parts.append(f"reintentos {self.retries} ({self.retry_rate:.2f}/s)")
+        if self.throttled >= 0.1:
+            parts.append(f"en espera {self.throttled:.1f}s")
+        return " | ".join(parts)
+
+
+# ---------- medidor ----------
+class Meter:
+    """progress_cb(done, total) que entrega Snapshots a `render`."""
+
+    def __init__(
+        self,
+        render: Callable[[Snapshot], None],
+        window: float = WINDOW_SECONDS,
+        interval: float = EMIT_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.render = render
+        self.window = window
+        self.interval = interval
+        self.clock = clock
+        self.last: Optional[Snapshot] = None
+        self._lock = threading.Lock()
+        self._render_lock = threading.Lock()
+        self._seq = 0
+        self._rendered = 0
+        self._samples: deque = deque()  # (t, done, reintentos)
+        self._start = None
+        self._base = None
+        self._account = None
+        self._smoothed: Optional[float] = None
+        self._emitted = None
+        self._pending: Optional[Tuple[int, Snapshot]] = None
+        self._timer: Optional[threading.Timer] = None
+
+    def __call__(self, done: int, total: int) -> None:
+        now = self.clock()
+        with self._lock:
+            if self._start is None:
+                self._start = now
+                self._account = accounts.current()
+                self._base = _totals(self._account)
+            snap = self._update(now, done, total)
+            self._seq += 1
+            seq = self._seq
+            final = bool(total) and done >= total
+            if (
+                self._emitted is not None
+                and not final
+                and now - self._emitted < self.interval
+            ):
+                self._pending = (seq, snap)
+                if self._timer is None:
+                    wait = self.interval - (now - self._emitted)
+                    # Con el contexto del trabajo: el evento va a su traza
+                    ctx = contextvars.copy_context()
+                    self._timer = threading.Timer(
+                        wait, ctx.run, args=(self._flush_pending,)
+                    )
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            self._emitted = now
+            self._pending = None
+        self._emit(seq, snap)
+
+    def _update(self, now: float, done: int, total: int) -> Snapshot:
+        retries, throttled, workers = _totals(self._account)
+        retries -= self._base[0]
+        samples = self._samples
+        prev = samples[-1] if samples else None
+        samples.append((now, done, retries))
+        # Se conserva una muestra anterior a la ventana como punto de partida
+        while len(samples) > 2 and samples[1][0] <= now - self.window:
+            samples.popleft()
+        t0, d0, r0 = samples[0]
+        span = now - t0
+        rate = (done - d0) / span if span > 0 else 0.0
+        if prev is not None and now > prev[0]:
+            alpha = 1 - math.exp(-(now - prev[0]) / ETA_SMOOTHING)
+            self._smoothed = (
+                rate
+                if self._smoothed is None
+                else self._smoothed + alpha * (rate - self._smoothed)
+            )
+        left = max(0, total - done) if total else 0
+        if not left and total:
+            eta = 0.0
+        elif self._smoothed:
+            eta = left / self._smoothed
+        else:
+            eta = None
+        return Snapshot(
+            done=done,
+            total=total,
+            elapsed=now - self._start,
+            rate=rate,
+            eta=eta,
+            concurrency=workers,
+            retries=retries,
+            retry_rate=(retries - r0) / span if span > 0 else 0.0,
+            throttled=throttled - self._base[1],
+        )
+
+    def _emit(self, seq: int, snap: Snapshot) -> None:
+        # El temporizador y la tubería pueden cruzarse: nunca se entrega un
+        # snapshot más viejo que el último entregado
+        with self._render_lock:
+            if seq <= self._rendered:
+                return
+            self._rendered = seq
+            self.last = snap
+            tracing.instant("progress", "progress", **snap.to_dict())
+            self.render(snap)
+
+    def _flush_pending(self) -> None:
+        with self._lock:
+            self._timer = None
+            pending, self._pending = self._pending, None
+            if pending is None:
+                return
+            self._emitted = self.clock()
+        self._emit(*pending)
+
+    def close(self) -> Optional[Snapshot]:
+        """Entrega el aviso retenido (si lo hay) y devuelve el último snapshot."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pending, self._pending = self._pending, None
+        if pending is not None:
+            self._emit(*pending)
+        return self.last
@@ -0,0 +1,267 @@
+"""
+Planificador de consultas: elige el camino de API más barato para una `q`.
+
+Muchas consultas de la GUI son selecciones de etiquetas (``label:x``,
+``in:inbox``, ``category:social``...) o formas simples. `plan()` parsea la
+consulta con query.py y reconoce:
+
+- ``labels``: sólo etiquetas en positivo → se listan con ``labelIds=`` (más
+  barato que buscar con ``q=``) y, si es una sola etiqueta sin más filtros,
+  el total sale de ``labels.get`` (``messagesTotal``) menos lo que esa
+  etiqueta tiene en Papelera/Spam, que messages.list no devuelve.
+- ``date``: sólo ``after: before: older_than: newer_than:`` → el conteo va
+  por shards de fecha (counting.estimate).
+- ``sender``: un único ``from:dirección`` → conteo de la caché de
+  remitentes (search.cached_sender_count) si hay un recorrido reciente.
+- ``search``: el resto, ``q=`` tal cual.
+
+En todos los casos los términos de etiqueta en positivo del nivel superior
+se pasan a ``labelIds`` y se quitan de la ``q``, que por lo demás queda
+tal cual (el AST de query.py es aproximado y no se vuelve a serializar).
+Si la consulta no se puede partir con seguridad (``OR`` en el nivel
+superior, paréntesis sin pareja) se busca con la ``q`` original. Cada plan
+se anota en la traza (evento ``plan``) y en `history` con su coste
+estimado en unidades de cuota.
+"""
+
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from . import accounts, api, counting, messages, search, tracing
+from .api import QUOTA_UNITS
+from .config import JOB_COUNT_MODE
+from . import query as gq
+from .service import get_gmail_service
+
+PAGE_SIZE = 500
+JOB_COUNT_MODES = ("estimate", "fast")
+# Nombres de etiqueta de usuario -> ID, refrescado cada LABELS_TTL segundos
+LABELS_TTL = 60
+# Etiquetas que messages.list no devuelve sin includeSpamTrash: se dejan en q
+_KEEP_IN_QUERY = {"TRASH", "SPAM"}
+_DATE_OPS = {"after", "before", "older", "newer", "older_than", "newer_than"}
+
+history: Deque[Dict] = deque(maxlen=100)
+_labels_cache: Dict = {}  # por cuenta
+
+
+class Plan:
+    """Camino elegido para listar y contar una consulta."""
+
+    __slots__ = ("kind", "q", "label_ids", "count_via", "sender", "count_units")
+
+    def __init__(self, kind, q, label_ids, count_via, sender=None):
+        self.kind = kind
+        self.q = q  # q residual (None si todo pasó a labelIds)
+        self.label_ids = label_ids
+        self.count_via = count_via  # labels.get | cache | shards | estimate
+        self.sender = sender
+        self.count_units = {
+            "labels.get": QUOTA_UNITS["labels.get"]
+            + len(_KEEP_IN_QUERY) * QUOTA_UNITS["messages.list"],
+            "cache": 0,
+            "shards": counting.DEFAULT_SHARDS * QUOTA_UNITS["messages.list"],
+            "estimate": QUOTA_UNITS["messages.list"],
+        }[count_via]
+
+    def list_units(self, n: int) -> int:
+        """Cuota de listar `n` IDs con este plan."""
+        return max(1, -(-n // PAGE_SIZE)) * QUOTA_UNITS["messages.list"]
+
+    def describe(self) -> str:
+        parts = [f"plan={self.kind}"]
+        if self.label_ids:
+            parts.append(f"labelIds={','.join(self.label_ids)}")
+        if self.q:
+            parts.append(f"q='{self.q}'")
+        parts.append(f"conteo={self.count_via} (~{self.count_units} u.)")
+        return " ".join(parts)
+
+
+# ---------- etiquetas ----------
+def _label_resolver():
+    c = _labels_cache.setdefault(accounts.current(), {})
+    if not c or time.time() - c["at"] > LABELS_TTL:
+        resp = api.execute("labels.list", None, api.LABEL_IDS_FIELDS)
+        names = {
+            gq.normalize_label_name(l.get("name", "")): l["id"]
+            for l in resp.get("labels", []) or []
+        }
+        c.update(names=names, at=time.time())
+    return lambda normalized: c["names"].get(normalized)
+
+
+def reset_cache() -> None:
+    """Olvida los nombres de etiqueta (p. ej. tras crear o renombrar)."""
+    _labels_cache.clear()
+
+
+# ---------- partir la consulta ----------
+_LABEL_OPS = ("label", "in", "is", "category")
+
+
+def _label_terms(q: str) -> List[Tuple[int, int, gq.Term]]:
+    """
+    Términos de etiqueta en positivo del nivel superior de `q` con su
+    posición en la cadena. Vacío si `q` no se puede partir con seguridad.
+    """
+    found: List[Tuple[int, int, gq.Term]] = []
+    depth = 0
+    prev = None
+    for tok, start, end in gq.tokenize_spans(q):
+        if tok in ("(", "{"):
+            depth += 1
+        elif tok in (")", "}"):
+            depth -= 1
+            if depth < 0:
+                return []
+        elif depth == 0:
+            if tok in ("OR", "|"):
+                return []  # una disyunción no admite sacar términos a labelIds
+            node = gq.parse(tok)
+            if prev != "-" and isinstance(node, gq.Term) and node.op in _LABEL_OPS:
+                found.append((start, end, node))
+        prev = tok
+    return found if depth == 0 else []
+
+
+def _cut(q: str, spans: List[Tuple[int, int]]) -> str:
+    """`q` sin los tramos `spans`; el resto, carácter a carácter."""
+    pieces, pos = [], 0
+    for start, end in spans:
+        pieces.append(q[pos:start])
+        pos = end
+    pieces.append(q[pos:])
+    return " ".join(p.strip() for p in pieces if p.strip())
+
+
+# ---------- plan ----------
+def plan(q: Optional[str] = "", label_ids: Optional[List[str]] = None) -> Plan:
+    q = (q or "").strip()
+    lids: List[str] = list(label_ids or [])
+    cuts: List[Tuple[int, int]] = []
+    resolver = None
+    for start, end, term in _label_terms(q):
+        if term.op == "label" and resolver is None:
+            resolver = _label_resolver()
+        lid = gq.label_for_term(term, resolver)
+        if lid and lid not in _KEEP_IN_QUERY:
+            if lid not in lids:
+                lids.append(lid)
+            cuts.append((start, end))
+
+    residual = (_cut(q, cuts) if cuts else q) or None
+    node = gq.parse(residual or "")
+    rest = node.items if isinstance(node, gq.And) else [node]
+    terms = [it for it in rest if isinstance(it, gq.Term)]
+    only_terms = len(terms) == len(rest)
+    if not rest and lids:
+        p = Plan("labels", None, lids, "labels.get" if len(lids) == 1 else "estimate")
+    elif only_terms and rest and all(t.op in _DATE_OPS for t in terms):
+        p = Plan("date", residual, lids, "shards")
+    elif only_terms and len(terms) == 1 and terms[0].op == "from" and not lids:
+        sender = terms[0].value.lower()
+        cached = "@" in sender and search.cached_sender_count(sender) is not None
+        p = Plan("sender", residual, lids, "cache" if cached else "estimate", sender)
+    else:
+        p = Plan("search", residual, lids, "estimate")
+
+    entry = {"q": q, "plan": p.describe(), "at": time.time()}
+    history.append(entry)
+    tracing.instant(
+        "plan", "planner", kind=p.kind, count_via=p.count_via, units=p.count_units
+    )
+    return p
+
+
+def _label_total(label_id: str) -> Optional[int]:
+    """
+    Mensajes de `label_id` que devuelve messages.list: messagesTotal menos
+    los que están en Papelera/Spam. None si esos no caben en una página.
+    """
+    got = api.execute("labels.get", None, "messagesTotal", id=label_id)
+    total = int(got.get("messagesTotal", 0) or 0)
+    svc = get_gmail_service()
+    for bin_id in sorted(_KEEP_IN_QUERY):
+        resp = messages._list_page(svc, None, [label_id, bin_id], None)
+        if resp.get("nextPageToken"):
+            return None
+        total -= len(resp.get("messages", []) or [])
+    return max(0, total)
+
+
+def estimate_total(p: Plan) -> int:
+    """Total rápido según el plan (lo que usa messages.estimate_count)."""
+    if p.count_via == "labels.get":
+        n = _label_total(p.label_ids[0])
+        if n is not None:
+            return n
+    elif p.count_via == "cache":
+        return int(search.cached_sender_count(p.sender) or 0)
+    elif p.count_via == "shards":
+        # resultSizeEstimate falla mucho con rangos de fechas
+        return counting.estimate(p.q or "", p.label_ids, time_budget=1.0)["count"]
+    resp = messages._list_page(get_gmail_service(), p.q, p.label_ids or None, None)
+    return int(resp.get("resultSizeEstimate", 0) or 0)
+
+
+def _sharded(count_mode: Optional[str]) -> bool:
+    mode = count_mode or JOB_COUNT_MODE
+    if mode not in JOB_COUNT_MODES:
+        raise ValueError(f"Modo de conteo desconocido: {mode}")
+    return mode == "estimate"
+
+
+def job_listing(
+    q: Optional[str] = "",
+    label_ids: Optional[List[str]] = None,
+    max_total: Optional[int] = None,
+    stop_event=None,
+    count_mode: Optional[str] = None,
+) -> "counting.JobListing":
+    """
+    IDs y total de un trabajo masivo por el plan de `q`: con conteo directo
+    (labels.get, caché) se lista sin partir; si no, counting.JobListing
+    afina el total con shards de fecha mientras lista. `count_mode`
+    (por defecto config.JOB_COUNT_MODE): ``"estimate"`` o ``"fast"`` (sólo
+    resultSizeEstimate, sin sondear shards).
+    """
+    sharded = _sharded(count_mode)
+    p = plan(q, label_ids)
+    total = estimate_total(p) if p.count_via in ("labels.get", "cache") else None
+    return counting.JobListing(
+        p.q, p.label_ids, max_total, stop_event, total, sharded=sharded
+    )
+
+
+def job_total(
+    p: Plan, max_total: Optional[int] = None, count_mode: Optional[str] = None
+) -> int:
+    """
+    Total inicial de la barra de un trabajo que no lista con `job_listing`
+    (motor asyncio): el mismo que tendría su JobListing tras sondear los
+    shards, sin listar nada.
+    """
+    if p.count_via in ("labels.get", "cache"):
+        return estimate_total(p)
+    listing = counting.JobListing(
+        p.q, p.label_ids, max_total, sharded=_sharded(count_mode)
+    )
+    return listing.seed()
+
+
+def count(q: Optional[str] = "", time_budget: float = 2.0) -> Dict:
+    """
+    Conteo para confirmaciones y barras de progreso por el camino más
+    barato; mismo formato que counting.count_matches más ``plan``.
+    """
+    p = plan(q)
+    if p.count_via in ("labels.get", "cache"):
+        n = estimate_total(p)
+        # Totales de etiqueta/caché: sin intervalo (ver nota del módulo)
+        res = {"count": n, "low": None, "high": None, "exact": False}
+    else:
+        res = counting.estimate(p.q or "", p.label_ids, time_budget=time_budget)
+    res["plan"] = p.describe()
+    return res
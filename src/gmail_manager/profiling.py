@@ -0,0 +1,138 @@
+"""
+Perfilado opcional de CPU (cProfile) y memoria (tracemalloc) por trabajo.
+
+Desactivado por defecto. Se activa con ``INBOXZERO_PROFILE_DIR`` (ver
+config.PROFILE_DIR), con el interruptor de la pestaña Cuenta o con
+``enable(dir)``. Cada trabajo genera en ese directorio:
+
+- ``<trabajo>-<fecha>.pstats``: abrir con ``python -m pstats`` o snakeviz.
+- ``<trabajo>-<fecha>.alloc.txt``: top de asignaciones por línea.
+
+cProfile sólo mide el hilo que ejecuta el trabajo (en los pipelines con
+ThreadPoolExecutor, los workers aparecen como espera en ``as_completed``);
+tracemalloc es global al proceso. Sólo puede haber un perfilador activo por
+proceso (desde Python 3.12 un segundo ``enable()`` lanza ValueError), así
+que si otro trabajo ya se está perfilando (``run_many``, la GUI y el demonio
+a la vez) el nuevo corre sin perfil y se avisa con un warning.
+"""
+
+import cProfile
+import functools
+import os
+import pstats
+import threading
+import tracemalloc
+import warnings
+from contextlib import contextmanager
+from datetime import datetime
+
+from .config import PROFILE_DIR
+
+TOP_ALLOCATIONS = 40
+
+_profile_dir: str = PROFILE_DIR
+# cProfile no admite perfiles anidados en el mismo hilo
+_local = threading.local()
+# Un solo trabajo perfilado a la vez en todo el proceso
+_busy = threading.Lock()
+
+
+def enable(directory: str) -> None:
+    global _profile_dir
+    _profile_dir = directory or ""
+
+
+def disable() -> None:
+    global _profile_dir
+    _profile_dir = ""
+
+
+def is_enabled() -> bool:
+    return bool(_profile_dir)
+
+
+def _write_alloc_report(snapshot, path: str, job: str) -> None:
+    stats = snapshot.statistics("lineno")
+    total = sum(s.size for s in stats)
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write(f"Trabajo: {job}\n")
+        fh.write(f"Memoria retenida al final: {total / 1024:.1f} KiB\n")
+        fh.write(f"Top {TOP_ALLOCATIONS} asignaciones por línea:\n\n")
+        for stat in stats[:TOP_ALLOCATIONS]:
+            fh.write(f"{stat}\n")
+
+
+@contextmanager
+def profile_job(job: str):
+    """Envuelve un trabajo en cProfile + tracemalloc si el perfilado está activo."""
+    directory = _profile_dir
+    if not directory or getattr(_local, "busy", False):
+        yield None
+        return
+    os.makedirs(directory, exist_ok=True)
+    if not _busy.acquire(blocking=False):
+        warnings.warn(
+            f"Perfilado omitido para '{job}': ya hay otro trabajo perfilándose.",
+            RuntimeWarning,
+            stacklevel=3,
+        )
+        yield None
+        return
+    prof = cProfile.Profile()
+    try:
+        prof.enable()
+    except ValueError as e:  # otro perfilador ajeno (p. ej. un depurador)
+        _busy.release()
+        warnings.warn(
+            f"Perfilado omitido para '{job}': {e}", RuntimeWarning, stacklevel=3
+        )
+        yield None
+        return
+
+    base = os.path.join(directory, f"{job}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+    started_tm = not tracemalloc.is_tracing()
+    if started_tm:
+        tracemalloc.start()
+    _local.busy = True
+    try:
+        yield prof
+    finally:
+        prof.disable()
+        _local.busy = False
+        try:
+            _write_reports(prof, base, job, started_tm)
+        finally:
+            _busy.release()
+
+
+def _write_reports(prof, base: str, job: str, started_tm: bool) -> None:
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ]
+    )
+    _, peak = tracemalloc.get_traced_memory()
+    if started_tm:
+        tracemalloc.stop()
+    prof.dump_stats(base + ".pstats")
+    _write_alloc_report(snapshot, base + ".alloc.txt", job)
+    with open(base + ".alloc.txt", "a", encoding="utf-8") as fh:
+        fh.write(f"\nPico de memoria trazada: {peak / 1024:.1f} KiB\n\n")
+        pstats.Stats(prof, stream=fh).sort_stats("cumulative").print_stats(25)
+
+
+def profiled(job: str):
+    """Decorador: perfila cada llamada a la función como el trabajo `job`."""
+
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _profile_dir:
+                return fn(*args, **kwargs)
+            with profile_job(job):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return deco
@@ -0,0 +1,448 @@
+"""
+Parser y evaluador local de la sintaxis de búsqueda de Gmail (`q`).
+
+Cubre el subconjunto que usa esta herramienta:
+
+- operadores ``from: to: subject: label: in: is: category: has:``
+- tamaño ``larger: smaller: size:`` (sufijos K/M/G)
+- fechas ``after: before: older_than: newer_than:`` (fecha o epoch)
+- negación ``-término``, ``OR``, grupos ``( )`` y ``{ }``, valores agrupados
+  ``from:(a OR b)`` y frases entre comillas
+- palabras sueltas (se buscan en asunto, remitente y snippet)
+
+La evaluación es aproximada respecto a Gmail (coincidencia por subcadena en
+vez de por tokens, fechas en UTC en vez de la zona de la cuenta); quien la use
+para decidir debe tratarla como una previsualización.
+"""
+
+import re
+import time
+from datetime import datetime, timezone
+from typing import Callable, Iterator, List, Optional, Set, Tuple
+
+DAY = 86400
+
+# Etiquetas de sistema alcanzables con in:/is:/category:
+IN_LABELS = {
+    "inbox": "INBOX",
+    "trash": "TRASH",
+    "spam": "SPAM",
+    "sent": "SENT",
+    "draft": "DRAFT",
+    "drafts": "DRAFT",
+    "starred": "STARRED",
+    "important": "IMPORTANT",
+    "unread": "UNREAD",
+    "chats": "CHAT",
+}
+IS_LABELS = {
+    "unread": "UNREAD",
+    "starred": "STARRED",
+    "important": "IMPORTANT",
+}
+CATEGORY_LABELS = {
+    "primary": "CATEGORY_PERSONAL",
+    "personal": "CATEGORY_PERSONAL",
+    "social": "CATEGORY_SOCIAL",
+    "promotions": "CATEGORY_PROMOTIONS",
+    "updates": "CATEGORY_UPDATES",
+    "forums": "CATEGORY_FORUMS",
+}
+SYSTEM_LABELS = {
+    "INBOX",
+    "TRASH",
+    "SPAM",
+    "SENT",
+    "DRAFT",
+    "STARRED",
+    "IMPORTANT",
+    "UNREAD",
+    "CHAT",
+    "CATEGORY_PERSONAL",
+    "CATEGORY_SOCIAL",
+    "CATEGORY_PROMOTIONS",
+    "CATEGORY_UPDATES",
+    "CATEGORY_FORUMS",
+}
+
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3}
+
+
+# ---------- AST ----------
+class Term:
+    __slots__ = ("op", "value")
+
+    def __init__(self, op: Optional[str], value: str):
+        self.op = op  # None = palabra suelta
+        self.value = value
+
+    def __repr__(self):
+        return f"Term({self.op!r}, {self.value!r})"
+
+
+class And:
+    __slots__ = ("items",)
+
+    def __init__(self, items: List):
+        self.items = items
+
+    def __repr__(self):
+        return f"And({self.items!r})"
+
+
+class Or:
+    __slots__ = ("items",)
+
+    def __init__(self, items: List):
+        self.items = items
+
+    def __repr__(self):
+        return f"Or({self.items!r})"
+
+
+class Not:
+    __slots__ = ("item",)
+
+    def __init__(self, item):
+        self.item = item
+
+    def __repr__(self):
+        return f"Not({self.item!r})"
+
+
+# ---------- tokenizer / parser ----------
+_TOKEN_RE = re.compile(
+    r'\s*(\(|\)|\{|\}|-(?=\S)|"[^"]*"|[^\s(){}"]+:"[^"]*"'
+    r'|[^\s(){}"]+(?:\([^)]*\))?|")'
+)
+
+
+def tokenize_spans(q: str) -> List[Tuple[str, int, int]]:
+    """Tokens de `q` con su posición ``[inicio, fin)`` en la cadena."""
+    tokens: List[Tuple[str, int, int]] = []
+    pos = 0
+    q = q or ""
+    while pos < len(q):
+        m = _TOKEN_RE.match(q, pos)
+        if not m:
+            break
+        tok = m.group(1)
+        pos = m.end()
+        if tok and tok != '"':
+            tokens.append((tok, m.start(1), m.end(1)))
+        if not q[pos:].strip():
+            break
+    return tokens
+
+
+def _tokenize(q: str) -> List[str]:
+    return [tok for tok, _, _ in tokenize_spans(q)]
+
+
+class _Parser:
+    def __init__(self, tokens: List[str]):
+        self.toks = tokens
+        self.i = 0
+
+    def peek(self) -> Optional[str]:
+        return self.toks[self.i] if self.i < len(self.toks) else None
+
+    def take(self) -> str:
+        tok = self.toks[self.i]
+        self.i += 1
+        return tok
+
+    def parse_or(self, closer: Optional[str] = None):
+        items = [self.parse_and(closer)]
+        while self.peek() == "OR":
+            self.take()
+            items.append(self.parse_and(closer))
+        return items[0] if len(items) == 1 else Or(items)
+
+    def parse_and(self, closer: Optional[str]):
+        items = []
+        while True:
+            tok = self.peek()
+            if tok is None or tok == "OR" or tok == closer:
+                break
+            if tok in (")", "}"):
+                self.take()  # paréntesis sin pareja: se ignora
+                continue
+            items.append(self.parse_unary(closer))
+        if len(items) == 1:
+            return items[0]
+        return And(items)
+
+    def parse_unary(self, closer: Optional[str]):
+        tok = self.take()
+        if tok == "-":
+            if self.peek() is None:
+                return And([])
+            return Not(self.parse_unary(closer))
+        if tok == "(":
+            node = self.parse_or(")")
+            if self.peek() == ")":
+                self.take()
+            return node
+        if tok == "{":
+            items = []
+            while self.peek() not in (None, "}"):
+                items.append(self.parse_unary("}"))
+            if self.peek() == "}":
+                self.take()
+            return Or(items)
+        return _make_term(tok)
+
+
+def _make_term(tok: str):
+    if tok.startswith('"') and tok.endswith('"') and len(tok) >= 2:
+        return Term(None, tok[1:-1])
+    if ":" in tok and not tok.startswith(":"):
+        op, value = tok.split(":", 1)
+        op = op.lower()
+        if value.startswith("(") and value.endswith(")"):
+            # Como en Gmail, `op:(a b)` es a Y b; sólo OR / | (o {a b}) es O
+            toks = ["OR" if t == "|" else t for t in _tokenize(value[1:-1])]
+            if not toks:
+                return Term(op, "")
+            return _apply_op(_Parser(toks).parse_or(), op)
+        return Term(op, _unquote(value))
+    return Term(None, tok)
+
+
+def _apply_op(node, op: str):
+    """Aplica el operador de un grupo `op:(...)` a sus palabras sueltas."""
+    if isinstance(node, Term):
+        return Term(op, node.value) if node.op is None else node
+    if isinstance(node, Not):
+        return Not(_apply_op(node.item, op))
+    return type(node)([_apply_op(it, op) for it in node.items])
+
+
+def _unquote(v: str) -> str:
+    if len(v) >= 2 and v[0] == v[-1] == '"':
+        return v[1:-1]
+    return v
+
+
+def parse(q: str):
+    """Convierte una consulta `q` en un AST (And/Or/Not/Term). `""` → And([])."""
+    tokens = _tokenize(q)
+    if not tokens:
+        return And([])
+    return _Parser(tokens).parse_or()
+
+
+def iter_terms(node) -> Iterator[Tuple[Term, bool]]:
+    """Recorre los términos con su polaridad (False si están bajo un Not)."""
+    stack = [(node, True)]
+    while stack:
+        n, positive = stack.pop()
+        if isinstance(n, Term):
+            yield n, positive
+        elif isinstance(n, Not):
+            stack.append((n.item, not positive))
+        else:
+            for it in n.items:
+                stack.append((it, positive))
+
+
+# ---------- valores ----------
+def parse_size(value: str) -> Optional[int]:
+    m = re.fullmatch(r"(\d+)\s*([KMG]?)B?", (value or "").strip().upper())
+    if not m:
+        return None
+    return int(m.group(1)) * _SIZE_UNITS[m.group(2)]
+
+
+def parse_date(value: str) -> Optional[int]:
+    """Epoch (segundos, UTC) para `2024/01/31`, `2024-01-31` o un epoch."""
+    value = (value or "").strip()
+    if value.isdigit() and len(value) > 8:
+        return int(value)
+    m = re.fullmatch(r"(\d{4})[/-](\d{1,2})[/-](\d{1,2})", value)
+    if not m:
+        return None
+    y, mo, d = (int(x) for x in m.groups())
+    try:
+        return int(datetime(y, mo, d, tzinfo=timezone.utc).timestamp())
+    except ValueError:
+        return None
+
+
+def parse_relative(value: str) -> Optional[int]:
+    """Segundos para `30d`, `6m`, `1y` (older_than / newer_than)."""
+    m = re.fullmatch(r"(\d+)([dmy])", (value or "").strip().lower())
+    if not m:
+        return None
+    n, unit = int(m.group(1)), m.group(2)
+    return n * {"d": DAY, "m": 30 * DAY, "y": 365 * DAY}[unit]
+
+
+def normalize_label_name(name: str) -> str:
+    """Forma en que Gmail escribe un nombre de etiqueta dentro de `label:`."""
+    return re.sub(r"[\s/&]+", "-", (name or "").strip().lower())
+
+
+def label_for_term(term: Term, resolver: Optional[Callable[[str], Optional[str]]]):
+    """
+    ID de etiqueta equivalente a un término (in:/is:/category:/label:) o None
+    si el término no es de etiqueta. `resolver` traduce nombres de usuario.
+    """
+    op, v = term.op, (term.value or "").lower()
+    if op == "in" and v in IN_LABELS:
+        return IN_LABELS[v]
+    if op == "is" and v in IS_LABELS:
+        return IS_LABELS[v]
+    if op == "category" and v in CATEGORY_LABELS:
+        return CATEGORY_LABELS[v]
+    if op == "label":
+        up = term.value.upper()
+        if up in SYSTEM_LABELS:
+            return up
+        if v in CATEGORY_LABELS:
+            return CATEGORY_LABELS[v]
+        if resolver:
+            return resolver(normalize_label_name(term.value))
+    return None
+
+
+def includes_spam_trash(node) -> bool:
+    """Gmail excluye SPAM/TRASH salvo que la consulta los pida explícitamente."""
+    for term, positive in iter_terms(node):
+        if not positive:
+            continue
+        v = (term.value or "").lower()
+        if term.op == "in" and v in ("trash", "spam", "anywhere"):
+            return True
+        if term.op == "label" and v in ("trash", "spam"):
+            return True
+    return False
+
+
+# ---------- evaluación local ----------
+class MessageView:
+    """
+    Vista mínima de un mensaje para evaluar consultas.
+    `date` en segundos epoch; `labels` con IDs de etiqueta.
+    """
+
+    __slots__ = (
+        "sender",
+        "to",
+        "subject",
+        "labels",
+        "date",
+        "size",
+        "has_attachment",
+        "snippet",
+    )
+
+    def __init__(
+        self,
+        sender: str = "",
+        to: str = "",
+        subject: str = "",
+        labels: Optional[Set[str]] = None,
+        date: int = 0,
+        size: int = 0,
+        has_attachment: bool = False,
+        snippet: str = "",
+    ):
+        self.sender = sender
+        self.to = to
+        self.subject = subject
+        self.labels = labels or set()
+        self.date = date
+        self.size = size
+        self.has_attachment = has_attachment
+        self.snippet = snippet
+
+
+def compile_query(
+    node,
+    resolver: Optional[Callable[[str], Optional[str]]] = None,
+    now: Optional[float] = None,
+    unsupported: Optional[List[str]] = None,
+) -> Callable[[MessageView], bool]:
+    """
+    Compila el AST en un predicado sobre MessageView. Los operadores que no se
+    saben evaluar se tratan como "coincide" y se anotan en `unsupported`.
+    """
+    now = time.time() if now is None else now
+
+    def build(n) -> Callable[[MessageView], bool]:
+        if isinstance(n, And):
+            parts = [build(x) for x in n.items]
+            return lambda m: all(p(m) for p in parts)
+        if isinstance(n, Or):
+            parts = [build(x) for x in n.items]
+            return lambda m: any(p(m) for p in parts)
+        if isinstance(n, Not):
+            inner = build(n.item)
+            return lambda m: not inner(m)
+        return _compile_term(n, resolver, now, unsupported)
+
+    return build(node)
+
+
+def _compile_term(term: Term, resolver, now, unsupported):
+    op = term.op
+    v = (term.value or "").lower()
+
+    def _skip():
+        if unsupported is not None:
+            unsupported.append(f"{op}:{term.value}" if op else term.value)
+        return lambda m: True
+
+    if op is None:
+        return (
+            lambda m: v in m.subject.lower()
+            or v in m.sender.lower()
+            or (v in m.snippet.lower())
+        )
+    if op == "from":
+        return lambda m: v in m.sender.lower()
+    if op in ("to", "cc", "deliveredto"):
+        return lambda m: v in m.to.lower()
+    if op == "subject":
+        return lambda m: v in m.subject.lower()
+    if op == "in" and v == "anywhere":
+        return lambda m: True
+    if op == "is" and v == "read":
+        return lambda m: "UNREAD" not in m.labels
+    if op == "has" and v == "attachment":
+        return lambda m: m.has_attachment
+    if op == "has" and v in ("userlabels", "nouserlabels"):
+        want = v == "userlabels"
+        return lambda m: any(l not in SYSTEM_LABELS for l in m.labels) == want
+    if op in ("larger", "size", "smaller"):
+        size = parse_size(term.value)
+        if size is None:
+            return _skip()
+        if op == "smaller":
+            return lambda m: m.size < size
+        return lambda m: m.size > size
+    if op in ("after", "before", "older", "newer"):
+        ts = parse_date(term.value)
+        if ts is None:
+            return _skip()
+        if op in ("after", "newer"):
+            return lambda m: m.date >= ts
+        return lambda m: m.date < ts
+    if op in ("older_than", "newer_than"):
+        delta = parse_relative(term.value)
+        if delta is None:
+            return _skip()
+        cutoff = now - delta
+        if op == "older_than":
+            return lambda m: m.date < cutoff
+        return lambda m: m.date >= cutoff
+    if op in ("in", "is", "category", "label"):
+        lid = label_for_term(term, resolver)
+        if lid is None:
+            if op == "label":
+                return lambda m: False  # etiqueta inexistente
+            return _skip()
+        return lambda m: lid in m.labels
+    return _skip()
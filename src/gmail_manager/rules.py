@@ -0,0 +1,547 @@
+"""
+Reglas declarativas de limpieza y demonio incremental.
+
+Un fichero JSON describe la política del buzón::
+
+    {"rules": [
+      {"name": "promos-viejas", "query": "category:promotions older_than:30d",
+       "action": "trash"},
+      {"name": "jira", "query": "from:jira.example.com",
+       "add_labels": ["Jira"], "archive": true}
+    ]}
+
+``action`` es ``trash``, ``delete`` o ``modify`` (por defecto); ``add_labels``
+y ``remove_labels`` llevan nombres de etiqueta (las que falten se crean) o
+IDs de sistema; ``archive`` equivale a quitar INBOX. Las reglas de papelera
+y borrado nunca tocan mensajes destacados.
+
+`run_once()` hace una pasada y `run_daemon()` la repite cada ``interval``
+segundos. Cada pasada lee ``history.list`` desde el último ``historyId`` de
+la cuenta, descarga la metadata sólo de los mensajes añadidos o cambiados y
+evalúa las reglas en local (query.compile_query). Dos tipos de regla no se
+pueden evaluar así y se ejecutan como consulta en el servidor cada
+``every`` segundos (modo ``scan``): las que dependen del reloj
+(``older_than``/``newer_than``: un mensaje envejece sin generar historial) y
+las que usan operadores que query.py no sabe evaluar. Una regla nueva o
+modificada se consulta una vez entera para ponerse al día (``backfill``).
+
+Las acciones de todas las reglas se agrupan por cambio combinado
+(filters._group_by_change) y salen en batchModify/batchDelete compartidos.
+El estado (``historyId`` y última consulta de cada regla) se guarda por
+cuenta en config.RULES_STATE_FILE.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from array import array
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from googleapiclient.errors import HttpError
+
+from . import accounts, api, backtest, filters, journal, labels, messages, planner
+from . import profiling, search, selection, tracing
+from . import query as gq
+from .config import RULES_STATE_FILE
+from .service import get_gmail_service
+
+USER_ID = "me"
+ACTIONS = ("trash", "delete", "modify")
+RULES_INTERVAL = 60  # segundos entre pasadas del demonio
+RESCAN_INTERVAL = 3600  # reglas en modo scan: una consulta por hora como mucho
+HISTORY_PAGE = 500
+_RELATIVE_OPS = {"older_than", "newer_than"}
+_HIDDEN = frozenset({"TRASH", "SPAM"})
+
+_state_lock = threading.Lock()
+# Cambios hechos por la última pasada, por cuenta: {id: (add, remove)}. El
+# historial los devuelve en la pasada siguiente y no hace falta releerlos.
+_own: Dict[Optional[str], Dict[str, Tuple[frozenset, frozenset]]] = {}
+
+
+class Rule:
+    """Regla validada; `predicate` y `mode` se rellenan en `load_rules`."""
+
+    __slots__ = (
+        "name",
+        "query",
+        "action",
+        "add",
+        "remove",
+        "every",
+        "mode",
+        "predicate",
+        "unsupported",
+    )
+
+    def __init__(self, name, query, action, add, remove, every, mode=None):
+        self.name = name
+        self.query = query
+        self.action = action
+        self.add = add
+        self.remove = remove
+        self.every = every
+        self.mode = mode  # None = se decide al compilar (local | scan)
+        self.predicate = None
+        self.unsupported: List[str] = []
+
+    @property
+    def key(self) -> str:
+        """Identidad de la regla: cambia si cambia la consulta o la acción."""
+        raw = json.dumps(
+            [self.query, self.action, sorted(self.add), sorted(self.remove)]
+        )
+        return self.name + ":" + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+    @property
+    def change(self) -> Tuple[frozenset, frozenset]:
+        add = set(self.add) | ({"TRASH"} if self.action == "trash" else set())
+        return frozenset(add), frozenset(self.remove) - add
+
+    def describe(self) -> str:
+        if self.action == "delete":
+            acts = "borrar"
+        else:
+            add, remove = self.change
+            acts = " ".join(
+                [f"+{l}" for l in sorted(add)] + [f"-{l}" for l in sorted(remove)]
+            )
+        return f"{self.name} [{self.mode or '?'}] '{self.query}' => {acts}"
+
+
+# ---------- fichero de reglas ----------
+def parse_rules(data) -> List[Rule]:
+    """Valida el contenido del fichero (dict con "rules" o lista) sin tocar la API."""
+    items = data.get("rules") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        raise ValueError("El fichero de reglas debe tener una lista 'rules'.")
+    out = []
+    seen: Set[str] = set()
+    for i, item in enumerate(items):
+        name = str(item.get("name") or "").strip()
+        where = f"regla {i + 1}" + (f" ({name})" if name else "")
+        if not name or name in seen:
+            raise ValueError(f"{where}: falta 'name' o está repetido.")
+        seen.add(name)
+        query = " ".join(str(item.get("query") or "").split())
+        if not query:
+            raise ValueError(f"{where}: 'query' vacía cogería todo el buzón.")
+        action = str(item.get("action") or "modify").lower()
+        if action not in ACTIONS:
+            raise ValueError(f"{where}: acción '{action}' no es {'/'.join(ACTIONS)}.")
+        add = list(item.get("add_labels") or [])
+        remove = list(item.get("remove_labels") or [])
+        if item.get("archive"):
+            remove.append("INBOX")
+        if action == "modify" and not (add or remove):
+            raise ValueError(f"{where}: sin etiquetas que añadir o quitar.")
+        mode = item.get("mode")
+        if mode not in (None, "local", "scan"):
+            raise ValueError(f"{where}: 'mode' debe ser local o scan.")
+        every = int(item.get("every") or RESCAN_INTERVAL)
+        out.append(Rule(name, query, action, add, remove, every, mode))
+    return out
+
+
+def _resolve_labels(rules: List[Rule], create: bool) -> None:
+    ids = {l["name"]: l["id"] for l in labels.list_labels()}
+    known = set(ids.values())
+    for rule in rules:
+        for attr in ("add", "remove"):
+            resolved = []
+            for name in getattr(rule, attr):
+                if name in known or name.upper() in gq.SYSTEM_LABELS:
+                    resolved.append(name if name in known else name.upper())
+                    continue
+                if name not in ids:
+                    if not create:
+                        raise ValueError(
+                            f"{rule.name}: la etiqueta '{name}' no existe en esta cuenta."
+                        )
+                    ids[name] = labels.create_label(name)["id"]
+                    known.add(ids[name])
+                resolved.append(ids[name])
+            setattr(rule, attr, sorted(set(resolved)))
+
+
+def _compile(rule: Rule, resolver) -> None:
+    node = gq.parse(rule.query)
+    unsupported: List[str] = []
+    pred = gq.compile_query(node, resolver, unsupported=unsupported)
+    if not gq.includes_spam_trash(node):
+        # Como la búsqueda de Gmail: Papelera y Spam sólo si se piden
+        base = pred
+        pred = lambda m: not (m.labels & _HIDDEN) and base(m)
+    rule.predicate = pred
+    rule.unsupported = unsupported
+    if rule.mode is None:
+        timed = any(t.op in _RELATIVE_OPS for t, _ in gq.iter_terms(node))
+        rule.mode = "scan" if timed or unsupported else "local"
+
+
+def load_rules(path: str, create_labels: bool = True) -> List[Rule]:
+    """Lee, valida y compila las reglas para la cuenta activa."""
+    with open(path, encoding="utf-8") as fh:
+        rules = parse_rules(json.load(fh))
+    _resolve_labels(rules, create_labels)
+    resolver = planner._label_resolver()
+    for rule in rules:
+        _compile(rule, resolver)
+    return rules
+
+
+# ---------- estado ----------
+def load_state(path: Optional[str] = None) -> Dict:
+    path = path or RULES_STATE_FILE
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(data: Dict, path: Optional[str] = None) -> None:
+    path = path or RULES_STATE_FILE
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _account_key() -> str:
+    return accounts.current() or ""
+
+
+def reset_state(path: Optional[str] = None) -> None:
+    """Olvida el historyId de la cuenta activa: la próxima pasada rehace todo."""
+    with _state_lock:
+        data = load_state(path)
+        data.pop(_account_key(), None)
+        save_state(data, path)
+    _own.pop(accounts.current(), None)
+
+
+# ---------- historial y metadata ----------
+def _status(exc) -> Optional[int]:
+    return getattr(getattr(exc, "resp", None), "status", None)
+
+
+def _read_history(
+    service, start: str, own: Dict
+) -> Tuple[str, List[str], Set[str], int]:
+    """
+    (historyId final, IDs cambiados en orden, IDs añadidos, páginas). Se
+    omiten los cambios de etiqueta que hizo la pasada anterior (`own`).
+    """
+    changed: Dict[str, None] = {}
+    added: Set[str] = set()
+    deleted: Set[str] = set()
+    token = None
+    pages = 0
+    while True:
+        resp = messages._with_retries(
+            lambda: api.execute(
+                "history.list",
+                service,
+                startHistoryId=start,
+                pageToken=token,
+                maxResults=HISTORY_PAGE,
+            )
+        )
+        pages += 1
+        for record in resp.get("history", []) or []:
+            for item in record.get("messagesAdded", []) or []:
+                mid = item["message"]["id"]
+                changed[mid] = None
+                added.add(mid)
+            for key, side in (("labelsAdded", 0), ("labelsRemoved", 1)):
+                for item in record.get(key, []) or []:
+                    mid = item["message"]["id"]
+                    mine = own.get(mid)
+                    if mine and set(item.get("labelIds") or []) <= mine[side]:
+                        continue
+                    changed[mid] = None
+            for item in record.get("messagesDeleted", []) or []:
+                deleted.add(item["message"]["id"])
+        token = resp.get("nextPageToken")
+        if not token:
+            break
+    ids = [mid for mid in changed if mid not in deleted]
+    return str(resp.get("historyId") or start), ids, added - deleted, pages
+
+
+def _fetch_views(
+    service, ids: List[str]
+) -> Tuple[Dict[str, gq.MessageView], List[str]]:
+    """Metadata de `ids` en batch; devuelve (vistas, IDs a reintentar)."""
+    views: Dict[str, gq.MessageView] = {}
+    failed: List[str] = []
+    for start in range(0, len(ids), search.BATCH_SIZE):
+        chunk = ids[start : start + search.BATCH_SIZE]
+
+        def callback(request_id, response, exception, chunk=chunk):
+            mid = chunk[int(request_id)]
+            if exception is None:
+                views[mid] = backtest.message_view(response)
+            elif _status(exception) != 404:  # 404: ya no existe
+                failed.append(mid)
+
+        batch = service.new_batch_http_request(callback=callback)
+        for i, mid in enumerate(chunk):
+            batch.add(
+                api.request(
+                    "messages.get",
+                    service,
+                    fields=api.BACKTEST_FIELDS,
+                    id=mid,
+                    format="metadata",
+                    metadataHeaders=backtest.VIEW_HEADERS,
+                ),
+                None,
+                str(i),
+            )
+        with tracing.span("batch", "http", action="GET_METADATA", size=len(chunk)):
+            messages._with_retries(batch.execute)
+    return views, failed
+
+
+def _scan(rule: Rule, protect_starred: bool) -> array:
+    q = rule.query
+    if protect_starred and rule.action in ("trash", "delete"):
+        q = f"({q}) -is:starred"
+    with tracing.span("rule_scan", "list", rule=rule.name):
+        return selection.compact(messages.iter_message_ids(q, None))
+
+
+def _latency(ids: Iterable[int], views: Dict[str, gq.MessageView], now: float):
+    ages = [now - views[selection._to_hex(v)].date for v in ids]
+    if not ages:
+        return None
+    return {"avg": round(sum(ages) / len(ages), 1), "max": round(max(ages), 1)}
+
+
+# ---------- PUBLIC ----------
+def run_once(
+    rules: List[Rule],
+    dry_run: bool = False,
+    backfill: bool = True,
+    protect_starred: bool = True,
+    concurrency: int = 4,
+    batch_size: int = messages.BATCH_LIMIT,
+    state_path: Optional[str] = None,
+) -> Dict:
+    """
+    Una pasada del demonio sobre la cuenta activa. Devuelve ``{"rules":
+    {nombre: {mode, matched, scanned, latency}}, "changed", "history_pages",
+    "processed", "deleted", "groups", "history_id", "reset", "journal",
+    "seconds"}``; ``journal`` es el diario de lo que se envió a la papelera.
+    ``latency`` (s) va desde la llegada del mensaje hasta la acción, sólo
+    para mensajes nuevos evaluados en local. Con dry_run no se modifica
+    nada ni se guarda el estado.
+    """
+    t0 = time.perf_counter()
+    service = get_gmail_service()
+    key = _account_key()
+    state = load_state(state_path).get(key, {})
+    own = _own.get(accounts.current(), {})
+    scans: Dict[str, float] = dict(state.get("scans", {}))
+    now = time.time()
+    history_id = state.get("history_id")
+    changed: List[str] = []
+    added: Set[str] = set()
+    pages = 0
+    reset = False
+
+    job = "rules_daemon"
+    with tracing.trace_job(job), profiling.profile_job(job):
+        if history_id:
+            try:
+                history_id, changed, added, pages = _read_history(
+                    service, history_id, own
+                )
+            except HttpError as e:
+                if _status(e) != 404:
+                    raise
+                # historyId caducado (~1 semana): se vuelve a consultar todo
+                history_id, reset = None, True
+                scans = {}
+        if not history_id:
+            # Se toma antes de consultar: lo que llegue durante la pasada
+            # aparecerá en el historial de la siguiente
+            history_id = str(api.execute("getProfile", service)["historyId"])
+            if not backfill and not reset:
+                scans.update({r.key: now for r in rules if r.mode == "local"})
+
+        fresh = set(changed)
+        pending = [m for m in state.get("pending", []) if m not in fresh]
+        to_fetch = pending + changed
+        views, failed = _fetch_views(service, to_fetch) if to_fetch else ({}, [])
+
+        stats = {}
+        arrays: List[array] = []
+        for rule in rules:
+            t_rule = time.perf_counter()
+            due = rule.key not in scans or (
+                rule.mode == "scan" and now - scans[rule.key] >= rule.every
+            )
+            if due:
+                arr = _scan(rule, protect_starred)
+                scans[rule.key] = now
+            else:
+                arr = array("Q")
+            local = array("Q")
+            if rule.mode == "local" and views:
+                add, remove = rule.change
+                hits = []
+                for mid, view in views.items():
+                    if not rule.predicate(view):
+                        continue
+                    # Ya aplicada (p. ej. a mano): no repetir la llamada
+                    if rule.action != "delete" and (
+                        add <= view.labels and not remove & view.labels
+                    ):
+                        continue
+                    if (
+                        protect_starred
+                        and rule.action != "modify"
+                        and "STARRED" in view.labels
+                    ):
+                        continue
+                    hits.append(mid)
+                local = selection.compact(hits)
+            arr = selection.union(arr, local) if due else local
+            arrays.append(arr)
+            stats[rule.name] = {
+                "mode": rule.mode,
+                "matched": len(arr),
+                "scanned": due,
+                "_new": [v for v in local if selection._to_hex(v) in added],
+                "seconds": round(time.perf_counter() - t_rule, 4),
+            }
+
+        # Borrado gana a todo; el resto se agrupa por cambio combinado
+        doomed = array("Q")
+        for rule, arr in zip(rules, arrays):
+            if rule.action == "delete":
+                doomed = selection.union(doomed, arr)
+        modify = [i for i, r in enumerate(rules) if r.action != "delete"]
+        groups = filters._group_by_change(
+            [arrays[i] for i in modify],
+            [[i] for i in modify],
+            [r.change for r in rules],
+        )
+        if doomed:
+            for change in list(groups):
+                rest = selection.difference(groups[change], doomed)
+                if rest:
+                    groups[change] = rest
+                else:
+                    del groups[change]
+
+        processed = deleted = trashed = 0
+        acted: Dict[str, Tuple[frozenset, frozenset]] = {}
+        jr = None
+        if not dry_run:
+            if any("TRASH" in add for add, _ in groups):
+                names = [r.name for r in rules if "TRASH" in r.change[0]]
+                jr = journal.start("rules", ", ".join(names))
+            try:
+                for (add, remove), arr in groups.items():
+                    done = messages._stream_action_from_ids(
+                        selection.iter_ids(arr),
+                        len(arr),
+                        None,
+                        batch_size,
+                        concurrency,
+                        None,
+                        None,
+                        "MODIFY",
+                        (list(add), list(remove)),
+                        on_chunk=jr.add if jr and "TRASH" in add else None,
+                    )
+                    processed += done
+                    if "TRASH" in add:
+                        trashed += done
+                    change = (frozenset(add), frozenset(remove))
+                    acted.update((mid, change) for mid in selection.iter_ids(arr))
+            finally:
+                if jr:
+                    jr.close(trashed)
+            if doomed:
+                deleted = messages._stream_action_from_ids(
+                    selection.iter_ids(doomed),
+                    len(doomed),
+                    None,
+                    batch_size,
+                    concurrency,
+                    None,
+                    None,
+                    "DELETE",
+                )
+
+    done_at = time.time()
+    for s in stats.values():
+        s["latency"] = _latency(s.pop("_new"), views, done_at)
+
+    if not dry_run:
+        _own[accounts.current()] = acted
+        keys = {r.key for r in rules}
+        with _state_lock:
+            data = load_state(state_path)
+            data[key] = {
+                "history_id": history_id,
+                "scans": {k: v for k, v in scans.items() if k in keys},
+                "pending": failed,
+                "updated": int(done_at),
+            }
+            save_state(data, state_path)
+
+    return {
+        "rules": stats,
+        "changed": len(to_fetch),
+        "history_pages": pages,
+        "processed": processed,
+        "deleted": deleted,
+        "groups": [
+            {"add": list(add), "remove": list(remove), "count": len(arr)}
+            for (add, remove), arr in groups.items()
+        ],
+        "retry": len(failed),
+        "history_id": history_id,
+        "reset": reset,
+        "journal": jr.id if jr else None,
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+
+
+def run_daemon(
+    path: str,
+    interval: float = RULES_INTERVAL,
+    stop_event: Optional[threading.Event] = None,
+    on_tick: Optional[Callable[[Dict], None]] = None,
+    **kwargs,
+) -> None:
+    """
+    Repite `run_once` cada `interval` segundos hasta `stop_event`. Si el
+    fichero de reglas cambia se recarga; si la recarga o una pasada fallan,
+    el error llega a `on_tick` como ``{"error": ...}`` y se sigue con las
+    reglas anteriores.
+    """
+    stop_event = stop_event or threading.Event()
+    rules = load_rules(path)
+    mtime = os.path.getmtime(path)
+    while not stop_event.is_set():
+        try:
+            if os.path.getmtime(path) != mtime:
+                mtime = os.path.getmtime(path)
+                rules = load_rules(path)
+            res = run_once(rules, **kwargs)
+        except Exception as e:
+            res = {"error": str(e)}
+        if on_tick:
+            on_tick(res)
+        stop_event.wait(interval)
@@ -1,106 +1,474 @@
+import re
+import time
 from collections import Counter
-from email.utils import parseaddr
-from typing import Dict, List, Tuple, Optional
+from email.utils import parseaddr, parsedate_to_datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 
+from . import accounts, aio, api, tracing
+from .sketches import SpaceSaving
+from .profiling import profiled
 from .service import get_gmail_service
 
 USER_ID = "me"
+# Tomamos los N msgs más recientes como muestra significativa para el "Top"
+SAMPLE_LIMIT = 2000
+# Sub-peticiones por batch HTTP (la librería NO parte batches > 1000)
+BATCH_SIZE = 100
+# Segundos que vale la caché de conteos por remitente (ver planner)
+SENDER_CACHE_TTL = 300
 
+# Conteos del último recorrido completo por cuenta: {cuenta: {q, counts, at}}
+_sender_cache: Dict = {}
 
-import re
-
-
-def top_senders(
-    q: str = "", limit: int = 50, regex_pattern: Optional[str] = None
-) -> List[Tuple[str, int]]:
-    """Devuelve los remitentes más frecuentes (optimizado con BatchHttpRequest) y filtrado opcional por Regex."""
-    service = get_gmail_service()
-    counts = Counter()
-
-    # 1. Obtener todos los IDs primero (rápido si usamos fields)
-    next_page_token = None
-    all_ids = []
-    # Límite de seguridad para no explotar memoria si q devuelve millones
-    # Tomamos 2000 msgs más recientes como muestra significativa para el "Top"
-    SAMPLE_LIMIT = 2000
 
-    while True:
-        resp = (
-            service.users()
-            .messages()
-            .list(
-                userId=USER_ID,
-                q=q,
-                pageToken=next_page_token,
-                maxResults=500,
-                fields="nextPageToken,messages(id)",
-            )
-            .execute()
+# ---------- muestreo de metadata ----------
+def _scan_sample(
+    q: str,
+    max_total: Optional[int],
+    headers: Sequence[str],
+    fields: str,
+    on_message: Callable[[Dict], None],
+) -> None:
+    """
+    Lista hasta `max_total` mensajes de `q` (None = todos) y entrega la
+    metadata de cada uno (messages.get format=metadata) a `on_message` según
+    llegan los lotes: no se espera al listado entero ni se acumula nada.
+    """
+    if aio.engine_enabled():
+        # Motor asyncio: listado y lotes de metadata solapados en un solo hilo
+        aio.fetch_metadata_for_query(
+            q, max_total, list(headers), fields, on_message=on_message
         )
-        messages = resp.get("messages", [])
-        if not messages:
-            break
-        all_ids.extend([m["id"] for m in messages])
-
-        if len(all_ids) >= SAMPLE_LIMIT:
-            all_ids = all_ids[:SAMPLE_LIMIT]
-            break
-
-        next_page_token = resp.get("nextPageToken")
-        if not next_page_token:
-            break
+        return
 
-    if not all_ids:
-        return []
+    service = get_gmail_service()
 
-    # 2. Descargar headers en Batch (lotes de 50-100)
-    # Callback para procesar cada respuesta del batch
     def callback(request_id, response, exception):
         if exception:
             return  # Ignorar fallos puntuales
+        on_message(response)
 
-        headers = response.get("payload", {}).get("headers", [])
-        sender = ""
-        for h in headers:
-            if h.get("name") == "From":
-                sender = h.get("value", "")
-                break
-        email = parseaddr(sender)[1].lower()
-        if email:
-            # Regex Filter (Client-side)
-            if regex_pattern:
-                try:
-                    if not re.search(
-                        regex_pattern, email, re.IGNORECASE
-                    ) and not re.search(regex_pattern, sender, re.IGNORECASE):
-                        return  # No match
-                except re.error:
-                    pass  # Invalid regex, ignore filter or log error? (safest: ignore filter)
-
-            counts[email] += 1
-
-    # Ejecutar batch (la librería maneja la fragmentación interna si es muy grande,
-    # pero mejor no excedernos del límite de la API, aunque 2000 suele pasar bien
-    # si la librería hace auto-batching. La de Python NO hace auto-split de batches > 1000.
-    # Así que lo partimos nosotros manualmente.)
-
-    # Batch manual de 100 en 100 para ser seguros y rápidos
-    BATCH_SIZE = 100
-    total = len(all_ids)
-    for i in range(0, total, BATCH_SIZE):
-        chunk = all_ids[i : i + BATCH_SIZE]
+    def fetch(chunk: List[str]) -> None:
         batch = service.new_batch_http_request(callback=callback)
         for mid in chunk:
             batch.add(
-                service.users()
-                .messages()
-                .get(
-                    userId=USER_ID, id=mid, format="metadata", metadataHeaders=["From"]
+                api.request(
+                    "messages.get",
+                    service,
+                    fields=fields,
+                    id=mid,
+                    format="metadata",
+                    metadataHeaders=list(headers),
                 )
             )
         try:
-            batch.execute()
+            with tracing.span("batch", "http", action="GET_METADATA", size=len(chunk)):
+                batch.execute()
         except Exception:
             pass  # Continuar con siguiente bloque
 
-    return counts.most_common(limit)
+    next_page_token = None
+    pending: List[str] = []
+    listed = 0
+    while True:
+        resp = api.execute(
+            "messages.list",
+            service,
+            fields="nextPageToken,messages(id)",
+            q=q,
+            pageToken=next_page_token,
+            maxResults=500,
+        )
+        ids = [m["id"] for m in resp.get("messages", []) or []]
+        if max_total:
+            ids = ids[: max(0, max_total - listed)]
+        listed += len(ids)
+        pending.extend(ids)
+        while len(pending) >= BATCH_SIZE:
+            fetch(pending[:BATCH_SIZE])
+            del pending[:BATCH_SIZE]
+        next_page_token = resp.get("nextPageToken")
+        if not ids or (max_total and listed >= max_total) or not next_page_token:
+            break
+    if pending:
+        fetch(pending)
+
+
+def _header(msg: Dict, name: str) -> str:
+    for h in msg.get("payload", {}).get("headers", []):
+        if h.get("name") == name:
+            return h.get("value", "")
+    return ""
+
+
+def _matches(regex_pattern: Optional[str], email: str, sender: str) -> bool:
+    if not regex_pattern:
+        return True
+    try:
+        return bool(
+            re.search(regex_pattern, email, re.IGNORECASE)
+            or re.search(regex_pattern, sender, re.IGNORECASE)
+        )
+    except re.error:
+        return True  # Regex inválida: no filtrar
+
+
+def _sender_counter(regex_pattern: Optional[str], add: Callable[[str], None]):
+    def on_message(msg: Dict) -> None:
+        sender = _header(msg, "From")
+        email = parseaddr(sender)[1].lower()
+        if email and _matches(regex_pattern, email, sender):
+            add(email)
+
+    return on_message
+
+
+@profiled("top_senders")
+def top_senders(
+    q: str = "",
+    limit: int = 50,
+    regex_pattern: Optional[str] = None,
+    max_messages: Optional[int] = SAMPLE_LIMIT,
+    approx_error: Optional[float] = None,
+) -> List[Tuple[str, int]]:
+    """
+    Devuelve los remitentes más frecuentes (optimizado con BatchHttpRequest) y filtrado opcional por Regex.
+
+    Por defecto cuenta exacto (Counter) sobre una muestra de SAMPLE_LIMIT
+    mensajes. Con `approx_error` usa un resumen Space-Saving de memoria
+    acotada (ver `sender_sketch`), pensado para max_messages=None sobre
+    buzones enormes; los conteos pueden sobrestimar hasta approx_error * total.
+    """
+    if approx_error:
+        sketch = sender_sketch(q, approx_error, regex_pattern, max_messages)
+        return [(email, count) for email, count, _ in sketch.top(limit)]
+    counts = Counter()
+
+    def add(email: str) -> None:
+        counts[email] += 1
+
+    _scan_sample(
+        q,
+        max_messages,
+        ["From"],
+        api.SENDER_FIELDS,
+        _sender_counter(regex_pattern, add),
+    )
+    if not regex_pattern:
+        _remember_counts(q, counts, max_messages)
+    # Empates por email: el orden de llegada de los lotes no es determinista
+    return sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))[:limit]
+
+
+def sender_sketch(
+    q: str = "",
+    epsilon: float = 0.001,
+    regex_pattern: Optional[str] = None,
+    max_messages: Optional[int] = None,
+) -> SpaceSaving:
+    """
+    Resumen Space-Saving de remitentes con error <= epsilon * total y
+    memoria O(1/epsilon). `top()` da (email, conteo, error) con el conteo real
+    en [conteo - error, conteo]; resúmenes de consultas disjuntas (p. ej.
+    rangos de fechas contados en paralelo) se combinan con `merge()`.
+    """
+    sketch = SpaceSaving.for_error(epsilon)
+    _scan_sample(
+        q,
+        max_messages,
+        ["From"],
+        api.SENDER_FIELDS,
+        _sender_counter(regex_pattern, sketch.update),
+    )
+    return sketch
+
+
+# ---------- caché de conteos ----------
+def _remember_counts(q: str, counts: Dict[str, int], max_messages: Optional[int]):
+    """Guarda los conteos sólo si el recorrido cubrió toda la consulta."""
+    if max_messages and sum(counts.values()) >= max_messages:
+        return  # muestra truncada: no sirve como conteo
+    _sender_cache[accounts.current()] = {
+        "q": (q or "").strip(),
+        "counts": dict(counts),
+        "at": time.time(),
+    }
+
+
+def cached_sender_count(email: str, q: str = "") -> Optional[int]:
+    """
+    Mensajes de `email` según el último recorrido completo de `q`, o None si
+    no hay uno reciente (SENDER_CACHE_TTL). Fallos puntuales de batch se
+    ignoran al recorrer, así que es un conteo aproximado.
+    """
+    c = _sender_cache.get(accounts.current())
+    if not c or c["q"] != (q or "").strip():
+        return None
+    if time.time() - c["at"] > SENDER_CACHE_TTL:
+        return None
+    return c["counts"].get(email.lower(), 0)
+
+
+# ---------- perfiles de remitente ----------
+class SenderProfile:
+    """Agregado compacto por remitente; se actualiza mensaje a mensaje."""
+
+    __slots__ = ("email", "count", "bytes", "unread", "newest", "oldest", "labels")
+
+    def __init__(self, email: str):
+        self.email = email
+        self.count = 0
+        self.bytes = 0
+        self.unread = 0
+        self.newest = 0  # epoch en segundos
+        self.oldest = 0
+        self.labels: Counter = Counter()
+
+    def add(self, size: int, ts: int, label_ids: Sequence[str]) -> None:
+        self.count += 1
+        self.bytes += size
+        if "UNREAD" in label_ids:
+            self.unread += 1
+        if ts:
+            self.newest = max(self.newest, ts)
+            self.oldest = min(self.oldest, ts) if self.oldest else ts
+        self.labels.update(label_ids)
+
+    @property
+    def unread_ratio(self) -> float:
+        return self.unread / self.count if self.count else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "email": self.email,
+            "count": self.count,
+            "bytes": self.bytes,
+            "unread": self.unread,
+            "unread_ratio": self.unread_ratio,
+            "newest": self.newest,
+            "oldest": self.oldest,
+            "labels": dict(self.labels.most_common()),
+        }
+
+
+# Métricas por las que se puede ordenar sin volver a pedir nada a la API
+PROFILE_METRICS = ("count", "bytes", "unread", "unread_ratio", "newest", "oldest")
+
+
+def _timestamp(msg: Dict) -> int:
+    internal = msg.get("internalDate")
+    if internal:
+        return int(internal) // 1000
+    try:
+        return int(parsedate_to_datetime(_header(msg, "Date")).timestamp())
+    except (TypeError, ValueError):
+        return 0
+
+
+@profiled("sender_profiles")
+def sender_profiles(
+    q: str = "",
+    limit: Optional[int] = 50,
+    regex_pattern: Optional[str] = None,
+    sort_by: str = "count",
+    max_messages: Optional[int] = SAMPLE_LIMIT,
+) -> List[Dict]:
+    """
+    Perfiles por remitente (conteo, bytes, no leídos, primera/última fecha y
+    reparto de etiquetas) en una sola pasada: cada messages.get trae From,
+    Date, labelIds y sizeEstimate a la vez.
+    """
+    profiles: Dict[str, SenderProfile] = {}
+
+    def on_message(msg: Dict) -> None:
+        sender = _header(msg, "From")
+        email = parseaddr(sender)[1].lower()
+        if not email or not _matches(regex_pattern, email, sender):
+            return
+        prof = profiles.get(email)
+        if prof is None:
+            prof = profiles[email] = SenderProfile(email)
+        prof.add(
+            int(msg.get("sizeEstimate", 0) or 0),
+            _timestamp(msg),
+            msg.get("labelIds", []) or [],
+        )
+
+    _scan_sample(q, max_messages, ["From", "Date"], api.PROFILE_FIELDS, on_message)
+    if not regex_pattern:
+        _remember_counts(q, {e: p.count for e, p in profiles.items()}, max_messages)
+    rows = sort_profiles([p.to_dict() for p in profiles.values()], sort_by)
+    return rows[:limit] if limit else rows
+
+
+def sort_profiles(
+    rows: List[Dict], key: str = "count", descending: bool = True
+) -> List[Dict]:
+    """Reordena perfiles ya calculados por cualquier métrica (o por email)."""
+    if key == "email":
+        return sorted(rows, key=lambda r: r["email"], reverse=descending)
+    if key not in PROFILE_METRICS:
+        raise ValueError(f"Métrica desconocida: {key}")
+    by_email = sorted(rows, key=lambda r: r["email"])
+    return sorted(by_email, key=lambda r: r[key], reverse=descending)
+
+
+# ---------- agrupación por dominio / organización ----------
+# Sufijos de dos niveles habituales (sin depender de la Public Suffix List)
+_MULTI_SUFFIXES = {
+    "co.uk",
+    "org.uk",
+    "ac.uk",
+    "gov.uk",
+    "com.au",
+    "net.au",
+    "org.au",
+    "co.nz",
+    "co.jp",
+    "ne.jp",
+    "or.jp",
+    "co.kr",
+    "co.in",
+    "co.za",
+    "com.ar",
+    "com.br",
+    "com.mx",
+    "com.co",
+    "com.pe",
+    "com.uy",
+    "com.ve",
+    "com.cl",
+    "com.ec",
+    "com.es",
+    "com.tr",
+    "com.cn",
+    "com.hk",
+    "com.sg",
+}
+# Proveedores donde los puntos de la parte local no cuentan
+_DOTLESS_DOMAINS = {"gmail.com", "googlemail.com"}
+
+
+def normalize_address(email: str) -> str:
+    """Quita la etiqueta +sub (y los puntos en Gmail): a.b+x@gmail.com -> ab@gmail.com."""
+    local, _, domain = email.lower().rpartition("@")
+    if not local:
+        return email.lower()
+    local = local.split("+", 1)[0] or local
+    if domain in _DOTLESS_DOMAINS:
+        local = local.replace(".", "")
+    return f"{local}@{domain}"
+
+
+def registrable_domain(domain: str) -> str:
+    """Dominio registrable: mail.news.shop.co.uk -> shop.co.uk."""
+    parts = domain.lower().strip(".").split(".")
+    n = 3 if ".".join(parts[-2:]) in _MULTI_SUFFIXES else 2
+    return ".".join(parts[-n:])
+
+
+def organization(domain: str) -> str:
+    """Grupo de organización: amazon.com y amazon.es -> amazon."""
+    return registrable_domain(domain).split(".", 1)[0]
+
+
+def _merge(group: Dict, row: Dict) -> None:
+    for k in ("count", "bytes", "unread"):
+        group[k] += row[k]
+    group["unread_ratio"] = group["unread"] / group["count"] if group["count"] else 0.0
+    group["newest"] = max(group["newest"], row["newest"])
+    if row["oldest"]:
+        group["oldest"] = (
+            min(group["oldest"], row["oldest"]) if group["oldest"] else row["oldest"]
+        )
+    labels = Counter(group["labels"])
+    labels.update(row["labels"])
+    group["labels"] = dict(labels.most_common())
+
+
+def _group(kind: str, name: str) -> Dict:
+    return {
+        "kind": kind,
+        "email": name,
+        "count": 0,
+        "bytes": 0,
+        "unread": 0,
+        "unread_ratio": 0.0,
+        "newest": 0,
+        "oldest": 0,
+        "labels": {},
+        "children": [],
+    }
+
+
+def rollup_senders(
+    rows: List[Dict],
+    level: str = "domain",
+    sort_by: str = "count",
+    descending: bool = True,
+) -> List[Dict]:
+    """
+    Agrupa perfiles (`sender_profiles`) ya descargados, sin nuevas llamadas:
+    ``address`` funde variantes +sub de una misma dirección, ``domain`` las
+    agrupa por dominio registrable y ``org`` junta dominios de la misma
+    organización. Cada grupo lleva sus hijos en ``children`` para desplegarlo.
+    """
+    if level not in ("address", "domain", "org"):
+        raise ValueError(f"Nivel desconocido: {level}")
+    addresses: Dict[str, Dict] = {}
+    for row in rows:
+        addr = normalize_address(row["email"])
+        g = addresses.get(addr)
+        if g is None:
+            g = addresses[addr] = _group("address", addr)
+        _merge(g, row)
+        g["children"].append(dict(row, kind="variant"))
+    groups = list(addresses.values())
+
+    if level in ("domain", "org"):
+        domains: Dict[str, Dict] = {}
+        for g in groups:
+            dom = registrable_domain(g["email"].rpartition("@")[2])
+            d = domains.get(dom)
+            if d is None:
+                d = domains[dom] = _group("domain", dom)
+            _merge(d, g)
+            d["children"].append(g)
+        groups = list(domains.values())
+
+    if level == "org":
+        orgs: Dict[str, Dict] = {}
+        for g in groups:
+            name = organization(g["email"])
+            o = orgs.get(name)
+            if o is None:
+                o = orgs[name] = _group("org", name)
+            _merge(o, g)
+            o["children"].append(g)
+        groups = list(orgs.values())
+
+    return sort_rollup(groups, sort_by, descending)
+
+
+def sort_rollup(
+    groups: List[Dict], key: str = "count", descending: bool = True
+) -> List[Dict]:
+    """`sort_profiles` aplicado a cada nivel del árbol de grupos."""
+    for g in groups:
+        if g.get("children"):
+            g["children"] = sort_rollup(g["children"], key, descending)
+    return sort_profiles(groups, key, descending)
+
+
+def rollup_query(group: Dict) -> str:
+    """Consulta Gmail que cubre el grupo entero (para acciones masivas)."""
+    kind = group.get("kind", "variant")
+    if kind == "org":
+        names = [d["email"] for d in group["children"]]
+    elif kind == "address":
+        names = sorted({c["email"] for c in group["children"]})
+    else:
+        names = [group["email"]]
+    if len(names) == 1:
+        return f"from:{names[0]}"
+    return "from:(" + " OR ".join(names) + ")"
@@ -0,0 +1,297 @@
+"""
+Selecciones compuestas: álgebra de conjuntos sobre IDs de varias consultas.
+
+Gmail no sabe expresar "en la etiqueta A o B, pero no en lo que encuentra la
+consulta C, y sólo de los remitentes de mi lista VIP". Aquí cada hoja
+(`query`, `labels`, `senders`, `ids`) lista sus IDs y las hojas se combinan
+con ``|`` (unión), ``&`` (intersección) y ``-`` (diferencia)::
+
+    sel = (labels("Label_1") | labels("Label_2")) - query("older_than:1y")
+    sel = sel & senders_file("vip.txt")
+    run_action(sel, "TRASH")
+
+Los IDs se guardan como enteros de 64 bits en ``array('Q')`` ordenados (8
+bytes por mensaje) y las operaciones son merges lineales sobre esos arrays.
+Las hojas se listan en paralelo y el resultado va directo a la tubería de
+batchModify/batchDelete de messages.py.
+"""
+
+import threading
+from array import array
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import messages, profiling, tracing
+from .accounts import ContextThreadPool
+
+# Direcciones por consulta from:(a OR b ...) para no pasar del largo de q
+SENDERS_PER_QUERY = 30
+
+
+# ---------- IDs compactos ----------
+def _to_int(mid: str) -> int:
+    # Los IDs de Gmail son hexadecimales sin ceros a la izquierda
+    if not mid or mid[0] == "0" or len(mid) > 16:
+        raise ValueError(f"ID de mensaje no compacto: {mid}")
+    return int(mid, 16)
+
+
+def _to_hex(value: int) -> str:
+    return format(value, "x")
+
+
+# IDs que se ordenan de una vez como lista de Python al compactar
+_RUN_SIZE = 65536
+
+
+def _sorted_run(chunk: array) -> array:
+    out = array("Q")
+    last = None
+    for x in sorted(chunk):
+        if x != last:
+            out.append(x)
+            last = x
+    return out
+
+
+def compact(ids: Iterable[str]) -> array:
+    """
+    array('Q') ordenado y sin duplicados. Se ordena por tramos de
+    `_RUN_SIZE` y se mezclan los tramos con `union`, así el pico de memoria
+    es el de los arrays (8 bytes por ID) más un tramo, no un set y una lista
+    con todos los IDs.
+    """
+    runs: List[array] = []
+    chunk = array("Q")
+    for m in ids:
+        chunk.append(_to_int(m))
+        if len(chunk) >= _RUN_SIZE:
+            runs.append(_sorted_run(chunk))
+            chunk = array("Q")
+    if chunk or not runs:
+        runs.append(_sorted_run(chunk))
+    while len(runs) > 1:
+        runs = [
+            union(runs[i], runs[i + 1]) if i + 1 < len(runs) else runs[i]
+            for i in range(0, len(runs), 2)
+        ]
+    return runs[0]
+
+
+def union(a: array, b: array) -> array:
+    out = array("Q")
+    i = j = 0
+    na, nb = len(a), len(b)
+    while i < na and j < nb:
+        x, y = a[i], b[j]
+        if x < y:
+            out.append(x)
+            i += 1
+        elif y < x:
+            out.append(y)
+            j += 1
+        else:
+            out.append(x)
+            i += 1
+            j += 1
+    out.extend(a[i:])
+    out.extend(b[j:])
+    return out
+
+
+def intersection(a: array, b: array) -> array:
+    out = array("Q")
+    i = j = 0
+    na, nb = len(a), len(b)
+    while i < na and j < nb:
+        x, y = a[i], b[j]
+        if x < y:
+            i += 1
+        elif y < x:
+            j += 1
+        else:
+            out.append(x)
+            i += 1
+            j += 1
+    return out
+
+
+def difference(a: array, b: array) -> array:
+    out = array("Q")
+    i = j = 0
+    na, nb = len(a), len(b)
+    while i < na:
+        x = a[i]
+        while j < nb and b[j] < x:
+            j += 1
+        if j >= nb or b[j] != x:
+            out.append(x)
+        i += 1
+    return out
+
+
+_OPS = {"|": union, "&": intersection, "-": difference}
+
+
+# ---------- expresiones ----------
+class Selection:
+    """Nodo de una selección; se combina con | & -."""
+
+    def leaves(self) -> List["Leaf"]:
+        raise NotImplementedError
+
+    def _combine(self, fetched: Dict[int, array]) -> array:
+        raise NotImplementedError
+
+    def __or__(self, other: "Selection") -> "Selection":
+        return _Op("|", self, other)
+
+    def __and__(self, other: "Selection") -> "Selection":
+        return _Op("&", self, other)
+
+    def __sub__(self, other: "Selection") -> "Selection":
+        return _Op("-", self, other)
+
+
+class Leaf(Selection):
+    def __init__(self, describe: str, fetch: Callable[[], Iterable[str]]):
+        self.describe = describe
+        self.fetch = fetch
+
+    def leaves(self) -> List["Leaf"]:
+        return [self]
+
+    def _combine(self, fetched: Dict[int, array]) -> array:
+        return fetched[id(self)]
+
+    def __repr__(self):
+        return self.describe
+
+
+class _Op(Selection):
+    def __init__(self, op: str, left: Selection, right: Selection):
+        self.op, self.left, self.right = op, left, right
+
+    def leaves(self) -> List[Leaf]:
+        return self.left.leaves() + self.right.leaves()
+
+    def _combine(self, fetched: Dict[int, array]) -> array:
+        return _OPS[self.op](self.left._combine(fetched), self.right._combine(fetched))
+
+    def __repr__(self):
+        return f"({self.left!r} {self.op} {self.right!r})"
+
+
+# ---------- hojas ----------
+def query(q: str) -> Selection:
+    """Mensajes que devuelve la búsqueda `q` (sin Spam/Papelera, como Gmail)."""
+    return Leaf(f"query({q!r})", lambda: messages.iter_message_ids(q, None))
+
+
+def labels(*label_ids: str, match_all: bool = False) -> Selection:
+    """Mensajes con alguna de las etiquetas (o todas con match_all=True)."""
+    lids = list(label_ids)
+    if match_all:
+        return Leaf(
+            f"labels({'&'.join(lids)})", lambda: messages.iter_message_ids("", lids)
+        )
+    sel: Optional[Selection] = None
+    for lid in lids:
+        leaf = Leaf(
+            f"labels({lid})", lambda lid=lid: messages.iter_message_ids("", [lid])
+        )
+        sel = leaf if sel is None else sel | leaf
+    return sel or ids([])
+
+
+def senders(addresses: Iterable[str]) -> Selection:
+    """Mensajes de cualquiera de las direcciones (consultas from: agrupadas)."""
+    addrs = sorted({a.strip().lower() for a in addresses if a.strip()})
+    sel: Optional[Selection] = None
+    for i in range(0, len(addrs), SENDERS_PER_QUERY):
+        chunk = addrs[i : i + SENDERS_PER_QUERY]
+        leaf = query("from:(" + " OR ".join(chunk) + ")")
+        sel = leaf if sel is None else sel | leaf
+    return sel or ids([])
+
+
+def senders_file(path: str) -> Selection:
+    """`senders` leyendo una dirección por línea (``#`` comenta)."""
+    with open(path, encoding="utf-8") as fh:
+        addrs = [line.split("#", 1)[0].strip() for line in fh]
+    return senders(a for a in addrs if a)
+
+
+def ids(message_ids: Iterable[str]) -> Selection:
+    fixed = list(message_ids)
+    return Leaf(f"ids({len(fixed)})", lambda: fixed)
+
+
+# ---------- evaluación ----------
+def evaluate(sel: Selection, concurrency: int = 4) -> array:
+    """Lista las hojas en paralelo y combina; devuelve array('Q') ordenado."""
+    leaves = {id(l): l for l in sel.leaves()}
+
+    def fetch(leaf: Leaf) -> Tuple[int, array]:
+        with tracing.span("selection_leaf", "list", leaf=leaf.describe):
+            return id(leaf), compact(leaf.fetch())
+
+    with ContextThreadPool(max_workers=max(1, concurrency)) as ex:
+        fetched = dict(ex.map(fetch, leaves.values()))
+    with tracing.span("selection_merge", leaves=len(fetched)):
+        return sel._combine(fetched)
+
+
+def iter_ids(arr: array) -> Iterator[str]:
+    for value in arr:
+        yield _to_hex(value)
+
+
+def run_action(
+    sel: Selection,
+    action_type: str = "TRASH",
+    label_changes: Optional[Tuple[List[str], List[str]]] = None,
+    protect_starred: bool = True,
+    concurrency: int = 4,
+    batch_size: int = messages.BATCH_LIMIT,
+    progress_cb: Optional[Callable[[int, int], None]] = None,
+    stop_event: Optional[threading.Event] = None,
+) -> Dict:
+    """
+    Evalúa la selección y aplica TRASH / DELETE / MODIFY con la tubería de
+    messages.py; con protect_starred se restan los destacados. TRASH deja
+    diario (journal) para poder deshacerlo.
+    """
+    from . import journal  # diferido: journal importa selection
+
+    if protect_starred:
+        sel = sel - query("is:starred")
+    job = f"{action_type.lower()}_by_selection"
+    with tracing.trace_job(job), profiling.profile_job(job):
+        arr = evaluate(sel, concurrency)
+        jr = None
+        if action_type == "TRASH" and len(arr):
+            jr = journal.start(job, repr(sel))
+        processed = 0
+        try:
+            processed = messages._stream_action_from_ids(
+                iter_ids(arr),
+                len(arr),
+                None,
+                batch_size,
+                concurrency,
+                progress_cb,
+                stop_event,
+                action_type,
+                label_changes,
+                on_chunk=jr.add if jr else None,
+            )
+        finally:
+            if jr:
+                jr.close(processed)
+    return {
+        "processed": processed,
+        "matched": len(arr),
+        "selection": repr(sel),
+        "action": action_type,
+        "journal": jr.id if jr else None,
+    }
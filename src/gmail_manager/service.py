@@ -1,9 +1,53 @@
+import threading
+from typing import Callable, Dict, Optional
+
 from googleapiclient.discovery import build
+from . import accounts
 from .auth import get_credentials
+from .transport import PooledHttp
+
+# Permite sustituir el backend (p. ej. simulator.SimulatedGmail.install())
+_service_factory: Optional[Callable] = None
+
+# Un servicio por cuenta (accounts.current()), compartido por todos los hilos
+# de esa cuenta (el transporte es thread-safe)
+_services: Dict[Optional[str], object] = {}
+_service_lock = threading.Lock()
+
+
+def set_service_factory(factory: Optional[Callable]) -> Optional[Callable]:
+    """Instala una fábrica de servicios alternativa; devuelve la anterior."""
+    global _service_factory
+    prev = _service_factory
+    _service_factory = factory
+    return prev
+
+
+def reset_service(all_accounts: bool = False) -> None:
+    """Descarta el servicio de la cuenta activa (p. ej. tras reautenticar)."""
+    with _service_lock:
+        keys = list(_services) if all_accounts else [accounts.current()]
+        for key in keys:
+            svc = _services.pop(key, None)
+            if svc is not None:
+                svc._http.close()
 
 
 def get_gmail_service():
-    """Construye y devuelve el servicio de Gmail API."""
-    creds = get_credentials()
-    service = build("gmail", "v1", credentials=creds, cache_discovery=False)
-    return service
+    """Servicio de Gmail API de la cuenta activa (se construye una vez por cuenta)."""
+    if _service_factory is not None:
+        return _service_factory()
+    key = accounts.current()
+    svc = _services.get(key)
+    if svc is None:
+        with _service_lock:
+            svc = _services.get(key)
+            if svc is None:
+                creds = get_credentials()
+                svc = _services[key] = build(
+                    "gmail",
+                    "v1",
+                    http=PooledHttp(creds),
+                    cache_discovery=False,
+                )
+    return svc
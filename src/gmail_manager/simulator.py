@@ -0,0 +1,1188 @@
+"""
+Simulador local de la API de Gmail (v1) para pruebas y benchmarks sin cuenta.
+
+Habla los mismos endpoints REST que usa el cliente de descubrimiento
+(`googleapiclient`), de modo que el código del paquete corre sin cambios:
+
+    sim = SimulatedGmail(SimMailbox(size=1_000_000), latency=0.02)
+    with sim.install():              # get_gmail_service() -> simulador
+        messages.trash_by_query_fast("category:promotions")
+    print(sim.stats())
+
+Cubre ``messages.list`` (pageToken, ``q``, labelIds), ``messages.get``
+(minimal/metadata/full/raw), batch HTTP (multipart/mixed), ``batchModify``,
+``batchDelete``, trash/untrash/delete/modify, ``threads`` (list/get/modify/
+trash/untrash/delete), etiquetas, filtros, history y perfil. Opciones: latencia por ida y vuelta, cuota por segundo con los costes
+de Gmail (429 al agotarse), inyección aleatoria de 429/5xx y buzones
+sintéticos de millones de mensajes (se generan bajo demanda a partir de la
+semilla; sólo se guardan en memoria los cambios).
+
+También puede servirse por HTTP en localhost con ``serve()``.
+"""
+
+import base64
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from email.parser import Parser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+import httplib2
+
+from . import query as gq
+from . import service as service_mod
+from .api import QUOTA_UNITS
+
+DAY = 86400
+ID_BASE = 0x18A0000000000000
+_M64 = (1 << 64) - 1
+
+SYSTEM_LABEL_IDS = [
+    "INBOX",
+    "SENT",
+    "DRAFT",
+    "SPAM",
+    "TRASH",
+    "UNREAD",
+    "STARRED",
+    "IMPORTANT",
+    "CATEGORY_PERSONAL",
+    "CATEGORY_SOCIAL",
+    "CATEGORY_PROMOTIONS",
+    "CATEGORY_UPDATES",
+    "CATEGORY_FORUMS",
+]
+_CATEGORIES = [
+    "CATEGORY_PERSONAL",
+    "CATEGORY_PROMOTIONS",
+    "CATEGORY_UPDATES",
+    "CATEGORY_SOCIAL",
+    "CATEGORY_FORUMS",
+]
+_DOMAINS = [
+    "example.com",
+    "shop.example.com",
+    "news.example.org",
+    "mail.acme.co.uk",
+    "acme.com",
+    "service.net",
+    "bank.example",
+    "github.com",
+    "jira.corp.example",
+    "promo.store.com",
+]
+_LOCALS = ["no-reply+{k}", "news", "info", "user{k}", "alerts", "team", "billing"]
+
+
+def _mix(x: int) -> int:
+    """splitmix64: hash entero rápido y determinista."""
+    x = (x + 0x9E3779B97F4A7C15) & _M64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _M64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _M64
+    return x ^ (x >> 31)
+
+
+class SimError(Exception):
+    def __init__(self, status: int, reason: str, message: str = ""):
+        super().__init__(message or reason)
+        self.status = status
+        self.reason = reason
+        self.message = message or reason
+
+    def payload(self) -> Dict:
+        return {
+            "error": {
+                "code": self.status,
+                "message": self.message,
+                "errors": [{"reason": self.reason, "message": self.message}],
+            }
+        }
+
+
+# ---------- buzón ----------
+class SimMailbox:
+    """
+    Buzón sintético determinista. El índice 0 es el mensaje más reciente; los
+    mensajes añadidos con `add_message` se numeran a continuación.
+    """
+
+    def __init__(
+        self,
+        size: int = 10000,
+        seed: int = 1,
+        senders: int = 2000,
+        user_labels: int = 8,
+        thread_size: int = 3,
+        end: Optional[float] = None,
+        span_days: int = 5 * 365,
+        email: str = "me@example.com",
+        history_limit: int = 200000,
+        raw_max_bytes: int = 16384,
+    ):
+        self.size = size
+        self.seed = seed
+        self.senders = max(1, senders)
+        self.thread_size = max(1, thread_size)
+        self.end = int(end or time.time())
+        self.start = self.end - span_days * DAY
+        self.email = email
+        self.raw_max_bytes = raw_max_bytes
+        self.lock = threading.RLock()
+
+        self._extra: List[Dict] = []
+        self._labels_override: Dict[int, FrozenSet[str]] = {}
+        self._deleted: Set[int] = set()
+        self._counts: Optional[Counter] = None
+        self._unread: Optional[Counter] = None
+
+        self.labels: Dict[str, Dict] = {}
+        for lid in SYSTEM_LABEL_IDS:
+            self.labels[lid] = {"id": lid, "name": lid, "type": "system"}
+        self._user_label_ids = []
+        for k in range(1, user_labels + 1):
+            lid = f"Label_{k}"
+            self.labels[lid] = {"id": lid, "name": f"Proyecto {k}", "type": "user"}
+            self._user_label_ids.append(lid)
+        self._next_label = user_labels + 1
+
+        self.filters: Dict[str, Dict] = {}
+        self._next_filter = 1
+
+        self.history_id = 1000
+        self.history: deque = deque(maxlen=history_limit)
+
+    # ---- identificadores ----
+    def __len__(self) -> int:
+        return self.size + len(self._extra)
+
+    @staticmethod
+    def id_of(idx: int) -> str:
+        return f"{ID_BASE + idx:016x}"
+
+    def index_of(self, mid: str) -> int:
+        try:
+            idx = int(mid, 16) - ID_BASE
+        except (TypeError, ValueError):
+            raise SimError(400, "invalidArgument", f"Invalid id value: {mid}")
+        if idx < 0 or idx >= len(self) or idx in self._deleted:
+            raise SimError(404, "notFound", "Requested entity was not found.")
+        return idx
+
+    def exists(self, idx: int) -> bool:
+        return 0 <= idx < len(self) and idx not in self._deleted
+
+    # ---- generación sintética ----
+    def _hash(self, idx: int) -> int:
+        return _mix((self.seed << 40) ^ idx)
+
+    def _base_labels(self, idx: int) -> FrozenSet[str]:
+        if idx >= self.size:
+            return self._extra[idx - self.size]["labels"]
+        b = self._hash(idx) >> 16
+        out = [_CATEGORIES[(b >> 13) % 5]]
+        if (b & 0x3) == 0:
+            out.append("UNREAD")
+        if ((b >> 2) & 0x3) != 0:
+            out.append("INBOX")
+        if ((b >> 4) & 0x3F) == 0:
+            out.append("STARRED")
+        if ((b >> 10) & 0x7) == 0:
+            out.append("IMPORTANT")
+        if self._user_label_ids and ((b >> 16) & 0x3) == 0:
+            out.append(self._user_label_ids[(b >> 18) % len(self._user_label_ids)])
+        bin_ = (b >> 24) & 0xFF
+        if bin_ == 0:
+            out.append("TRASH")
+        elif bin_ == 1:
+            out.append("SPAM")
+        if ((b >> 32) & 0xF) == 0:
+            out.append("SENT")
+        return frozenset(out)
+
+    def labels_of(self, idx: int) -> FrozenSet[str]:
+        got = self._labels_override.get(idx)
+        return got if got is not None else self._base_labels(idx)
+
+    def sender_of(self, k: int) -> Tuple[str, str]:
+        domain = _DOMAINS[k % len(_DOMAINS)]
+        local = _LOCALS[(k // len(_DOMAINS)) % len(_LOCALS)].format(k=k)
+        return f"Remitente {k}", f"{local}@{domain}"
+
+    def record(self, idx: int) -> Dict:
+        """Todos los campos de un mensaje como dict (para get/consultas)."""
+        if idx >= self.size:
+            rec = dict(self._extra[idx - self.size])
+            rec["labels"] = self.labels_of(idx)
+            return rec
+        h = self._hash(idx)
+        u = (h & 0xFFFF) / 65536.0
+        k = int(self.senders * u * u * u)
+        name, addr = self.sender_of(k)
+        step = (self.end - self.start) / max(1, self.size)
+        date = int(self.end - idx * step - ((h >> 56) / 256.0) * step)
+        size = int(2048 * 2 ** ((((h >> 40) & 0xFF) / 255.0) ** 2 * 12))
+        leader = idx - (idx % self.thread_size)
+        return {
+            "id": self.id_of(idx),
+            "threadId": self.id_of(leader),
+            "labels": self.labels_of(idx),
+            "from": f"{name} <{addr}>",
+            "to": self.email,
+            "subject": f"Aviso {(h >> 48) % 5000} de {name}",
+            "date": date,
+            "size": size,
+            "has_attachment": size > 200 * 1024,
+            "message_id": f"<{h:016x}.{idx}@{addr.split('@', 1)[1]}>",
+            "snippet": f"Mensaje sintético {idx}",
+        }
+
+    def view(self, rec: Dict) -> gq.MessageView:
+        return gq.MessageView(
+            sender=rec["from"],
+            to=rec["to"],
+            subject=rec["subject"],
+            labels=set(rec["labels"]),
+            date=rec["date"],
+            size=rec["size"],
+            has_attachment=rec["has_attachment"],
+            snippet=rec["snippet"],
+        )
+
+    # ---- hilos ----
+    def thread_of(self, idx: int) -> str:
+        if idx < self.size:
+            return self.id_of(idx - (idx % self.thread_size))
+        return self._extra[idx - self.size]["threadId"]
+
+    def thread_members(self, tid: str) -> List[int]:
+        """Índices vivos del hilo `tid` (los sintéticos son bloques contiguos)."""
+        try:
+            lead = int(tid, 16) - ID_BASE
+        except (TypeError, ValueError):
+            raise SimError(400, "invalidArgument", f"Invalid id value: {tid}")
+        out: List[int] = []
+        if 0 <= lead < self.size and lead % self.thread_size == 0:
+            out.extend(range(lead, min(lead + self.thread_size, self.size)))
+        out.extend(
+            self.size + i for i, rec in enumerate(self._extra) if rec["threadId"] == tid
+        )
+        out = [i for i in out if i not in self._deleted]
+        if not out:
+            raise SimError(404, "notFound", "Requested entity was not found.")
+        return out
+
+    # ---- etiquetas ----
+    def resolve_label_name(self, normalized: str) -> Optional[str]:
+        for lid, lbl in self.labels.items():
+            if gq.normalize_label_name(lbl["name"]) == normalized:
+                return lid
+        return None
+
+    def _ensure_counts(self) -> None:
+        if self._counts is not None:
+            return
+        counts: Counter = Counter()
+        unread: Counter = Counter()
+        for idx in range(len(self)):
+            if idx in self._deleted:
+                continue
+            lbls = self.labels_of(idx)
+            counts.update(lbls)
+            if "UNREAD" in lbls:
+                unread.update(lbls)
+        self._counts, self._unread = counts, unread
+
+    def label_counts(self, lid: str) -> Tuple[int, int]:
+        with self.lock:
+            self._ensure_counts()
+            return self._counts[lid], self._unread[lid]
+
+    # ---- mutaciones ----
+    def _record_history(self, kind: str, idx: int, labels: Iterable[str] = ()) -> None:
+        self.history_id += 1
+        self.history.append((self.history_id, kind, idx, tuple(labels)))
+
+    def _count_delta(self, lbls: FrozenSet[str], sign: int) -> None:
+        if self._counts is None:
+            return
+        for l in lbls:
+            self._counts[l] += sign
+            if "UNREAD" in lbls:
+                self._unread[l] += sign
+
+    def add_message(
+        self,
+        sender: str,
+        subject: str = "",
+        labels: Iterable[str] = ("INBOX", "UNREAD"),
+        date: Optional[int] = None,
+        size: int = 4096,
+        to: Optional[str] = None,
+        message_id: Optional[str] = None,
+        thread_id: Optional[str] = None,
+        snippet: str = "",
+        has_attachment: bool = False,
+    ) -> str:
+        """Entrega un mensaje nuevo (queda en el historial como messageAdded)."""
+        with self.lock:
+            idx = len(self)
+            mid = self.id_of(idx)
+            lbls = frozenset(labels)
+            self._extra.append(
+                {
+                    "id": mid,
+                    "threadId": thread_id or mid,
+                    "labels": lbls,
+                    "from": sender,
+                    "to": to or self.email,
+                    "subject": subject,
+                    "date": int(date if date is not None else self.end),
+                    "size": size,
+                    "has_attachment": has_attachment,
+                    "message_id": message_id or f"<{mid}@sim.local>",
+                    "snippet": snippet,
+                }
+            )
+            self._count_delta(lbls, +1)
+            self._record_history("messageAdded", idx, lbls)
+            return mid
+
+    def modify(self, idx: int, add: Iterable[str] = (), remove: Iterable[str] = ()):
+        with self.lock:
+            old = self.labels_of(idx)
+            new = (old | frozenset(add)) - frozenset(remove)
+            if new == old:
+                return
+            self._count_delta(old, -1)
+            self._count_delta(new, +1)
+            self._labels_override[idx] = new
+            if new - old:
+                self._record_history("labelAdded", idx, sorted(new - old))
+            if old - new:
+                self._record_history("labelRemoved", idx, sorted(old - new))
+
+    def delete(self, idx: int) -> None:
+        with self.lock:
+            if idx in self._deleted:
+                return
+            self._count_delta(self.labels_of(idx), -1)
+            self._deleted.add(idx)
+            self._record_history("messageDeleted", idx)
+
+    # ---- búsqueda ----
+    def date_bounds(self, q: Optional[str]) -> Tuple[int, int]:
+        """
+        Tramo [lo, hi) de índices del buzón sintético que puede cumplir los
+        ``after:/before:`` de nivel superior de `q` (los añadidos con
+        add_message se miran siempre). Las fechas bajan con el índice: como
+        en Gmail, un listado por fechas no recorre todo el buzón.
+        """
+        node = gq.parse(q or "")
+        items = node.items if isinstance(node, gq.And) else [node]
+        step = (self.end - self.start) / max(1, self.size)
+        lo, hi = 0, self.size
+        for t in items:
+            if not isinstance(t, gq.Term) or t.op not in ("after", "before"):
+                continue
+            ts = gq.parse_date(t.value)
+            if ts is None or step <= 0:
+                continue
+            k = (self.end - ts) / step
+            if t.op == "after":  # date >= ts  =>  idx <= k
+                hi = min(hi, max(0, int(k) + 1))
+            else:  # date < ts  =>  idx > k - 1
+                lo = max(lo, int(k) - 2)
+        return lo, hi
+
+    def matcher(self, q: Optional[str], label_ids: Optional[List[str]], spam_trash):
+        """Predicado idx -> bool equivalente a messages.list(q, labelIds)."""
+        node = gq.parse(q or "")
+        include_st = spam_trash or gq.includes_spam_trash(node)
+        required = set(label_ids or [])
+        if isinstance(node, gq.And) and not node.items:
+            pred = None
+        else:
+            pred = gq.compile_query(node, self.resolve_label_name, now=self.end)
+
+        def match(idx: int) -> bool:
+            if idx in self._deleted:
+                return False
+            lbls = self.labels_of(idx)
+            if not include_st and ("TRASH" in lbls or "SPAM" in lbls):
+                if not (required & {"TRASH", "SPAM"}):
+                    return False
+            if required and not required.issubset(lbls):
+                return False
+            if pred is None:
+                return True
+            return pred(self.view(self.record(idx)))
+
+        return match
+
+
+# ---------- fields (respuesta parcial) ----------
+def _split_top(spec: str) -> List[str]:
+    out, depth, cur = [], 0, ""
+    for ch in spec:
+        if ch == "," and depth == 0:
+            out.append(cur)
+            cur = ""
+            continue
+        depth += ch == "("
+        depth -= ch == ")"
+        cur += ch
+    if cur:
+        out.append(cur)
+    return [x.strip() for x in out if x.strip()]
+
+
+def parse_fields(spec: str) -> Dict:
+    tree: Dict = {}
+    for item in _split_top(spec or ""):
+        sub = None
+        m = re.fullmatch(r"([^()]+)\((.*)\)", item)
+        if m:
+            item, sub = m.group(1), m.group(2)
+        node = tree
+        parts = item.split("/")
+        for p in parts[:-1]:
+            node = node.setdefault(p, {})
+        leaf = node.setdefault(parts[-1], {})
+        if sub is not None:
+            _merge(leaf, parse_fields(sub))
+    return tree
+
+
+def _merge(dst: Dict, src: Dict) -> None:
+    for k, v in src.items():
+        _merge(dst.setdefault(k, {}), v)
+
+
+def apply_fields(obj, tree: Dict):
+    if not tree:
+        return obj
+    if isinstance(obj, list):
+        return [apply_fields(x, tree) for x in obj]
+    if not isinstance(obj, dict):
+        return obj
+    return {k: apply_fields(obj[k], sub) for k, sub in tree.items() if k in obj}
+
+
+# ---------- servidor simulado ----------
+class SimulatedGmail:
+    """
+    Backend simulado: enruta peticiones REST/batch sobre un SimMailbox.
+
+    latency: segundos por ida y vuelta HTTP (un batch cuenta como una).
+    quota_per_sec: unidades de cuota por segundo (None = sin límite).
+    error_rate: probabilidad de 429 por operación; server_error_rate de 503.
+    """
+
+    MAX_BATCH_PARTS = 100
+
+    def __init__(
+        self,
+        mailbox: Optional[SimMailbox] = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        quota_per_sec: Optional[float] = None,
+        error_rate: float = 0.0,
+        server_error_rate: float = 0.0,
+        seed: int = 7,
+        log_size: int = 10000,
+    ):
+        self.mailbox = mailbox or SimMailbox()
+        self.latency = latency
+        self.jitter = jitter
+        self.quota_per_sec = quota_per_sec
+        self.error_rate = error_rate
+        self.server_error_rate = server_error_rate
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._quota_lock = threading.Lock()
+        self._tokens = quota_per_sec or 0.0
+        self._tokens_ts = time.monotonic()
+        self._stats_lock = threading.Lock()
+        self.calls: Counter = Counter()
+        self.http_requests = 0
+        self.bytes_out = 0
+        self.throttled = 0
+        self.connections = 0  # conexiones TCP aceptadas por serve()
+        self.log: deque = deque(maxlen=log_size)
+        self._service = None
+
+    # ---- integración con el paquete ----
+    def http(self) -> "SimHttp":
+        return SimHttp(self)
+
+    def build_service(self):
+        """Servicio de descubrimiento real apuntando al simulador (se reutiliza)."""
+        if self._service is None:
+            from googleapiclient.discovery import build
+
+            self._service = build(
+                "gmail",
+                "v1",
+                http=self.http(),
+                cache_discovery=False,
+                static_discovery=True,
+            )
+        return self._service
+
+    @contextmanager
+    def install(self):
+        """Hace que get_gmail_service() devuelva el servicio simulado."""
+        prev = service_mod.set_service_factory(self.build_service)
+        try:
+            yield self
+        finally:
+            service_mod.set_service_factory(prev)
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            return {
+                "http_requests": self.http_requests,
+                "api_calls": sum(self.calls.values()),
+                "calls": dict(self.calls),
+                "bytes_out": self.bytes_out,
+                "throttled": self.throttled,
+                "connections": self.connections,
+            }
+
+    def reset_stats(self) -> None:
+        with self._stats_lock:
+            self.calls.clear()
+            self.http_requests = 0
+            self.bytes_out = 0
+            self.throttled = 0
+            self.connections = 0
+            self.log.clear()
+
+    # ---- cuota / fallos ----
+    def _charge(self, op: str) -> None:
+        if self.quota_per_sec:
+            cost = QUOTA_UNITS.get(op, 1)
+            with self._quota_lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.quota_per_sec,
+                    self._tokens + (now - self._tokens_ts) * self.quota_per_sec,
+                )
+                self._tokens_ts = now
+                if self._tokens < cost:
+                    with self._stats_lock:
+                        self.throttled += 1
+                    raise SimError(
+                        429, "rateLimitExceeded", "User-rate limit exceeded."
+                    )
+                self._tokens -= cost
+        if self.error_rate or self.server_error_rate:
+            with self._rng_lock:
+                r = self._rng.random()
+            if r < self.error_rate:
+                with self._stats_lock:
+                    self.throttled += 1
+                raise SimError(429, "rateLimitExceeded", "Too many requests.")
+            if r < self.error_rate + self.server_error_rate:
+                raise SimError(503, "backendError", "Backend Error")
+
+    def _sleep(self) -> None:
+        delay = self.latency
+        if self.jitter:
+            with self._rng_lock:
+                delay += self._rng.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    # ---- entrada HTTP ----
+    def handle(
+        self, method: str, uri: str, body=None, headers: Optional[Dict] = None
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        self._sleep()
+        with self._stats_lock:
+            self.http_requests += 1
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        path = urlparse(uri).path
+        if path.startswith("/batch"):
+            status, hdrs, content = self._handle_batch(body or "", headers)
+        else:
+            status, payload = self.dispatch(method, uri, body)
+            content = b"" if payload is None else json.dumps(payload).encode("utf-8")
+            hdrs = {"content-type": "application/json; charset=UTF-8"}
+        with self._stats_lock:
+            self.bytes_out += len(content)
+        return status, hdrs, content
+
+    def dispatch(self, method: str, uri: str, body: Optional[str]):
+        """Ejecuta una operación REST simple -> (status, payload|None)."""
+        parsed = urlparse(uri)
+        params = {k: v for k, v in parse_qs(parsed.query).items()}
+        path = unquote(parsed.path)
+        op, handler, args = self._route(method.upper(), path)
+        with self._stats_lock:
+            self.calls[op] += 1
+            self.log.append((op, method.upper(), path, params))
+        try:
+            self._charge(op)
+            data = json.loads(body) if body else {}
+            status, payload = handler(params, data, *args)
+        except SimError as e:
+            return e.status, e.payload()
+        fields = params.get("fields", [None])[0]
+        if fields and payload is not None:
+            payload = apply_fields(payload, parse_fields(fields))
+        return status, payload
+
+    _ROUTES = [
+        ("GET", r"profile", "getProfile", "_get_profile"),
+        ("GET", r"messages", "messages.list", "_messages_list"),
+        ("POST", r"messages/batchModify", "messages.batchModify", "_batch_modify"),
+        ("POST", r"messages/batchDelete", "messages.batchDelete", "_batch_delete"),
+        ("GET", r"messages/([^/]+)", "messages.get", "_messages_get"),
+        ("DELETE", r"messages/([^/]+)", "messages.delete", "_messages_delete"),
+        ("POST", r"messages/([^/]+)/modify", "messages.modify", "_messages_modify"),
+        ("POST", r"messages/([^/]+)/trash", "messages.trash", "_messages_trash"),
+        ("POST", r"messages/([^/]+)/untrash", "messages.untrash", "_messages_untrash"),
+        ("GET", r"labels", "labels.list", "_labels_list"),
+        ("POST", r"labels", "labels.create", "_labels_create"),
+        ("GET", r"labels/([^/]+)", "labels.get", "_labels_get"),
+        ("PUT", r"labels/([^/]+)", "labels.update", "_labels_update"),
+        ("PATCH", r"labels/([^/]+)", "labels.update", "_labels_update"),
+        ("DELETE", r"labels/([^/]+)", "labels.delete", "_labels_delete"),
+        ("GET", r"settings/filters", "settings.filters.list", "_filters_list"),
+        ("POST", r"settings/filters", "settings.filters.create", "_filters_create"),
+        ("GET", r"settings/filters/([^/]+)", "settings.filters.get", "_filters_get"),
+        (
+            "DELETE",
+            r"settings/filters/([^/]+)",
+            "settings.filters.delete",
+            "_filters_delete",
+        ),
+        ("GET", r"history", "history.list", "_history_list"),
+        ("GET", r"threads", "threads.list", "_threads_list"),
+        ("GET", r"threads/([^/]+)", "threads.get", "_threads_get"),
+        ("DELETE", r"threads/([^/]+)", "threads.delete", "_threads_delete"),
+        ("POST", r"threads/([^/]+)/modify", "threads.modify", "_threads_modify"),
+        ("POST", r"threads/([^/]+)/trash", "threads.trash", "_threads_trash"),
+        ("POST", r"threads/([^/]+)/untrash", "threads.untrash", "_threads_untrash"),
+    ]
+
+    def _route(self, method: str, path: str):
+        m = re.match(r"^/gmail/v1/users/([^/]+)/(.*)$", path)
+        if m:
+            rest = m.group(2)
+            for r_method, pattern, op, name in self._ROUTES:
+                if r_method != method:
+                    continue
+                mm = re.fullmatch(pattern, rest)
+                if mm:
+                    return op, getattr(self, name), mm.groups()
+        return "unknown", self._not_found, ()
+
+    def _not_found(self, params, data):
+        raise SimError(404, "notFound", "Not Found")
+
+    # ---- batch HTTP ----
+    def _handle_batch(self, body: str, headers: Dict) -> Tuple[int, Dict, bytes]:
+        ctype = headers.get("content-type", "")
+        msg = Parser().parsestr(f"content-type: {ctype}\r\n\r\n" + body)
+        if not msg.is_multipart():
+            return 400, {"content-type": "text/plain"}, b"Bad batch request"
+        parts = msg.get_payload()
+        if len(parts) > self.MAX_BATCH_PARTS:
+            err = SimError(
+                400, "invalidArgument", "Too many requests in batch (max 100)."
+            )
+            return (
+                400,
+                {"content-type": "application/json; charset=UTF-8"},
+                json.dumps(err.payload()).encode("utf-8"),
+            )
+        boundary = "batch_sim_" + f"{self._next_boundary():08d}"
+        out: List[str] = []
+        for part in parts:
+            cid = part.get("Content-ID", "<sim + 0>")
+            raw = part.get_payload()
+            if isinstance(raw, list):
+                raw = raw[0].as_string()
+            line, _, rest = raw.partition("\n")
+            method, target, _ = (line.strip() + "  ").split(" ", 2)
+            _, _, sub_body = rest.replace("\r\n", "\n").partition("\n\n")
+            status, payload = self.dispatch(method, target, sub_body.strip() or None)
+            text = "" if payload is None else json.dumps(payload)
+            reason = "OK" if status < 300 else "Error"
+            out.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{cid.strip()[1:]}\r\n\r\n"
+                f"HTTP/1.1 {status} {reason}\r\n"
+                "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{text}\r\n"
+            )
+        out.append(f"--{boundary}--\r\n")
+        return (
+            200,
+            {"content-type": f"multipart/mixed; boundary={boundary}"},
+            "".join(out).encode("utf-8"),
+        )
+
+    _boundary_seq = 0
+
+    def _next_boundary(self) -> int:
+        with self._stats_lock:
+            SimulatedGmail._boundary_seq += 1
+            return SimulatedGmail._boundary_seq
+
+    # ---- handlers: perfil / mensajes ----
+    def _get_profile(self, params, data):
+        mb = self.mailbox
+        return 200, {
+            "emailAddress": mb.email,
+            "messagesTotal": len(mb) - len(mb._deleted),
+            "threadsTotal": (len(mb) - len(mb._deleted)) // mb.thread_size,
+            "historyId": str(mb.history_id),
+        }
+
+    def _messages_list(self, params, data):
+        mb = self.mailbox
+        q = params.get("q", [""])[0]
+        label_ids = params.get("labelIds", [])
+        spam_trash = params.get("includeSpamTrash", ["false"])[0] == "true"
+        max_results = min(500, int(params.get("maxResults", ["100"])[0]))
+        token = params.get("pageToken", [None])[0]
+        start = int(token[1:]) if token and token.startswith("p") else 0
+        match = mb.matcher(q, label_ids, spam_trash)
+        lo, hi = mb.date_bounds(q)
+
+        total = len(mb)
+        found: List[Dict] = []
+        idx = max(start, lo)
+        while idx < total and len(found) < max_results:
+            if hi <= idx < mb.size:
+                idx = mb.size  # resto del buzón base: fuera del rango de fechas
+                continue
+            if match(idx):
+                found.append({"id": mb.id_of(idx), "threadId": mb.thread_of(idx)})
+            idx += 1
+        # Lo que queda dentro del rango de fechas (más lo añadido después)
+        first = max(start, lo)
+        end = min(hi, mb.size)
+        scanned = max(1, min(idx, end) - first) if first < end else 1
+        if idx >= total:
+            estimate = len(found)
+        else:
+            # Igual que Gmail: extrapolación grosera a partir de la 1ª página
+            rest = max(0, end - first) + (total - mb.size)
+            estimate = int(len(found) / scanned * rest)
+        payload: Dict = {"resultSizeEstimate": estimate}
+        if found:
+            payload["messages"] = found
+        if idx < total:
+            payload["nextPageToken"] = f"p{idx}"
+        return 200, payload
+
+    def _message_resource(self, idx: int, fmt: str, headers: List[str]) -> Dict:
+        mb = self.mailbox
+        rec = mb.record(idx)
+        res = {
+            "id": rec["id"],
+            "threadId": rec["threadId"],
+            "labelIds": sorted(rec["labels"]),
+            "snippet": rec["snippet"],
+            "sizeEstimate": rec["size"],
+            "historyId": str(mb.history_id),
+            "internalDate": str(rec["date"] * 1000),
+        }
+        if fmt == "minimal":
+            return res
+        all_headers = [
+            ("From", rec["from"]),
+            ("To", rec["to"]),
+            ("Subject", rec["subject"]),
+            (
+                "Date",
+                time.strftime("%a, %d %b %Y %H:%M:%S +0000", time.gmtime(rec["date"])),
+            ),
+            ("Message-ID", rec["message_id"]),
+        ]
+        if fmt == "raw":
+            res["raw"] = base64.urlsafe_b64encode(
+                self._raw_message(rec, all_headers)
+            ).decode("ascii")
+            return res
+        if fmt == "metadata" and headers:
+            wanted = {h.lower() for h in headers}
+            all_headers = [h for h in all_headers if h[0].lower() in wanted]
+        res["payload"] = {
+            "mimeType": "text/plain",
+            "headers": [{"name": n, "value": v} for n, v in all_headers],
+        }
+        if fmt == "full":
+            res["payload"]["body"] = {
+                "size": len(rec["snippet"]),
+                "data": base64.urlsafe_b64encode(rec["snippet"].encode()).decode(),
+            }
+        return res
+
+    def _raw_message(self, rec: Dict, headers: List[Tuple[str, str]]) -> bytes:
+        head = "".join(f"{n}: {v}\r\n" for n, v in headers)
+        body = rec["snippet"] + "\r\n"
+        filler = min(self.mailbox.raw_max_bytes, rec["size"]) - len(head) - len(body)
+        if filler > 0:
+            line = ("From the desk of " + rec["id"] + " ").ljust(76, "x") + "\r\n"
+            body += line * (filler // len(line))
+        return (head + "\r\n" + body).encode("utf-8")
+
+    def _messages_get(self, params, data, mid):
+        idx = self.mailbox.index_of(mid)
+        fmt = params.get("format", ["full"])[0]
+        return 200, self._message_resource(idx, fmt, params.get("metadataHeaders", []))
+
+    def _ids_from_body(self, data) -> List[int]:
+        ids = data.get("ids") or []
+        if len(ids) > 1000:
+            raise SimError(400, "invalidArgument", "Too many ids (max 1000).")
+        out = []
+        for mid in ids:
+            try:
+                out.append(self.mailbox.index_of(mid))
+            except SimError:
+                continue  # Gmail ignora IDs inexistentes en operaciones batch
+        return out
+
+    def _batch_modify(self, params, data):
+        add = data.get("addLabelIds") or []
+        remove = data.get("removeLabelIds") or []
+        for lid in list(add) + list(remove):
+            if lid not in self.mailbox.labels:
+                raise SimError(400, "invalidArgument", f"Invalid label: {lid}")
+        for idx in self._ids_from_body(data):
+            self.mailbox.modify(idx, add, remove)
+        return 204, None
+
+    def _batch_delete(self, params, data):
+        for idx in self._ids_from_body(data):
+            self.mailbox.delete(idx)
+        return 204, None
+
+    def _messages_delete(self, params, data, mid):
+        self.mailbox.delete(self.mailbox.index_of(mid))
+        return 204, None
+
+    def _messages_modify(self, params, data, mid):
+        idx = self.mailbox.index_of(mid)
+        self.mailbox.modify(
+            idx, data.get("addLabelIds") or [], data.get("removeLabelIds") or []
+        )
+        return 200, self._message_resource(idx, "minimal", [])
+
+    def _messages_trash(self, params, data, mid):
+        idx = self.mailbox.index_of(mid)
+        self.mailbox.modify(idx, ["TRASH"], [])
+        return 200, self._message_resource(idx, "minimal", [])
+
+    def _messages_untrash(self, params, data, mid):
+        idx = self.mailbox.index_of(mid)
+        self.mailbox.modify(idx, [], ["TRASH"])
+        return 200, self._message_resource(idx, "minimal", [])
+
+    # ---- handlers: hilos ----
+    def _threads_list(self, params, data):
+        """Un hilo coincide si coincide alguno de sus mensajes (como en Gmail)."""
+        mb = self.mailbox
+        q = params.get("q", [""])[0]
+        label_ids = params.get("labelIds", [])
+        spam_trash = params.get("includeSpamTrash", ["false"])[0] == "true"
+        max_results = min(500, int(params.get("maxResults", ["100"])[0]))
+        token = params.get("pageToken", [None])[0]
+        start = int(token[1:]) if token and token.startswith("p") else 0
+        match = mb.matcher(q, label_ids, spam_trash)
+
+        total = len(mb)
+        ts = mb.thread_size
+        seen: Set[str] = set()
+        found: List[Dict] = []
+        idx = start
+        while idx < total and len(found) < max_results:
+            if match(idx):
+                tid = mb.thread_of(idx)
+                if tid not in seen:
+                    seen.add(tid)
+                    found.append(
+                        {
+                            "id": tid,
+                            "snippet": mb.record(idx)["snippet"],
+                            "historyId": str(mb.history_id),
+                        }
+                    )
+                if idx < mb.size:
+                    idx = min(idx - idx % ts + ts, mb.size)  # resto del hilo
+                    continue
+            idx += 1
+        scanned = max(1, idx - start)
+        if idx >= total:
+            estimate = len(found)
+        else:
+            estimate = int(len(found) / scanned * (total - start))
+        payload: Dict = {"resultSizeEstimate": estimate}
+        if found:
+            payload["threads"] = found
+        if idx < total:
+            payload["nextPageToken"] = f"p{idx}"
+        return 200, payload
+
+    def _thread_resource(self, tid: str, members: List[int], fmt: str, headers):
+        return {
+            "id": tid,
+            "historyId": str(self.mailbox.history_id),
+            "messages": [self._message_resource(i, fmt, headers) for i in members],
+        }
+
+    def _threads_get(self, params, data, tid):
+        members = self.mailbox.thread_members(tid)
+        fmt = params.get("format", ["full"])[0]
+        headers = params.get("metadataHeaders", [])
+        return 200, self._thread_resource(tid, members, fmt, headers)
+
+    def _threads_modify(self, params, data, tid, add=None, remove=None):
+        mb = self.mailbox
+        add = add if add is not None else data.get("addLabelIds") or []
+        remove = remove if remove is not None else data.get("removeLabelIds") or []
+        for lid in list(add) + list(remove):
+            if lid not in mb.labels:
+                raise SimError(400, "invalidArgument", f"Invalid label: {lid}")
+        members = mb.thread_members(tid)
+        for idx in members:
+            mb.modify(idx, add, remove)
+        return 200, self._thread_resource(tid, members, "minimal", [])
+
+    def _threads_trash(self, params, data, tid):
+        return self._threads_modify(params, data, tid, ["TRASH"], [])
+
+    def _threads_untrash(self, params, data, tid):
+        return self._threads_modify(params, data, tid, [], ["TRASH"])
+
+    def _threads_delete(self, params, data, tid):
+        for idx in self.mailbox.thread_members(tid):
+            self.mailbox.delete(idx)
+        return 204, None
+
+    # ---- handlers: etiquetas ----
+    def _label_resource(self, lid: str, counts: bool) -> Dict:
+        lbl = dict(self.mailbox.labels[lid])
+        lbl.setdefault("messageListVisibility", "show")
+        lbl.setdefault("labelListVisibility", "labelShow")
+        if counts:
+            total, unread = self.mailbox.label_counts(lid)
+            per_thread = self.mailbox.thread_size
+            lbl.update(
+                {
+                    "messagesTotal": total,
+                    "messagesUnread": unread,
+                    "threadsTotal": -(-total // per_thread),
+                    "threadsUnread": -(-unread // per_thread),
+                }
+            )
+        return lbl
+
+    def _labels_list(self, params, data):
+        return 200, {
+            "labels": [self._label_resource(l, False) for l in self.mailbox.labels]
+        }
+
+    def _labels_get(self, params, data, lid):
+        if lid not in self.mailbox.labels:
+            raise SimError(404, "notFound", "Requested entity was not found.")
+        return 200, self._label_resource(lid, True)
+
+    def _labels_create(self, params, data):
+        mb = self.mailbox
+        name = (data.get("name") or "").strip()
+        if not name or any(l["name"] == name for l in mb.labels.values()):
+            raise SimError(409, "alreadyExists", "Label name exists or conflicts")
+        with mb.lock:
+            lid = f"Label_{mb._next_label}"
+            mb._next_label += 1
+            lbl = {k: v for k, v in data.items() if k != "id"}
+            lbl.update({"id": lid, "name": name, "type": "user"})
+            mb.labels[lid] = lbl
+        return 200, self._label_resource(lid, False)
+
+    def _labels_update(self, params, data, lid):
+        mb = self.mailbox
+        if lid not in mb.labels or mb.labels[lid].get("type") == "system":
+            raise SimError(404, "notFound", "Requested entity was not found.")
+        mb.labels[lid].update({k: v for k, v in data.items() if k != "id"})
+        return 200, self._label_resource(lid, False)
+
+    def _labels_delete(self, params, data, lid):
+        mb = self.mailbox
+        if lid not in mb.labels or mb.labels[lid].get("type") == "system":
+            raise SimError(404, "notFound", "Requested entity was not found.")
+        with mb.lock:
+            for idx in list(mb._labels_override):
+                if lid in mb._labels_override[idx]:
+                    mb.modify(idx, [], [lid])
+            del mb.labels[lid]
+            mb._counts = None
+        return 204, None
+
+    # ---- handlers: filtros ----
+    def _filters_list(self, params, data):
+        return 200, {"filter": list(self.mailbox.filters.values())}
+
+    def _filters_get(self, params, data, fid):
+        if fid not in self.mailbox.filters:
+            raise SimError(404, "notFound", "Filter not found")
+        return 200, self.mailbox.filters[fid]
+
+    def _filters_create(self, params, data):
+        mb = self.mailbox
+        if not data.get("criteria") or not data.get("action"):
+            raise SimError(400, "invalidArgument", "Filter needs criteria and action")
+        for existing in mb.filters.values():
+            if (
+                existing["criteria"] == data["criteria"]
+                and existing["action"] == data["action"]
+            ):
+                raise SimError(400, "failedPrecondition", "Filter already exists")
+        with mb.lock:
+            fid = f"ANe1Bmj{mb._next_filter:06d}"
+            mb._next_filter += 1
+            mb.filters[fid] = {
+                "id": fid,
+                "criteria": data["criteria"],
+                "action": data["action"],
+            }
+        return 200, mb.filters[fid]
+
+    def _filters_delete(self, params, data, fid):
+        if self.mailbox.filters.pop(fid, None) is None:
+            raise SimError(404, "notFound", "Filter not found")
+        return 204, None
+
+    # ---- handlers: history ----
+    def _history_list(self, params, data):
+        mb = self.mailbox
+        try:
+            start = int(params.get("startHistoryId", ["0"])[0])
+        except ValueError:
+            raise SimError(400, "invalidArgument", "Invalid startHistoryId")
+        token = params.get("pageToken", [None])[0]
+        if token:
+            start = int(token)
+        max_results = min(500, int(params.get("maxResults", ["100"])[0]))
+        types = set(params.get("historyTypes", []))
+        label_filter = params.get("labelId", [None])[0]
+        with mb.lock:
+            oldest = mb.history[0][0] if mb.history else mb.history_id + 1
+            if start + 1 < oldest and start < mb.history_id:
+                raise SimError(404, "notFound", "startHistoryId too old")
+            entries = [h for h in mb.history if h[0] > start]
+        kinds = {
+            "messageAdded": "messagesAdded",
+            "messageDeleted": "messagesDeleted",
+            "labelAdded": "labelsAdded",
+            "labelRemoved": "labelsRemoved",
+        }
+        out = []
+        last = start
+        for hid, kind, idx, lbls in entries[:max_results]:
+            last = hid
+            if types and kind not in types:
+                continue
+            msg = {"id": mb.id_of(idx), "threadId": mb.id_of(idx)}
+            if idx < len(mb):
+                rec_labels = mb.labels_of(idx)
+                if (
+                    label_filter
+                    and label_filter not in rec_labels
+                    and (label_filter not in lbls)
+                ):
+                    continue
+                msg["labelIds"] = sorted(rec_labels)
+            item = {
+                "id": str(hid),
+                "messages": [{"id": msg["id"], "threadId": msg["threadId"]}],
+            }
+            key = kinds[kind]
+            if kind in ("labelAdded", "labelRemoved"):
+                item[key] = [{"message": msg, "labelIds": list(lbls)}]
+            else:
+                item[key] = [{"message": msg}]
+            out.append(item)
+        payload: Dict = {"historyId": str(mb.history_id)}
+        if out:
+            payload["history"] = out
+        if len(entries) > max_results:
+            payload["nextPageToken"] = str(last)
+        return 200, payload
+
+    # ---- localhost ----
+    def serve(self, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+        """
+        Expone el simulador por HTTP (útil para clientes que no usan httplib2).
+        Devuelve el servidor ya arrancado en un hilo; `server.base_url` apunta a
+        la raíz (equivalente a https://gmail.googleapis.com/).
+        """
+        sim = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with sim._stats_lock:
+                    sim.connections += 1
+
+            def _serve(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else None
+                status, hdrs, content = sim.handle(
+                    self.command, self.path, body, dict(self.headers.items())
+                )
+                self.send_response(status)
+                for k, v in hdrs.items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _serve
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        server.base_url = f"http://{host}:{server.server_address[1]}/"
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class SimHttp:
+    """Sustituto de httplib2.Http que enruta al simulador (thread-safe)."""
+
+    def __init__(self, sim: SimulatedGmail):
+        self.sim = sim
+
+    def request(
+        self,
+        uri,
+        method="GET",
+        body=None,
+        headers=None,
+        redirections=5,
+        connection_type=None,
+    ):
+        status, hdrs, content = self.sim.handle(method, uri, body, headers)
+        resp = httplib2.Response(dict(hdrs, status=str(status)))
+        return resp, content
@@ -0,0 +1,126 @@
+"""
+Resúmenes aproximados de memoria acotada para conteos sobre millones de mensajes.
+
+`SpaceSaving` (Metwally et al.) guarda como mucho ``capacity`` contadores.
+Para cada clave devuelve un conteo ``c`` y un error ``e`` con la garantía
+``c - e <= real <= c``, y cualquier clave con más de ``total / capacity``
+apariciones está en el resumen. Con ``SpaceSaving.for_error(eps)`` el error
+máximo es ``eps * total``.
+
+Los resúmenes se pueden fusionar (Agarwal et al., "Mergeable Summaries"),
+así que cada shard paralelo puede contar por su lado y combinarse al final
+sin perder la garantía.
+"""
+
+import heapq
+import math
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+class SpaceSaving:
+    """Heavy-hitters aproximados con ``capacity`` contadores como máximo."""
+
+    __slots__ = ("capacity", "total", "_counts", "_errors", "_heap")
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("capacity debe ser >= 1")
+        self.capacity = int(capacity)
+        self.total = 0
+        self._counts: Dict[Hashable, int] = {}
+        self._errors: Dict[Hashable, int] = {}
+        # (conteo, clave) con borrado perezoso: entradas viejas se descartan al salir
+        self._heap: List[Tuple[int, Hashable]] = []
+
+    @classmethod
+    def for_error(cls, epsilon: float) -> "SpaceSaving":
+        """Resumen cuyo error por entrada no supera ``epsilon * total``."""
+        if not 0 < epsilon < 1:
+            raise ValueError("epsilon debe estar en (0, 1)")
+        return cls(math.ceil(1 / epsilon))
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    @property
+    def error_bound(self) -> int:
+        """Cota superior del error de cualquier entrada (total / capacity)."""
+        return self.total // self.capacity
+
+    def _min(self) -> Tuple[int, Hashable]:
+        while True:
+            count, key = self._heap[0]
+            if self._counts.get(key) == count:
+                return count, key
+            heapq.heappop(self._heap)
+
+    def _push(self, key: Hashable) -> None:
+        heapq.heappush(self._heap, (self._counts[key], key))
+        if len(self._heap) > 4 * self.capacity + 64:
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        self._heap = [(c, k) for k, c in self._counts.items()]
+        heapq.heapify(self._heap)
+
+    def min_count(self) -> int:
+        """Conteo mínimo si el resumen está lleno (0 si aún cabe todo)."""
+        if len(self._counts) < self.capacity:
+            return 0
+        return self._min()[0]
+
+    def update(self, key: Hashable, weight: int = 1) -> None:
+        self.total += weight
+        if key in self._counts:
+            self._counts[key] += weight
+        elif len(self._counts) < self.capacity:
+            self._counts[key] = weight
+            self._errors[key] = 0
+        else:
+            # Se expulsa el mínimo y la clave nueva hereda su conteo como error
+            floor, victim = self._min()
+            heapq.heappop(self._heap)
+            del self._counts[victim], self._errors[victim]
+            self._counts[key] = floor + weight
+            self._errors[key] = floor
+        self._push(key)
+
+    def update_many(self, keys: Iterable[Hashable]) -> None:
+        for key in keys:
+            self.update(key)
+
+    def estimate(self, key: Hashable) -> Tuple[int, int]:
+        """(conteo, error) de `key`; si no está, el real es <= min_count()."""
+        if key in self._counts:
+            return self._counts[key], self._errors[key]
+        floor = self.min_count()
+        return floor, floor
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        """Fusiona dos resúmenes de igual capacidad en uno nuevo."""
+        if other.capacity != self.capacity:
+            raise ValueError("Sólo se fusionan resúmenes de igual capacidad")
+        m1, m2 = self.min_count(), other.min_count()
+        merged = SpaceSaving(self.capacity)
+        merged.total = self.total + other.total
+        rows = []
+        for key in set(self._counts) | set(other._counts):
+            count = self._counts.get(key, m1) + other._counts.get(key, m2)
+            error = self._errors.get(key, m1) + other._errors.get(key, m2)
+            rows.append((count, error, key))
+        for count, error, key in heapq.nlargest(
+            self.capacity, rows, key=lambda r: r[0]
+        ):
+            merged._counts[key] = count
+            merged._errors[key] = error
+        merged._rebuild()
+        return merged
+
+    def top(self, k: Optional[int] = None) -> List[Tuple[Hashable, int, int]]:
+        """[(clave, conteo, error)] de mayor a menor; real en [conteo - error, conteo]."""
+        items = sorted(
+            self._counts.items(), key=lambda kv: (-kv[1], self._errors[kv[0]])
+        )
+        if k:
+            items = items[:k]
+        return [(key, count, self._errors[key]) for key, count in items]
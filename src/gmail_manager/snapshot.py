@@ -0,0 +1,317 @@
+"""
+Instantánea columnar de la metadata del buzón para análisis sin red (requiere ``numpy``).
+
+`export()` recorre una consulta una sola vez (messages.get en metadata, por
+lotes) y escribe una columna por campo en un directorio::
+
+    id.bin       uint64   ID de mensaje (hex -> entero)
+    thread.bin   uint64   ID de hilo
+    sender.bin   uint32   índice en meta.json["senders"] (diccionario)
+    date.bin     int64    epoch en segundos (internalDate)
+    size.bin     uint32   sizeEstimate en bytes
+    labels.bin   uint64   bitmap de etiquetas (``words`` palabras por fila)
+    meta.json             filas, etiquetas (bit -> ID/nombre), remitentes
+
+Las columnas se escriben por bloques de CHUNK_ROWS filas, así que la memoria
+no crece con el buzón (sólo el diccionario de remitentes). Son binarios de
+ancho fijo para que `load()` los abra con ``np.memmap`` sin leerlos. El
+``From`` se guarda una vez por remitente y las etiquetas como bits: ~40
+bytes por mensaje. `pack()` crea además un ``.npz`` comprimido para
+archivar o copiar; `load()` lo acepta, pero ése se descomprime en memoria.
+
+Los análisis (`top_senders`, `size_histogram`, `time_series`...) son
+vectoriales sobre las columnas y aceptan una máscara booleana (`mask`) para
+filtrar por etiqueta, remitente o fechas sin volver a la API.
+"""
+
+import json
+import math
+import os
+from email.utils import parseaddr
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # dependencia opcional
+    np = None
+
+from . import api, search, tracing
+from .profiling import profiled
+from .selection import _to_int
+
+CHUNK_ROWS = 50_000
+FORMAT_VERSION = 1
+# Columnas de ancho fijo (las etiquetas tienen `words` palabras por fila)
+COLUMNS = {
+    "id": "<u8",
+    "thread": "<u8",
+    "sender": "<u4",
+    "date": "<i8",
+    "size": "<u4",
+    "labels": "<u8",
+}
+_PERIODS = {"day": "D", "week": "W", "month": "M", "year": "Y"}
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError(
+            'snapshot requiere numpy: pip install "inboxzero-tool[snapshot]"'
+        )
+
+
+# ---------- escritura ----------
+class SnapshotWriter:
+    """Acumula filas y vuelca cada CHUNK_ROWS a los ficheros de columna."""
+
+    def __init__(self, path: str, label_names: Dict[str, str]):
+        _require_numpy()
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.label_ids = list(label_names)
+        self.label_names = label_names
+        self.bits = {lid: i for i, lid in enumerate(self.label_ids)}
+        self.words = max(1, math.ceil(len(self.label_ids) / 64))
+        self.senders: Dict[str, int] = {}
+        self.rows = 0
+        self._buf: Dict[str, List] = {c: [] for c in COLUMNS}
+        self._files = {c: open(os.path.join(path, f"{c}.bin"), "wb") for c in COLUMNS}
+
+    def add(self, msg: Dict) -> None:
+        email = parseaddr(search._header(msg, "From"))[1].lower()
+        sender = self.senders.setdefault(email, len(self.senders))
+        bitmap = [0] * self.words
+        for lid in msg.get("labelIds", []) or []:
+            bit = self.bits.get(lid)
+            if bit is not None:  # etiquetas creadas durante la exportación
+                bitmap[bit >> 6] |= 1 << (bit & 63)
+        buf = self._buf
+        buf["id"].append(_to_int(msg["id"]))
+        buf["thread"].append(_to_int(msg.get("threadId") or msg["id"]))
+        buf["sender"].append(sender)
+        buf["date"].append(search._timestamp(msg))
+        buf["size"].append(min(int(msg.get("sizeEstimate", 0) or 0), 2**32 - 1))
+        buf["labels"].extend(bitmap)
+        if len(buf["id"]) >= CHUNK_ROWS:
+            self.flush()
+
+    def flush(self) -> None:
+        n = len(self._buf["id"])
+        if not n:
+            return
+        with tracing.span("snapshot_chunk", "io", rows=n):
+            for col, dtype in COLUMNS.items():
+                np.asarray(self._buf[col], dtype=dtype).tofile(self._files[col])
+                self._buf[col].clear()
+        self.rows += n
+
+    def close(self, q: str = "") -> Dict:
+        self.flush()
+        for fh in self._files.values():
+            fh.close()
+        meta = {
+            "version": FORMAT_VERSION,
+            "rows": self.rows,
+            "query": q,
+            "words": self.words,
+            "labels": [
+                {"id": lid, "name": self.label_names[lid]} for lid in self.label_ids
+            ],
+            "senders": sorted(self.senders, key=self.senders.get),
+        }
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(meta, fh, ensure_ascii=False)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+        return meta
+
+
+@profiled("snapshot_export")
+def export(path: str, q: str = "", max_messages: Optional[int] = None) -> Dict:
+    """
+    Exporta la metadata de `q` (todo el buzón por defecto) al directorio
+    `path`. Devuelve meta.json sin la lista de remitentes.
+    """
+    resp = api.execute("labels.list", None, api.LABEL_IDS_FIELDS)
+    names = {l["id"]: l.get("name", l["id"]) for l in resp.get("labels", []) or []}
+    writer = SnapshotWriter(path, names)
+    try:
+        search._scan_sample(q, max_messages, ["From"], api.SNAPSHOT_FIELDS, writer.add)
+    finally:
+        meta = writer.close(q)
+    meta = dict(meta, senders=len(meta["senders"]))
+    return meta
+
+
+# ---------- lectura ----------
+class Snapshot:
+    """Columnas de una instantánea (memmap de solo lectura o arrays del .npz)."""
+
+    def __init__(self, meta: Dict, columns: Dict):
+        self.meta = meta
+        self.rows = int(meta["rows"])
+        self.senders: List[str] = meta["senders"]
+        self.labels: List[Dict] = meta["labels"]
+        self.id = columns["id"]
+        self.thread = columns["thread"]
+        self.sender = columns["sender"]
+        self.date = columns["date"]
+        self.size = columns["size"]
+        self.label_bits = columns["labels"].reshape(self.rows, meta["words"])
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def message_id(self, row: int) -> str:
+        return format(int(self.id[row]), "x")
+
+    def _label_bit(self, label: str) -> int:
+        for i, l in enumerate(self.labels):
+            if label in (l["id"], l["name"]):
+                return i
+        raise KeyError(f"Etiqueta no incluida en la instantánea: {label}")
+
+    # ---------- máscaras ----------
+    def has_label(self, label: str) -> "np.ndarray":
+        bit = self._label_bit(label)
+        word = self.label_bits[:, bit >> 6]
+        return (word & np.uint64(1 << (bit & 63))) != 0
+
+    def from_sender(self, email: str) -> "np.ndarray":
+        try:
+            idx = self.senders.index(email.lower())
+        except ValueError:
+            return np.zeros(self.rows, dtype=bool)
+        return self.sender == idx
+
+    def between(self, after: Optional[int] = None, before: Optional[int] = None):
+        """Máscara de fecha con la semántica de Gmail (after: >=, before: <)."""
+        m = np.ones(self.rows, dtype=bool)
+        if after is not None:
+            m &= self.date >= after
+        if before is not None:
+            m &= self.date < before
+        return m
+
+
+def load(path: str) -> Snapshot:
+    """Abre una instantánea: directorio (memmap) o ``.npz`` de `pack()`."""
+    _require_numpy()
+    if path.endswith(".npz"):
+        with np.load(path) as z:
+            meta = json.loads(bytes(z["meta"]).decode("utf-8"))
+            return Snapshot(meta, {c: z[c] for c in COLUMNS})
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as fh:
+        meta = json.load(fh)
+    if meta.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Versión de instantánea no soportada: {meta.get('version')}")
+    columns = {}
+    for col, dtype in COLUMNS.items():
+        n = meta["rows"] * (meta["words"] if col == "labels" else 1)
+        if n == 0:
+            columns[col] = np.zeros(0, dtype=dtype)
+        else:
+            columns[col] = np.memmap(
+                os.path.join(path, f"{col}.bin"), dtype=dtype, mode="r", shape=(n,)
+            )
+    return Snapshot(meta, columns)
+
+
+def pack(path: str, out: Optional[str] = None) -> str:
+    """Comprime el directorio `path` en un único ``.npz`` (para archivar)."""
+    snap = load(path)
+    out = out or path.rstrip("/\\") + ".npz"
+    raw = json.dumps(snap.meta, ensure_ascii=False).encode("utf-8")
+    np.savez_compressed(
+        out,
+        meta=np.frombuffer(raw, dtype=np.uint8),
+        **{c: np.asarray(getattr(snap, c)) for c in COLUMNS if c != "labels"},
+        labels=np.asarray(snap.label_bits).ravel(),
+    )
+    return out
+
+
+# ---------- análisis ----------
+def _select(snap: Snapshot, col, mask):
+    return col if mask is None else col[mask]
+
+
+def top_senders(
+    snap: Snapshot, limit: int = 50, mask=None, by: str = "count"
+) -> List[Tuple[str, int]]:
+    """[(email, mensajes|bytes)] de mayor a menor; empates por email."""
+    idx = _select(snap, snap.sender, mask)
+    weights = None
+    if by == "bytes":
+        weights = _select(snap, snap.size, mask).astype(np.float64)
+    elif by != "count":
+        raise ValueError(f"Métrica desconocida: {by}")
+    totals = np.bincount(idx, weights=weights, minlength=len(snap.senders))
+    nonzero = np.flatnonzero(totals)
+    if limit and len(nonzero) > limit:
+        # Candidatos: todo lo que empata con el k-ésimo, para desempatar por email
+        kth = np.partition(totals[nonzero], -limit)[-limit]
+        nonzero = nonzero[totals[nonzero] >= kth]
+    rows = sorted(
+        ((snap.senders[i], int(totals[i])) for i in nonzero),
+        key=lambda kv: (-kv[1], kv[0]),
+    )
+    return rows[:limit] if limit else rows
+
+
+def size_histogram(
+    snap: Snapshot, bins: Optional[Sequence[int]] = None, mask=None
+) -> List[Tuple[int, int, int, int]]:
+    """
+    [(desde, hasta, mensajes, bytes)] por tramos de tamaño; por defecto
+    tramos de potencias de 4 desde 4 KB.
+    """
+    sizes = _select(snap, snap.size, mask)
+    if bins is None:
+        bins = [0] + [4**k * 1024 for k in range(1, 9)] + [2**32]
+    edges = np.asarray(bins, dtype=np.int64)
+    which = np.searchsorted(edges, sizes, side="right") - 1
+    counts = np.bincount(which, minlength=len(edges) - 1)
+    total = np.bincount(
+        which, weights=sizes.astype(np.float64), minlength=len(edges) - 1
+    )
+    return [
+        (int(edges[i]), int(edges[i + 1]), int(counts[i]), int(total[i]))
+        for i in range(len(edges) - 1)
+    ]
+
+
+def time_series(
+    snap: Snapshot, period: str = "month", mask=None
+) -> List[Tuple[str, int, int]]:
+    """[(periodo, mensajes, bytes)] en orden cronológico (UTC)."""
+    unit = _PERIODS.get(period)
+    if unit is None:
+        raise ValueError(f"Periodo desconocido: {period}")
+    dates = (
+        _select(snap, snap.date, mask)
+        .astype("datetime64[s]")
+        .astype(f"datetime64[{unit}]")
+    )
+    keys, inverse, counts = np.unique(dates, return_inverse=True, return_counts=True)
+    sizes = _select(snap, snap.size, mask).astype(np.float64)
+    total = np.bincount(inverse.ravel(), weights=sizes, minlength=len(keys))
+    return [(str(k), int(c), int(b)) for k, c, b in zip(keys, counts, total)]
+
+
+def label_totals(snap: Snapshot, mask=None) -> List[Tuple[str, int]]:
+    """[(nombre de etiqueta, mensajes)] de las etiquetas presentes."""
+    bits = _select(snap, snap.label_bits, mask)
+    out = []
+    for i, l in enumerate(snap.labels):
+        word = bits[:, i >> 6]
+        n = int(np.count_nonzero(word & np.uint64(1 << (i & 63))))
+        if n:
+            out.append((l["name"], n))
+    return sorted(out, key=lambda kv: (-kv[1], kv[0]))
+
+
+def ids(snap: Snapshot, mask=None) -> Iterable[str]:
+    """IDs de mensaje (hex) de las filas seleccionadas, p. ej. para selection.ids."""
+    for value in _select(snap, snap.id, mask):
+        yield format(int(value), "x")
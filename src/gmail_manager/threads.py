@@ -0,0 +1,336 @@
+"""
+Modo conversación: acciones masivas y análisis por hilos en vez de mensajes.
+
+Se listan ``threads`` (500 conversaciones por página en lugar de 500
+mensajes) y se actúa con ``threads.trash`` / ``threads.delete`` /
+``threads.modify`` agrupados en batch HTTP, así que en buzones de boletines
+o conversaciones largas hay menos idas y vueltas de listado y menos IDs en
+memoria. Con ``expand=True`` los hilos se expanden perezosamente a IDs de
+mensaje (``threads.get`` minimal) y se reutiliza la tubería de
+batchModify/batchDelete de messages.py.
+
+Ojo con la cuota: cada operación sobre un hilo cuesta 10 unidades (20 el
+borrado), frente a 50 por cada 1000 mensajes de batchModify. El modo hilo
+compensa cuando las conversaciones son largas o cuando se quiere trabajar
+por conversación completa.
+
+Un hilo coincide con la consulta si coincide alguno de sus mensajes, y las
+acciones afectan a la conversación entera; con ``protect_starred`` se
+omiten los hilos que contengan algún mensaje destacado.
+"""
+
+import itertools
+import random
+import re
+import threading
+import time
+from collections import Counter
+from email.utils import parseaddr
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from . import api, messages, meter, profiling, tracing
+from .profiling import profiled
+from .service import get_gmail_service
+
+USER_ID = "me"
+MAX_RESULTS_PER_PAGE = 500
+# Gmail recomienda no pasar de 50 sub-peticiones por batch para no agotar cuota
+THREAD_BATCH_SIZE = 50
+SAMPLE_LIMIT = 1000
+
+
+# ---------- listados ----------
+def _list_thread_page(
+    service, q: Optional[str], label_ids: Optional[List[str]], page_token
+):
+    with tracing.span("list_page", "list", first=not page_token, unit="threads"):
+        return messages._with_retries(
+            lambda: api.execute(
+                "threads.list",
+                service,
+                q=q or None,
+                labelIds=label_ids or None,
+                pageToken=page_token or None,
+                includeSpamTrash=False,
+                maxResults=MAX_RESULTS_PER_PAGE,
+            )
+        )
+
+
+def estimate_thread_count(q: str = "", label_ids: Optional[List[str]] = None) -> int:
+    svc = get_gmail_service()
+    resp = _list_thread_page(svc, q or None, label_ids or None, None)
+    return int(resp.get("resultSizeEstimate", 0) or 0)
+
+
+def iter_thread_ids(
+    q: Optional[str], label_ids: Optional[List[str]], max_total: Optional[int] = None
+) -> Iterable[str]:
+    """Itera IDs de hilo página a página."""
+    svc = get_gmail_service()
+    token = None
+    yielded = 0
+    while True:
+        resp = _list_thread_page(svc, q or None, label_ids or None, token)
+        for t in resp.get("threads", []) or []:
+            yield t["id"]
+            yielded += 1
+            if max_total and yielded >= max_total:
+                return
+        token = resp.get("nextPageToken")
+        if not token:
+            return
+
+
+# ---------- batch HTTP por hilo ----------
+def _batch_calls(
+    op: str, ids: List[str], fields: Optional[str] = None, **params
+) -> Dict[str, Dict]:
+    """
+    Ejecuta `op` para cada ID agrupando THREAD_BATCH_SIZE por ida y vuelta.
+    Reintenta sólo las sub-peticiones 429/5xx; devuelve {id: respuesta}.
+    """
+    service = get_gmail_service()
+    results: Dict[str, Dict] = {}
+    pending = list(ids)
+    for attempt in range(6):
+        retry: List[str] = []
+        denied: List[Exception] = []
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                results[request_id] = response or {}
+                return
+            status = getattr(getattr(exception, "resp", None), "status", None)
+            if status in messages.RETRY_STATUS:
+                retry.append(request_id)
+            elif status == 403:
+                denied.append(exception)
+
+        for i in range(0, len(pending), THREAD_BATCH_SIZE):
+            batch = service.new_batch_http_request(callback=callback)
+            for tid in pending[i : i + THREAD_BATCH_SIZE]:
+                batch.add(api.request(op, service, fields, id=tid, **params), None, tid)
+            messages._with_retries(batch.execute)
+        if denied:
+            raise PermissionError(
+                f"Permisos insuficientes para {op}. "
+                "Reautentica con los scopes requeridos."
+            ) from denied[0]
+        if not retry:
+            break
+        pending = retry
+        sleep = min(8.0, 0.4 * (2**attempt) + random.uniform(0, 0.4))
+        meter.note_retry(sleep)
+        with tracing.span("retry_sleep", "retry", status=429, attempt=attempt):
+            time.sleep(sleep)
+    return results
+
+
+def _get_thread_worker(
+    action_type: str, label_changes: Optional[Tuple[List[str], List[str]]] = None
+) -> Callable[[List[str]], int]:
+    if action_type == "MODIFY":
+        add, remove = label_changes or ([], [])
+        op, params = "threads.modify", {
+            "body": {"addLabelIds": add, "removeLabelIds": remove}
+        }
+    else:
+        op = "threads.trash" if action_type == "TRASH" else "threads.delete"
+        params = {}
+
+    def worker(chunk: List[str]) -> int:
+        with tracing.span("batch", "http", action=op, size=len(chunk)):
+            return len(_batch_calls(op, chunk, **params))
+
+    return worker
+
+
+def iter_thread_message_ids(
+    thread_ids: Iterable[str], stop_event: Optional[threading.Event] = None
+) -> Iterable[str]:
+    """Expande hilos a IDs de mensaje de forma perezosa (un batch por bloque)."""
+    it = iter(thread_ids)
+    while not (stop_event and stop_event.is_set()):
+        chunk = list(itertools.islice(it, THREAD_BATCH_SIZE))
+        if not chunk:
+            return
+        got = _batch_calls(
+            "threads.get", chunk, api.THREAD_MESSAGE_IDS_FIELDS, format="minimal"
+        )
+        for tid in chunk:
+            for m in got.get(tid, {}).get("messages", []) or []:
+                yield m["id"]
+
+
+def _starred_thread_ids() -> Set[str]:
+    return set(iter_thread_ids("is:starred", None))
+
+
+# ---------- PUBLIC: acciones ----------
+def trash_threads_by_query(
+    q: str,
+    protect_starred: bool = True,
+    max_threads: Optional[int] = None,
+    concurrency: int = 4,
+    progress_cb: Optional[Callable[[int, int], None]] = None,
+    stop_event: Optional[threading.Event] = None,
+    expand: bool = False,
+) -> Dict:
+    return _thread_action_by_query(
+        q,
+        protect_starred,
+        max_threads,
+        concurrency,
+        progress_cb,
+        stop_event,
+        "TRASH",
+        expand=expand,
+    )
+
+
+def delete_threads_by_query(
+    q: str,
+    protect_starred: bool = True,
+    max_threads: Optional[int] = None,
+    concurrency: int = 4,
+    progress_cb: Optional[Callable[[int, int], None]] = None,
+    stop_event: Optional[threading.Event] = None,
+    expand: bool = False,
+) -> Dict:
+    return _thread_action_by_query(
+        q,
+        protect_starred,
+        max_threads,
+        concurrency,
+        progress_cb,
+        stop_event,
+        "DELETE",
+        expand=expand,
+    )
+
+
+def modify_threads_by_query(
+    q: str,
+    add_label_ids: Optional[List[str]] = None,
+    remove_label_ids: Optional[List[str]] = None,
+    protect_starred: bool = False,
+    max_threads: Optional[int] = None,
+    concurrency: int = 4,
+    progress_cb: Optional[Callable[[int, int], None]] = None,
+    stop_event: Optional[threading.Event] = None,
+    expand: bool = False,
+) -> Dict:
+    return _thread_action_by_query(
+        q,
+        protect_starred,
+        max_threads,
+        concurrency,
+        progress_cb,
+        stop_event,
+        "MODIFY",
+        (list(add_label_ids or []), list(remove_label_ids or [])),
+        expand,
+    )
+
+
+def _thread_action_by_query(
+    q: str,
+    protect_starred: bool,
+    max_threads: Optional[int],
+    concurrency: int,
+    progress_cb: Optional[Callable[[int, int], None]],
+    stop_event: Optional[threading.Event],
+    action_type: str,
+    label_changes: Optional[Tuple[List[str], List[str]]] = None,
+    expand: bool = False,
+) -> Dict:
+    q = (q or "").strip()
+    job = f"{action_type.lower()}_threads_by_query"
+    with tracing.trace_job(job), profiling.profile_job(job):
+        skip = _starred_thread_ids() if protect_starred else set()
+        tids: Iterable[str] = (
+            t for t in iter_thread_ids(q or None, None) if t not in skip
+        )
+        if max_threads:
+            tids = itertools.islice(tids, max_threads)
+        if expand:
+            # Progreso en mensajes: los lotes van por batchModify/batchDelete
+            est = messages.estimate_count(q, None)
+            processed = messages._stream_action_from_ids(
+                iter_thread_message_ids(tids, stop_event),
+                est,
+                None,
+                messages.BATCH_LIMIT,
+                concurrency,
+                progress_cb,
+                stop_event,
+                action_type,
+                label_changes,
+            )
+        else:
+            est = estimate_thread_count(q, None)
+            if max_threads:
+                est = min(est, max_threads)
+            processed = messages._stream_action_from_ids(
+                tids,
+                est,
+                None,
+                THREAD_BATCH_SIZE,
+                concurrency,
+                progress_cb,
+                stop_event,
+                action_type,
+                label_changes,
+                _get_thread_worker(action_type, label_changes),
+            )
+    return {
+        "processed": processed,
+        "unit": "messages" if expand else "threads",
+        "query_used": q,
+        "estimated": est,
+        "skipped_starred_threads": len(skip),
+        "action": action_type,
+    }
+
+
+# ---------- análisis ----------
+@profiled("top_thread_senders")
+def top_senders(
+    q: str = "", limit: int = 50, regex_pattern: Optional[str] = None
+) -> List[Tuple[str, int]]:
+    """
+    Remitentes que más conversaciones inician (muestra de SAMPLE_LIMIT hilos);
+    cuenta el From del primer mensaje de cada hilo.
+    """
+    tids = list(iter_thread_ids(q or None, None, max_total=SAMPLE_LIMIT))
+    got = _batch_calls(
+        "threads.get",
+        tids,
+        api.THREAD_SENDER_FIELDS,
+        format="metadata",
+        metadataHeaders=["From"],
+    )
+    counts: Counter = Counter()
+    for tid in tids:
+        msgs = got.get(tid, {}).get("messages") or []
+        if not msgs:
+            continue
+        sender = ""
+        for h in msgs[0].get("payload", {}).get("headers", []):
+            if h.get("name") == "From":
+                sender = h.get("value", "")
+                break
+        email = parseaddr(sender)[1].lower()
+        if not email:
+            continue
+        if regex_pattern:
+            try:
+                if not re.search(regex_pattern, email, re.IGNORECASE) and not re.search(
+                    regex_pattern, sender, re.IGNORECASE
+                ):
+                    continue
+            except re.error:
+                pass
+        counts[email] += 1
+    return counts.most_common(limit)
@@ -0,0 +1,238 @@
+"""
+Trazas opcionales de los trabajos masivos en formato Chrome Trace / Perfetto.
+
+Desactivado por defecto. Se activa con la variable de entorno
+``INBOXZERO_TRACE_DIR`` (ver config.TRACE_DIR) o llamando a ``enable(dir)``.
+Cada trabajo envuelto en ``trace_job(nombre)`` genera un archivo
+``<dir>/<nombre>-<fecha>.trace.json`` que se abre en chrome://tracing o
+https://ui.perfetto.dev.
+
+La traza activa vive en un ``ContextVar`` (como la cuenta en accounts.py):
+los workers de ``ContextThreadPool`` y las tareas asyncio la heredan, y dos
+trabajos a la vez (``run_many``, la GUI y el demonio) escriben cada uno en
+la suya. Sin traza activa, ``span()`` devuelve un contexto nulo compartido,
+así que el coste en la ruta caliente es una lectura del ContextVar.
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .config import TRACE_DIR
+
+_trace_dir: str = TRACE_DIR
+_active: contextvars.ContextVar = contextvars.ContextVar("tracer", default=None)
+
+
+class Tracer:
+    """Acumula eventos de un trabajo en memoria (thread-safe)."""
+
+    def __init__(self, job: str, path: Optional[str] = None):
+        self.job = job
+        self.path = path
+        self.events: List[Dict] = []
+        self._pid = os.getpid()
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self._named_tids = set()
+        self.events.append(
+            {
+                "name": "process_name",
+                "ph": "M",
+                "pid": self._pid,
+                "tid": 0,
+                "args": {"name": job},
+            }
+        )
+
+    def now_us(self) -> float:
+        return (time.perf_counter() - self._t0) * 1e6
+
+    def _emit(self, ev: Dict) -> None:
+        th = threading.current_thread()
+        tid = th.ident or 0
+        ev["pid"] = self._pid
+        ev["tid"] = tid
+        args = ev.setdefault("args", {})
+        args["job"] = self.job
+        with self._lock:
+            if tid not in self._named_tids:
+                self._named_tids.add(tid)
+                self.events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": self._pid,
+                        "tid": tid,
+                        "args": {"name": th.name},
+                    }
+                )
+            self.events.append(ev)
+
+    def complete(self, name: str, cat: str, start_us: float, args: Dict) -> None:
+        self._emit(
+            {
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": start_us,
+                "dur": max(0.0, self.now_us() - start_us),
+                "args": args,
+            }
+        )
+
+    def instant(self, name: str, cat: str, args: Dict) -> None:
+        self._emit(
+            {
+                "name": name,
+                "cat": cat,
+                "ph": "i",
+                "s": "t",
+                "ts": self.now_us(),
+                "args": args,
+            }
+        )
+
+    def async_event(
+        self, phase: str, name: str, cat: str, ev_id: int, args: Dict
+    ) -> None:
+        self._emit(
+            {
+                "name": name,
+                "cat": cat,
+                "ph": phase,
+                "id": ev_id,
+                "ts": self.now_us(),
+                "args": args,
+            }
+        )
+
+    def spans(self, name: str) -> List[Dict]:
+        """Eventos completos ("X") con ese nombre (útil para benchmarks)."""
+        with self._lock:
+            return [e for e in self.events if e.get("ph") == "X" and e["name"] == name]
+
+    def save(self, path: Optional[str] = None) -> str:
+        path = path or self.path
+        if not path:
+            raise ValueError("Tracer sin ruta de salida.")
+        with self._lock:
+            data = {
+                "traceEvents": list(self.events),
+                "displayTimeUnit": "ms",
+                "otherData": {"job": self.job},
+            }
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(data, fh)
+        return path
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "cat", "args", "start")
+
+    def __init__(self, tracer: Tracer, name: str, cat: str, args: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = self.tracer.now_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.complete(self.name, self.cat, self.start, self.args)
+        return False
+
+
+# ---------- API pública ----------
+def enable(directory: str) -> None:
+    """Activa la escritura de trazas en `directory` para los siguientes trabajos."""
+    global _trace_dir
+    _trace_dir = directory or ""
+
+
+def disable() -> None:
+    global _trace_dir
+    _trace_dir = ""
+
+
+def is_enabled() -> bool:
+    return bool(_trace_dir)
+
+
+def active() -> Optional[Tracer]:
+    return _active.get()
+
+
+@contextmanager
+def trace_job(job: str, tracer: Optional[Tracer] = None):
+    """
+    Registra un trabajo completo. Si se pasa `tracer`, se usa tal cual (en
+    memoria, sin escribir archivo); si no, sólo traza cuando está habilitado.
+    """
+    if tracer is None and not _trace_dir:
+        yield None
+        return
+
+    if tracer is None:
+        os.makedirs(_trace_dir, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        tracer = Tracer(job, os.path.join(_trace_dir, f"{job}-{stamp}.trace.json"))
+
+    token = _active.set(tracer)
+    start = tracer.now_us()
+    try:
+        yield tracer
+    finally:
+        tracer.complete(job, "job", start, {})
+        _active.reset(token)
+        if tracer.path:
+            tracer.save()
+
+
+def span(name: str, cat: str = "pipeline", **args):
+    """Contexto que mide un tramo; no-op si no hay traza activa."""
+    tracer = _active.get()
+    if tracer is None:
+        return _NULL_SPAN
+    return _Span(tracer, name, cat, args)
+
+
+def instant(name: str, cat: str = "pipeline", **args) -> None:
+    tracer = _active.get()
+    if tracer is not None:
+        tracer.instant(name, cat, args)
+
+
+def async_begin(name: str, ev_id: int, cat: str = "queue", **args) -> None:
+    tracer = _active.get()
+    if tracer is not None:
+        tracer.async_event("b", name, cat, ev_id, args)
+
+
+def async_end(name: str, ev_id: int, cat: str = "queue", **args) -> None:
+    tracer = _active.get()
+    if tracer is not None:
+        tracer.async_event("e", name, cat, ev_id, args)
@@ -0,0 +1,87 @@
+"""
+Transporte HTTP con pool de conexiones keep-alive, compartido entre hilos.
+
+`httplib2.Http` no es thread-safe y cada instancia abre sus propias
+conexiones TLS, así que cada hilo nuevo (y cada trabajo nuevo) pagaba el
+handshake. `PooledHttp` expone la interfaz ``request()`` de httplib2 que usa
+googleapiclient pero delega en una `requests.Session` (``AuthorizedSession``
+si hay credenciales) con un ``HTTPAdapter`` de urllib3: las conexiones se
+reutilizan entre hilos y entre trabajos, y las respuestas llegan con gzip.
+
+El tamaño del pool se configura con ``INBOXZERO_HTTP_POOL_SIZE``
+(config.HTTP_POOL_SIZE).
+"""
+
+import socket
+from http.cookiejar import DefaultCookiePolicy
+from typing import Dict, Optional
+
+import httplib2
+import requests
+from google.auth.transport.requests import AuthorizedSession
+from requests.adapters import HTTPAdapter
+
+from .config import HTTP_POOL_SIZE, HTTP_TIMEOUT
+
+# Cabeceras que no deben llegar a googleapiclient: requests ya descomprimió
+_DROP_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+
+class PooledHttp:
+    """Sustituto thread-safe de httplib2.Http sobre un pool de urllib3."""
+
+    def __init__(
+        self,
+        credentials=None,
+        pool_size: int = HTTP_POOL_SIZE,
+        timeout: float = HTTP_TIMEOUT,
+    ):
+        session = (
+            AuthorizedSession(credentials)
+            if credentials is not None
+            else requests.Session()
+        )
+        adapter = HTTPAdapter(
+            pool_connections=4, pool_maxsize=max(1, int(pool_size)), max_retries=0
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers["Accept-Encoding"] = "gzip, deflate"
+        # La API no usa cookies; sin jar mutable la sesión es segura entre hilos
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        self.session = session
+        self.credentials = credentials
+        self.timeout = timeout
+        self.pool_size = pool_size
+
+    def request(
+        self,
+        uri: str,
+        method: str = "GET",
+        body=None,
+        headers: Optional[Dict[str, str]] = None,
+        redirections: int = 5,
+        connection_type=None,
+    ):
+        try:
+            r = self.session.request(
+                method,
+                uri,
+                data=body,
+                headers=headers,
+                timeout=self.timeout,
+                allow_redirects=redirections > 0,
+            )
+        except requests.exceptions.Timeout as e:
+            # googleapiclient reintenta socket.timeout / ConnectionError nativos
+            raise socket.timeout(str(e)) from e
+        except requests.exceptions.ConnectionError as e:
+            raise ConnectionError(str(e)) from e
+        info = {k: v for k, v in r.headers.items() if k.lower() not in _DROP_HEADERS}
+        info["status"] = str(r.status_code)
+        resp = httplib2.Response(info)
+        resp.reason = r.reason
+        return resp, r.content
+
+    def close(self) -> None:
+        self.session.close()
@@ -1,4 +1,6 @@
 from typing import Dict, List
+from . import api
+from .profiling import profiled
 from .service import get_gmail_service
 
 USER_ID = "me"
@@ -9,16 +11,12 @@ def list_trash_ids(max_results: int = 500) -> List[str]:
     ids = []
     next_page_token = None
     while True:
-        resp = (
-            service.users()
-            .messages()
-            .list(
-                userId=USER_ID,
-                labelIds=["TRASH"],
-                pageToken=next_page_token,
-                maxResults=500,
-            )
-            .execute()
+        resp = api.execute(
+            "messages.list",
+            service,
+            labelIds=["TRASH"],
+            pageToken=next_page_token,
+            maxResults=500,
         )
         msgs = resp.get("messages", [])
         ids.extend([m["id"] for m in msgs])
@@ -28,6 +26,7 @@ def list_trash_ids(max_results: int = 500) -> List[str]:
     return ids
 
 
+@profiled("empty_trash")
 def empty_trash(batch_size: int = 1000) -> Dict:
     """Elimina permanentemente todos los mensajes en TRASH usando batchDelete."""
     service = get_gmail_service()
@@ -36,9 +35,7 @@ def empty_trash(batch_size: int = 1000) -> Dict:
         ids = list_trash_ids(max_results=batch_size)
         if not ids:
             break
-        service.users().messages().batchDelete(
-            userId=USER_ID, body={"ids": ids}
-        ).execute()
+        api.execute("messages.batchDelete", service, body={"ids": ids})
         total_deleted += len(ids)
         if len(ids) < batch_size:
             break
@@ -0,0 +1,196 @@
+"""
+Auto-ajuste de tamaño de lote y concurrencia por cuenta y operación.
+
+`calibrate()` ejecuta sondas cortas y seguras: añade y quita una etiqueta
+desechable (``_inboxzero_probe``) sobre una muestra pequeña de mensajes,
+recorriendo una rejilla de (batch_size, concurrency). Mide mensajes/s y tasa
+de reintentos (429/5xx) y guarda el mejor perfil en config.TUNING_FILE.
+
+Papelera y borrado no se pueden sondear sin tocar correo real: TRASH usa el
+mismo endpoint que la sonda (batchModify) y DELETE (batchDelete) tiene el
+mismo coste de cuota, así que ambos heredan el resultado de la sonda y se
+marcan con ``"source": "modify_probe"``.
+
+Los perfiles se guardan por cuenta de accounts.py (``accounts.current()``),
+así cada trabajo de `run_many` usa la calibración de su propia cuenta. La
+GUI y la CLI leen el perfil con `recommended(operation)`.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from . import accounts, api, messages, tracing
+from .config import TUNING_FILE
+from .service import get_gmail_service
+
+USER_ID = "me"
+PROBE_LABEL = "_inboxzero_probe"
+OPERATIONS = ("TRASH", "DELETE", "MODIFY")
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_CONCURRENCY = 4
+BATCH_GRID = (250, 500, 1000)
+CONCURRENCY_GRID = (1, 2, 4, 8)
+DEFAULT_ACCOUNT_KEY = "_default"  # perfil de la cuenta sin nombre (token.json)
+
+_lock = threading.Lock()
+_account_cache: Dict[Optional[str], str] = {}
+
+
+# ---------- almacenamiento ----------
+def load_profiles(path: Optional[str] = None) -> Dict:
+    path = path or TUNING_FILE
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_profiles(data: Dict, path: Optional[str] = None) -> None:
+    path = path or TUNING_FILE
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def account_email(refresh: bool = False) -> str:
+    """Email de la cuenta autenticada (se cachea por perfil de accounts.py)."""
+    key = accounts.current()
+    if key not in _account_cache or refresh:
+        svc = get_gmail_service()
+        prof = api.execute("getProfile", svc, fields="emailAddress")
+        _account_cache[key] = prof.get("emailAddress", "")
+    return _account_cache[key]
+
+
+def _account_key(account: Optional[str] = None) -> str:
+    return account or accounts.current() or DEFAULT_ACCOUNT_KEY
+
+
+def get_profile(operation: str, account: Optional[str] = None) -> Optional[Dict]:
+    """Perfil guardado para (cuenta, operación); sin `account` usa la cuenta activa."""
+    data = load_profiles()
+    per_account = data.get("accounts", {}).get(_account_key(account), {})
+    return per_account.get(operation.upper())
+
+
+def recommended(operation: str, account: Optional[str] = None) -> Tuple[int, int]:
+    """(batch_size, concurrency) calibrados o los valores por defecto."""
+    prof = get_profile(operation, account)
+    if not prof:
+        return DEFAULT_BATCH_SIZE, DEFAULT_CONCURRENCY
+    return int(prof["batch_size"]), int(prof["concurrency"])
+
+
+# ---------- sonda ----------
+def _ensure_probe_label(svc) -> str:
+    res = api.execute("labels.list", svc, fields=api.LABEL_IDS_FIELDS)
+    for lbl in res.get("labels", []):
+        if lbl.get("name") == PROBE_LABEL:
+            return lbl["id"]
+    body = {
+        "name": PROBE_LABEL,
+        "labelListVisibility": "labelHide",
+        "messageListVisibility": "hide",
+    }
+    return api.execute("labels.create", svc, body=body)["id"]
+
+
+def _run_probe(
+    ids: List[str], label_id: str, batch_size: int, concurrency: int
+) -> Dict:
+    """Añade y quita la etiqueta sonda; devuelve throughput y tasa de reintentos."""
+    tracer = tracing.Tracer(f"probe_b{batch_size}_c{concurrency}")
+    t0 = time.perf_counter()
+    done = 0
+    with tracing.trace_job(tracer.job, tracer=tracer):
+        for changes in (([label_id], []), ([], [label_id])):
+            done += messages._stream_action_from_ids(
+                iter(ids),
+                len(ids),
+                None,
+                batch_size,
+                concurrency,
+                None,
+                None,
+                "MODIFY",
+                changes,
+            )
+    elapsed = time.perf_counter() - t0
+    calls = len(tracer.spans("batch"))
+    retries = len(tracer.spans("retry_sleep"))
+    failed = 2 * len(ids) - done
+    return {
+        "batch_size": batch_size,
+        "concurrency": concurrency,
+        "msgs_per_sec": round(done / elapsed, 1) if elapsed else 0.0,
+        "error_rate": round((retries + (failed > 0)) / max(1, calls), 3),
+        "failed": failed,
+    }
+
+
+def _score(result: Dict) -> float:
+    # Penalizar configuraciones que viven a base de reintentos o pierden mensajes
+    if result["failed"]:
+        return 0.0
+    return result["msgs_per_sec"] * max(0.0, 1.0 - 3.0 * result["error_rate"])
+
+
+def calibrate(
+    sample_size: int = 2000,
+    batch_sizes: Iterable[int] = BATCH_GRID,
+    concurrencies: Iterable[int] = CONCURRENCY_GRID,
+    q: str = "",
+    progress_cb: Optional[Callable[[int, int], None]] = None,
+) -> Dict:
+    """
+    Mide la rejilla con sondas de etiqueta y guarda el mejor perfil por
+    operación para la cuenta activa. Devuelve {"account", "email", "best",
+    "results"}.
+    """
+    svc = get_gmail_service()
+    account = _account_key()
+    email = account_email(refresh=True)
+    ids = list(messages.iter_message_ids(q or None, None, max_total=sample_size))
+    if not ids:
+        raise ValueError("No hay mensajes para la sonda de calibración.")
+
+    label_id = _ensure_probe_label(svc)
+    grid = [(b, c) for b in batch_sizes for c in concurrencies]
+    results: List[Dict] = []
+    try:
+        for i, (b, c) in enumerate(grid):
+            results.append(_run_probe(ids, label_id, b, c))
+            if progress_cb:
+                progress_cb(i + 1, len(grid))
+    finally:
+        try:
+            api.execute("labels.delete", svc, id=label_id)
+        except Exception:
+            pass
+
+    best = max(results, key=_score)
+    stamp = datetime.now().isoformat(timespec="seconds")
+    profile = {
+        "batch_size": best["batch_size"],
+        "concurrency": best["concurrency"],
+        "msgs_per_sec": best["msgs_per_sec"],
+        "error_rate": best["error_rate"],
+        "sample_size": len(ids),
+        "measured_at": stamp,
+        "email": email,
+    }
+    with _lock:
+        data = load_profiles()
+        per_account = data.setdefault("accounts", {}).setdefault(account, {})
+        for op in OPERATIONS:
+            per_account[op] = dict(profile, source="modify_probe")
+        save_profiles(data)
+    return {"account": account, "email": email, "best": profile, "results": results}
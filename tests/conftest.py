@@ -0,0 +1,9 @@
+import pytest
+
+from gmail_manager import journal
+
+
+@pytest.fixture(autouse=True)
+def _journal_dir(tmp_path, monkeypatch):
+    # Los trabajos de papelera escriben su diario; que no acabe en el repo
+    monkeypatch.setattr(journal, "JOURNAL_DIR", str(tmp_path / "journal"))
@@ -0,0 +1,81 @@
+import time
+
+from gmail_manager import accounts, messages, service
+from gmail_manager.simulator import SimMailbox, SimulatedGmail
+
+
+def _factory(sims):
+    def build():
+        sim = sims.get(accounts.current())
+        if sim is None:
+            raise FileNotFoundError("No se encontró credentials.json")
+        return sim.build_service()
+
+    return build
+
+
+def test_profiles_and_context(tmp_path, monkeypatch):
+    monkeypatch.setattr(accounts, "ACCOUNTS_FILE", str(tmp_path / "accounts.json"))
+    monkeypatch.setattr(accounts, "TOKENS_DIR", "tokens")
+    accounts.add("soporte", quota_per_sec=250)
+    assert accounts.token_file("soporte").endswith("soporte.json")
+    assert accounts.current() is None
+    with accounts.use("soporte"):
+        assert accounts.budget().per_sec == 250
+        with accounts.ContextThreadPool(max_workers=2) as ex:
+            assert ex.submit(accounts.current).result() == "soporte"
+    assert accounts.current() is None
+    assert accounts.remove("soporte") and accounts.names() == []
+
+
+def test_run_many_isolates_slow_and_failing_accounts(tmp_path, monkeypatch):
+    sims = {
+        "rapida": SimulatedGmail(SimMailbox(size=2000, seed=1)),
+        "lenta": SimulatedGmail(SimMailbox(size=2000, seed=2), latency=0.02),
+    }
+    monkeypatch.setattr(accounts, "ACCOUNTS_FILE", str(tmp_path / "accounts.json"))
+    for name in ("rapida", "lenta", "rota"):
+        accounts.add(name)
+    prev = service.set_service_factory(_factory(sims))
+    finished = {}
+
+    def job(progress_cb):
+        res = messages.trash_by_query_fast(
+            "category:promotions", progress_cb=progress_cb
+        )
+        finished[accounts.current()] = time.monotonic()
+        return res
+
+    try:
+        out = accounts.run_many(["rapida", "lenta", "rota"], job, max_workers=3)
+    finally:
+        service.set_service_factory(prev)
+
+    per = out["accounts"]
+    assert per["rapida"]["ok"] and per["lenta"]["ok"]
+    assert not per["rota"]["ok"] and out["summary"]["failed"] == 1
+    assert finished["rapida"] < finished["lenta"]
+    assert out["summary"]["processed"] == sum(
+        per[n]["result"]["processed"] for n in ("rapida", "lenta")
+    )
+    # Cada cuenta actuó sobre su propio buzón
+    for name, sim in sims.items():
+        assert per[name]["result"]["processed"] > 0
+        with sim.install():
+            left = list(
+                messages.iter_message_ids("category:promotions -is:starred", None)
+            )
+        assert left == []
+
+
+def test_budget_counts_every_unit_across_threads():
+    budget = accounts.QuotaBudget(per_sec=None)
+
+    def spend():
+        for _ in range(2000):
+            budget.acquire(5)
+
+    with accounts.ContextThreadPool(max_workers=8) as ex:
+        for f in [ex.submit(spend) for _ in range(8)]:
+            f.result()
+    assert budget.spent == 8 * 2000 * 5
@@ -0,0 +1,90 @@
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from gmail_manager import aio, labels, messages, planner, search
+from gmail_manager.simulator import SimMailbox, SimulatedGmail
+
+
+@pytest.fixture
+def async_sim():
+    sim = SimulatedGmail(SimMailbox(size=3000, seed=5))
+    server = sim.serve()
+    prev_engine, prev_url = aio._engine, aio._base_url
+    aio.configure(engine="async", base_url=server.base_url)
+    try:
+        yield sim
+    finally:
+        aio._engine, aio._base_url = prev_engine, prev_url
+        server.shutdown()
+
+
+def test_async_engine_matches_threaded_results(async_sim):
+    with async_sim.install():
+        aio.set_engine("threads")
+        expected_top = search.top_senders("", limit=5)
+        expected_counts = {
+            l["id"]: l["messagesTotal"] for l in labels.list_labels_with_counts()
+        }
+        aio.set_engine("async")
+    assert search.top_senders("", limit=5) == expected_top
+    counts = {l["id"]: l["messagesTotal"] for l in labels.list_labels_with_counts()}
+    assert counts == expected_counts
+
+
+def test_async_trash_pipeline_reports_progress(async_sim):
+    progress = []
+    with async_sim.install():
+        res = messages.trash_by_query_fast(
+            "category:social",
+            batch_size=100,
+            concurrency=16,
+            progress_cb=lambda done, total: progress.append((done, total)),
+        )
+        # Mismo plan que la ruta por hilos: la categoría va en labelIds
+        last = planner.history[-1]
+        assert last["q"] == res["query_used"]
+        assert "labelIds=CATEGORY_SOCIAL" in last["plan"]
+        assert messages.estimate_count("category:social -is:starred") == 0
+    assert res["processed"] > 100
+    assert progress[0][0] == 0 and progress[-1] == (res["processed"],) * 2
+    assert async_sim.calls["messages.batchModify"] == -(-res["processed"] // 100)
+
+
+def test_metadata_stream_keeps_bounded_batches_in_flight(async_sim, monkeypatch):
+    real_run, real_batch = aio.run, aio.AsyncGmail.get_metadata_batch
+    monkeypatch.setattr(aio, "run", lambda job: real_run(job, max_in_flight=2))
+    state = {"now": 0, "peak": 0}
+
+    async def counted(self, ids, *args):
+        state["now"] += 1
+        state["peak"] = max(state["peak"], state["now"])
+        try:
+            return await real_batch(self, ids, *args)
+        finally:
+            state["now"] -= 1
+
+    monkeypatch.setattr(aio.AsyncGmail, "get_metadata_batch", counted)
+    seen = []
+    with async_sim.install():
+        out = aio.fetch_metadata_for_query("", on_message=seen.append)
+        expected = sum(1 for _ in messages.iter_message_ids("", None))
+    assert out == [] and len(seen) == expected
+    assert state["peak"] <= 2
+
+
+def test_async_engine_charges_the_account_budget(async_sim, monkeypatch):
+    from gmail_manager import accounts
+    from gmail_manager.api import QUOTA_UNITS
+
+    budget = accounts.QuotaBudget(per_sec=2000)
+    monkeypatch.setitem(accounts._budgets, None, budget)
+    with async_sim.install():
+        res = messages.trash_by_query_fast("category:social", batch_size=100)
+        seen = []
+        aio.fetch_metadata_for_query("category:updates", on_message=seen.append)
+    assert res["processed"] > 0 and seen
+    # Lo mismo que cobraría api.request, sub-peticiones del batch incluidas
+    charged = sum(QUOTA_UNITS.get(op, 5) * n for op, n in async_sim.calls.items())
+    assert budget.spent == charged > budget.burst
+    assert budget.waited > 0
@@ -0,0 +1,33 @@
+from gmail_manager import api, filters, labels, messages, search, trash, tuning
+from gmail_manager.simulator import SimMailbox, SimulatedGmail
+
+
+def test_every_request_carries_a_field_mask():
+    sim = SimulatedGmail(SimMailbox(size=1500, seed=9))
+    with sim.install():
+        search.top_senders("", limit=5)
+        labels.list_labels_with_counts()
+        created = labels.create_label("Revisar")
+        labels.rename_label(created["id"], "Revisado")
+        labels.apply_label_to_query("category:social", [created["id"]])
+        labels.delete_label(created["id"])
+        f = filters.create_filter(
+            {"from": "news@github.com"}, {"addLabelIds": ["TRASH"]}
+        )
+        filters.list_filters()
+        filters.delete_filter(f["id"])
+        messages.trash_by_query_fast("category:promotions", batch_size=300)
+        mid = next(messages.iter_message_ids("in:inbox", None))
+        messages._modify_one(mid, ["STARRED"], [])
+        messages._trash_one(mid)
+        messages._delete_one(mid)
+        trash.empty_trash()
+        tuning.account_email(refresh=True)
+
+    ops = {op for op, _, _, _ in sim.log}
+    assert {"messages.get", "labels.get", "settings.filters.create"} <= ops
+    for op, method, path, params in sim.log:
+        assert op in api.FIELDS, op
+        if api.FIELDS[op] is None:
+            continue
+        assert params.get("fields"), (op, method, path)
@@ -0,0 +1,48 @@
+from gmail_manager import backtest, filters, messages
+from gmail_manager.simulator import SimMailbox, SimulatedGmail
+
+
+def test_backtest_agrees_with_server_and_warns():
+    sim = SimulatedGmail(SimMailbox(size=2000, seed=8))
+    cases = [
+        {"from": "news@shop.example.com"},
+        {"query": "category:promotions", "size": 50000, "sizeComparison": "larger"},
+        {"subject": "Aviso", "negatedQuery": "shop"},
+    ]
+    with sim.install():
+        cache = backtest.load_cache(limit=None, refresh=True)
+        expected = [
+            set(messages.iter_message_ids(filters.criteria_to_query(c), None))
+            for c in cases
+        ]
+        sim.reset_stats()
+        results = [backtest.backtest(c, cache, sample_size=5) for c in cases]
+        assert sim.stats()["api_calls"] == 0  # todo en local
+
+    for res, ids in zip(results, expected):
+        assert res["count"] == len(ids) > 0 and res["complete"]
+        assert len(res["sample"]) == 5 and {r["id"] for r in res["sample"]} <= ids
+    assert any("subcadena" in w for w in results[0]["warnings"])
+    assert any("sizeEstimate" in w for w in results[1]["warnings"])
+
+    partial = backtest.MetadataCache(limit=100)
+    with sim.install():
+        partial.load()
+    res = backtest.backtest({"from": "news@shop.example.com"}, partial)
+    assert not res["complete"] and any("recientes" in w for w in res["warnings"])
+
+
+def test_grouped_value_is_and_unless_or():
+    from gmail_manager import query as gq
+
+    subjects = ["Quarterly report Q3", "Weekly report", "Lunch quarterly", "Hola"]
+    views = [gq.MessageView(subject=s) for s in subjects]
+
+    def matches(q):
+        pred = gq.compile_query(gq.parse(q))
+        return [v.subject for v in views if pred(v)]
+
+    assert matches("subject:(quarterly report)") == ["Quarterly report Q3"]
+    assert matches("subject:(quarterly OR report)") == subjects[:3]
+    assert matches("subject:(quarterly | report)") == subjects[:3]
+    assert matches("subject:(report -weekly)") == ["Quarterly report Q3"]
@@ -0,0 +1,72 @@
+import pytest
+
+from gmail_manager import counting, messages, planner
+from gmail_manager.simulator import SimMailbox, SimulatedGmail
+
+
+def test_exact_and_estimate_bracket_true_count():
+    sim = SimulatedGmail(SimMailbox(size=8000, seed=3))
+    q = "category:promotions OR larger:1M"
+    with sim.install():
+        truth = sum(1 for _ in messages.iter_message_ids(q, None))
+        assert counting.count_exact(q, shards=8) == truth
+        full = counting.estimate(q, shards=8, time_budget=60)
+        assert full["exact"] and full["count"] == truth
+        est = counting.estimate("-is:starred", shards=32, time_budget=0, seed=1)
+        everything = sum(1 for _ in messages.iter_message_ids("-is:starred", None))
+    assert not est["exact"] and est["sampled"] >= counting.MIN_SAMPLED
+    assert est["low"] <= everything <= est["high"]
+
+
+def test_progress_total_refines_to_exact():
+    sim = SimulatedGmail(SimMailbox(size=3000, seed=8))
+    seen = []
+    with sim.install():
+        res = messages.trash_by_query_fast(
+            "category:social", progress_cb=lambda d, t: seen.append((d, t))
+        )
+    assert seen[-1] == (res["processed"], res["processed"])
+
+
+def test_job_listing_refines_while_listing(monkeypatch):
+    monkeypatch.setattr(counting, "JOB_SHARD_SIZE", 500)
+    sim = SimulatedGmail(SimMailbox(size=6000, seed=4))
+    q = "-is:starred"
+    with sim.install():
+        plain = list(messages.iter_message_ids(q, None))
+        sim.reset_stats()
+        listing = counting.JobListing(q, None)
+        est = listing.open()
+        after_open = sim.stats()["calls"]["messages.list"]
+        ids = list(listing)
+        calls = sim.stats()["calls"]["messages.list"]
+    # open() sólo pide la 1ª página; al terminar el total es exacto y los
+    # IDs salen en el mismo orden que el listado normal
+    assert after_open == 1 and est > 0 and listing.shards >= 2
+    assert ids == plain and listing.estimate == len(plain)
+    # Sobrecoste: una 1ª página por shard sondeado
+    assert calls <= -(-len(plain) // 500) + listing.shards
+
+
+def test_job_listing_stops_at_max_total():
+    sim = SimulatedGmail(SimMailbox(size=20000, seed=6))
+    with sim.install():
+        sim.reset_stats()
+        res = messages.trash_by_query_fast("", max_fetch=10)
+        calls = sim.stats()["calls"]["messages.list"]
+    assert res["processed"] == 10 and calls == 1
+
+
+def test_job_listing_fast_mode_skips_shards(monkeypatch):
+    monkeypatch.setattr(counting, "JOB_SHARD_SIZE", 500)
+    sim = SimulatedGmail(SimMailbox(size=6000, seed=4))
+    with sim.install():
+        plain = list(messages.iter_message_ids("", None))
+        sim.reset_stats()
+        listing = planner.job_listing("", count_mode="fast")
+        ids = list(listing)
+        calls = sim.stats()["calls"]["messages.list"]
+        with pytest.raises(ValueError):
+            planner.job_listing("", count_mode="exact")
+    assert listing.shards == 0 and ids == plain
+    assert calls == -(-len(plain) // 500)
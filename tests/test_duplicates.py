@@ -0,0 +1,53 @@
+from gmail_manager import duplicates, journal, messages
+from gmail_manager.simulator import SimMailbox, SimulatedGmail
+
+
+def test_duplicates_keep_one_copy_per_group():
+    mb = SimMailbox(size=600, seed=33)
+    sim = SimulatedGmail(mb)
+    with sim.install():
+        originals = [mb.id_of(i) for i in range(0, 40, 4)]
+        copies = []
+        for mid in originals:
+            rec = mb.record(mb.index_of(mid))
+            for _ in range(2):
+                copies.append(
+                    mb.add_message(
+                        rec["from"],
+                        rec["subject"],
+                        labels=("INBOX",),
+                        date=rec["date"] + 60,
+                        size=rec["size"],
+                        message_id=rec["message_id"].upper(),
+                    )
+                )
+        # Sin Message-ID: se agrupan por huella (From + Date + Subject + tamaño)
+        bare = [
+            mb.add_message("a@list.example.org", "Resumen", date=1.7e9, message_id=" ")
+            for _ in range(3)
+        ]
+        starred = mb.add_message(
+            "a@list.example.org",
+            "Resumen",
+            labels=("INBOX", "STARRED"),
+            date=1.7e9,
+            message_id=" ",
+        )
+        live = {
+            m for m in originals if "TRASH" not in mb.record(mb.index_of(m))["labels"]
+        }
+
+        sim.reset_stats()
+        found = duplicates.find_duplicates()
+        calls = sim.stats()["calls"]
+        res = duplicates.remove_duplicates(found=found)
+        left = set(messages.iter_message_ids("", None))
+        jr = journal.list_journals()[0]
+
+    assert found["scanned"] == calls["messages.get"]
+    assert found["by_fingerprint"] == 1 and found["by_message_id"] >= len(live)
+    assert found["duplicates"] == res["processed"] == len(found["ids"])
+    assert jr["id"] == res["journal"] and jr["count"] == res["processed"]
+    # Se conserva la copia más antigua; de las sin Message-ID, la destacada
+    assert live <= left and not set(copies) & left
+    assert starred in left and not set(bare) & left
@@ -0,0 +1,57 @@
+import gzip
+import mailbox
+import os
+import threading
+
+from gmail_manager import export, messages
+from gmail_manager.simulator import SimMailbox, SimulatedGmail
+
+
+def test_export_resumes_and_deletes_exactly_the_archive(tmp_path):
+    mb = SimMailbox(size=1500, seed=21)
+    sim = SimulatedGmail(mb)
+    path = str(tmp_path / "promos.mbox.gz")
+    with sim.install():
+
+        def ids(q):
+            return set(messages.iter_message_ids(q, None))
+
+        wanted = ids("category:promotions -is:starred")
+        stop = threading.Event()
+
+        def cb(done, total):
+            if done >= 60:
+                stop.set()
+
+        first = export.export_messages(
+            "category:promotions",
+            path,
+            concurrency=1,
+            delete=True,
+            progress_cb=cb,
+            stop_event=stop,
+        )
+        assert first["deleted"] == 0 and 60 <= first["exported"] < len(wanted)
+        # Escritura a medias tras el último lote confirmado
+        with open(path, "ab") as fh:
+            fh.write(b"\x1f\x8b basura")
+
+        sim.reset_stats()
+        second = export.export_messages("category:promotions", path, delete=True)
+        calls = sim.stats()["calls"]
+        left = ids("category:promotions")
+
+        eml = export.export_messages("category:social", str(tmp_path / "eml"), "eml")
+        social = ids("category:social")
+
+    assert second["skipped"] == first["exported"]
+    assert second["archived"] == len(wanted) == second["deleted"]
+    assert calls["messages.get"] == len(wanted) - first["exported"]
+    assert not left & wanted and left
+    plain = tmp_path / "promos.mbox"
+    plain.write_bytes(gzip.decompress(open(path, "rb").read()))
+    box = mailbox.mbox(str(plain))
+    assert len(box) == len(wanted)
+    assert all(m["X-GM-THRID"] for m in box)
+    files = [f for f in os.listdir(tmp_path / "eml") if f.endswith(".eml")]
+    assert eml["exported"] == len(files) == len(social)
@@ -0,0 +1,105 @@
+import pytest
+
+from gmail_manager import filters, journal, labels, messages
+from gmail_manager.simulator import SimMailbox, SimulatedGmail
+
+
+def test_criteria_to_query():
+    q = filters.criteria_to_query(
+        {
+            "from": "a@x.com OR b@y.com",
+            "subject": "Factura mensual",
+            "negatedQuery": "urgente pago",
+            "hasAttachment": True,
+            "size": 100000,
+            "sizeComparison": "smaller",
+        }
+    )
+    assert q == (
+        'from:(a@x.com OR b@y.com) subject:"Factura mensual" '
+        "-{urgente pago} has:attachment smaller:100000"
+    )
+
+
+def test_apply_filters_shares_listing_and_merges_actions():
+    sim = SimulatedGmail(SimMailbox(size=3000, seed=6))
+    sender = {"from": "news@shop.example.com"}
+    with sim.install():
+
+        def ids(q):
+            return set(messages.iter_message_ids(q, None))
+
+        from_sender = ids("from:news@shop.example.com")
+        promos = ids("category:promotions")
+        starred = ids("is:starred")
+        fl = [
+            {"id": "f1", "criteria": sender, "action": {"addLabelIds": ["Label_1"]}},
+            {"id": "f2", "criteria": sender, "action": {"removeLabelIds": ["INBOX"]}},
+            {
+                "id": "f3",
+                "criteria": {"query": "category:promotions"},
+                "action": {"addLabelIds": ["TRASH"]},
+            },
+            {"id": "f4", "criteria": {}, "action": {"addLabelIds": ["Label_2"]}},
+        ]
+        sim.reset_stats()
+        res = filters.apply_filters(fl)
+        lists = sim.stats()["calls"].get("messages.list", 0)
+        labelled = set(messages.iter_message_ids("", ["Label_1"]))
+        inbox = ids("in:inbox")
+        trashed = ids("in:trash")
+        journaled = journal.list_journals()
+
+    assert res["queries"] == 2 and res["skipped"] == ["f4"]
+    # 2 consultas + destacados; cada una cabe en pocas páginas
+    assert lists <= 3 * 2
+    kept = from_sender - (promos - starred)
+    assert kept and kept <= labelled and not kept & inbox
+    assert (promos - starred) <= trashed and not starred & trashed
+    assert res["skipped_starred"] == len(promos & starred)
+    assert [j["id"] for j in journaled] == [res["journal"]]
+    assert journaled[0]["count"] == len(promos - starred)
+    assert (
+        res["processed"]
+        == res["matched"]
+        == len((from_sender | promos) - (promos & starred - from_sender))
+    )
+
+
+def test_export_import_dedupe_between_accounts(tmp_path, monkeypatch):
+    monkeypatch.setattr(filters, "FILTER_BATCH_SIZE", 2)  # varios lotes
+    monkeypatch.setattr(filters, "FILTER_BATCH_INTERVAL", 0)
+    src = SimulatedGmail(SimMailbox(size=50, seed=1))
+    dst = SimulatedGmail(SimMailbox(size=50, seed=2, user_labels=2))
+    path = str(tmp_path / "filters.json")
+    with src.install():
+        filters.create_filter(
+            {"from": "@shop.example.com"}, {"addLabelIds": ["Label_5"]}
+        )
+        filters.create_filter(
+            {"from": "News@Shop.example.com"}, {"addLabelIds": ["Label_5"]}
+        )
+        filters.create_filter({"subject": "Aviso"}, {"removeLabelIds": ["INBOX"]})
+        assert filters.export_filters(path) == 3
+        dedupe = filters.dedupe_filters(dry_run=True)
+    assert [f["criteria"]["from"] for f in dedupe["delete"]] == [
+        "News@Shop.example.com"
+    ]
+
+    with dst.install():
+        filters.create_filter({"subject": "Aviso"}, {"removeLabelIds": ["INBOX"]})
+        filters.create_filter({"from": "viejo@x.com"}, {"addLabelIds": ["TRASH"]})
+        with pytest.raises(ValueError):
+            filters.load_filter_file(path)
+        plan = filters.import_filters(path, prune=True, dry_run=True)
+        assert (len(plan["diff"]["create"]), len(plan["diff"]["delete"])) == (2, 1)
+        assert len(plan["redundant"]["subsumed"]) == 1
+        res = filters.import_filters(path, prune=True)["result"]
+        current = filters.list_filters()
+        names = {l["id"]: l["name"] for l in labels.list_labels()}
+        again = filters.import_filters(path, prune=True, dry_run=True)["diff"]
+
+    assert (res["created"], res["deleted"], res["failed"]) == (2, 1, [])
+    added = {names[l] for f in current for l in f["action"].get("addLabelIds", [])}
+    assert added == {"Proyecto 5"}
+    assert not again["create"] and not again["delete"] and len(again["unchanged"]) == 3
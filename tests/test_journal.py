@@ -0,0 +1,93 @@
+import os
+import time
+
+import pytest
+
+from gmail_manager import journal, messages
+from gmail_manager.simulator import SimMailbox, SimulatedGmail
+
+
+def test_trash_journal_restores_ids_and_labels(monkeypatch):
+    monkeypatch.setattr(journal, "JOURNAL_CAPTURE", True)
+    mb = SimMailbox(size=2500, seed=12)
+    sim = SimulatedGmail(mb)
+    with sim.install():
+
+        def ids(q):
+            return set(messages.iter_message_ids(q, None))
+
+        inbox_before = ids("in:inbox category:promotions -is:starred")
+        unread_before = ids("is:unread category:promotions -is:starred")
+        already = ids("in:trash")
+        res = messages.trash_by_query_fast("category:promotions", batch_size=200)
+        trashed = ids("in:trash") - already
+        assert res["journal"] and len(trashed) == res["processed"] > 200
+        # Gmail saca de INBOX lo que va a la papelera
+        for mid in inbox_before:
+            mb.modify(mb.index_of(mid), [], ["INBOX"])
+        assert not ids("in:inbox category:promotions -is:starred")
+
+        meta = journal.list_journals()[0]
+        path = os.path.join(journal._account_dir(), meta["id"], "ids.bin")
+        assert meta["count"] == res["processed"] and os.path.getsize(path) == 8 * len(
+            trashed
+        )
+
+        sim.reset_stats()
+        out = journal.restore()
+        calls = sim.stats()["calls"]
+        assert out["restored"] == len(trashed) and out["missing"] == 0
+        assert ids("in:trash") == already
+        assert ids("in:inbox category:promotions") >= inbox_before
+        assert ids("is:unread category:promotions") >= unread_before
+        # Un batchModify por grupo de etiquetas (y lote de 1000)
+        assert calls["messages.batchModify"] <= len(out["groups"]) * 2
+
+        again = journal.restore(meta["id"])
+    assert again["restored"] == 0 and again["missing"] == len(trashed)
+    assert journal.prune(now=time.time() + 31 * 86400) == 1
+    assert journal.list_journals() == []
+
+
+def test_label_jobs_journal_their_labels_without_extra_listings():
+    mb = SimMailbox(size=2500, seed=13)
+    sim = SimulatedGmail(mb)
+    with sim.install():
+
+        def ids(q):
+            return set(messages.iter_message_ids(q, None))
+
+        selected = ids("in:inbox category:social -is:starred")
+        listed = sim.stats()["calls"]["messages.list"]
+        sim.reset_stats()
+        res = messages.trash_by_label_ids_fast(
+            ["INBOX", "CATEGORY_SOCIAL"], use_or=False
+        )
+        # Sin captura: sólo el listado del propio trabajo
+        assert sim.stats()["calls"]["messages.list"] <= listed + 1
+        assert res["processed"] == len(selected)
+        for mid in selected:
+            mb.modify(mb.index_of(mid), [], ["INBOX"])
+
+        out = journal.restore(res["journal"])
+        assert out["restored"] == len(selected)
+        assert out["groups"] == [
+            {
+                "add": ["CATEGORY_SOCIAL", "INBOX"],
+                "remove": ["TRASH"],
+                "count": len(selected),
+            }
+        ]
+        assert ids("in:inbox category:social -is:starred") == selected
+
+
+def test_journal_is_closed_when_the_job_fails(monkeypatch):
+    def boom(*args, **kwargs):
+        raise RuntimeError("fallo a mitad")
+
+    monkeypatch.setattr(messages, "_stream_action_from_ids", boom)
+    with SimulatedGmail(SimMailbox(size=300, seed=5)).install():
+        with pytest.raises(RuntimeError):
+            messages.trash_by_query_fast("category:social")
+        meta = journal.list_journals()[0]
+    assert meta["complete"] and meta["processed"] == 0
@@ -0,0 +1,39 @@
+from gmail_manager import messages, meter
+from gmail_manager.simulator import SimMailbox, SimulatedGmail
+
+
+def test_meter_window_rate_eta_and_throttling():
+    now = [100.0]
+    seen = []
+    m = meter.Meter(seen.append, window=10.0, interval=1.0, clock=lambda: now[0])
+    m(0, 1000)
+    for i in range(20):
+        now[0] += 0.25
+        m(5 * (i + 1), 1000)
+    # 21 avisos en 5 s: primero + uno por segundo, el resto queda retenido
+    assert len(seen) == 6
+    for step in range(40):
+        now[0] += 0.5
+        m(100 + 50 * (step + 1), 1000 + step)
+    last = m.close()
+    # La ventana sólo ve el ritmo nuevo (100/s); el ETA usa la media suavizada
+    assert last.done == 2100 and abs(last.rate - 100.0) < 1e-6
+    assert last.eta == 0.0 and seen[-1] is last
+    now[0] += 0.5
+    m(2100, 2200)
+    assert 1.0 < m.close().eta < 5.0
+
+
+def test_meter_counts_retries_and_concurrency():
+    mb = SimMailbox(size=1500, seed=5)
+    sim = SimulatedGmail(mb, error_rate=0.3, seed=3)
+    seen = []
+    with sim.install():
+        prog = meter.Meter(seen.append, interval=0.0)
+        res = messages.trash_by_query_fast(
+            "category:promotions", batch_size=50, concurrency=3, progress_cb=prog
+        )
+        last = prog.close()
+    assert last.done == res["processed"] and last.concurrency == 3
+    assert last.retries > 0 and last.throttled > 0
+    assert last.rate > 0 and "msg/s" in last.describe()
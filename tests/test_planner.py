@@ -0,0 +1,46 @@
+from gmail_manager import messages, planner
+from gmail_manager.simulator import SimMailbox, SimulatedGmail
+
+
+def test_label_queries_list_by_label_ids():
+    sim = SimulatedGmail(SimMailbox(size=2000, seed=6))
+    q = "in:inbox category:social -is:starred"
+    with sim.install():
+        expected = set(messages.iter_message_ids(q, None))
+        p = planner.plan(q)
+        assert p.kind == "search" and p.q == "-is:starred"
+        assert p.label_ids == ["INBOX", "CATEGORY_SOCIAL"]
+
+        sim.log.clear()
+        total = messages.estimate_count("category:social")
+        ops = [(op, params) for op, _, _, params in sim.log]
+        assert [op for op, _ in ops] == ["labels.get", "messages.list", "messages.list"]
+        # messagesTotal menos lo que esté en Papelera/Spam con la etiqueta
+        listed = sum(1 for _ in messages.iter_message_ids("category:social", None))
+        assert total == listed
+
+        sim.log.clear()
+        got = set(messages.iter_message_ids(q, None))
+        for op, _, _, params in sim.log:
+            assert op == "messages.list"
+            assert params.get("labelIds") and params.get("q") == ["-is:starred"]
+    assert got == expected
+
+
+def test_residual_query_is_kept_verbatim():
+    with SimulatedGmail(SimMailbox(size=10)).install():
+        p = planner.plan("in:inbox subject:(quarterly report)")
+        assert p.label_ids == ["INBOX"] and p.q == "subject:(quarterly report)"
+        # Con OR en el nivel superior no se parte: la q original tal cual
+        q = "in:inbox OR from:ana@example.com"
+        p = planner.plan(q)
+        assert p.q == q and not p.label_ids
+
+
+def test_shapes():
+    with SimulatedGmail(SimMailbox(size=10)).install():
+        assert planner.plan("older_than:1y").kind == "date"
+        assert planner.plan("from:ana@example.com").kind == "sender"
+        assert planner.plan("in:trash").kind == "search"
+        assert planner.plan("label:inbox").count_via == "labels.get"
+    assert planner.history[-1]["q"] == "label:inbox"
@@ -0,0 +1,49 @@
+import os
+import threading
+import warnings
+
+from gmail_manager import profiling
+
+
+def _busy_work(n: int = 20000) -> int:
+    return sum(i * i for i in range(n))
+
+
+def test_profile_job_writes_pstats_and_alloc_report(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "_profile_dir", str(tmp_path))
+    with profiling.profile_job("demo") as prof:
+        assert prof is not None
+        data = [bytes(1000) for _ in range(200)]
+        _busy_work()
+    del data
+    files = sorted(os.listdir(tmp_path))
+    assert [f.rsplit(".", 1)[-1] for f in files] == ["txt", "pstats"]
+    report = (tmp_path / files[0]).read_text(encoding="utf-8")
+    assert report.startswith("Trabajo: demo") and "Pico de memoria" in report
+    assert "_busy_work" in report
+
+
+def test_concurrent_jobs_profile_one_and_warn(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "_profile_dir", str(tmp_path))
+    inside = threading.Barrier(2)
+    got = {}
+
+    def job(name):
+        with profiling.profile_job(name) as prof:
+            inside.wait()  # los dos trabajos dentro a la vez
+            got[name] = (prof is not None, _busy_work())
+            inside.wait()
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        threads = [threading.Thread(target=job, args=(n,)) for n in ("a", "b")]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    # Ambos trabajos terminan; sólo uno se perfila y el otro avisa
+    assert len(got) == 2 and sorted(p for p, _ in got.values()) == [False, True]
+    assert [w.category for w in caught] == [RuntimeWarning]
+    assert len([f for f in os.listdir(tmp_path) if f.endswith(".pstats")]) == 1
+    with profiling.profile_job("after") as prof:
+        assert prof is not None
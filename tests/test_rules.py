@@ -0,0 +1,68 @@
+import json
+
+from gmail_manager import journal, labels, messages, rules
+from gmail_manager.simulator import SimMailbox, SimulatedGmail
+
+
+def test_daemon_applies_rules_incrementally(tmp_path, monkeypatch):
+    monkeypatch.setattr(rules, "RULES_STATE_FILE", str(tmp_path / "state.json"))
+    path = tmp_path / "rules.json"
+    path.write_text(
+        json.dumps(
+            {
+                "rules": [
+                    {
+                        "name": "promos",
+                        "query": "category:promotions older_than:30d",
+                        "action": "trash",
+                    },
+                    {
+                        "name": "jira",
+                        "query": "from:jira.example.com",
+                        "add_labels": ["Jira"],
+                        "archive": True,
+                    },
+                    {"name": "ruido", "query": "subject:ruido", "action": "delete"},
+                ]
+            }
+        )
+    )
+    mb = SimMailbox(size=1500, seed=9)
+    sim = SimulatedGmail(mb)
+    with sim.install():
+        loaded = rules.load_rules(str(path))
+        assert [r.mode for r in loaded] == ["scan", "local", "local"]
+
+        def ids(q, label_ids=None):
+            return set(messages.iter_message_ids(q, label_ids))
+
+        old_promos = ids("category:promotions older_than:30d -is:starred")
+        first = rules.run_once(loaded)
+        assert first["rules"]["promos"]["matched"] == len(old_promos) > 0
+        assert journal.list_journals()[0]["count"] == len(old_promos)
+        assert not ids("category:promotions older_than:30d -is:starred")
+        assert ids("category:promotions older_than:30d is:starred")
+
+        jira = [mb.add_message(f"bot{i}@jira.example.com", f"T-{i}") for i in range(3)]
+        mb.add_message("ana@example.org", "Hola")
+        mb.add_message("x@example.org", "ruido semanal")
+        sim.reset_stats()
+        second = rules.run_once(loaded)
+        calls = sim.stats()["calls"]
+        lid = {l["name"]: l["id"] for l in labels.list_labels()}["Jira"]
+        tagged = ids("", [lid])
+        inbox = ids("in:inbox")
+
+        sim.reset_stats()
+        third = rules.run_once(loaded)
+        third_calls = sim.stats()["calls"]
+
+    # Sólo historial + metadata de los 5 nuevos, sin listar el buzón
+    assert "messages.list" not in calls and calls["messages.get"] == 5
+    assert calls.get("messages.batchModify") == 1 and calls["messages.batchDelete"] == 1
+    assert second["changed"] == 5 and second["rules"]["jira"]["matched"] == 3
+    assert second["rules"]["jira"]["latency"] is not None
+    assert set(jira) <= tagged and not set(jira) & inbox
+    # Los cambios propios de la pasada anterior no se vuelven a leer
+    assert third["changed"] == 0 and "messages.get" not in third_calls
+    assert first["journal"] and second["journal"] is None
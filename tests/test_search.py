@@ -0,0 +1,60 @@
+from gmail_manager import search
+from gmail_manager.simulator import SimMailbox, SimulatedGmail
+
+
+def test_sender_profiles_single_pass():
+    sim = SimulatedGmail(SimMailbox(size=1200, seed=5))
+    with sim.install():
+        top = search.top_senders("", limit=5)
+        sim.log.clear()
+        rows = search.sender_profiles("", limit=None)
+
+    ops = [op for op, _, _, _ in sim.log]
+    fetched = ops.count("messages.get")
+    assert ops.count("messages.list") == 3
+    assert [(r["email"], r["count"]) for r in rows[:5]] == top
+    assert sum(r["count"] for r in rows) == fetched
+    for r in rows:
+        assert r["oldest"] <= r["newest"]
+        assert 0 <= r["unread_ratio"] <= 1
+
+    by_size = search.sort_profiles(rows, "bytes")
+    assert by_size[0]["bytes"] == max(r["bytes"] for r in rows)
+    assert search.sort_profiles(rows, "oldest", descending=False)[0]["oldest"] == min(
+        r["oldest"] for r in rows
+    )
+
+
+def test_rollups_merge_variants_without_refetch():
+    rows = [
+        {
+            "email": e,
+            "count": c,
+            "bytes": c * 10,
+            "unread": 1,
+            "unread_ratio": 1 / c,
+            "newest": 200 + c,
+            "oldest": 100 - c,
+            "labels": {"INBOX": c},
+        }
+        for e, c in [
+            ("no-reply+a@shop.co.uk", 2),
+            ("no-reply+b@shop.co.uk", 3),
+            ("news@mail.shop.com", 4),
+            ("ana@example.org", 1),
+        ]
+    ]
+    domains = search.rollup_senders(rows, "domain")
+    assert [(d["email"], d["count"]) for d in domains] == [
+        ("shop.co.uk", 5),
+        ("shop.com", 4),
+        ("example.org", 1),
+    ]
+    shop_uk = domains[0]
+    assert [a["email"] for a in shop_uk["children"]] == ["no-reply@shop.co.uk"]
+    assert shop_uk["oldest"] == 97 and shop_uk["newest"] == 203
+    assert search.rollup_query(shop_uk) == "from:shop.co.uk"
+
+    orgs = search.rollup_senders(rows, "org")
+    assert orgs[0]["email"] == "shop" and orgs[0]["count"] == 9
+    assert search.rollup_query(orgs[0]) == "from:(shop.co.uk OR shop.com)"
@@ -0,0 +1,51 @@
+import random
+from array import array
+
+from gmail_manager import messages, selection
+from gmail_manager.simulator import SimMailbox, SimulatedGmail
+
+
+def test_merges_match_set_algebra():
+    rng = random.Random(0)
+    a = sorted(rng.sample(range(1, 10**6), 4000))
+    b = sorted(rng.sample(range(1, 10**6), 6000))
+    A, B = array("Q", a), array("Q", b)
+    assert list(selection.union(A, B)) == sorted(set(a) | set(b))
+    assert list(selection.intersection(A, B)) == sorted(set(a) & set(b))
+    assert list(selection.difference(A, B)) == sorted(set(a) - set(b))
+
+
+def test_compact_sorts_and_dedupes_across_runs(monkeypatch):
+    monkeypatch.setattr(selection, "_RUN_SIZE", 100)
+    rng = random.Random(1)
+    ids = [format(rng.randrange(1 << 60, 1 << 61), "x") for _ in range(1000)]
+    ids += ids[:300]
+    rng.shuffle(ids)
+    out = selection.compact(ids)
+    assert out.typecode == "Q" and list(out) == sorted({int(m, 16) for m in ids})
+    assert len(selection.compact([])) == 0
+
+
+def test_compound_selection_feeds_pipeline(tmp_path):
+    vip = tmp_path / "vip.txt"
+    vip.write_text("news@shop.example.com\n# comentario\nno-reply+1@shop.example.com\n")
+    sim = SimulatedGmail(SimMailbox(size=3000, seed=2))
+    with sim.install():
+
+        def ids(q):
+            return set(messages.iter_message_ids(q, None))
+
+        expected = (
+            (ids("category:social") | ids("category:promotions"))
+            - ids("larger:1M")
+            - ids("is:starred")
+        ) & ids("from:(news@shop.example.com OR no-reply+1@shop.example.com)")
+        sel = (
+            selection.labels("CATEGORY_SOCIAL", "CATEGORY_PROMOTIONS")
+            - selection.query("larger:1M")
+        ) & selection.senders_file(str(vip))
+        res = selection.run_action(sel, "TRASH")
+        trashed = ids("in:trash")
+    assert expected and res["processed"] == len(expected)
+    assert res["journal"]
+    assert expected <= trashed
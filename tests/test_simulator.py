@@ -0,0 +1,63 @@
+import pytest
+from googleapiclient.errors import HttpError
+
+from gmail_manager import labels, messages, search
+from gmail_manager.simulator import SimMailbox, SimulatedGmail
+
+
+@pytest.fixture
+def sim():
+    s = SimulatedGmail(SimMailbox(size=3000, seed=5))
+    with s.install():
+        yield s
+
+
+def test_list_pages_and_query_subsets(sim):
+    all_ids = list(messages.iter_message_ids(None, None))
+    promo = list(messages.iter_message_ids("category:promotions", None))
+    assert len(set(all_ids)) == len(all_ids) > 2000
+    assert 0 < len(promo) < len(all_ids)
+    assert set(promo) <= set(all_ids)
+    assert sim.calls["messages.list"] >= 7  # 500 por página
+
+
+def test_batch_metadata_get(sim):
+    top = search.top_senders("", limit=3)
+    assert len(top) == 3
+    assert top[0][1] >= top[1][1] >= top[2][1]
+    assert sim.calls["messages.get"] == 2000
+
+
+def test_trash_pipeline_updates_label_counts(sim):
+    before = {l["id"]: l["messagesTotal"] for l in labels.list_labels_with_counts()}
+    res = messages.trash_by_query_fast("category:social", batch_size=200)
+    after = {l["id"]: l["messagesTotal"] for l in labels.list_labels_with_counts()}
+    assert res["processed"] > 0
+    assert after["TRASH"] == before["TRASH"] + res["processed"]
+    assert messages.estimate_count("category:social -is:starred") == 0
+
+
+def test_quota_exhaustion_returns_429():
+    s = SimulatedGmail(SimMailbox(size=10), quota_per_sec=60)
+    svc = s.build_service()
+    svc.users().messages().batchModify(
+        userId="me", body={"ids": [], "addLabelIds": ["INBOX"]}
+    ).execute()
+    with pytest.raises(HttpError) as exc:
+        svc.users().messages().batchModify(
+            userId="me", body={"ids": [], "addLabelIds": ["INBOX"]}
+        ).execute()
+    assert exc.value.resp.status == 429
+
+
+def test_history_reports_new_and_changed_messages():
+    s = SimulatedGmail(SimMailbox(size=10))
+    svc = s.build_service()
+    start = svc.users().getProfile(userId="me").execute()["historyId"]
+    mid = s.mailbox.add_message("Jira <jira@corp.example>", "Ticket")
+    svc.users().messages().batchModify(
+        userId="me", body={"ids": [mid], "removeLabelIds": ["UNREAD"]}
+    ).execute()
+    hist = svc.users().history().list(userId="me", startHistoryId=start).execute()
+    kinds = [k for h in hist["history"] for k in h if k not in ("id", "messages")]
+    assert kinds == ["messagesAdded", "labelsRemoved"]
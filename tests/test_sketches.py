@@ -0,0 +1,44 @@
+import random
+from collections import Counter
+
+from gmail_manager.sketches import SpaceSaving
+
+
+def _stream(n, seed):
+    rng = random.Random(seed)
+    # Cola larga: pocos remitentes pesados y muchos de una sola vez
+    return [f"s{int(rng.paretovariate(1.1))}" for _ in range(n)]
+
+
+def _check(sketch, truth):
+    assert len(sketch) <= sketch.capacity
+    total = sum(truth.values())
+    for key, count, error in sketch.top():
+        assert count - error <= truth[key] <= count
+        assert error <= total // sketch.capacity
+    for key, n in truth.items():
+        if n > total / sketch.capacity:
+            assert key in dict((k, c) for k, c, _ in sketch.top())
+
+
+def test_space_saving_bounds():
+    data = _stream(50_000, 1)
+    sketch = SpaceSaving.for_error(0.005)
+    sketch.update_many(data)
+    _check(sketch, Counter(data))
+    assert sketch.top(1)[0][0] == Counter(data).most_common(1)[0][0]
+
+
+def test_space_saving_merge_shards():
+    shards = [_stream(20_000, seed) for seed in range(4)]
+    sketches = []
+    for data in shards:
+        s = SpaceSaving(150)
+        s.update_many(data)
+        sketches.append(s)
+    merged = sketches[0]
+    for s in sketches[1:]:
+        merged = merged.merge(s)
+    truth = Counter(x for data in shards for x in data)
+    assert merged.total == sum(truth.values())
+    _check(merged, truth)
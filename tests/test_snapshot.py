@@ -0,0 +1,60 @@
+import json
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from gmail_manager import messages, search, snapshot
+from gmail_manager.simulator import SimMailbox, SimulatedGmail
+
+
+def test_export_matches_live_queries(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, "CHUNK_ROWS", 500)  # varios bloques
+    sim = SimulatedGmail(SimMailbox(size=1200, seed=4))
+    with sim.install():
+        meta = snapshot.export(str(tmp_path / "snap"))
+        live_top = search.top_senders("", 10, max_messages=None)
+        promos = set(messages.iter_message_ids("category:promotions", None))
+    snap = snapshot.load(str(tmp_path / "snap"))
+    assert meta["rows"] == len(snap) > 0
+    assert snapshot.top_senders(snap, 10) == live_top
+    mask = snap.has_label("CATEGORY_PROMOTIONS")
+    assert set(snapshot.ids(snap, mask)) == promos
+    assert sum(c for _, c, _ in snapshot.time_series(snap, "year")) == len(snap)
+
+    packed = snapshot.load(snapshot.pack(str(tmp_path / "snap")))
+    assert snapshot.top_senders(packed, 10, mask) == snapshot.top_senders(
+        snap, 10, mask
+    )
+
+
+def test_analytics_on_a_million_rows(tmp_path):
+    n, rng = 1_000_000, np.random.default_rng(0)
+    path = tmp_path / "big"
+    path.mkdir()
+    cols = {
+        "id": np.arange(1, n + 1, dtype="<u8") + 0x18A0000000000000,
+        "thread": np.arange(1, n + 1, dtype="<u8"),
+        "sender": rng.zipf(1.3, n).clip(max=20_000).astype("<u4") - 1,
+        "date": rng.integers(1.2e9, 1.7e9, n).astype("<i8"),
+        "size": rng.lognormal(10, 1.5, n).clip(max=2**31).astype("<u4"),
+        "labels": rng.integers(0, 2**8, n).astype("<u8"),
+    }
+    for name, arr in cols.items():
+        arr.tofile(path / f"{name}.bin")
+    labels = [{"id": f"Label_{i}", "name": f"L{i}"} for i in range(8)]
+    senders = [f"s{i}@example.com" for i in range(20_000)]
+    meta = {"version": 1, "rows": n, "words": 1, "labels": labels, "senders": senders}
+    (path / "meta.json").write_text(json.dumps(meta))
+
+    snap = snapshot.load(str(path))
+    t0 = time.perf_counter()
+    top = snapshot.top_senders(snap, 20)
+    hist = snapshot.size_histogram(snap)
+    series = snapshot.time_series(snap, "month", snap.has_label("L3"))
+    elapsed = time.perf_counter() - t0
+    assert top[0] == ("s0@example.com", int(np.count_nonzero(cols["sender"] == 0)))
+    assert sum(h[2] for h in hist) == n
+    assert sum(c for _, c, _ in series) == int(np.count_nonzero(cols["labels"] & 8))
+    assert elapsed < 1.0
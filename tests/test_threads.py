@@ -0,0 +1,26 @@
+from gmail_manager import messages, threads
+from gmail_manager.simulator import SimMailbox, SimulatedGmail
+
+
+def test_trash_threads_uses_fewer_list_calls():
+    sim = SimulatedGmail(SimMailbox(size=3000, seed=4))
+    q = "category:promotions"
+    with sim.install():
+        expected = set(messages.iter_message_ids(q, None))
+        sim.log.clear()
+        res = threads.trash_threads_by_query(q, protect_starred=False)
+        trashed = set(messages.iter_message_ids("in:trash", None))
+
+    assert res["unit"] == "threads" and res["processed"] > 0
+    assert expected <= trashed
+    ops = [op for op, _, _, _ in sim.log]
+    pages = -(-len(expected) // threads.MAX_RESULTS_PER_PAGE)
+    assert ops.count("threads.list") <= pages
+    assert "messages.batchModify" not in ops
+
+
+def test_thread_top_senders_counts_conversations():
+    sim = SimulatedGmail(SimMailbox(size=800, seed=2))
+    with sim.install():
+        top = threads.top_senders("", limit=5)
+    assert top and all(n > 0 for _, n in top)
@@ -0,0 +1,66 @@
+import json
+import threading
+
+from gmail_manager import tracing
+from gmail_manager.accounts import ContextThreadPool
+
+
+def _work(owner):
+    with tracing.span("work", owner=owner):
+        tracing.instant("tick", owner=owner)
+
+
+def test_spans_nest_and_save_chrome_trace(tmp_path):
+    tracer = tracing.Tracer("job", str(tmp_path / "job.trace.json"))
+    with tracing.trace_job("job", tracer):
+        with tracing.span("outer", size=2):
+            # Los workers de ContextThreadPool heredan la traza activa
+            with ContextThreadPool(max_workers=2) as ex:
+                ex.submit(_work, "job").result()
+    assert tracing.active() is None
+    outer, inner = tracer.spans("outer")[0], tracer.spans("work")[0]
+    assert outer["ts"] <= inner["ts"]
+    assert inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+    assert tracer.spans("job")
+
+    with open(tracer.save(), encoding="utf-8") as fh:
+        data = json.load(fh)
+    assert data["displayTimeUnit"] == "ms" and data["otherData"] == {"job": "job"}
+    assert {"M", "X", "i"} <= {e["ph"] for e in data["traceEvents"]}
+    for ev in data["traceEvents"]:
+        assert {"name", "ph", "pid", "tid"} <= set(ev)
+        if ev["ph"] == "X":
+            assert ev["dur"] >= 0 and ev["args"]["job"] == "job"
+
+
+def test_disabled_tracing_is_a_no_op(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, "_trace_dir", "")
+    with tracing.trace_job("job") as tracer:
+        span = tracing.span("batch", size=1)
+        with span:
+            tracing.instant("tick")
+    assert tracer is None and tracing.active() is None
+    assert span is tracing._NULL_SPAN
+    assert not list(tmp_path.iterdir())
+
+
+def test_concurrent_jobs_keep_their_own_trace():
+    tracers = {name: tracing.Tracer(name) for name in ("a", "b")}
+    barrier = threading.Barrier(2)
+
+    def job(name):
+        with tracing.trace_job(name, tracers[name]):
+            barrier.wait()  # los dos trabajos abiertos a la vez
+            with ContextThreadPool(max_workers=2) as ex:
+                for f in [ex.submit(_work, name) for _ in range(3)]:
+                    f.result()
+            barrier.wait()
+
+    threads = [threading.Thread(target=job, args=(n,)) for n in tracers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for name, tracer in tracers.items():
+        spans = tracer.spans("work")
+        assert len(spans) == 3 and {s["args"]["owner"] for s in spans} == {name}
@@ -0,0 +1,31 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from googleapiclient.discovery import build
+
+from gmail_manager.simulator import SimMailbox, SimulatedGmail
+from gmail_manager.transport import PooledHttp
+
+
+def test_pooled_transport_reuses_connections_across_threads():
+    sim = SimulatedGmail(SimMailbox(size=50))
+    server = sim.serve()
+    try:
+        svc = build(
+            "gmail",
+            "v1",
+            http=PooledHttp(pool_size=4),
+            cache_discovery=False,
+            client_options={"api_endpoint": server.base_url},
+        )
+
+        def get_label(lid):
+            return svc.users().labels().get(userId="me", id=lid).execute()["id"]
+
+        ids = ["INBOX", "UNREAD", "STARRED", "Label_1"] * 10
+        for _ in range(2):  # dos "trabajos" con pools de hilos nuevos
+            with ThreadPoolExecutor(max_workers=4) as ex:
+                assert list(ex.map(get_label, ids)) == ids
+    finally:
+        server.shutdown()
+    assert sim.stats()["http_requests"] == 80
+    assert sim.stats()["connections"] <= 4
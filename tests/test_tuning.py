@@ -0,0 +1,25 @@
+from gmail_manager import accounts, tuning
+from gmail_manager.simulator import SimMailbox, SimulatedGmail
+
+
+def test_calibrate_saves_profile_and_cleans_probe_label(tmp_path, monkeypatch):
+    monkeypatch.setattr(tuning, "TUNING_FILE", str(tmp_path / "tuning.json"))
+    monkeypatch.setattr(accounts, "ACCOUNTS_FILE", str(tmp_path / "accounts.json"))
+    accounts.add("soporte")
+    defaults = (tuning.DEFAULT_BATCH_SIZE, tuning.DEFAULT_CONCURRENCY)
+    sim = SimulatedGmail(SimMailbox(size=800, seed=2))
+    with sim.install(), accounts.use("soporte"):
+        res = tuning.calibrate(
+            sample_size=300, batch_sizes=(100, 300), concurrencies=(1, 2)
+        )
+    assert len(res["results"]) == 4 and res["account"] == "soporte"
+    assert all(r["failed"] == 0 for r in res["results"])
+    best = (res["best"]["batch_size"], res["best"]["concurrency"])
+    # El perfil es de la cuenta calibrada, no de la última que se calibró
+    with accounts.use("soporte"):
+        assert tuning.recommended("TRASH") == tuning.recommended("DELETE") == best
+    assert tuning.recommended("TRASH") == defaults
+    assert tuning.recommended("TRASH", account="soporte") == best
+    assert tuning.recommended("TRASH", account="otra") == defaults
+    names = {l["name"] for l in sim.mailbox.labels.values()}
+    assert tuning.PROBE_LABEL not in names